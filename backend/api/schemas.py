@@ -66,6 +66,8 @@ class UserInfo(BaseModel):
     id: int
     username: str
     avatar_base64: Optional[str] = None
+    # login / check_token 按引用返回头像：GET avatar_url 下载（需要请求头鉴权，带版本参数，可长期缓存）
+    avatar_url: Optional[str] = None
 
 
 class VipInfo(BaseModel):
@@ -80,6 +82,8 @@ class RegisterResponse(BaseModel):
     success: bool
     message: str
     token: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
     user: UserInfo
     vip: VipInfo
 
@@ -98,6 +102,8 @@ class LoginResponse(BaseModel):
     success: bool
     message: str
     token: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
     user: UserInfo
     vip: VipInfo
 
@@ -150,6 +156,19 @@ class CheckTokenResponse(BaseModel):
     token: Optional[str] = None
 
 
+class RefreshTokenRequest(BaseModel):
+    """刷新token请求"""
+    refresh_token: str
+
+
+class RefreshTokenResponse(BaseModel):
+    """刷新token响应"""
+    success: bool
+    token: str
+    refresh_token: str
+    expires_in: int
+
+
 # ==================== 公告 ====================
 
 class AnnouncementResponse(BaseModel):
@@ -180,6 +199,7 @@ class VipPurchaseRequest(BaseModel):
     token: str
     package_type: str = Field(..., description="套餐类型：'monthly', 'yearly' 等")
     payment_method: Optional[str] = Field(default=None, description="支付方式")
+    idempotency_key: Optional[str] = Field(default=None, max_length=64, description="幂等键：重试时保持不变，避免重复扣费")
 
 
 class VipPurchaseResponse(BaseModel):
@@ -187,6 +207,7 @@ class VipPurchaseResponse(BaseModel):
     success: bool
     message: str
     vip_info: Optional[VipInfo] = None
+    duplicate: bool = Field(default=False, description="是否为已处理过的重复请求")
 
 
 # ==================== 客服相关 ====================
@@ -204,6 +225,8 @@ class CustomerServiceRegisterResponse(BaseModel):
     success: bool
     message: str
     token: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
     user: UserInfo
 
 
@@ -219,6 +242,8 @@ class CustomerServiceLoginResponse(BaseModel):
     success: bool
     message: str
     token: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
     user: UserInfo
 
 
@@ -235,6 +260,24 @@ class CustomerServiceVerifyTokenResponse(BaseModel):
 
 # ==================== 消息相关 ====================
 
+class RichTextInfo(BaseModel):
+    """文本消息的预渲染富文本结果（发送 / 编辑时生成）"""
+    html: str
+    is_rich: bool = False
+    urls: List[str] = []
+    mentions: List[Dict[str, str]] = []
+
+
+class LinkPreviewInfo(BaseModel):
+    """链接预览（发送消息后由服务端后台抓取，通过 message_preview_ready 推送并随历史消息返回）"""
+    url: str
+    title: Optional[str] = None
+    description: Optional[str] = None
+    image: Optional[str] = None
+    site_name: Optional[str] = None
+    success: bool = True
+
+
 class MessageInfo(BaseModel):
     """消息信息"""
     id: int
@@ -253,6 +296,8 @@ class MessageInfo(BaseModel):
     sent_at: Optional[str] = None
     delivered_at: Optional[str] = None
     read_at: Optional[str] = None
+    rich: Optional[RichTextInfo] = None
+    link_previews: List[LinkPreviewInfo] = []
 
 
 class SendMessageRequest(BaseModel):
@@ -292,6 +337,8 @@ class EditMessageResponse(BaseModel):
     """编辑消息响应"""
     success: bool
     message: str
+    edited_at: Optional[str] = None
+    rich: Optional[RichTextInfo] = None
 
 
 class RecallMessageRequest(BaseModel):
@@ -17,7 +17,8 @@ import sys
 import secrets
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote
 
 # 确保项目根目录在 sys.path 中，便于导入 backend 等顶层包
 # 这样可以从 backend 目录直接运行，也可以从项目根目录运行
@@ -30,14 +31,27 @@ from backend.config.env_loader import *  # noqa: F401
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 import socketio as sio_lib
 
-from backend.config.config import email_config, SECRET_KEY, FRONTEND_BASE_URL  # noqa: F401
+from backend.config.config import (  # noqa: F401
+    email_config, SECRET_KEY, FRONTEND_BASE_URL, RICH_TEXT_CACHE_SIZE,
+    LINK_PREVIEW_CACHE_SIZE, LINK_PREVIEW_CACHE_TTL, LINK_PREVIEW_NEGATIVE_TTL,
+    LINK_PREVIEW_MAX_BYTES, LINK_PREVIEW_TIMEOUT, LINK_PREVIEW_MAX_CONNECTIONS,
+    LINK_PREVIEW_PREFETCH_CONCURRENCY, LINK_PREVIEW_MAX_PER_MESSAGE,
+    KNOWLEDGE_BASE_CHECK_INTERVAL, BOT_REPLY_CACHE_SIZE, BOT_REPLY_MAX_BATCH,
+    MENTION_SUGGEST_MAX_LIMIT, MENTION_NOTIFY_MAX,
+    SENT_MESSAGE_DEDUP_SIZE, SENT_MESSAGE_DEDUP_TTL, SEND_MESSAGES_MAX_BATCH,
+    NEW_MESSAGES_FLUSH_INTERVAL, NEW_MESSAGES_MAX_BATCH, SOCKETIO_MSGPACK_ENABLED,
+    SOCKETIO_COMPRESSION_ENABLED, SOCKETIO_COMPRESSION_THRESHOLD, SOCKETIO_COMPRESSION_LEVEL, WS_PER_MESSAGE_DEFLATE,
+    FILE_UPLOAD_DIR, FILE_UPLOAD_MAX_SIZE, FILE_UPLOAD_CHUNK_SIZE, FILE_UPLOAD_STAGING_TTL,
+    FILE_UPLOAD_MAX_PENDING_PER_USER, FILE_UPLOAD_MAX_PENDING_BYTES_PER_USER,
+)
 from backend.database.async_database_manager import AsyncDatabaseManager
+from backend.database.profile_cache import AsyncProfileCache
 from backend.async_membership_service import AsyncMembershipService
 from backend.email.email_sender import EmailSender, generate_verification_code
-from backend.login.token_utils import generate_token, verify_token
+from backend.login.token_utils import generate_token_pair, verify_token, verify_refresh_token
 from backend.login.login_attempts import (
     record_failed_attempt,
     clear_attempts,
@@ -47,17 +61,30 @@ from backend.login.login_attempts import (
 from backend.logging_manager import setup_logging  # noqa: F401
 from backend.validation.validator import validate_email, validate_password
 from backend.validation.verification_manager import VerificationManager
-from backend.utils.rich_text_processor import process_rich_text, extract_urls_from_text, extract_mentions_from_text
-from backend.utils.async_link_preview import fetch_link_preview, get_simple_preview
+from backend.utils.rich_text_processor import (
+    RichTextCache, extract_urls_from_text, extract_mentions_from_text, resolve_mentions,
+)
+from backend.utils.async_link_preview import LinkPreviewService, get_simple_preview
+from backend.utils.file_store import FileStore, FileStoreError
 from backend.websocket.async_websocket_manager import AsyncWebSocketManager
+from backend.websocket.packed_serializer import PackedAsyncServer
+from backend.customer_service.knowledge_store import KnowledgeBaseStore
+from backend.customer_service.bot_service import BotReplyService
+from backend.resources import get_default_avatar
 
 # 初始化日志
 logger = logging.getLogger(__name__)
 
 # 初始化 SocketIO AsyncServer（需要在创建 ws_manager 之前）
-sio = sio_lib.AsyncServer(
+# 注册时声明 "msgpack" / "deflate" 的连接改用 msgpack 编码 / 压缩大帧，其余连接保持未压缩的 JSON
+sio = PackedAsyncServer(
     async_mode='asgi',
-    cors_allowed_origins="*"
+    cors_allowed_origins="*",
+    msgpack_enabled=SOCKETIO_MSGPACK_ENABLED,
+    frame_compression=SOCKETIO_COMPRESSION_ENABLED,
+    frame_compression_threshold=SOCKETIO_COMPRESSION_THRESHOLD,
+    frame_compression_level=SOCKETIO_COMPRESSION_LEVEL,
+    compression_threshold=SOCKETIO_COMPRESSION_THRESHOLD,
 )
 
 # 全局单例：数据库、会员服务、验证码管理、邮件发送器、WebSocket 管理器
@@ -68,7 +95,9 @@ try:
     membership_service = AsyncMembershipService(db)
     verification_manager = VerificationManager()
     email_sender = EmailSender(email_config)
-    ws_manager = AsyncWebSocketManager(sio, db)
+    ws_manager = AsyncWebSocketManager(
+        sio, db, batch_interval=NEW_MESSAGES_FLUSH_INTERVAL, max_batch=NEW_MESSAGES_MAX_BATCH
+    )
 except ValueError as e:
     # 如果缺少数据库配置，记录错误但不阻止模块导入
     # 这样可以在测试时导入模块而不需要完整的 .env 配置
@@ -79,6 +108,39 @@ except ValueError as e:
     email_sender = EmailSender(email_config) if email_config else None
     ws_manager = None
 
+# 富文本渲染结果缓存：消息发送 / 编辑时渲染一次，推送与历史加载直接复用
+rich_text_cache = RichTextCache(RICH_TEXT_CACHE_SIZE)
+
+# 链接预览服务：共享连接池 + 结果缓存
+link_preview_service = LinkPreviewService(
+    max_size=LINK_PREVIEW_CACHE_SIZE,
+    ttl=LINK_PREVIEW_CACHE_TTL,
+    negative_ttl=LINK_PREVIEW_NEGATIVE_TTL,
+    max_bytes=LINK_PREVIEW_MAX_BYTES,
+    timeout=LINK_PREVIEW_TIMEOUT,
+    max_connections=LINK_PREVIEW_MAX_CONNECTIONS,
+)
+# 后台链接预览预抓取：限制并发，并持有任务引用避免被垃圾回收
+link_preview_prefetch_semaphore = asyncio.Semaphore(max(LINK_PREVIEW_PREFETCH_CONCURRENCY, 1))
+_background_tasks: set = set()
+
+# 已发送消息去重的进程内缓存：合并同一条消息的并发重发，持久的去重键见 sent_message_keys 表
+sent_message_cache = AsyncProfileCache("sent_message", SENT_MESSAGE_DEDUP_SIZE, SENT_MESSAGE_DEDUP_TTL)
+
+# 聊天文件：分块续传写入暂存区，sha256 校验通过后移入正式存储
+file_store = FileStore(
+    FILE_UPLOAD_DIR,
+    FILE_UPLOAD_MAX_SIZE,
+    staging_ttl=FILE_UPLOAD_STAGING_TTL,
+    max_pending_per_user=FILE_UPLOAD_MAX_PENDING_PER_USER,
+    max_pending_bytes_per_user=FILE_UPLOAD_MAX_PENDING_BYTES_PER_USER,
+)
+
+# 客服知识库：数据文件编译为匹配索引后序列化发布，文件修改后自动热更新
+knowledge_base_store = KnowledgeBaseStore(check_interval=KNOWLEDGE_BASE_CHECK_INTERVAL)
+# 机器人自动回复：结果缓存 + 分流统计
+bot_reply_service = BotReplyService(knowledge_base_store, cache_size=BOT_REPLY_CACHE_SIZE)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -88,6 +150,7 @@ async def lifespan(app: FastAPI):
         logger.error("数据库管理器未初始化，请检查 .env 配置文件")
         raise RuntimeError("数据库配置缺失，无法启动应用")
     await db.initialize_tables()
+    await db.load_username_index()
     if ws_manager:
         await ws_manager.start()
     logger.info("FastAPI 应用启动完成")
@@ -97,6 +160,7 @@ async def lifespan(app: FastAPI):
     # 关闭逻辑
     if ws_manager:
         await ws_manager.stop()
+    await link_preview_service.close()
     if db:
         await db.close()
     logger.info("FastAPI 应用关闭完成")
@@ -124,6 +188,85 @@ socketio_app = sio_lib.ASGIApp(sio, app)
 
 
 # 辅助函数
+def _rich_text_for_message(message_type: Any, text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    文本消息返回预渲染的富文本结果 {html, is_rich, urls, mentions}，其他类型返回 None。
+
+    渲染结果按内容缓存；@用户 提及每次通过用户名索引解析，改名后立即生效。
+    """
+    if str(message_type or "text") != "text" or not text:
+        return None
+    return resolve_mentions(rich_text_cache.get(text), db.username_index)
+
+
+async def _notify_mentions(
+    chat_session: Dict[str, Any],
+    rich: Optional[Dict[str, Any]],
+    payload_data: Dict[str, Any],
+) -> None:
+    """
+    向消息中 @到的用户推送 mentioned 事件。
+
+    只通知会话参与者与客服 / 管理员（普通用户不能借提及看到别人的会话），
+    已经收到这条消息的发送方 / 接收方不重复通知。
+    """
+    if not rich or not rich.get("mentions"):
+        return
+    skip = {payload_data.get("from_user_id"), payload_data.get("to_user_id")}
+    participants = {chat_session.get("user_id"), chat_session.get("agent_id")}
+    targets = []
+    for mention in rich["mentions"]:
+        for user_id in mention.get("user_ids") or []:
+            if user_id not in skip and user_id not in targets:
+                targets.append(user_id)
+    for user_id in targets[:MENTION_NOTIFY_MAX]:
+        if user_id not in participants:
+            profile = await db.get_user_profile(user_id)
+            if not profile or profile.get("role") not in AGENT_ROLES:
+                continue
+        await ws_manager.send_message_to_user(user_id, "mentioned", {
+            "session_id": payload_data["session_id"],
+            "message_id": payload_data["id"],
+            "from_user_id": payload_data["from_user_id"],
+            "from_username": payload_data.get("username"),
+            "text": payload_data["text"],
+            "time": payload_data["time"],
+        })
+
+
+def _schedule_link_preview_prefetch(
+    session_id: str, message_id: int, text: str, edited_at: Optional[datetime] = None
+) -> None:
+    """为消息中的链接安排后台预览抓取，不阻塞发送流程；edited_at 为此时消息的编辑时间，保存前据此判断消息是否又被编辑"""
+    urls = []
+    for url in extract_urls_from_text(text):
+        # Markdown 链接 [文本](url) 会把右括号带进来
+        url = url.rstrip(".,;:!?)]")
+        if url and url not in urls:
+            urls.append(url)
+    for url in urls[:LINK_PREVIEW_MAX_PER_MESSAGE]:
+        task = asyncio.create_task(_prefetch_link_preview(session_id, message_id, url, edited_at))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+async def _prefetch_link_preview(
+    session_id: str, message_id: int, url: str, edited_at: Optional[datetime] = None
+) -> None:
+    """抓取单个链接预览，保存到消息并推送 message_preview_ready 给会话双方"""
+    try:
+        async with link_preview_prefetch_semaphore:
+            preview = await link_preview_service.get_preview(url)
+        if not preview.get("success"):
+            return
+        # 抓取期间消息被编辑 / 撤回，或该链接已有预览时不保存也不推送
+        if not await db.save_message_link_preview(message_id, preview, edited_at=edited_at):
+            return
+        await ws_manager.push_message_preview_ready(session_id, message_id, preview)
+    except Exception as e:
+        logger.error(f"后台抓取链接预览失败: message_id={message_id}, url={url}, error={e}", exc_info=True)
+
+
 def _vip_dict_from_row(row: Dict[str, Any] | None) -> Dict[str, Any]:
     """将数据库中的 VIP 行转换为统一返回结构。"""
     if not row:
@@ -171,8 +314,108 @@ def _user_dict_with_avatar(user_row: Dict[str, Any] | None) -> Dict[str, Any]:
     }
 
 
+def _avatar_url(user_id: Any, updated_at: datetime | None) -> str:
+    """生成头像引用地址：带版本参数，头像变化后地址随之变化，便于客户端长期缓存。"""
+    version = int(updated_at.timestamp()) if updated_at else 0
+    return f"/api/user/avatar/{user_id}?v={version}"
+
+
+def _user_dict_with_avatar_ref(user_row: Dict[str, Any] | None) -> Dict[str, Any]:
+    """将用户行转换为带 avatar_url 的 dict（头像按引用返回，不内联 base64）。"""
+    if not user_row:
+        return {}
+    return {
+        "id": user_row.get("id"),
+        "username": user_row.get("username"),
+        "avatar_url": _avatar_url(user_row.get("id"), user_row.get("avatar_updated_at")),
+    }
+
+
+def _detect_image_type(data: bytes) -> str:
+    """根据文件头判断图片 MIME 类型，无法识别时按 PNG 处理"""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
 # ==================== WebSocket 辅助函数 ====================
 
+# 客服工作台相关事件允许的角色
+AGENT_ROLES = ("customer_service", "admin")
+
+
+async def _authenticate(
+    token: str,
+    user_id: int,
+    roles: Optional[Tuple[str, ...]] = None,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    校验 token 并返回调用者身份（供 WebSocket 事件复用）
+
+    新版 access token 自带 user_id / role 声明，直接基于声明鉴权，不查库；
+    仅含 email 的旧版 token 回退为按 user_id 查库比对。
+
+    Args:
+        token: access token
+        user_id: 请求声明的用户ID
+        roles: 允许的角色，为 None 时不做角色限制
+
+    Returns:
+        (identity, error)：identity 为 {user_id, role, email}；失败时 identity 为 None，error 为提示文案
+    """
+    payload = verify_token(token)
+    if not payload:
+        return None, "Token 无效或已过期"
+
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None, "参数类型错误"
+
+    token_uid = payload.get("user_id")
+    token_role = payload.get("role")
+    if token_uid is not None and token_role:
+        if int(token_uid) != user_id:
+            return None, "Token 与用户不匹配"
+        identity = {"user_id": user_id, "role": token_role, "email": payload.get("email")}
+    else:
+        user_row = await db.get_user_profile(user_id)
+        if not user_row:
+            return None, "用户不存在"
+        token_email = payload.get("email")
+        if token_email and user_row.get("email") != token_email:
+            return None, "Token 与用户不匹配"
+        identity = {"user_id": user_id, "role": user_row.get("role", "user"), "email": user_row.get("email")}
+
+    if roles and identity["role"] not in roles:
+        return None, "无权限访问"
+    return identity, None
+
+
+async def _authenticate_request(
+    request: Request,
+    roles: Optional[Tuple[str, ...]] = None,
+) -> Dict[str, Any]:
+    """
+    从请求头鉴权（分块上传的请求体是文件数据、GET 请求没有请求体，无法携带 JSON 字段）：
+    Authorization: Bearer <access token>，X-User-Id: <用户ID>
+
+    roles 不为 None 时还要求调用者角色在其中，否则返回 403。
+    """
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:].strip() if authorization.lower().startswith("bearer ") else ""
+    identity, error = await _authenticate(token, request.headers.get("x-user-id", ""))
+    if not identity:
+        raise HTTPException(status_code=401, detail=error)
+    if roles and identity["role"] not in roles:
+        raise HTTPException(status_code=403, detail="无权限访问")
+    return identity
+
+
 def _format_time(dt) -> str:
     """格式化时间为可读字符串"""
     if not dt:
@@ -235,16 +478,11 @@ async def _format_session_list(sessions: list, include_duration: bool = True) ->
                 minutes = int((diff.total_seconds() % 3600) // 60)
                 duration = f"{hours:02d}:{minutes:02d}"
 
-        # 获取用户头像
-        user_info = await db.get_user_by_id(user_id)
+        # 获取用户头像（经头像缓存，避免每次推送会话列表都读取 LONGBLOB）
+        avatar_bytes = await db.get_user_avatar_data(user_id)
         avatar_base64 = None
-        if user_info and user_info.get('avatar'):
-            try:
-                avatar_bytes = user_info['avatar']
-                if isinstance(avatar_bytes, bytes):
-                    avatar_base64 = f"data:image/png;base64,{base64.b64encode(avatar_bytes).decode('utf-8')}"
-            except:
-                    pass
+        if avatar_bytes:
+            avatar_base64 = f"data:image/png;base64,{base64.b64encode(avatar_bytes).decode('utf-8')}"
         
         formatted_sessions.append({
             "id": session.get('session_id', ''),
@@ -344,7 +582,7 @@ async def _accept_session_logic(user_id: int, session_id: str) -> Dict[str, Any]
     # 推送给最终用户：会话已被客服接入
     if user_side_id:
         try:
-            agent_row = await db.get_user_by_id(user_id)
+            agent_row = await db.get_user_profile(user_id)
             agent_name = agent_row.get("username") if agent_row else None
         except Exception:
             agent_name = None
@@ -400,8 +638,10 @@ async def handle_register(sid, data, environ=None):
         token: str,
         connection_id: str,
         device_id?: str,
-        device_info?: {...}
+        device_info?: {...},
+        capabilities?: [str]    # 客户端支持的能力："new_messages"（批量推送新消息）、"msgpack"（二进制序列化）、"deflate"（大帧压缩）
     }
+    返回给回调：{success, connection_id?, socket_id?, capabilities?, message}
     """
     try:
         user_id = int(data.get("user_id", 0) or 0)
@@ -409,24 +649,16 @@ async def handle_register(sid, data, environ=None):
         connection_id = str(data.get("connection_id", "")).strip()
         device_id = data.get("device_id")
         device_info = data.get("device_info", {})
+        capabilities = data.get("capabilities") or []
+        capabilities = [c for c in capabilities if isinstance(c, str)] if isinstance(capabilities, list) else []
         
         if not user_id or not token or not connection_id:
             return {"success": False, "message": "参数缺失"}
         
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-        
-        # 验证用户
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-        
         # 验证 token 与用户匹配
-        token_email = payload.get("email")
-        if token_email and user_row.get("email") != token_email:
-            return {"success": False, "message": "Token 与用户不匹配"}
+        identity, error = await _authenticate(token, user_id)
+        if not identity:
+            return {"success": False, "message": error}
         
         # 获取连接信息（从 environ 获取）
         ip_address = environ.get("REMOTE_ADDR") if environ else None
@@ -452,7 +684,9 @@ async def handle_register(sid, data, environ=None):
             connection_id=connection_id,
             device_id=device_id,
             ip_address=ip_address,
-            user_agent=user_agent
+            user_agent=user_agent,
+            role=identity["role"],
+            capabilities=capabilities,
         )
         
         if success:
@@ -461,6 +695,7 @@ async def handle_register(sid, data, environ=None):
                 "success": True,
                 "connection_id": connection_id,
                 "socket_id": sid,
+                "capabilities": sorted(ws_manager.accepted_capabilities(capabilities)),
                 "message": "连接注册成功"
             }
         else:
@@ -513,18 +748,9 @@ async def handle_match_agent(sid, data):
         if not user_id or not session_id or not token:
             return {"success": False, "message": "缺少必要参数"}
 
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-
-        # token 与用户匹配检查
-        token_uid = payload.get("user_id")
-        if token_uid and int(token_uid) != int(user_id):
-            return {"success": False, "message": "Token 与用户不匹配"}
+        identity, error = await _authenticate(token, user_id)
+        if not identity:
+            return {"success": False, "message": error}
 
         return await _match_agent_logic(user_id, session_id)
     except Exception as e:
@@ -546,21 +772,9 @@ async def handle_accept_session(sid, data):
         if not user_id or not session_id or not token:
             return {"success": False, "message": "缺少必要参数"}
 
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-
-        user_role = user_row.get("role", "user")
-        if user_role not in ['customer_service', 'admin']:
-            return {"success": False, "message": "无权限访问"}
-
-        token_uid = payload.get("user_id")
-        if token_uid and int(token_uid) != int(user_id):
-            return {"success": False, "message": "Token 与用户不匹配"}
+        identity, error = await _authenticate(token, user_id, roles=AGENT_ROLES)
+        if not identity:
+            return {"success": False, "message": error}
 
         return await _accept_session_logic(user_id, session_id)
     except Exception as e:
@@ -573,19 +787,24 @@ async def handle_message_delivered(sid, data):
     """
     消息送达回执
     data: {
-        message_id: int,
+        message_id: int,            # 或 message_ids: [int]（批量收到 new_messages 后一次回执）
         user_id: int
     }
     """
     try:
-        message_id = int(data.get("message_id", 0) or 0)
         user_id = int(data.get("user_id", 0) or 0)
+        message_ids = data.get("message_ids")
+        if isinstance(message_ids, list):
+            message_ids = [int(i) for i in message_ids[:NEW_MESSAGES_MAX_BATCH] if i]
+        else:
+            message_ids = [int(data.get("message_id", 0) or 0)]
         
-        if not message_id or not user_id:
+        if not message_ids or not all(message_ids) or not user_id:
             return {"success": False, "message": "参数缺失"}
         
         # 更新消息状态为已送达
-        await ws_manager.handle_message_status(message_id, 'delivered', user_id)
+        for message_id in message_ids:
+            await ws_manager.handle_message_status(message_id, 'delivered', user_id)
         
         return {"success": True}
     
@@ -634,24 +853,10 @@ async def handle_subscribe_sessions(sid, data):
         if not user_id or not token:
             return {"success": False, "message": "参数缺失"}
         
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-        
-        # 验证用户和权限
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-        
-        user_role = user_row.get("role", "user")
-        if user_role not in ['customer_service', 'admin']:
-            return {"success": False, "message": "无权限访问"}
-        
-        # 验证 token 与用户匹配
-        token_email = payload.get("email")
-        if token_email and user_row.get("email") != token_email:
-            return {"success": False, "message": "Token 与用户不匹配"}
+        # 验证 token、用户和权限
+        identity, error = await _authenticate(token, user_id, roles=AGENT_ROLES)
+        if not identity:
+            return {"success": False, "message": error}
         
         # 获取会话列表
         if session_type == 'pending':
@@ -686,19 +891,10 @@ async def handle_subscribe_pending_sessions(sid, data):
         if not user_id or not token:
             return {"success": False, "message": "参数缺失"}
         
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-        
-        # 验证用户和权限
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-        
-        user_role = user_row.get("role", "user")
-        if user_role not in ['customer_service', 'admin']:
-            return {"success": False, "message": "无权限访问"}
+        # 验证 token、用户和权限
+        identity, error = await _authenticate(token, user_id, roles=AGENT_ROLES)
+        if not identity:
+            return {"success": False, "message": error}
         
         # 获取待接入会话列表
         pending_sessions = await db.get_pending_sessions()
@@ -735,19 +931,10 @@ async def handle_update_agent_status(sid, data):
         if not token:
             return {"success": False, "message": "缺少 Token"}
         
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-        
-        # 验证用户和权限
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-        
-        user_role = user_row.get("role", "user")
-        if user_role not in ['customer_service', 'admin']:
-            return {"success": False, "message": "无权限访问"}
+        # 验证 token、用户和权限
+        identity, error = await _authenticate(token, user_id, roles=AGENT_ROLES)
+        if not identity:
+            return {"success": False, "message": error}
         
         # 更新状态
         success = await db.update_agent_status(user_id, status)
@@ -778,20 +965,10 @@ async def handle_subscribe_vip_info(sid, data):
         if not user_id or not token:
             return {"success": False, "message": "参数缺失"}
         
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-        
-        # 验证用户
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-        
         # 验证 token 与用户匹配
-        token_email = payload.get("email")
-        if token_email and user_row.get("email") != token_email:
-            return {"success": False, "message": "Token 与用户不匹配"}
+        identity, error = await _authenticate(token, user_id)
+        if not identity:
+            return {"success": False, "message": error}
         
         # 获取初始 VIP 信息
         vip_row = await db.get_user_vip_info(user_id)
@@ -821,22 +998,16 @@ async def handle_subscribe_user_profile(sid, data):
         if not user_id or not token:
             return {"success": False, "message": "参数缺失"}
         
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-        
-        # 验证用户
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-        
         # 验证 token 与用户匹配
-        token_email = payload.get("email")
-        if token_email and user_row.get("email") != token_email:
-            return {"success": False, "message": "Token 与用户不匹配"}
+        identity, error = await _authenticate(token, user_id)
+        if not identity:
+            return {"success": False, "message": error}
         
         # 获取初始用户资料
+        user_row = await db.get_user_profile(user_id)
+        if not user_row:
+            return {"success": False, "message": "用户不存在"}
+        user_row["avatar"] = await db.get_user_avatar_data(user_id)
         user = _user_dict_with_avatar(user_row)
         vip_row = await db.get_user_vip_info(user_id)
         vip = _vip_dict_from_row(vip_row)
@@ -875,20 +1046,10 @@ async def handle_edit_message(sid, data):
         if not new_content:
             return {"success": False, "message": "消息内容不能为空"}
         
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-        
-        # 获取用户信息
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-        
         # 验证 token 与用户匹配
-        token_email = payload.get("email")
-        if token_email and user_row.get("email") != token_email:
-            return {"success": False, "message": "Token 与用户不匹配"}
+        identity, error = await _authenticate(token, user_id)
+        if not identity:
+            return {"success": False, "message": error}
         
         # 编辑消息
         try:
@@ -908,11 +1069,16 @@ async def handle_edit_message(sid, data):
             else:
                 edited_at_str = datetime.utcnow().isoformat()
             
+            # 编辑时重新渲染富文本，随编辑事件一起推送
+            rich = _rich_text_for_message(message.get("message_type"), new_content)
+
             # 推送消息编辑事件给会话中的所有用户
-            await ws_manager.push_message_edited(session_id, message_id, new_content, edited_at_str)
+            await ws_manager.push_message_edited(session_id, message_id, new_content, edited_at_str, rich=rich)
+            if rich and rich.get("is_rich"):
+                _schedule_link_preview_prefetch(session_id, int(message_id), new_content, message.get("edited_at"))
             
             logger.debug(f"消息 {message_id} 编辑成功")
-            return {"success": True, "message": "编辑成功", "edited_at": edited_at_str}
+            return {"success": True, "message": "编辑成功", "edited_at": edited_at_str, "rich": rich}
         
         except Exception as e:
             logger.error(f"编辑消息失败: {e}", exc_info=True)
@@ -940,20 +1106,10 @@ async def handle_close_session(sid, data):
         if not session_id or not user_id or not token:
             return {"success": False, "message": "参数缺失"}
         
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-        
-        # 获取用户信息
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-        
         # 验证 token 与用户匹配
-        token_email = payload.get("email")
-        if token_email and user_row.get("email") != token_email:
-            return {"success": False, "message": "Token 与用户不匹配"}
+        identity, error = await _authenticate(token, user_id)
+        if not identity:
+            return {"success": False, "message": error}
         
         # 关闭会话
         try:
@@ -973,7 +1129,7 @@ async def handle_close_session(sid, data):
             await ws_manager.push_session_status_update(session_id, "closed", session_user_id, session_agent_id)
             
             # 如果用户是客服，同时推送会话列表更新
-            if user_row.get("role") in ['customer_service', 'admin']:
+            if identity["role"] in AGENT_ROLES:
                 sessions = await db.get_agent_sessions(user_id, include_pending=False)
                 formatted_sessions = await _format_session_list(sessions, include_duration=True)
                 await ws_manager.push_session_list_update(user_id, "my", formatted_sessions)
@@ -1013,7 +1169,7 @@ async def _get_reply_message_info(reply_to_message_id: int | None) -> Dict[str,
         reply_from_username = None
         if reply_from_user_id:
             try:
-                reply_from_user = await db.get_user_by_id(reply_from_user_id)
+                reply_from_user = await db.get_user_profile(reply_from_user_id)
                 if reply_from_user:
                     reply_from_username = reply_from_user.get("username")
             except Exception:
@@ -1062,12 +1218,6 @@ async def handle_recall_message(sid, data):
             logger.warning(f"撤回消息参数缺失: message_id={message_id}, user_id={user_id}, token_exists={bool(token)}")
             return {"success": False, "message": "参数缺失"}
         
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            logger.warning(f"撤回消息 Token 验证失败: user_id={user_id}")
-            return {"success": False, "message": "Token 无效或已过期"}
-        
         # 确保 user_id 是整数
         try:
             user_id = int(user_id)
@@ -1076,36 +1226,27 @@ async def handle_recall_message(sid, data):
             logger.error(f"撤回消息参数类型错误: message_id={message_id}, user_id={user_id}, error={e}")
             return {"success": False, "message": "参数类型错误"}
         
-        # 获取用户信息
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            logger.warning(f"撤回消息时用户不存在: user_id={user_id}")
-            return {"success": False, "message": "用户不存在"}
+        # 验证 token 与用户匹配
+        identity, error = await _authenticate(token, user_id)
+        if not identity:
+            logger.warning(f"撤回消息鉴权失败: user_id={user_id}, reason={error}")
+            return {"success": False, "message": error}
         
-        # 获取用户名和角色信息
-        username = user_row.get("username", "未知用户")
-        user_role = user_row.get("role", "user")
         # 将角色转换为中文显示
         role_name_map = {
             "user": "用户",
             "customer_service": "客服",
             "admin": "管理员"
         }
-        role_display = role_name_map.get(user_role, user_role)
-        
-        # 验证 token 与用户匹配
-        token_email = payload.get("email")
-        if token_email and user_row.get("email") != token_email:
-            logger.warning(f"撤回消息 Token 与用户不匹配: user_id={user_id}, username={username}, token_email={token_email}, user_email={user_row.get('email')}")
-            return {"success": False, "message": "Token 与用户不匹配"}
+        role_display = role_name_map.get(identity["role"], identity["role"])
         
         # 撤回消息
         try:
             success = await db.recall_message(message_id, user_id)
             if success:
-                logger.info(f"撤回消息成功: message_id={message_id}, user_id={user_id}, username={username} ({role_display})")
+                logger.info(f"撤回消息成功: message_id={message_id}, user_id={user_id} ({role_display})")
             else:
-                logger.warning(f"撤回消息失败: message_id={message_id}, user_id={user_id}, username={username} ({role_display})")
+                logger.warning(f"撤回消息失败: message_id={message_id}, user_id={user_id} ({role_display})")
             if success:
                 # 获取消息详情
                 message = await db.get_message_by_id(int(message_id))
@@ -1157,7 +1298,7 @@ async def handle_recall_message(sid, data):
                     # 获取发送者的用户名
                     from_username = None
                     try:
-                        from_user_row = await db.get_user_by_id(from_user_id)
+                        from_user_row = await db.get_user_profile(from_user_id)
                         if from_user_row:
                             from_username = from_user_row.get("username")
                     except Exception:
@@ -1249,33 +1390,32 @@ async def handle_get_session_messages(sid, data):
     """
     WebSocket 获取会话历史消息：
     data: {
-      session_id, user_id, token, limit?
+      session_id, user_id, token, limit?, after_id?, changed_from_id?
     }
-    返回给回调：{success, messages: []}
+    after_id：客户端本地缓存的最后一条消息ID，只返回其后的消息（增量同步）
+    changed_from_id：本地缓存的第一条消息ID（与 after_id 一起传），changes 中返回
+      [changed_from_id, after_id] 范围内已撤回或编辑过的消息，用于校正离线期间的变化；
+      changes 按消息ID升序分页，未取完时 changes_next_id 为下一页的 changed_from_id
+    返回给回调：{success, messages: [], changes: [], session_status, has_more, changes_next_id}
     """
     try:
         session_id = str(data.get("session_id", "")).strip()
         user_id = data.get("user_id")
         token = str(data.get("token", "")).strip()
         limit = int(data.get("limit", 200) or 200)
+        after_id = data.get("after_id")
+        after_id = int(after_id) if after_id not in (None, "") else None
+        changed_from_id = data.get("changed_from_id")
+        changed_from_id = int(changed_from_id) if changed_from_id not in (None, "") else None
 
         if not session_id or not user_id or not token:
             return {"success": False, "message": "参数缺失"}
 
-        # 验证 token
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-
-        # 验证用户
-        user_row = await db.get_user_by_id(user_id)
-        if not user_row:
-            return {"success": False, "message": "用户不存在"}
-
         # 验证 token 与用户匹配
-        token_email = payload.get("email")
-        if token_email and user_row.get("email") != token_email:
-            return {"success": False, "message": "Token 与用户不匹配"}
+        identity, error = await _authenticate(token, user_id)
+        if not identity:
+            return {"success": False, "message": error}
+        user_id = identity["user_id"]
 
         # 验证会话权限
         chat_session = await db.get_chat_session_by_id(session_id)
@@ -1284,7 +1424,7 @@ async def handle_get_session_messages(sid, data):
 
         session_user_id = chat_session.get("user_id")
         session_agent_id = chat_session.get("agent_id")
-        user_role = user_row.get("role", "user")
+        user_role = identity["role"]
 
         # 普通用户只能访问自己的会话；客服 / 管理员只能访问与自己关联的会话
         if user_role == "user":
@@ -1301,23 +1441,39 @@ async def handle_get_session_messages(sid, data):
         messages = await db.get_chat_messages(
                 session_id=session_id,
                 limit=limit,
+                after_id=after_id,
             )
+        # 本地缓存范围内离线期间被撤回 / 编辑的消息
+        modified = []
+        if after_id is not None and changed_from_id is not None and changed_from_id <= after_id:
+            modified = await db.get_modified_messages(session_id, changed_from_id, after_id, limit=limit)
+
+        # 一次批量查询所有发送者（通常只有会话双方），避免逐条消息查询用户与头像
+        senders = await db.get_users_fields(
+            [msg["from_user_id"] for msg in messages + modified],
+            fields=("id", "username", "avatar"),
+        )
+        avatar_cache: Dict[int, Optional[str]] = {}
+        # 批量加载后台抓取好的链接预览
+        link_previews = await db.get_message_link_previews([msg["id"] for msg in messages + modified])
 
         # 格式化消息数据（结构尽量与 HTTP 接口保持一致）
-        formatted_messages = []
-        for msg in messages:
+        async def _format_message(msg: Dict[str, Any]) -> Dict[str, Any]:
             msg_user_id = msg["from_user_id"]
 
-            # 获取发送者的用户信息（包括头像）
-            msg_user = await db.get_user_by_id(msg_user_id)
-            avatar_base64 = None
-            if msg_user and msg_user.get("avatar"):
-                try:
-                    avatar_bytes = msg_user['avatar']
-                    if isinstance(avatar_bytes, bytes):
-                        avatar_base64 = f"data:image/png;base64,{base64.b64encode(avatar_bytes).decode('utf-8')}"
-                except Exception:
-                    pass
+            # 获取发送者的用户信息（头像按发送者只编码一次）
+            msg_user = senders.get(msg_user_id)
+            if msg_user_id not in avatar_cache:
+                avatar_base64 = None
+                if msg_user and msg_user.get("avatar"):
+                    try:
+                        avatar_bytes = msg_user['avatar']
+                        if isinstance(avatar_bytes, bytes):
+                            avatar_base64 = f"data:image/png;base64,{base64.b64encode(avatar_bytes).decode('utf-8')}"
+                    except Exception:
+                        pass
+                avatar_cache[msg_user_id] = avatar_base64
+            avatar_base64 = avatar_cache[msg_user_id]
 
             # 获取发送者用户名
             msg_username = None
@@ -1338,10 +1494,11 @@ async def handle_get_session_messages(sid, data):
             else:
                 from_field = "user" if msg_user_id == user_id else "agent"
 
+            is_recalled = msg.get("is_recalled", False)
             formatted_msg = {
                 "id": str(msg["id"]),
                 "from": from_field,
-                "text": "[消息已撤回]" if msg.get("is_recalled") else msg["message"],
+                "text": "[消息已撤回]" if is_recalled else msg["message"],
                 "time": _format_time(msg["created_at"]),
                 "created_at": created_at_str,
                 "userId": msg_user_id,
@@ -1352,6 +1509,8 @@ async def handle_get_session_messages(sid, data):
                 "is_edited": msg.get("is_edited", False),
                 "edited_at": msg.get("edited_at").isoformat() if msg.get("edited_at") else None,
                 "reply_to_message_id": msg.get("reply_to_message_id"),
+                "rich": None if is_recalled else _rich_text_for_message(msg.get("message_type"), msg["message"]),
+                "link_previews": [] if is_recalled else link_previews.get(msg["id"], []),
             }
 
             # 如果存在引用消息，添加引用消息摘要
@@ -1360,15 +1519,42 @@ async def handle_get_session_messages(sid, data):
                 reply_info = await _get_reply_message_info(reply_to_message_id)
                 if reply_info:
                     formatted_msg["reply_to_message"] = reply_info
+            return formatted_msg
 
-            formatted_messages.append(formatted_msg)
+        formatted_messages = [await _format_message(msg) for msg in messages]
+        changes = [await _format_message(msg) for msg in modified]
 
-        return {"success": True, "messages": formatted_messages}
+        return {
+            "success": True,
+            "messages": formatted_messages,
+            "changes": changes,
+            "session_status": chat_session.get("status"),
+            # 增量同步时本页已满，客户端应以最后一条消息ID继续请求
+            "has_more": after_id is not None and len(messages) >= limit,
+            # 撤回 / 编辑本页已满，客户端应以此作为 changed_from_id 继续请求
+            "changes_next_id": modified[-1]["id"] + 1 if len(modified) >= limit else None,
+        }
     except Exception as e:
         logger.error("WebSocket 获取会话消息失败: %s", e, exc_info=True)
         return {"success": False, "message": "服务器错误"}
 
 
+@app.get("/api/cache/stats")
+async def cache_stats_api(request: Request) -> Dict[str, Any]:
+    """
+    用户资料 / VIP / 头像读穿缓存、富文本缓存、链接预览缓存、机器人回复缓存与消息去重记录的命中统计。
+    仅客服 / 管理员可访问（请求头鉴权，见 _authenticate_request）。
+    """
+    await _authenticate_request(request, roles=AGENT_ROLES)
+    return {
+        "success": True,
+        "caches": db.cache_stats() + [
+            rich_text_cache.stats(), link_preview_service.stats(), bot_reply_service.stats(),
+            sent_message_cache.stats(),
+        ],
+    }
+
+
 @app.get("/api/health")
 async def health() -> Dict[str, str]:
     """健康检查接口。"""
@@ -1409,7 +1595,7 @@ async def send_verification_code_api(request: Request) -> Dict[str, Any]:
     if not validate_email(email):
         raise HTTPException(status_code=400, detail="邮箱格式不正确")
 
-    existing = await db.get_user_by_email(email)
+    existing = await db.get_user_fields(email=email, fields=("id",))
     if mode == "login":
         if not existing:
             raise HTTPException(
@@ -1462,7 +1648,7 @@ async def register_api(request: Request) -> Dict[str, Any]:
         role = 'user'  # 默认值
 
     # 已存在检查
-    if await db.get_user_by_email(email):
+    if await db.get_user_fields(email=email, fields=("id",)):
         raise HTTPException(status_code=400, detail="该邮箱已被注册")
 
     # 写库：AsyncDatabaseManager 会负责密码哈希
@@ -1477,14 +1663,14 @@ async def register_api(request: Request) -> Dict[str, Any]:
     vip_row = await db.get_user_vip_info(user_row["id"]) if role == 'user' else None
     vip = _vip_dict_from_row(vip_row) if vip_row else {}
     user = _user_dict_with_avatar(user_row)
-    token = generate_token(email)
+    tokens = generate_token_pair(user_row)
 
     logger.info("用户 %s 注册成功，ID: %s, 角色: %s", user_row.get("username"), user_row.get("id"), role)
 
     return {
         "success": True,
         "message": "注册成功",
-        "token": token,
+        **tokens,
         "user": user,
         "vip": vip,
     }
@@ -1508,9 +1694,11 @@ async def login_api(request: Request) -> Dict[str, Any]:
     if not verification_manager.verify_code(email, code):
         raise HTTPException(status_code=400, detail="验证码错误或已过期")
 
-    user_row = await db.get_user_by_email(email)
-    if not user_row:
+    # 快速路径：一次查询取回用户与 VIP 信息，不读取头像大字段
+    result = await db.get_user_with_vip(email=email, include_password=True)
+    if not result:
         raise HTTPException(status_code=400, detail="邮箱或密码错误")
+    user_row = result["user"]
 
     stored_password = user_row.get("password", "")
     try:
@@ -1524,17 +1712,16 @@ async def login_api(request: Request) -> Dict[str, Any]:
         logger.error("密码验证异常：%s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="登录失败，请稍后重试")
 
-    vip_row = await db.get_user_vip_info(user_row["id"])
-    vip = _vip_dict_from_row(vip_row)
-    user = _user_dict_with_avatar(user_row)
-    token = generate_token(email)
+    vip = _vip_dict_from_row(result["vip"])
+    user = _user_dict_with_avatar_ref(user_row)
+    tokens = generate_token_pair(user_row)
 
     logger.info("用户 %s 登录成功，ID: %s", user_row.get("username"), user_row.get("id"))
 
     return {
         "success": True,
         "message": "登录成功",
-        "token": token,
+        **tokens,
         "user": user,
         "vip": vip,
     }
@@ -1555,7 +1742,7 @@ async def forgot_password_api(request: Request) -> Dict[str, Any]:
         raise HTTPException(status_code=400, detail="邮箱格式不正确")
 
     # 检查用户是否存在
-    user_row = await db.get_user_by_email(email)
+    user_row = await db.get_user_fields(email=email, fields=("id",))
     if not user_row:
         # 为了安全，不透露用户是否存在，统一返回成功消息
         logger.warning("忘记密码请求：用户不存在 email=%s", email)
@@ -1685,13 +1872,13 @@ async def check_token_api(request: Request) -> Dict[str, Any]:
     if not email:
         raise HTTPException(status_code=401, detail="Token 无效")
 
-    user_row = await db.get_user_by_email(email)
-    if not user_row:
+    # 自动登录快速路径：一次轻量查询，头像按引用返回，由客户端按版本缓存
+    result = await db.get_user_with_vip(email=email)
+    if not result:
         raise HTTPException(status_code=401, detail="用户不存在")
 
-    vip_row = await db.get_user_vip_info(user_row["id"])
-    vip = _vip_dict_from_row(vip_row)
-    user = _user_dict_with_avatar(user_row)
+    vip = _vip_dict_from_row(result["vip"])
+    user = _user_dict_with_avatar_ref(result["user"])
 
     return {
         "success": True,
@@ -1701,6 +1888,64 @@ async def check_token_api(request: Request) -> Dict[str, Any]:
     }
 
 
+@app.get("/api/user/avatar/{user_id}")
+async def get_user_avatar_api(user_id: int, request: Request) -> Response:
+    """
+    下载用户头像二进制。
+
+    地址由 login / check_token 返回的 avatar_url 给出，v 参数为头像版本；需要登录（请求头鉴权），
+    用户ID连续可枚举，不能匿名下载。同一版本的内容不会变化，因此允许客户端私有缓存，并支持 If-None-Match 协商。
+    """
+    await _authenticate_request(request)
+    row = await db.get_user_avatar(user_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="用户不存在")
+
+    avatar_bytes = row.get("avatar")
+    if isinstance(avatar_bytes, memoryview):
+        avatar_bytes = avatar_bytes.tobytes()
+    if not avatar_bytes:
+        avatar_bytes = get_default_avatar()
+    if not avatar_bytes:
+        raise HTTPException(status_code=404, detail="头像不存在")
+
+    updated_at = row.get("avatar_updated_at")
+    etag = f'"{user_id}-{int(updated_at.timestamp()) if updated_at else 0}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=avatar_bytes, media_type=_detect_image_type(avatar_bytes), headers=headers)
+
+
+@app.post("/api/refresh_token")
+async def refresh_token_api(request: Request) -> Dict[str, Any]:
+    """
+    使用 refresh token 换取新的 access token（同时轮换 refresh token）。
+    Request JSON: { refresh_token }
+
+    仅在此处查库比对令牌版本：修改/重置密码后旧的 refresh token 立即失效。
+    """
+    data = await request.json()
+    refresh_token = str(data.get("refresh_token", "")).strip()
+    payload = verify_refresh_token(refresh_token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="登录已过期，请重新登录")
+
+    user_row = await db.get_user_fields(
+        payload.get("user_id"), fields=("id", "email", "role", "token_version")
+    )
+    if not user_row or user_row.get("email") != payload.get("email"):
+        raise HTTPException(status_code=401, detail="用户不存在")
+
+    if int(user_row.get("token_version", 0) or 0) != int(payload.get("ver", 0) or 0):
+        raise HTTPException(status_code=401, detail="登录已失效，请重新登录")
+
+    return {
+        "success": True,
+        **generate_token_pair(user_row),
+    }
+
+
 @app.get("/api/announcement/latest")
 async def get_latest_announcement_api() -> Dict[str, Any]:
     """获取最新公告。"""
@@ -1740,8 +1985,8 @@ async def change_password_api(request: Request) -> Dict[str, Any]:
     if not validate_password(new_password, min_length=8):
         raise HTTPException(status_code=400, detail="新密码至少8位，需包含至少一个字母和一个符号")
 
-    # 获取用户信息
-    user_row = await db.get_user_by_email(email)
+    # 获取用户信息（只需校验密码，不读取头像）
+    user_row = await db.get_user_fields(email=email, fields=("id", "email", "password"))
     if not user_row:
         raise HTTPException(status_code=404, detail="用户不存在")
 
@@ -1782,11 +2027,15 @@ async def change_password_api(request: Request) -> Dict[str, Any]:
 async def purchase_vip_api(request: Request) -> Dict[str, Any]:
     """
     购买会员套餐。
-    Request JSON: { user_id, card: {...} }
+    Request JSON: { user_id, card: {...}, idempotency_key? }
+    idempotency_key 也可以通过 Idempotency-Key 请求头传入；同一键的重试请求不会重复扣费。
     """
     data = await request.json()
     user_id = int(data.get("user_id", 0) or 0)
     card = data.get("card") or {}
+    idempotency_key = str(
+        data.get("idempotency_key") or request.headers.get("idempotency-key") or ""
+    ).strip() or None
 
     if not user_id:
         raise HTTPException(status_code=400, detail="未登录，无法购买会员")
@@ -1794,40 +2043,158 @@ async def purchase_vip_api(request: Request) -> Dict[str, Any]:
     cost = int(card.get("diamonds", 0) or 0)
     if cost <= 0:
         raise HTTPException(status_code=400, detail="无效的会员套餐")
+    if idempotency_key and len(idempotency_key) > 64:
+        raise HTTPException(status_code=400, detail="幂等键过长")
 
-    vip_row = await db.get_user_vip_info(user_id)
-    vip = _vip_dict_from_row(vip_row)
-    diamonds = int(vip.get("diamonds", 0) or 0)
-    if diamonds < cost:
+    # 扣费、续期与读回最新状态在一个事务内完成，余额不足由条件更新判断
+    result = await membership_service.purchase_membership(user_id, card, idempotency_key)
+    status = result.get("status")
+    if status == "insufficient":
         raise HTTPException(
             status_code=400,
             detail="钻石不足，请先充值钻石后再购买会员"
         )
-
-    # 调用服务层进行扣费与有效期更新
-    success, new_expiry = await membership_service.purchase_membership(user_id, card)
-    if not success:
+    if status not in ("ok", "duplicate"):
         raise HTTPException(
             status_code=500,
             detail="会员购买失败，请稍后重试"
         )
 
-    # 重新查询最新 VIP 信息
-    vip_row = await db.get_user_vip_info(user_id)
-    vip = _vip_dict_from_row(vip_row)
-    
-    # 推送 VIP 状态和钻石余额更新
-    await ws_manager.push_vip_status_update(user_id, vip)
-    diamonds = int(vip.get("diamonds", 0) or 0)
-    await ws_manager.push_diamond_balance_update(user_id, diamonds)
+    vip = _vip_dict_from_row(result.get("vip"))
+
+    # 推送 VIP 状态和钻石余额更新（重复请求未产生变化，无需推送）
+    if status == "ok":
+        await ws_manager.push_vip_status_update(user_id, vip)
+        diamonds = int(vip.get("diamonds", 0) or 0)
+        await ws_manager.push_diamond_balance_update(user_id, diamonds)
     
     return {
         "success": True,
         "message": "会员购买成功",
         "vip": vip,
+        "duplicate": status == "duplicate",
     }
 
 
+# ==================== 聊天文件接口 ====================
+
+def _file_store_error_response(e: FileStoreError) -> JSONResponse:
+    content: Dict[str, Any] = {"success": False, "message": str(e)}
+    if e.offset is not None:
+        content["offset"] = e.offset
+    return JSONResponse(status_code=e.status, content=content)
+
+
+def _upload_state_response(state: Dict[str, Any]) -> Dict[str, Any]:
+    """上传任务状态；完成后附带文件引用（file_id / url），消息中只发送该地址"""
+    file_meta = state.get("file")
+    file_info = None
+    if file_meta:
+        file_info = {
+            "file_id": file_meta["file_id"],
+            "filename": file_meta["filename"],
+            "size": file_meta["size"],
+            "sha256": file_meta["sha256"],
+            "mime_type": file_meta["mime_type"],
+            "url": f"/api/files/{file_meta['file_id']}/{quote(file_meta['filename'])}",
+        }
+    return {
+        "success": True,
+        "upload_id": state["upload_id"],
+        "offset": state["offset"],
+        "size": state["size"],
+        "chunk_size": FILE_UPLOAD_CHUNK_SIZE,
+        "completed": file_info is not None,
+        "file": file_info,
+    }
+
+
+@app.post("/api/files/uploads")
+async def create_file_upload_api(request: Request):
+    """
+    创建（或恢复）分块上传任务。
+    Request JSON: { filename, size, sha256 }，鉴权见 _authenticate_request
+    返回已上传的偏移量 offset：同一用户对同一文件重复创建时从该偏移量继续上传。
+    未完成的上传任务数或总大小超出上限时返回 429。
+    """
+    identity = await _authenticate_request(request)
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="请求体不是有效的 JSON")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="参数格式错误")
+    try:
+        size = int(data.get("size", 0) or 0)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="参数类型错误")
+    try:
+        state = await asyncio.to_thread(
+            file_store.create_upload,
+            identity["user_id"], str(data.get("filename") or ""), size, str(data.get("sha256") or ""),
+        )
+    except FileStoreError as e:
+        return _file_store_error_response(e)
+    return _upload_state_response(state)
+
+
+@app.get("/api/files/uploads/{upload_id}")
+async def get_file_upload_api(upload_id: str, request: Request):
+    """查询上传任务的当前偏移量（断线后续传前调用）"""
+    identity = await _authenticate_request(request)
+    try:
+        state = await asyncio.to_thread(file_store.get_upload, upload_id, identity["user_id"])
+    except FileStoreError as e:
+        return _file_store_error_response(e)
+    return _upload_state_response(state)
+
+
+@app.patch("/api/files/uploads/{upload_id}")
+async def upload_file_chunk_api(upload_id: str, request: Request):
+    """
+    上传一块数据：请求头 Upload-Offset 为该块在文件中的起始位置，请求体为原始字节（不超过 chunk_size）。
+    偏移量与服务端不一致时返回 409 与服务端当前的 offset；最后一块写入后校验 sha256 并返回文件引用。
+    """
+    identity = await _authenticate_request(request)
+    try:
+        offset = int(request.headers.get("upload-offset", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="缺少 Upload-Offset 请求头")
+
+    body = bytearray()
+    async for piece in request.stream():
+        body.extend(piece)
+        if len(body) > FILE_UPLOAD_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail="分块过大")
+    try:
+        state = await asyncio.to_thread(
+            file_store.write_chunk, upload_id, identity["user_id"], offset, bytes(body)
+        )
+    except FileStoreError as e:
+        return _file_store_error_response(e)
+    return _upload_state_response(state)
+
+
+@app.get("/api/files/{file_id}/{filename}")
+async def download_file_api(file_id: str, filename: str) -> FileResponse:
+    """
+    下载已上传的文件。
+
+    file_id 为上传完成时随机生成的不可猜测标识，地址即访问凭证（客服工作台直接以链接打开）；
+    路径中的文件名仅用于展示，实际文件名以上传时记录的为准。内容不会变化，允许长期缓存。
+    """
+    _ = filename
+    file_meta = await asyncio.to_thread(file_store.get_file, file_id)
+    if not file_meta:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return FileResponse(
+        file_meta["path"],
+        media_type=file_meta["mime_type"],
+        filename=file_meta["filename"],
+        headers={"Cache-Control": "private, max-age=31536000, immutable"},
+    )
+
+
 # ==================== 客服系统专用接口 ====================
 
 @app.post("/api/customer_service/register")
@@ -1876,7 +2243,7 @@ async def customer_service_register_api(request: Request) -> Dict[str, Any]:
             raise HTTPException(status_code=400, detail="密码长度不能超过50个字符")
 
         # 已存在检查
-        existing = await db.get_user_by_email(email)
+        existing = await db.get_user_fields(email=email, fields=("id",))
         if existing:
             raise HTTPException(status_code=400, detail="该邮箱已被注册，请直接登录")
 
@@ -1892,14 +2259,14 @@ async def customer_service_register_api(request: Request) -> Dict[str, Any]:
             raise HTTPException(status_code=500, detail="注册成功但未能读取用户信息")
 
         user = _user_dict_with_avatar(user_row)
-        token = generate_token(email)
+        tokens = generate_token_pair(user_row)
 
         logger.info("客服 %s 注册成功，ID: %s", user_row.get("username"), user_row.get("id"))
 
         return {
             "success": True,
             "message": "注册成功",
-            "token": token,
+            **tokens,
             "user": user,
         }
     except HTTPException:
@@ -1986,7 +2353,7 @@ async def customer_service_login_api(request: Request) -> Dict[str, Any]:
         clear_attempts(email)
 
         user = _user_dict_with_avatar(user_row)
-        token = generate_token(email)
+        tokens = generate_token_pair(user_row)
         
         # 自动设置客服为在线状态
         user_id = user_row.get("id")
@@ -1998,7 +2365,7 @@ async def customer_service_login_api(request: Request) -> Dict[str, Any]:
         return {
             "success": True,
             "message": "登录成功",
-            "token": token,
+            **tokens,
             "user": user,
         }
     except HTTPException:
@@ -2041,6 +2408,99 @@ async def customer_service_verify_token_api(request: Request) -> Dict[str, Any]:
     }
 
 
+@app.get("/api/customer_service/knowledge_base")
+async def get_knowledge_base_api(request: Request) -> Response:
+    """
+    下载编译好的客服知识库匹配索引。
+
+    响应体在知识库变化时才重新生成；ETag 随版本与内容变化，客户端用 If-None-Match 协商，
+    未变化时返回 304。
+    """
+    # 数据文件变化时需要重新编译，放到线程中执行，避免阻塞事件循环
+    snapshot = await asyncio.to_thread(knowledge_base_store.get)
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+
+def _bot_questions(data: Any) -> Tuple[Optional[list], Optional[str]]:
+    """从请求中取出问题列表：单个 question 或批量 questions，返回 (问题列表, 错误信息)"""
+    if not isinstance(data, dict):
+        return None, "请求格式错误"
+    if "questions" in data:
+        questions = data.get("questions")
+        if not isinstance(questions, list) or not all(isinstance(q, str) for q in questions):
+            return None, "questions 必须是字符串列表"
+        if len(questions) > BOT_REPLY_MAX_BATCH:
+            return None, f"单次最多 {BOT_REPLY_MAX_BATCH} 个问题"
+        return questions, None
+    question = data.get("question")
+    if not isinstance(question, str):
+        return None, "缺少 question 参数"
+    return [question], None
+
+
+async def _bot_reply(data: Any) -> Dict[str, Any]:
+    """bot_reply 的 HTTP / WebSocket 共用逻辑"""
+    questions, error = _bot_questions(data)
+    if error:
+        return {"success": False, "message": error}
+    add_greeting = bool(data.get("add_greeting", True))
+    # 知识库文件变化时需要重新编译，放到线程中执行，避免阻塞事件循环
+    results = await asyncio.to_thread(bot_reply_service.reply_many, questions, add_greeting)
+    if "questions" in data:
+        return {"success": True, "results": results}
+    return {"success": True, **results[0]}
+
+
+@app.post("/api/customer_service/bot_reply")
+async def bot_reply_api(request: Request) -> Dict[str, Any]:
+    """
+    机器人自动回复。
+    Request JSON: { question, add_greeting? } 或批量 { questions: [...], add_greeting? }，鉴权见 _authenticate_request
+
+    返回 reply（带随机语气的回复）、answer、topic、score、need_human；
+    need_human 为 True 时应引导用户转人工客服。
+    """
+    await _authenticate_request(request)
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="请求体不是有效的 JSON")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="参数格式错误")
+    result = await _bot_reply(data)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+@app.get("/api/customer_service/bot_stats")
+async def bot_stats_api(request: Request) -> Dict[str, Any]:
+    """机器人分流统计：各主题命中次数、转人工次数与最常转人工的问题（含用户原话，仅客服 / 管理员可查看）"""
+    await _authenticate_request(request, roles=AGENT_ROLES)
+    return {"success": True, **bot_reply_service.topic_stats()}
+
+
+@sio.on("bot_reply")
+async def handle_bot_reply(sid, data):
+    """
+    WebSocket 事件：机器人自动回复
+    data: { user_id, token, question, add_greeting? } 或批量 { user_id, token, questions: [...], add_greeting? }
+    """
+    try:
+        if not isinstance(data, dict):
+            return {"success": False, "message": "参数格式错误"}
+        identity, error = await _authenticate(str(data.get("token", "")).strip(), data.get("user_id"))
+        if not identity:
+            return {"success": False, "message": error}
+        return await _bot_reply(data)
+    except Exception as e:
+        logger.error(f"机器人回复失败: {e}", exc_info=True)
+        return {"success": False, "message": "机器人回复失败"}
+
+
 @sio.on("link_preview")
 async def handle_link_preview(sid, data):
     """
@@ -2059,7 +2519,7 @@ async def handle_link_preview(sid, data):
             if not payload:
                 return {"success": False, "message": "Token 无效或已过期"}
         
-        preview = await fetch_link_preview(url, timeout=5.0)
+        preview = await link_preview_service.get_preview(url)
         if not preview.get("success"):
             preview = get_simple_preview(url)
         
@@ -2098,23 +2558,53 @@ async def handle_process_rich_text(sid, data):
                 if int(user_id) != int(payload.get("user_id", 0)):
                     return {"success": False, "message": "Token 与用户ID不匹配"}
         
-        result = process_rich_text(content, user_id)
+        result = resolve_mentions(rich_text_cache.get(content), db.username_index)
         return {"success": True, **result}
     except Exception as e:
         logger.error(f"处理富文本失败: {e}", exc_info=True)
         return {"success": False, "message": "处理富文本时出错"}
 
 
-@sio.on("send_message")
-async def handle_send_message(sid, data):
+@sio.on("mention_suggest")
+async def handle_mention_suggest(sid, data):
     """
-    WebSocket 发送消息：
-    data: {
-      session_id, from_user_id, to_user_id?, message, role: 'user' | 'agent', token, message_type?, reply_to_message_id?
-    }
-    返回给回调：{success, message_id?, time?, message?}
+    WebSocket 事件：@提及 用户名补全（仅客服 / 管理员）
+    data: { user_id, prefix, limit?, token }
+
+    直接查询内存中的用户名前缀索引，不访问 users 表；结果按用户名排序。
+    """
+    try:
+        user_id = data.get("user_id")
+        prefix = str(data.get("prefix", "")).strip()
+        token = str(data.get("token", "")).strip()
+
+        if not user_id or not token:
+            return {"success": False, "message": "参数缺失"}
+
+        identity, error = await _authenticate(token, user_id, roles=AGENT_ROLES)
+        if not identity:
+            return {"success": False, "message": error}
+
+        try:
+            limit = int(data.get("limit") or 10)
+        except (TypeError, ValueError):
+            limit = 10
+        limit = max(1, min(limit, MENTION_SUGGEST_MAX_LIMIT))
+        return {"success": True, "users": db.username_index.complete(prefix, limit)}
+    except Exception as e:
+        logger.error(f"用户名补全失败: {e}", exc_info=True)
+        return {"success": False, "message": "服务器错误"}
+
+
+async def _send_message(data: Dict[str, Any], identity: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    写入并推送一条消息（send_message / send_messages 共用）
+
+    identity 为已校验的发送者身份（_send_message_once 已鉴权时传入，不再重复校验 token）。
+    带 client_message_id 的消息已写入过时返回写入失败（retryable），由 _send_message_once 返回首次写入的结果。
     """
     try:
+        client_message_id = _client_message_id(data)
         session_id = str(data.get("session_id", "")).strip()
         from_user_id = data.get("from_user_id")
         to_user_id = data.get("to_user_id")
@@ -2128,17 +2618,10 @@ async def handle_send_message(sid, data):
             return {"success": False, "message": "参数缺失"}
 
         # 校验并解析 Token，确保与发送者匹配
-        payload = verify_token(token)
-        if not payload:
-            return {"success": False, "message": "Token 无效或已过期"}
-
-        sender = await db.get_user_by_id(from_user_id)
-        if not sender:
-            return {"success": False, "message": "发送者不存在"}
-
-        token_email = payload.get("email")
-        if token_email and sender.get("email") != token_email:
-            return {"success": False, "message": "Token 与用户不匹配"}
+        if identity is None:
+            identity, error = await _authenticate(token, from_user_id)
+            if not identity:
+                return {"success": False, "message": error}
 
         chat_session = await db.get_chat_session_by_id(session_id)
         if not chat_session:
@@ -2200,17 +2683,21 @@ async def handle_send_message(sid, data):
             except (ValueError, TypeError):
                 reply_to_id = None
 
+        # 在写入时完成富文本渲染，随消息推送，接收方与历史加载不再重复解析
+        rich = _rich_text_for_message(message_type, message)
+
         message_id = await db.insert_chat_message(
                 session_id=session_id,
                 from_user_id=from_user_id,
                 to_user_id=to_user_id,
                 message=message,
                 message_type=message_type,
-                reply_to_message_id=reply_to_id
+                reply_to_message_id=reply_to_id,
+                client_message_id=client_message_id or None
             )
 
         if not message_id:
-            return {"success": False, "message": "写入消息失败"}
+            return {"success": False, "message": "写入消息失败", "retryable": True}
 
         # 获取消息详情
         message_info = await db.get_message_by_id(message_id)
@@ -2224,7 +2711,9 @@ async def handle_send_message(sid, data):
                     created_at = datetime.utcnow()
 
         # 获取发送者头像和用户名
-        sender_info = await db.get_user_by_id(from_user_id)
+        sender_info = await db.get_user_profile(from_user_id)
+        if sender_info:
+            sender_info["avatar"] = await db.get_user_avatar_data(from_user_id)
         avatar_base64 = None
         username = None
         if sender_info:
@@ -2247,7 +2736,7 @@ async def handle_send_message(sid, data):
                     reply_from_username = None
                     if reply_from_user_id:
                         try:
-                            reply_from_user = await db.get_user_by_id(reply_from_user_id)
+                            reply_from_user = await db.get_user_profile(reply_from_user_id)
                             if reply_from_user:
                                 reply_from_username = reply_from_user.get("username")
                         except Exception:
@@ -2287,36 +2776,142 @@ async def handle_send_message(sid, data):
             "reply_to_message_id": reply_to_id,
             "status": "sent",
             "is_from_self": False,
+            "rich": rich,
         }
         
         if reply_to_message_info:
             payload_data["reply_to_message"] = reply_to_message_info
+        if client_message_id:
+            # 发送方据此把回推的消息与本地乐观展示的消息对应起来
+            payload_data["client_message_id"] = client_message_id
 
         # 使用 WebSocket 管理器推送消息
         if to_user_id:
-            delivered_count = await ws_manager.send_message_to_user(to_user_id, "new_message", payload_data)
+            delivered_count = await ws_manager.push_new_message(to_user_id, payload_data)
             if delivered_count == 0:
                 logger.warning(f"发送给用户 {to_user_id} 的实时消息未送达")
         
         # 也广播给发送者（多设备同步）
         payload_data_with_self = payload_data.copy()
         payload_data_with_self["is_from_self"] = True
-        await ws_manager.send_message_to_user(from_user_id, "new_message", payload_data_with_self)
+        await ws_manager.push_new_message(from_user_id, payload_data_with_self)
+
+        # 消息中含链接时后台抓取预览，完成后通过 message_preview_ready 推送
+        if rich and rich.get("is_rich"):
+            _schedule_link_preview_prefetch(session_id, message_id, message)
+
+        # @到的其他用户（如转介的客服）单独收到 mentioned 通知
+        try:
+            await _notify_mentions(chat_session, rich, payload_data)
+        except Exception as e:
+            logger.error(f"推送提及通知失败: message_id={message_id}, error={e}", exc_info=True)
         
         # 更新会话列表（如果发送者是客服）
         try:
-            sender = await db.get_user_by_id(from_user_id)
-            if sender and sender.get('role') in ['customer_service', 'admin']:
+            if identity["role"] in AGENT_ROLES:
                 sessions = await db.get_agent_sessions(from_user_id, include_pending=False)
                 formatted_sessions = await _format_session_list(sessions)
                 await ws_manager.push_session_list_update(from_user_id, "my", formatted_sessions)
         except Exception as e:
             logger.debug(f"更新会话列表失败（可忽略）: {e}")
         
-        return {"success": True, "message_id": message_id, "time": payload_data["time"]}
+        result = {"success": True, "message_id": message_id, "time": payload_data["time"]}
+        if client_message_id:
+            result["client_message_id"] = client_message_id
+        return result
     except Exception as e:
         logger.error("WebSocket 发送消息失败: %s", e, exc_info=True)
-        return {"success": False, "message": "服务器错误"}
+        return {"success": False, "message": "服务器错误", "retryable": True}
+
+
+def _client_message_id(data: Dict[str, Any]) -> str:
+    return str(data.get("client_message_id") or "").strip()[:64]
+
+
+async def _send_message_once(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    按 (发送者, client_message_id) 去重发送：同一条消息重发时返回首次写入的结果，不重复写入和推送。
+
+    发送者取自 token 校验后的身份。去重键随消息持久化在 sent_message_keys 表中（唯一索引），
+    服务重启或由其他进程处理重发时同样生效；进程内缓存只用于合并并发请求、减少查库。
+    只记录成功结果，失败的消息可以重试。
+    """
+    client_message_id = _client_message_id(data)
+    if not client_message_id:
+        return await _send_message(data)
+
+    identity, error = await _authenticate(str(data.get("token", "")).strip(), data.get("from_user_id"))
+    if not identity:
+        return {"success": False, "message": error}
+
+    failure: Dict[str, Any] = {}
+
+    async def send():
+        sent = await db.get_sent_message(identity["user_id"], client_message_id)
+        if sent:
+            return {
+                "success": True,
+                "message_id": sent["message_id"],
+                "time": _format_time(sent["created_at"]),
+                "client_message_id": client_message_id,
+            }
+        result = await _send_message(data, identity)
+        if result.get("success"):
+            return result
+        failure.update(result)
+        return None
+
+    key = (identity["user_id"], client_message_id)
+    result = await sent_message_cache.get(key, send)
+    if result is not None:
+        return result
+    # 与本次请求并发的同一条消息发送失败时，failure 为空，让客户端稍后重试
+    return failure or {"success": False, "message": "消息发送失败，请重试", "retryable": True}
+
+
+@sio.on("send_message")
+async def handle_send_message(sid, data):
+    """
+    WebSocket 发送消息：
+    data: {
+      session_id, from_user_id, to_user_id?, message, role: 'user' | 'agent', token, message_type?,
+      reply_to_message_id?, client_message_id?
+    }
+    client_message_id 为客户端生成的消息ID，重发同一ID不会重复写入。
+    返回给回调：{success, message_id?, time?, client_message_id?, message?, retryable?}
+    retryable 为 True 表示服务端暂时失败，客户端可以稍后重发。
+    """
+    return await _send_message_once(data)
+
+
+@sio.on("send_messages")
+async def handle_send_messages(sid, data):
+    """
+    WebSocket 批量发送消息（客户端断线重连后补发离线消息）：
+    data: { token, messages: [send_message 的 data（可不带 token）, ...] }
+    按顺序逐条处理；某条暂时失败（retryable）后，其余消息不再处理并同样标记为 retryable，保证会话内顺序。
+    返回给回调：{success, results: [与 messages 一一对应的 send_message 结果]}
+    """
+    try:
+        messages = data.get("messages")
+        if not isinstance(messages, list) or not messages:
+            return {"success": False, "message": "messages 必须是非空列表"}
+        if len(messages) > SEND_MESSAGES_MAX_BATCH:
+            return {"success": False, "message": f"单次最多 {SEND_MESSAGES_MAX_BATCH} 条消息"}
+        token = data.get("token")
+        results = []
+        for item in messages:
+            if results and results[-1].get("retryable"):
+                results.append({"success": False, "message": "前一条消息发送失败", "retryable": True})
+                continue
+            if not isinstance(item, dict):
+                results.append({"success": False, "message": "参数错误"})
+                continue
+            results.append(await _send_message_once(dict(item, token=item.get("token") or token)))
+        return {"success": True, "results": results}
+    except Exception as e:
+        logger.error("WebSocket 批量发送消息失败: %s", e, exc_info=True)
+        return {"success": False, "message": "服务器错误", "retryable": True}
 
 
 # 启动配置
@@ -2332,6 +2927,7 @@ if __name__ == "__main__":
         host=server_host,
         port=server_port,
         reload=debug_mode,
-        log_level="info"
+        log_level="info",
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
     )
 
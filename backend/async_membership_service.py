@@ -3,7 +3,7 @@
 本模块封装了与数据库交互的 VIP / 钻石业务逻辑，供 FastAPI 路由调用：
 - 查询用户 VIP 信息与到期时间
 - 查询/刷新钻石余额与用户基础信息
-- 执行购买会员（扣减钻石并更新有效期）
+- 执行购买会员（原子扣减钻石并更新有效期，支持幂等键）
 
 所有方法都是异步的。
 """
@@ -12,7 +12,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional
 
 from backend.database.async_database_manager import AsyncDatabaseManager
 
@@ -85,26 +85,33 @@ class AsyncMembershipService:
         base = current_expiry if (current_expiry and current_expiry > now) else now
         return base + timedelta(days=int(days))
 
-    async def purchase_membership(self, user_id: int, card_info: dict) -> Tuple[bool, Optional[datetime]]:
-        """购买会员套餐：扣减钻石并更新 VIP，有足够钻石则返回 (True, new_expiry)。"""
-        if not user_id:
-            return False, None
+    async def purchase_membership(
+        self,
+        user_id: int,
+        card_info: dict,
+        idempotency_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """购买会员套餐：扣减钻石并更新 VIP。
+
+        扣费、续期与读回最新状态在数据库中一次完成（新有效期由 SQL 计算），
+        idempotency_key 用于防止客户端重试导致重复扣费。
 
-        vip_info = await self.get_vip_info(user_id)
-        current_expiry = vip_info.vip_expiry if vip_info else None
+        Returns:
+            {"status": "ok" | "duplicate" | "insufficient" | "error", "vip": {...} 或 None}
+        """
+        if not user_id:
+            return {"status": "error", "vip": None}
 
         cost = int(card_info.get("diamonds", 0))
         days = card_info.get("days", None)
 
-        new_expiry = self.calculate_new_vip_expiry(current_expiry, days)
+        # 永久会员使用约定的远未来时间，其余套餐在 SQL 中基于当前有效期叠加
+        fixed_expiry = self.calculate_new_vip_expiry(None, None) if days is None else None
 
-        success = await self.db_manager.consume_diamonds_and_update_vip(
+        return await self.db_manager.purchase_vip(
             user_id=user_id,
             cost=cost,
-            new_expiry=new_expiry,
+            days=None if days is None else int(days),
+            fixed_expiry=fixed_expiry,
+            idempotency_key=idempotency_key,
         )
-        if not success:
-            return False, None
-
-        return True, new_expiry
-
@@ -18,6 +18,78 @@ email_config = {
 SECRET_KEY = os.getenv("SECRET_KEY")
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
 
+# access token 有效期（默认 30 分钟），refresh token 有效期（默认 7 天）
+ACCESS_TOKEN_EXPIRE_SECONDS = int(os.getenv("ACCESS_TOKEN_EXPIRE_SECONDS", 30 * 60))
+REFRESH_TOKEN_EXPIRE_SECONDS = int(os.getenv("REFRESH_TOKEN_EXPIRE_SECONDS", 7 * 24 * 60 * 60))
+
+# ==================== 缓存配置 ====================
+# 用户资料 / VIP 信息读穿缓存：容量上限与过期时间（秒）；头像单独缓存，容量更小
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10000))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", 60))
+AVATAR_CACHE_SIZE = int(os.getenv("AVATAR_CACHE_SIZE", 256))
+# 富文本渲染结果缓存（按消息内容哈希），条目数上限
+RICH_TEXT_CACHE_SIZE = int(os.getenv("RICH_TEXT_CACHE_SIZE", 5000))
+
+# ==================== 链接预览配置 ====================
+# 预览结果缓存：容量、成功结果 TTL、失败结果 TTL（秒）
+LINK_PREVIEW_CACHE_SIZE = int(os.getenv("LINK_PREVIEW_CACHE_SIZE", 2048))
+LINK_PREVIEW_CACHE_TTL = float(os.getenv("LINK_PREVIEW_CACHE_TTL", 3600))
+LINK_PREVIEW_NEGATIVE_TTL = float(os.getenv("LINK_PREVIEW_NEGATIVE_TTL", 120))
+# 单个页面最多读取的字节数（读到 </head> 会提前停止）、请求超时与连接池大小
+LINK_PREVIEW_MAX_BYTES = int(os.getenv("LINK_PREVIEW_MAX_BYTES", 512 * 1024))
+LINK_PREVIEW_TIMEOUT = float(os.getenv("LINK_PREVIEW_TIMEOUT", 5))
+LINK_PREVIEW_MAX_CONNECTIONS = int(os.getenv("LINK_PREVIEW_MAX_CONNECTIONS", 20))
+# 发送消息后后台预抓取：全局并发上限、每条消息最多抓取的链接数
+LINK_PREVIEW_PREFETCH_CONCURRENCY = int(os.getenv("LINK_PREVIEW_PREFETCH_CONCURRENCY", 4))
+LINK_PREVIEW_MAX_PER_MESSAGE = int(os.getenv("LINK_PREVIEW_MAX_PER_MESSAGE", 3))
+
+# ==================== 客服知识库配置 ====================
+# 检查知识库数据文件是否被修改的最小间隔（秒），修改后自动热更新
+KNOWLEDGE_BASE_CHECK_INTERVAL = float(os.getenv("KNOWLEDGE_BASE_CHECK_INTERVAL", 2))
+# 机器人自动回复：按规范化问题缓存匹配结果的条目数、单次批量请求最多的问题数
+BOT_REPLY_CACHE_SIZE = int(os.getenv("BOT_REPLY_CACHE_SIZE", 5000))
+BOT_REPLY_MAX_BATCH = int(os.getenv("BOT_REPLY_MAX_BATCH", 100))
+
+# ==================== @提及配置 ====================
+# 用户名补全单次最多返回的用户数、每条消息最多发送提及通知的用户数
+MENTION_SUGGEST_MAX_LIMIT = int(os.getenv("MENTION_SUGGEST_MAX_LIMIT", 20))
+MENTION_NOTIFY_MAX = int(os.getenv("MENTION_NOTIFY_MAX", 10))
+
+# ==================== 消息发送配置 ====================
+# 已发送消息去重的进程内缓存（持久的去重键在 sent_message_keys 表中，此缓存只减少查库）：条目数上限、保留时间（秒）
+SENT_MESSAGE_DEDUP_SIZE = int(os.getenv("SENT_MESSAGE_DEDUP_SIZE", 20000))
+SENT_MESSAGE_DEDUP_TTL = float(os.getenv("SENT_MESSAGE_DEDUP_TTL", 24 * 3600))
+# 批量发送（send_messages）单次最多的消息条数
+SEND_MESSAGES_MAX_BATCH = int(os.getenv("SEND_MESSAGES_MAX_BATCH", 50))
+
+# ==================== 实时推送配置 ====================
+# 新消息批量推送（支持 new_messages 的客户端）：合并时间窗口（秒）、单批最多消息条数
+NEW_MESSAGES_FLUSH_INTERVAL = float(os.getenv("NEW_MESSAGES_FLUSH_INTERVAL", 0.02))
+NEW_MESSAGES_MAX_BATCH = int(os.getenv("NEW_MESSAGES_MAX_BATCH", 50))
+# 允许客户端协商 msgpack 二进制序列化（附件以原始字节传输）；需要安装 msgpack
+SOCKETIO_MSGPACK_ENABLED = os.getenv("SOCKETIO_MSGPACK_ENABLED", "true").lower() in ("1", "true", "yes")
+# 帧压缩：声明 "deflate" 的连接（桌面客户端），达到阈值（字节）的帧以 zlib 压缩；级别 1 最快、9 最小
+# 同一阈值也用于长轮询响应的 HTTP 压缩
+SOCKETIO_COMPRESSION_ENABLED = os.getenv("SOCKETIO_COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+SOCKETIO_COMPRESSION_THRESHOLD = int(os.getenv("SOCKETIO_COMPRESSION_THRESHOLD", 1024))
+SOCKETIO_COMPRESSION_LEVEL = int(os.getenv("SOCKETIO_COMPRESSION_LEVEL", 1))
+# 浏览器（网页工作台）的 WebSocket permessage-deflate，由 uvicorn 协商
+WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() in ("1", "true", "yes")
+
+# ==================== 文件上传配置 ====================
+# 聊天文件存储目录（staging 子目录存放上传中的数据，files 子目录存放校验通过的文件）
+FILE_UPLOAD_DIR = os.getenv(
+    "FILE_UPLOAD_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
+)
+# 单个文件大小上限（字节）、单次请求最多上传的分块大小（字节）
+FILE_UPLOAD_MAX_SIZE = int(os.getenv("FILE_UPLOAD_MAX_SIZE", 100 * 1024 * 1024))
+FILE_UPLOAD_CHUNK_SIZE = int(os.getenv("FILE_UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# 暂存区中超过此时长未继续上传的任务会被清理（秒）
+FILE_UPLOAD_STAGING_TTL = float(os.getenv("FILE_UPLOAD_STAGING_TTL", 24 * 3600))
+# 每个用户未完成的上传任务数、未完成任务声明的总大小（字节）上限，超出时拒绝创建新任务
+FILE_UPLOAD_MAX_PENDING_PER_USER = int(os.getenv("FILE_UPLOAD_MAX_PENDING_PER_USER", 10))
+FILE_UPLOAD_MAX_PENDING_BYTES_PER_USER = int(os.getenv("FILE_UPLOAD_MAX_PENDING_BYTES_PER_USER", 1024 * 1024 * 1024))
+
 # ==================== 前端配置 ====================
 FRONTEND_BASE_URL = os.getenv("FRONTEND_BASE_URL")
 
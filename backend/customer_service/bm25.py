@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+BM25 排序引擎
+中文按相邻二字切分（不依赖分词词典），英文数字按连续词切分；
+主题的关键词、示例问题、答案分字段加权计入词频，按词存储稀疏倒排表，打分用 NumPy 向量化计算
+"""
+
+import re
+from collections import Counter
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[\u4e00-\u9fff]+|[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """切分文本：中文连续片段产出二字组（单字片段保留单字），英文 / 数字产出整词"""
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if "\u4e00" <= run[0] <= "\u9fff" and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25 倒排打分索引（构建后只读，可在多线程间共享）。
+
+    按词存储倒排表（CSR）：词 t 的分量在 values[indptr[t]:indptr[t + 1]]，对应文档为 docs 中同一区间，
+    分量已含 idf 与长度归一化；查询得分即查询词倒排表按文档累加。
+    只存非零分量，内存与（主题数 × 每个主题的词数）成正比，不随词表与主题数的乘积增长。
+
+    归一化用的最高分：词表内的词取它能贡献的最大分量 upper[t]；词表外的词按“只在一个假想文档中
+    出现”的 idf 计入，这样与知识库无关的问题（大部分词都不在词表中）得分比例很低。
+    """
+
+    def __init__(
+        self,
+        vocabulary: Dict[str, int],
+        doc_count: int,
+        indptr: np.ndarray,
+        docs: np.ndarray,
+        values: np.ndarray,
+    ):
+        self.vocabulary = vocabulary
+        self.doc_count = doc_count
+        self.indptr = indptr
+        self.docs = docs
+        self.values = values
+        self.upper = np.zeros(len(vocabulary), dtype=np.float32)
+        nonempty = np.flatnonzero(np.diff(indptr))
+        if nonempty.size:
+            self.upper[nonempty] = np.maximum.reduceat(values, indptr[nonempty])
+        self.unknown_weight = float(np.log1p((doc_count + 0.5) / 0.5))
+        # 倒排表各分量的 (词, 文档) 组合键 词 × 文档数 + 文档，整体升序，用于二分查找某个词是否出现在某个文档中
+        self.keys = np.repeat(np.arange(len(vocabulary), dtype=np.int64) * doc_count, np.diff(indptr)) + docs
+
+    @property
+    def nbytes(self) -> int:
+        """倒排表占用的字节数"""
+        return self.indptr.nbytes + self.docs.nbytes + self.values.nbytes + self.upper.nbytes + self.keys.nbytes
+
+    @classmethod
+    def build(
+        cls,
+        documents: Sequence[Iterable[Tuple[str, float]]],
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> "BM25Index":
+        """
+        由文档构建索引。
+
+        每个文档是若干 (文本, 字段权重) 组成的序列；词频按字段权重累加（BM25F 的简化形式）。
+        """
+        vocabulary: Dict[str, int] = {}
+        doc_tfs: List[Dict[int, float]] = []
+        doc_lengths: List[float] = []
+        for fields in documents:
+            tf: Dict[int, float] = {}
+            length = 0.0
+            for text, weight in fields:
+                for token in tokenize(text):
+                    term = vocabulary.setdefault(token, len(vocabulary))
+                    tf[term] = tf.get(term, 0.0) + weight
+                    length += weight
+            doc_tfs.append(tf)
+            doc_lengths.append(length)
+
+        n_docs = len(doc_tfs)
+        nnz = sum(len(tf) for tf in doc_tfs)
+        terms = np.empty(nnz, dtype=np.int64)
+        docs = np.empty(nnz, dtype=np.int32)
+        values = np.empty(nnz, dtype=np.float32)
+        if nnz:
+            df = np.zeros(len(vocabulary), dtype=np.float32)
+            for tf in doc_tfs:
+                df[list(tf)] += 1
+            idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+            avg_length = (sum(doc_lengths) / n_docs) or 1.0
+            pos = 0
+            for doc, tf in enumerate(doc_tfs):
+                if not tf:
+                    continue
+                end = pos + len(tf)
+                doc_terms = np.fromiter(tf.keys(), dtype=np.int64, count=len(tf))
+                freqs = np.fromiter(tf.values(), dtype=np.float32, count=len(tf))
+                norm = k1 * (1 - b + b * doc_lengths[doc] / avg_length)
+                terms[pos:end] = doc_terms
+                docs[pos:end] = doc
+                values[pos:end] = idf[doc_terms] * freqs * (k1 + 1) / (freqs + norm)
+                pos = end
+        # 按词排序（稳定排序，同一词内文档保持升序）
+        order = np.argsort(terms, kind="stable")
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=indptr[1:])
+        return cls(vocabulary, n_docs, indptr, docs[order], values[order])
+
+    def _postings(self, term_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """取出若干词（可重复）的倒排表，返回 (每个词的倒排长度, 拼接后在 docs / values 中的下标)"""
+        ids = np.asarray(term_ids, dtype=np.int64)
+        starts = self.indptr[ids]
+        lengths = self.indptr[ids + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(int(lengths.sum()), dtype=np.int64) + np.repeat(starts - offsets, lengths)
+        return lengths, positions
+
+    def _accumulate(self, queries: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        解析查询（每个查询内的词去重，词频作为权重），一次取出全部查询词的倒排表按 (查询, 文档) 累加。
+
+        返回 (queries × 文档 得分矩阵, 各查询可能达到的最高分, 各查询去重后的词数, 词表内的词编号, 词所属的查询)
+        """
+        bounds = np.zeros(len(queries), dtype=np.float32)
+        distinct = np.ones(len(queries), dtype=np.float64)
+        term_ids: List[int] = []
+        term_counts: List[int] = []
+        term_rows: List[int] = []
+        for row, query in enumerate(queries):
+            counts = Counter(tokenize(query))
+            distinct[row] = max(len(counts), 1)
+            unknown = 0
+            for token, count in counts.items():
+                term = self.vocabulary.get(token)
+                if term is None:
+                    unknown += count
+                else:
+                    term_ids.append(term)
+                    term_counts.append(count)
+                    term_rows.append(row)
+            bounds[row] = unknown * self.unknown_weight
+        ids = np.asarray(term_ids, dtype=np.int64)
+        rows = np.asarray(term_rows, dtype=np.int64)
+        if not term_ids:
+            return np.zeros((len(queries), self.doc_count), dtype=np.float32), bounds, distinct, ids, rows
+        counts = np.asarray(term_counts, dtype=np.float32)
+        bounds += np.bincount(rows, weights=self.upper[ids] * counts, minlength=len(queries)).astype(np.float32)
+        lengths, positions = self._postings(ids)
+        cells = np.repeat(rows * self.doc_count, lengths) + self.docs[positions]
+        weights = self.values[positions]
+        if max(term_counts) > 1:
+            weights = weights * np.repeat(counts, lengths)
+        scores = np.bincount(cells, weights=weights, minlength=len(queries) * self.doc_count)
+        return scores.astype(np.float32).reshape(len(queries), self.doc_count), bounds, distinct, ids, rows
+
+    def score(self, query: str) -> Tuple[np.ndarray, float]:
+        """返回 (各文档得分, 该查询可能达到的最高分)"""
+        scores, bounds = self.score_many([query])
+        return scores[0], float(bounds[0])
+
+    def score_many(self, queries: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """批量打分：返回 (queries × 文档 得分矩阵, 各查询可能达到的最高分)"""
+        scores, bounds, _, _, _ = self._accumulate(queries)
+        return scores, bounds
+
+    def rank_many(
+        self,
+        queries: Sequence[str],
+        candidates: Optional[Sequence[Sequence[int]]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        批量选出每个查询的最佳文档，返回 (最佳文档, 得分占最高分的比例, 词覆盖率)。
+
+        candidates[i] 非空时只在这些文档（可重复、无需有序）中选，否则在全部文档中选；同分时取序号小的文档。
+        词覆盖率为查询中的词（去重）出现在最佳文档中的比例。
+        """
+        n = len(queries)
+        scores, bounds, distinct, ids, rows = self._accumulate(queries)
+        if not self.doc_count:
+            return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.float32), np.zeros(n)
+        best = scores.argmax(axis=1)
+        if candidates:
+            lengths = np.fromiter(map(len, candidates), dtype=np.int64, count=n)
+            total = int(lengths.sum())
+            if total:
+                docs = np.fromiter(chain.from_iterable(candidates), dtype=np.int64, count=total)
+                owners = np.repeat(np.arange(n), lengths)
+                # 按 (查询, 得分降序, 文档升序) 排序，每个查询排在最前的候选即为最佳
+                order = np.lexsort((docs, -scores[owners, docs], owners))
+                owners, docs = owners[order], docs[order]
+                first = np.ones(total, dtype=bool)
+                first[1:] = owners[1:] != owners[:-1]
+                best[owners[first]] = docs[first]
+        best_scores = scores[np.arange(n), best]
+        confidences = np.divide(best_scores, bounds, out=np.zeros_like(best_scores), where=bounds > 0)
+        if not ids.size or not self.keys.size:
+            return best, confidences, np.zeros(n)
+        # 每个查询词的 (词, 最佳文档) 组合键在倒排表中二分查找，统计命中最佳文档的词数
+        targets = ids * self.doc_count + best[rows]
+        found = self.keys[np.minimum(np.searchsorted(self.keys, targets), self.keys.size - 1)] == targets
+        hits = np.bincount(rows, weights=found, minlength=n)
+        return best, confidences, hits / distinct
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可 JSON 序列化的字典（按词存储非零分量）"""
+        terms = [""] * len(self.vocabulary)
+        for token, term in self.vocabulary.items():
+            terms[term] = token
+        postings = []
+        for term in range(len(terms)):
+            start, end = int(self.indptr[term]), int(self.indptr[term + 1])
+            postings.append([
+                [int(doc), round(float(value), 6)]
+                for doc, value in zip(self.docs[start:end].tolist(), self.values[start:end].tolist())
+            ])
+        return {"doc_count": self.doc_count, "terms": terms, "postings": postings}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BM25Index":
+        """由 to_dict() 的结果恢复索引"""
+        terms = data["terms"]
+        postings = data["postings"]
+        if len(terms) != len(postings):
+            raise ValueError("BM25 索引数据不完整")
+        doc_count = int(data["doc_count"])
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(pairs) for pairs in postings], out=indptr[1:])
+        pairs = [pair for term_pairs in postings for pair in term_pairs]
+        docs = np.array([doc for doc, _ in pairs], dtype=np.int32)
+        values = np.array([value for _, value in pairs], dtype=np.float32)
+        if docs.size and (docs.min() < 0 or docs.max() >= doc_count):
+            raise ValueError("BM25 索引数据不完整")
+        return cls({token: term for term, token in enumerate(terms)}, doc_count, indptr, docs, values)
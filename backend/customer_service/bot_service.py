@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+机器人自动回复服务
+基于 KeywordMatcher 为任意客户端生成 FAQ 回复：
+- 按规范化后的问题缓存匹配结果（知识库更新后自动清空）
+- 未命中缓存的问题合并为一批打分
+- 统计各主题命中次数与转人工次数，用于衡量机器人分流效果
+"""
+
+import heapq
+import re
+import threading
+from collections import Counter, OrderedDict
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .keyword_matcher import GREETING_REPLY
+from .knowledge_store import KnowledgeBaseStore
+
+_PUNCTUATION_RE = re.compile(r"[\W_]+")
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题作为缓存键：转小写，标点和空白合并为一个空格（不影响匹配结果）"""
+    return _PUNCTUATION_RE.sub(" ", (question or "").lower()).strip()
+
+
+class _BoundedCounter:
+    """容量有限的计数器：超出容量时淘汰次数最少（次数相同时最早计入）的键，计数与淘汰均为 O(1)"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(int(capacity), 1)
+        self._counts: Dict[str, int] = {}
+        # 次数 -> 该次数的键（按进入该次数的先后排列）
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = {}
+        self._min_count = 0
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, key: str) -> None:
+        count = self._counts.get(key, 0)
+        if count:
+            bucket = self._buckets[count]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[count]
+                if self._min_count == count:
+                    self._min_count = count + 1
+        else:
+            if len(self._counts) >= self.capacity:
+                bucket = self._buckets[self._min_count]
+                least, _ = bucket.popitem(last=False)
+                if not bucket:
+                    del self._buckets[self._min_count]
+                del self._counts[least]
+            self._min_count = 1
+        self._counts[key] = count + 1
+        self._buckets.setdefault(count + 1, OrderedDict())[key] = None
+
+    def most_common(self, n: int) -> List[Tuple[str, int]]:
+        return heapq.nlargest(n, self._counts.items(), key=itemgetter(1))
+
+
+class BotReplyService:
+    """机器人回复服务（线程安全，可在线程池中调用）"""
+
+    def __init__(self, store: KnowledgeBaseStore, cache_size: int = 5000, max_handoff_questions: int = 500):
+        self._store = store
+        self.max_size = max(int(cache_size), 1)
+        self.max_handoff_questions = max(int(max_handoff_questions), 1)
+        self._lock = threading.Lock()
+        # 规范化问题 -> (topic, answer, score)
+        self._data: "OrderedDict[str, Tuple[Optional[str], str, float]]" = OrderedDict()
+        self._etag: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.total = 0
+        self.greetings = 0
+        self.handoffs = 0
+        self._topic_hits: Counter = Counter()
+        # 转人工的问题（规范化后）及次数，超出上限时淘汰次数最少的
+        self._handoff_questions = _BoundedCounter(self.max_handoff_questions)
+
+    def reply(self, question: str, add_greeting: bool = True) -> Dict[str, Any]:
+        """为单个问题生成回复，结构同 reply_many 的元素"""
+        return self.reply_many([question], add_greeting)[0]
+
+    def reply_many(self, questions: Sequence[str], add_greeting: bool = True) -> List[Dict[str, Any]]:
+        """
+        批量生成回复
+
+        Returns:
+            与 questions 一一对应的 {reply, answer, topic, score, need_human, version}；
+            need_human 为 True 时 answer 为 NEED_HUMAN_SERVICE，由调用方引导用户转人工
+        """
+        snapshot = self._store.get()
+        matcher = self._store.matcher
+        keys = [normalize_question(q) for q in questions]
+
+        results: List[Optional[Tuple[Optional[str], str, float]]] = [None] * len(questions)
+        pending: Dict[str, List[int]] = {}
+        with self._lock:
+            if self._etag != snapshot.etag:
+                self._data.clear()
+                self._etag = snapshot.etag
+            for i, (question, key) in enumerate(zip(questions, keys)):
+                if matcher.is_greeting(question):
+                    continue
+                cached = self._data.get(key)
+                if cached is not None:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    results[i] = cached
+                else:
+                    pending.setdefault(key, []).append(i)
+            self.misses += sum(len(positions) for positions in pending.values())
+
+        if pending:
+            matched = matcher.match_topics(list(pending))
+            with self._lock:
+                for (key, positions), result in zip(pending.items(), matched):
+                    for i in positions:
+                        results[i] = result
+                    # 空问题不缓存
+                    if key and self._etag == snapshot.etag:
+                        self._data[key] = result
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+
+        replies: List[Dict[str, Any]] = []
+        with self._lock:
+            for question, key, result in zip(questions, keys, results):
+                self.total += 1
+                if result is None:
+                    self.greetings += 1
+                    replies.append({
+                        "reply": GREETING_REPLY,
+                        "answer": GREETING_REPLY,
+                        "topic": None,
+                        "score": 1.0,
+                        "need_human": False,
+                        "version": snapshot.version,
+                    })
+                    continue
+                topic, answer, score = result
+                if topic is None:
+                    self._record_handoff(key)
+                else:
+                    self._topic_hits[topic] += 1
+                replies.append({
+                    "reply": answer,
+                    "answer": answer,
+                    "topic": topic,
+                    "score": round(score, 4),
+                    "need_human": topic is None,
+                    "version": snapshot.version,
+                })
+
+        # 随机包装不缓存，每次回复的语气可以不同
+        for item in replies:
+            if not item["need_human"] and item["topic"]:
+                item["reply"] = matcher.decorate_answer(item["answer"], item["score"], add_greeting)
+        return replies
+
+    def _record_handoff(self, key: str) -> None:
+        self.handoffs += 1
+        self._handoff_questions.add(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": "bot_reply",
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def topic_stats(self, top_questions: int = 20) -> Dict[str, Any]:
+        """返回分流统计：各主题命中次数、转人工次数与最常转人工的问题"""
+        with self._lock:
+            answered = self.total - self.handoffs
+            return {
+                "total": self.total,
+                "answered": answered,
+                "greetings": self.greetings,
+                "handoffs": self.handoffs,
+                # 机器人直接回答（含问候）占全部提问的比例
+                "deflection_rate": round(answered / self.total, 4) if self.total else 0.0,
+                "topics": dict(self._topic_hits.most_common()),
+                "top_handoff_questions": [
+                    {"question": question, "count": count}
+                    for question, count in self._handoff_questions.most_common(top_questions)
+                ],
+            }
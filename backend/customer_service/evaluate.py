@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+FAQ 匹配离线评估
+用标注好的问题集评估匹配准确率、转人工比例与吞吐量
+
+用法：python -m backend.customer_service.evaluate [--dataset 路径] [--knowledge-base 路径] [--repeat 次数]
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .keyword_matcher import KeywordMatcher
+from .knowledge_base import load_knowledge_base
+
+# 标注问题集：[{"question": 问题, "topic": 期望主题（应转人工时为 null）}]
+EVALUATION_SET_PATH = Path(__file__).resolve().parent / "evaluation_set.json"
+
+
+def evaluate(
+    matcher: KeywordMatcher,
+    cases: List[Dict[str, Any]],
+    repeat: int = 20,
+) -> Dict[str, Any]:
+    """返回准确率、转人工统计、吞吐量以及判错的问题"""
+    questions = [case["question"] for case in cases]
+    predicted: List[Optional[str]] = [topic for topic, _, _ in matcher.match_topics(questions)]
+
+    in_scope = [i for i, case in enumerate(cases) if case["topic"]]
+    out_of_scope = [i for i, case in enumerate(cases) if not case["topic"]]
+    correct = [i for i, case in enumerate(cases) if predicted[i] == (case["topic"] or None)]
+    errors = [
+        {"question": cases[i]["question"], "expected": cases[i]["topic"], "predicted": predicted[i]}
+        for i in range(len(cases)) if i not in set(correct)
+    ]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for question in questions:
+            matcher.match(question)
+    single_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        matcher.match_many(questions)
+    batch_elapsed = time.perf_counter() - start
+
+    total = len(questions) * repeat
+    return {
+        "cases": len(cases),
+        "in_scope_cases": len(in_scope),
+        "out_of_scope_cases": len(out_of_scope),
+        "accuracy": len(correct) / len(cases) if cases else 0.0,
+        "in_scope_accuracy": (
+            sum(1 for i in in_scope if predicted[i] == cases[i]["topic"]) / len(in_scope) if in_scope else 0.0
+        ),
+        # 应由机器人回答却转给人工的比例
+        "false_handoff_rate": (
+            sum(1 for i in in_scope if predicted[i] is None) / len(in_scope) if in_scope else 0.0
+        ),
+        "out_of_scope_handoff_rate": (
+            sum(1 for i in out_of_scope if predicted[i] is None) / len(out_of_scope) if out_of_scope else 0.0
+        ),
+        "match_qps": total / single_elapsed if single_elapsed else 0.0,
+        "match_many_qps": total / batch_elapsed if batch_elapsed else 0.0,
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="FAQ 匹配离线评估")
+    parser.add_argument("--dataset", default=str(EVALUATION_SET_PATH), help="标注问题集 JSON 文件")
+    parser.add_argument("--knowledge-base", default=None, help="知识库数据文件（默认使用当前知识库）")
+    parser.add_argument("--repeat", type=int, default=20, help="测吞吐量时重复的轮数")
+    args = parser.parse_args()
+
+    with open(args.dataset, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    matcher = KeywordMatcher()
+    matcher.load_data(load_knowledge_base(args.knowledge_base))
+    report = evaluate(matcher, cases, repeat=args.repeat)
+
+    print(f"问题数: {report['cases']}（知识库内 {report['in_scope_cases']}，知识库外 {report['out_of_scope_cases']}；"
+          f"知识库版本 {matcher.version}）")
+    print(f"准确率: {report['accuracy']:.1%}")
+    print(f"知识库内问题准确率: {report['in_scope_accuracy']:.1%}")
+    print(f"知识库内问题误转人工: {report['false_handoff_rate']:.1%}")
+    # 知识库外（无关）问题应全部转人工，低于 100% 说明机器人会用不相干的答案回复
+    print(f"知识库外问题转人工: {report['out_of_scope_handoff_rate']:.1%}")
+    print(f"吞吐量: match {report['match_qps']:,.0f} 条/秒，match_many {report['match_many_qps']:,.0f} 条/秒")
+    for error in report["errors"]:
+        print(f"  ✗ {error['question']}  期望: {error['expected']}  实际: {error['predicted']}")
+
+
+if __name__ == "__main__":
+    main()
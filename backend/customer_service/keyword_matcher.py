@@ -6,8 +6,81 @@
 
 import re
 import random
-from typing import Optional, Tuple
-from .knowledge_base import KNOWLEDGE_BASE, GREETING_WORDS, ENDING_WORDS
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .aho_corasick import AhoCorasick
+from .bm25 import BM25Index
+from .knowledge_base import (
+    KNOWLEDGE_BASE,
+    KNOWLEDGE_BASE_VERSION,
+    GREETING_WORDS,
+    ENDING_WORDS,
+    load_knowledge_base,
+)
+
+# 序列化索引的格式版本，结构变化时递增
+INDEX_FORMAT = 3
+
+# 匹配分数（0~1）低于该值时转人工客服
+MATCH_THRESHOLD = 0.1
+
+# 问题中的词（去重）出现在最佳主题中的比例低于该值时转人工客服：
+# 主题数很多时词表很大，无关问题里的个别二字组也能在某个主题中命中一个高 idf 的词，
+# 只看分数比例会误判；知识库内的问题通常有两成以上的词落在所属主题中
+MIN_TERM_COVERAGE = 0.2
+
+# 常见的问候语（中英文）及对应的固定回复
+GREETING_KEYWORDS = ["你好", "在吗", "您好", "哈喽", "hello", "hi", "嗨"]
+GREETING_REPLY = "你好呀～我是《云汐幻声》的智能小助手，有什么想了解的可以直接告诉我哈~"
+
+# 主题各字段计入 BM25 词频的权重：关键词 / 示例问题比答案正文更能代表主题
+KEYWORD_FIELD_WEIGHT = 3.0
+QUESTION_FIELD_WEIGHT = 2.0
+ANSWER_FIELD_WEIGHT = 1.0
+
+
+class _MatchIndex(NamedTuple):
+    """编译后的匹配索引（只读，热更新时整体替换）"""
+    version: int
+    knowledge_base: dict
+    greeting_words: List[str]
+    ending_words: List[str]
+    ranker: BM25Index
+    # 文档序号 -> 主题名（按优先级排序，同分时 argmax 取优先级高的主题）
+    topics: List[str]
+    # 全部关键词（小写）编译成的 Aho–Corasick 自动机，用于筛选候选主题
+    automaton: AhoCorasick
+    # 自动机中的模式编号 -> 包含该关键词的文档序号（升序）
+    keyword_topics: List[List[int]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可 JSON 编码的字典（客户端下载后直接加载，无需重新编译）"""
+        return {
+            "format": INDEX_FORMAT,
+            "version": self.version,
+            "knowledge_base": self.knowledge_base,
+            "greeting_words": self.greeting_words,
+            "ending_words": self.ending_words,
+            "ranker": self.ranker.to_dict(),
+            "topics": self.topics,
+            "automaton": self.automaton.to_dict(),
+            "keyword_topics": self.keyword_topics,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_MatchIndex":
+        if data.get("format") != INDEX_FORMAT:
+            raise ValueError(f"不支持的索引格式：{data.get('format')}")
+        return cls(
+            version=data["version"],
+            knowledge_base=data["knowledge_base"],
+            greeting_words=list(data["greeting_words"]),
+            ending_words=list(data["ending_words"]),
+            ranker=BM25Index.from_dict(data["ranker"]),
+            topics=list(data["topics"]),
+            automaton=AhoCorasick.from_dict(data["automaton"]),
+            keyword_topics=[list(docs) for docs in data["keyword_topics"]],
+        )
 
 
 class KeywordMatcher:
@@ -28,25 +101,91 @@ class KeywordMatcher:
         "后续使用中有任何小问题，都可以直接在这里问我～",
     ]
 
-    def __init__(self):
-        self.knowledge_base = KNOWLEDGE_BASE
+    def __init__(self, knowledge_base: Optional[dict] = None):
         # 构建关键词索引（小写，便于匹配）
-        self._build_keyword_index()
+        if knowledge_base is None:
+            self._index = self._build_keyword_index(
+                KNOWLEDGE_BASE, KNOWLEDGE_BASE_VERSION, GREETING_WORDS, ENDING_WORDS
+            )
+        else:
+            self._index = self._build_keyword_index(knowledge_base)
+
+    @property
+    def knowledge_base(self) -> dict:
+        return self._index.knowledge_base
+
+    @property
+    def version(self) -> int:
+        """当前知识库版本号"""
+        return self._index.version
+
+    def reload(self, knowledge_base: Optional[dict] = None) -> None:
+        """
+        热更新知识库。
+
+        未传入 knowledge_base 时重新读取知识库数据文件。新索引构建完成后整体替换，
+        正在进行的匹配继续使用旧索引，不会读到构建了一半的数据。
+        """
+        if knowledge_base is None:
+            self.load_data(load_knowledge_base())
+        else:
+            self._index = self._build_keyword_index(knowledge_base)
+
+    def load_data(self, data: Dict[str, Any]) -> None:
+        """由带版本号的知识库数据（load_knowledge_base() 的结果）编译并替换索引"""
+        self._index = self._build_keyword_index(
+            data["topics"], data["version"], data["greeting_words"], data["ending_words"]
+        )
+
+    def export_index(self) -> Dict[str, Any]:
+        """导出当前编译好的索引（可 JSON 序列化）"""
+        return self._index.to_dict()
+
+    def load_index(self, data: Dict[str, Any]) -> None:
+        """加载 export_index() 导出的索引并整体替换；数据无效时抛出 ValueError"""
+        try:
+            index = _MatchIndex.from_dict(data)
+        except (AttributeError, KeyError, TypeError) as e:
+            raise ValueError(f"索引数据无效：{e}") from e
+        self._index = index
     
-    def _build_keyword_index(self):
-        """构建关键词索引"""
-        self.keyword_index = {}
-        for topic, data in self.knowledge_base.items():
-            if topic == "默认":
-                continue
-            for keyword in data["keywords"]:
-                keyword_lower = keyword.lower()
-                if keyword_lower not in self.keyword_index:
-                    self.keyword_index[keyword_lower] = []
-                self.keyword_index[keyword_lower].append({
-                    "topic": topic,
-                    "priority": data["priority"]
-                })
+    def _build_keyword_index(
+        self,
+        knowledge_base: dict,
+        version: int = 0,
+        greeting_words: Optional[List[str]] = None,
+        ending_words: Optional[List[str]] = None,
+    ) -> _MatchIndex:
+        """构建 BM25 索引（每个主题的关键词、示例问题、答案作为一个文档）与关键词自动机"""
+        topics = sorted(
+            (topic for topic, data in knowledge_base.items() if topic != "默认" and data["keywords"]),
+            key=lambda topic: knowledge_base[topic]["priority"],
+        )
+        documents = []
+        for topic in topics:
+            data = knowledge_base[topic]
+            fields = [(topic, KEYWORD_FIELD_WEIGHT)]
+            fields += [(keyword, KEYWORD_FIELD_WEIGHT) for keyword in data["keywords"]]
+            fields += [(question, QUESTION_FIELD_WEIGHT) for question in data.get("questions", [])]
+            fields.append((data["answer"], ANSWER_FIELD_WEIGHT))
+            documents.append(fields)
+        # 关键词（小写） -> 文档序号；同一关键词可能属于多个主题
+        keyword_index: Dict[str, List[int]] = {}
+        for doc, topic in enumerate(topics):
+            for keyword in knowledge_base[topic]["keywords"]:
+                docs = keyword_index.setdefault(keyword.lower(), [])
+                if not docs or docs[-1] != doc:
+                    docs.append(doc)
+        return _MatchIndex(
+            version=version,
+            knowledge_base=knowledge_base,
+            greeting_words=list(greeting_words if greeting_words is not None else GREETING_WORDS),
+            ending_words=list(ending_words if ending_words is not None else ENDING_WORDS),
+            ranker=BM25Index.build(documents),
+            topics=topics,
+            automaton=AhoCorasick(keyword_index.keys()),
+            keyword_topics=list(keyword_index.values()),
+        )
     
     def _normalize_text(self, text: str) -> str:
         """文本标准化处理"""
@@ -65,31 +204,6 @@ class KeywordMatcher:
         keywords = [w for w in words if len(w) > 1]
         return keywords
     
-    def _calculate_match_score(self, question: str, topic_data: dict) -> float:
-        """计算匹配分数"""
-        question_lower = question.lower()
-        keywords = topic_data["keywords"]
-        
-        # 计算匹配的关键词数量
-        matched_count = 0
-        for keyword in keywords:
-            if keyword.lower() in question_lower:
-                matched_count += 1
-        
-        if not keywords:
-            return 0.0
-        
-        # 基础分数：匹配关键词比例
-        base_score = matched_count / len(keywords)
-        
-        # 优先级权重（优先级越小，权重越高）
-        priority_weight = 1.0 / topic_data["priority"]
-        
-        # 最终分数
-        final_score = base_score * priority_weight
-        
-        return final_score
-    
     def match(self, question: str) -> Tuple[str, float]:
         """
         匹配问题并返回答案
@@ -100,31 +214,64 @@ class KeywordMatcher:
         Returns:
             (answer, score): 答案和匹配分数
         """
-        if not question or not question.strip():
-            return self.knowledge_base["默认"]["answer"], 0.0
-        
-        question = question.strip()
-        best_topic = None
-        best_score = 0.0
-        
-        # 遍历所有主题，计算匹配分数
-        for topic, data in self.knowledge_base.items():
-            if topic == "默认":
-                continue
-            
-            score = self._calculate_match_score(question, data)
-            if score > best_score:
-                best_score = score
-                best_topic = topic
-        
-        # 如果匹配分数太低，返回特殊标记，触发人工客服匹配
-        if best_score < 0.1:
-            # 使用特殊标记，前端会识别并显示"联系人工客服"按钮
-            answer = "NEED_HUMAN_SERVICE"
-        else:
-            answer = self.knowledge_base[best_topic]["answer"]
-        
-        return answer, best_score
+        return self.match_many([question])[0]
+
+    def match_many(self, questions: Sequence[str]) -> List[Tuple[str, float]]:
+        """
+        批量匹配问题，一次矩阵运算完成全部打分
+
+        Args:
+            questions: 用户问题列表
+
+        Returns:
+            与 questions 一一对应的 (answer, score)
+        """
+        return [(answer, score) for _, answer, score in self.match_topics(questions)]
+
+    def match_topics(self, questions: Sequence[str]) -> List[Tuple[Optional[str], str, float]]:
+        """
+        批量匹配问题并返回命中的主题
+
+        问题中原样出现了某些主题的关键词时（Aho–Corasick 自动机一次扫描找出），只在这些候选主题中
+        按 BM25 得分选最佳主题；没有出现任何关键词时在全部主题中选。
+        分数为最佳主题的 BM25 得分占该问题理论最高分的比例（0~1）；分数低于 MATCH_THRESHOLD，
+        或问题中出现在最佳主题里的词不足 MIN_TERM_COVERAGE 时转人工。
+
+        Returns:
+            与 questions 一一对应的 (topic, answer, score)：空问题的主题为"默认"，
+            分数低于阈值时主题为 None、answer 为 NEED_HUMAN_SERVICE
+        """
+        index = self._index
+        texts = [q or "" for q in questions]
+        # 文档序号即优先级顺序，同分时取优先级高的主题
+        best, confidences, coverage = index.ranker.rank_many(
+            texts, [self._candidate_topics(index, text) for text in texts]
+        )
+
+        results: List[Tuple[Optional[str], str, float]] = []
+        for question, topic_pos, score, covered in zip(questions, best.tolist(), confidences.tolist(), coverage.tolist()):
+            if not question or not question.strip():
+                results.append(("默认", index.knowledge_base["默认"]["answer"], 0.0))
+            elif not index.topics or score < MATCH_THRESHOLD or covered < MIN_TERM_COVERAGE:
+                # 匹配分数太低，返回特殊标记，前端会识别并显示"联系人工客服"按钮
+                results.append((None, "NEED_HUMAN_SERVICE", score))
+            else:
+                topic = index.topics[topic_pos]
+                results.append((topic, index.knowledge_base[topic]["answer"], score))
+        return results
+
+    @staticmethod
+    def _candidate_topics(index: _MatchIndex, question: str) -> List[int]:
+        """问题中原样出现的关键词所属的文档序号（可能重复），一次扫描问题"""
+        keyword_topics = index.keyword_topics
+        return [doc for pattern in index.automaton.find_all(question.strip().lower()) for doc in keyword_topics[pattern]]
+
+    def is_greeting(self, question: str) -> bool:
+        """是否为打招呼这类简单问候"""
+        if not question:
+            return False
+        q_norm = question.strip().lower()
+        return len(q_norm) <= 8 and any(g in q_norm for g in GREETING_KEYWORDS)
     
     def generate_reply(self, question: str, add_greeting: bool = True) -> str:
         """
@@ -138,17 +285,17 @@ class KeywordMatcher:
             完整的回复文本
         """
         # 先处理打招呼这类简单问候，避免直接走“联系QQ”的兜底
-        if question:
-            q_norm = question.strip().lower()
-            # 常见的问候语（中英文）
-            greeting_keywords = ["你好", "在吗", "您好", "哈喽", "hello", "hi", "嗨"]
-            if len(q_norm) <= 8 and any(g in q_norm for g in greeting_keywords):
-                return "你好呀～我是《云汐幻声》的智能小助手，有什么想了解的可以直接告诉我哈~"
+        if self.is_greeting(question):
+            return GREETING_REPLY
 
         answer, score = self.match(question)
+        return self.decorate_answer(answer, score, add_greeting)
 
-        # 匹配到具体问题（score >= 0.1）时，做“人性化包装”
-        if score >= 0.1:
+    def decorate_answer(self, answer: str, score: float, add_greeting: bool = True) -> str:
+        """为匹配到的答案加上随机的开头 / 结尾与语气词；未匹配到具体问题时原样返回"""
+        # 匹配到具体问题时，做“人性化包装”
+        # 词覆盖率不足而转人工时分数可能不低于阈值，按标记判断
+        if score >= MATCH_THRESHOLD and answer != "NEED_HUMAN_SERVICE":
             # 1）可选：在前面加一句自然的开头
             if random.random() < 0.6:  # 60% 概率加开头，避免每句都一样
                 prefix = random.choice(self.HUMAN_PREFIXES)
@@ -161,10 +308,11 @@ class KeywordMatcher:
 
             # 3）原来的语气词逻辑（保持不变）
             if add_greeting:
+                index = self._index
                 # 随机选择语气词（30%概率再加一层口语化）
                 if random.random() < 0.3:
-                    greeting = random.choice(GREETING_WORDS)
-                    ending = random.choice(ENDING_WORDS)
+                    greeting = random.choice(index.greeting_words)
+                    ending = random.choice(index.ending_words)
                     if not answer.startswith(greeting):
                         answer = f"{greeting}，{answer}"
                     if not answer.endswith(ending) and not answer.endswith("~"):
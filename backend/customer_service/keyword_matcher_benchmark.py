@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+FAQ 匹配吞吐量测试：大规模知识库
+
+随机生成 --topics 个主题（每个主题 --keywords 个关键词、2 个示例问题和一段答案）的合成知识库，
+用由某个主题的关键词拼成的问题（另有 --off-topic 比例的无关问题）对比：
+- 旧实现：逐个主题、逐个关键词做子串查找（本文件中的 _legacy_match）；
+- KeywordMatcher.match：逐条匹配（关键词自动机筛选候选主题 + BM25 排序 + 词覆盖率检查）；
+- KeywordMatcher.match_many：批量匹配（--batch 条一批）。
+统计每秒匹配条数、索引构建耗时与索引大小，以及命中出题主题、无关问题转人工的比例。
+
+用法：python backend/customer_service/keyword_matcher_benchmark.py [--topics 5000] [--keywords 8] [--queries 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 确保项目根目录在 sys.path 中，便于导入 backend 包
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from backend.customer_service.keyword_matcher import MATCH_THRESHOLD, MIN_TERM_COVERAGE, KeywordMatcher
+
+# 常用汉字区段，生成的词足够分散，接近真实知识库的词表规模
+_CHARS = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+_FILLERS = ["请问", "怎么办", "为什么", "一直", "还是不行", "麻烦看下", "我的", "突然"]
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(_CHARS) for _ in range(rng.randint(2, 4)))
+
+
+def _knowledge_base(rng: random.Random, topics: int, keywords: int) -> dict:
+    knowledge_base = {"默认": {"keywords": [], "answer": "默认回复", "priority": 99}}
+    for i in range(topics):
+        words = [_word(rng) for _ in range(keywords)]
+        knowledge_base[f"主题{i}"] = {
+            "keywords": words,
+            "questions": [f"{rng.choice(_FILLERS)}{words[0]}{words[1]}", f"{words[2]}{rng.choice(_FILLERS)}"],
+            "answer": "".join(_word(rng) for _ in range(20)),
+            "priority": rng.randint(1, 3),
+        }
+    return knowledge_base
+
+
+def _questions(rng: random.Random, knowledge_base: dict, count: int, off_topic: float) -> List[Tuple[str, Optional[str]]]:
+    """返回 (问题, 出题主题)；无关问题的主题为 None"""
+    topics = [topic for topic in knowledge_base if topic != "默认"]
+    questions = []
+    for _ in range(count):
+        if rng.random() < off_topic:
+            questions.append(("".join(_word(rng) for _ in range(4)), None))
+            continue
+        topic = rng.choice(topics)
+        words = rng.sample(knowledge_base[topic]["keywords"], 3)
+        questions.append((f"{rng.choice(_FILLERS)}{words[0]}和{words[1]}{rng.choice(_FILLERS)}{words[2]}", topic))
+    return questions
+
+
+def _legacy_match(knowledge_base: dict, question: str) -> Tuple[Optional[str], float]:
+    """旧实现的 match：逐个主题计算关键词命中比例 / 优先级，返回 (主题, 分数)，仅作为对比基准"""
+    if not question or not question.strip():
+        return "默认", 0.0
+    question_lower = question.strip().lower()
+    best_topic = None
+    best_score = 0.0
+    for topic, data in knowledge_base.items():
+        if topic == "默认":
+            continue
+        keywords = data["keywords"]
+        if not keywords:
+            continue
+        matched_count = sum(1 for keyword in keywords if keyword.lower() in question_lower)
+        score = matched_count / len(keywords) / data["priority"]
+        if score > best_score:
+            best_score = score
+            best_topic = topic
+    if best_score < 0.1:
+        return None, best_score
+    return best_topic, best_score
+
+
+def _accuracy(predicted: List[Optional[str]], questions: List[Tuple[str, Optional[str]]]) -> Dict[str, float]:
+    in_scope = [(p, t) for p, (_, t) in zip(predicted, questions) if t]
+    out_of_scope = [p for p, (_, t) in zip(predicted, questions) if not t]
+    return {
+        "hit": sum(p == t for p, t in in_scope) / max(len(in_scope), 1),
+        "handoff": sum(p is None for p in out_of_scope) / max(len(out_of_scope), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="FAQ 匹配吞吐量测试：大规模知识库")
+    parser.add_argument("--topics", type=int, default=5000, help="主题数")
+    parser.add_argument("--keywords", type=int, default=8, help="每个主题的关键词数")
+    parser.add_argument("--queries", type=int, default=2000, help="问题数")
+    parser.add_argument("--legacy-queries", type=int, default=200, help="旧实现只测前若干个问题")
+    parser.add_argument("--off-topic", type=float, default=0.2, help="无关问题的比例")
+    parser.add_argument("--batch", type=int, default=64, help="match_many 每批的问题数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    knowledge_base = _knowledge_base(rng, args.topics, args.keywords)
+    questions = _questions(rng, knowledge_base, args.queries, args.off_topic)
+    texts = [text for text, _ in questions]
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(knowledge_base)
+    build_s = time.perf_counter() - start
+    ranker = matcher._index.ranker
+    automaton = matcher._index.automaton
+    print(f"{args.topics} 个主题 × {args.keywords} 个关键词，{args.queries} 个问题（无关问题 {args.off_topic:.0%}）")
+    print(f"索引构建 {build_s:.2f} s，词表 {len(ranker.vocabulary):,} 个词，索引 {ranker.nbytes / 1024 / 1024:.1f} MB，"
+          f"关键词自动机 {len(automaton.patterns):,} 个关键词")
+    print(f"{'':<24}{'条/秒':>12}{'命中出题主题':>14}{'无关问题转人工':>16}")
+
+    def _report(label: str, elapsed: float, predicted: List[Optional[str]]) -> float:
+        qps = len(predicted) / elapsed
+        accuracy = _accuracy(predicted, questions[:len(predicted)])
+        print(f"{label:<24}{qps:>12,.0f}{accuracy['hit']:>14.1%}{accuracy['handoff']:>16.1%}")
+        return qps
+
+    # 旧实现太慢，只测前 --legacy-queries 条
+    legacy_texts = texts[:args.legacy_queries]
+    start = time.perf_counter()
+    legacy = [_legacy_match(knowledge_base, text)[0] for text in legacy_texts]
+    legacy_qps = _report(f"旧实现（前 {len(legacy_texts)} 条）", time.perf_counter() - start, legacy)
+
+    start = time.perf_counter()
+    single = [topic for text in texts for topic, _, _ in matcher.match_topics([text])]
+    single_qps = _report("match", time.perf_counter() - start, single)
+
+    start = time.perf_counter()
+    batched: List[Optional[str]] = []
+    for offset in range(0, len(texts), args.batch):
+        batched += [topic for topic, _, _ in matcher.match_topics(texts[offset:offset + args.batch])]
+    batched_qps = _report(f"match_many（每批 {args.batch} 条）", time.perf_counter() - start, batched)
+    assert batched == single, "批量匹配与逐条匹配结果不一致"
+    print(f"match 为旧实现的 {single_qps / legacy_qps:,.0f} 倍，match_many 为 {batched_qps / legacy_qps:,.0f} 倍"
+          f"（分数阈值 {MATCH_THRESHOLD}，词覆盖率阈值 {MIN_TERM_COVERAGE}）")
+
+
+if __name__ == "__main__":
+    main()
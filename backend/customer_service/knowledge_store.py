@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+知识库发布服务
+监视知识库数据文件，变化后重新编译匹配索引并整体替换；编译结果序列化一次，供客户端按 ETag 下载
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+from .keyword_matcher import KeywordMatcher, get_matcher
+from .knowledge_base import KNOWLEDGE_BASE_PATH, load_knowledge_base
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBaseSnapshot(NamedTuple):
+    """某一版本知识库的发布结果（只读）"""
+    version: int
+    etag: str
+    # 序列化后的响应体：{"success": true, "version": ..., "index": {...}}
+    body: bytes
+    mtime: float
+
+
+class KnowledgeBaseStore:
+    """
+    知识库存储：数据文件修改后（按 mtime 判断）自动重新加载，无需重启。
+
+    新索引编译完成后才替换匹配器与发布快照；数据文件有误时保留旧版本继续服务。
+    修改数据文件时建议先写临时文件再重命名覆盖，避免读到写了一半的内容。
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        matcher: Optional[KeywordMatcher] = None,
+        check_interval: float = 2.0,
+    ):
+        self._path = Path(path or KNOWLEDGE_BASE_PATH)
+        self._matcher = matcher or get_matcher()
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._snapshot: Optional[KnowledgeBaseSnapshot] = None
+        self.reload()
+
+    @property
+    def matcher(self) -> KeywordMatcher:
+        return self._matcher
+
+    def get(self) -> KnowledgeBaseSnapshot:
+        """返回当前发布的快照；距上次检查超过 check_interval 时先检查数据文件是否变化"""
+        if time.monotonic() >= self._next_check:
+            self._reload_if_changed()
+        return self._snapshot
+
+    def reload(self) -> KnowledgeBaseSnapshot:
+        """强制重新读取数据文件并发布；失败时抛出异常（已有快照保持不变）"""
+        with self._lock:
+            self._next_check = time.monotonic() + self._check_interval
+            return self._publish(os.stat(self._path).st_mtime)
+
+    def _reload_if_changed(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_check:
+                return
+            self._next_check = now + self._check_interval
+            try:
+                mtime = os.stat(self._path).st_mtime
+                if mtime == self._snapshot.mtime:
+                    return
+                snapshot = self._publish(mtime)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error(f"重新加载知识库失败，继续使用版本 {self._snapshot.version}: {e}")
+                return
+            logger.info(f"知识库已热更新到版本 {snapshot.version}")
+
+    def _publish(self, mtime: float) -> KnowledgeBaseSnapshot:
+        data = load_knowledge_base(self._path)
+        # 匹配器整体替换索引；发布快照也是单次赋值，读者不会看到构建了一半的数据
+        self._matcher.load_data(data)
+        index = self._matcher.export_index()
+        body = json.dumps(
+            {"success": True, "version": data["version"], "index": index},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        etag = f'"kb-{data["version"]}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        self._snapshot = KnowledgeBaseSnapshot(data["version"], etag, body, mtime)
+        return self._snapshot
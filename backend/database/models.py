@@ -140,6 +140,8 @@ class User(Base):
         default=UserRole.USER,
         nullable=False
     )
+    # 令牌版本：修改/重置密码时递增，使已签发的 refresh token 失效
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
@@ -165,6 +167,24 @@ class UserVip(Base):
     user = relationship("User", back_populates="vip_info")
 
 
+class VipPurchase(Base):
+    """VIP 购买记录表模型（幂等键：同一用户同一键只扣费一次）"""
+    __tablename__ = "vip_purchases"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    idempotency_key = Column(String(64), nullable=False)
+    cost = Column(Integer, nullable=False)
+    days = Column(Integer, nullable=True)  # NULL 表示永久会员
+    new_expiry = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # 唯一约束
+    __table_args__ = (
+        Index("unique_user_idempotency_key", "user_id", "idempotency_key", unique=True),
+    )
+
+
 class ChatMessage(Base):
     """聊天消息表模型"""
     __tablename__ = "chat_messages"
@@ -199,6 +219,42 @@ class ChatMessage(Base):
     )
 
 
+class MessageLinkPreview(Base):
+    """消息链接预览表模型（发送消息后后台抓取，随历史消息返回）"""
+    __tablename__ = "message_link_previews"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    message_id = Column(Integer, ForeignKey("chat_messages.id", ondelete="CASCADE"), nullable=False)
+    url = Column(String(2048), nullable=False)
+    url_hash = Column(String(64), nullable=False)  # url 的 sha256，url 过长无法直接建唯一索引
+    title = Column(String(512), nullable=True)
+    description = Column(Text, nullable=True)
+    image = Column(String(2048), nullable=True)
+    site_name = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # 唯一约束：同一消息的同一链接只保存一份预览（也用于按 message_id 查询）
+    __table_args__ = (
+        Index("unique_message_url", "message_id", "url_hash", unique=True),
+    )
+
+
+class SentMessageKey(Base):
+    """已发送消息的客户端消息 ID 表模型（幂等键：客户端重放发送日志时同一用户同一 ID 只写入一条消息）"""
+    __tablename__ = "sent_message_keys"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    from_user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    client_message_id = Column(String(64), nullable=False)
+    message_id = Column(Integer, ForeignKey("chat_messages.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # 唯一约束
+    __table_args__ = (
+        Index("unique_user_client_message_id", "from_user_id", "client_message_id", unique=True),
+    )
+
+
 class ChatSession(Base):
     """聊天会话表模型"""
     __tablename__ = "chat_sessions"
@@ -0,0 +1,112 @@
+"""
+用户资料 / VIP 信息的异步读穿缓存
+
+- 容量有界（LRU 淘汰）+ TTL 过期，TTL 兜底覆盖绕过管理器的直接改库
+- single-flight：同一 key 的并发未命中只触发一次数据库查询，其余协程等待同一结果
+- 写操作调用 invalidate() 失效；失效发生在加载过程中时，本次加载结果不会写入缓存
+- stats() 返回命中 / 未命中等统计
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Set, Tuple
+
+
+def _retrieve_exception(task: "asyncio.Task[Any]") -> None:
+    """标记异常已被读取，避免所有等待者都已取消时输出 'exception was never retrieved'"""
+    if not task.cancelled():
+        task.exception()
+
+
+class AsyncProfileCache:
+    """有界异步读穿缓存（LRU + TTL + single-flight）"""
+
+    def __init__(self, name: str, max_size: int = 10000, ttl: float = 60.0) -> None:
+        self.name = name
+        self.max_size = max(int(max_size), 1)
+        self.ttl = float(ttl)
+        # key -> (过期时间, 值)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        # 加载过程中被失效的 key：加载结果不写入缓存
+        self._dirty: Set[Hashable] = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """读取缓存，未命中时调用 loader 加载；None 结果不缓存"""
+        entry = self._data.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._data[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            # 加载在独立任务中进行：发起加载的调用方被取消不会取消其他等待者的加载
+            task = asyncio.ensure_future(self._load(key, loader))
+            task.add_done_callback(_retrieve_exception)
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        # shield：单个调用方被取消不影响正在进行的加载
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+        except BaseException:
+            self._dirty.discard(key)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        if key in self._dirty:
+            self._dirty.discard(key)
+        elif value is not None:
+            self._store(key, value)
+        return value
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """失效单个 key（写操作后调用）"""
+        self.invalidations += 1
+        self._data.pop(key, None)
+        if key in self._inflight:
+            self._dirty.add(key)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._data.clear()
+        self._dirty.update(self._inflight.keys())
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
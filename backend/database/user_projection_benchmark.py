@@ -0,0 +1,148 @@
+"""
+用户查询列投影测试：各处理器每次读取的字节数
+
+在临时 SQLite 库中写入 --users 个用户（头像 --avatar-kb KB，与真实头像相当），按各处理器的查询方式
+对比投影前（get_user_by_id / get_user_by_email 读取整行，含 avatar）与投影后（get_user_fields 只读需要的列）
+每次调用读取的字节数与耗时。get_session_messages 对比逐条消息查询发送者与一次批量查询（每页 --page-size 条）。
+
+用法：python backend/database/user_projection_benchmark.py [--users 200] [--avatar-kb 500] [--calls 200]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+# 确保项目根目录在 sys.path 中，便于导入 backend 包
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from backend.database.async_database_manager import AsyncDatabaseManager, PROFILE_FIELDS
+from backend.database.models import User, UserRole
+
+# get_user_by_id / get_user_by_email 读取的整行字段（投影前各处理器的读取方式）
+_FULL_BY_ID = ("id", "username", "email", "avatar", "role", "token_version")
+_FULL_BY_EMAIL = ("id", "username", "email", "password", "avatar", "role", "token_version")
+
+# (处理器, 查询方式, 投影后的字段)
+HANDLERS: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ("_authenticate 旧版 token 回退", "id", PROFILE_FIELDS),
+    ("disconnect 角色查询", "id", ("role",)),
+    ("回复 / 撤回 发送者用户名", "id", ("username",)),
+    ("accept_session 客服用户名", "id", ("username",)),
+    ("refresh_token", "id", ("id", "email", "role", "token_version")),
+    ("change_password", "email", ("id", "email", "password")),
+    ("注册 / 验证码 / 找回密码 存在性检查", "email", ("id",)),
+]
+
+
+def _row_bytes(row: Any) -> int:
+    """查询结果中各字段值的字节数（字符串按 UTF-8，数字与时间按 8 字节）"""
+    if not row:
+        return 0
+    total = 0
+    for value in row.values():
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            total += len(value)
+        elif isinstance(value, str):
+            total += len(value.encode("utf-8"))
+        elif value is not None:
+            total += 8
+    return total
+
+
+async def _seed(db: AsyncDatabaseManager, users: int, avatar_kb: int, rng: random.Random) -> None:
+    await db.initialize_tables()
+    async with db.async_session() as session:
+        for i in range(1, users + 1):
+            session.add(User(
+                id=i,
+                username=f"玩家{i}",
+                email=f"user{i}@example.com",
+                # 基准测试不需要真实的 bcrypt 哈希
+                password="$2b$12$" + "x" * 53,
+                avatar=rng.randbytes(avatar_kb * 1024),
+                role=UserRole.CUSTOMER_SERVICE if i % 10 == 0 else UserRole.USER,
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow(),
+            ))
+        await session.commit()
+
+
+async def _measure(calls: int, query: Callable[[int], Awaitable[Any]], users: int) -> Tuple[float, float]:
+    """返回 (每次调用的平均字节数, 每次调用的平均耗时 ms)"""
+    total_bytes = 0
+    start = time.perf_counter()
+    for i in range(calls):
+        result = await query(i % users + 1)
+        if isinstance(result, dict) and result and all(isinstance(v, dict) for v in result.values()):
+            total_bytes += sum(_row_bytes(row) for row in result.values())
+        else:
+            total_bytes += _row_bytes(result)
+    return total_bytes / calls, (time.perf_counter() - start) * 1000 / calls
+
+
+async def _run(args) -> None:
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabaseManager(db_url=f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        try:
+            await _seed(db, args.users, args.avatar_kb, rng)
+            print(f"{args.users} 个用户，头像 {args.avatar_kb} KB，每项 {args.calls} 次调用")
+            print(f"{'':<40}{'投影前 B/次':>14}{'投影后 B/次':>14}{'减少':>8}{'投影前 ms':>12}{'投影后 ms':>12}")
+
+            cases: List[Tuple[str, Callable, Callable]] = []
+            for name, key, fields in HANDLERS:
+                if key == "id":
+                    full = (lambda uid: db.get_user_fields(uid, fields=_FULL_BY_ID))
+                    projected = (lambda uid, fields=fields: db.get_user_fields(uid, fields=fields))
+                else:
+                    full = (lambda uid: db.get_user_fields(email=f"user{uid}@example.com", fields=_FULL_BY_EMAIL))
+                    projected = (lambda uid, fields=fields: db.get_user_fields(
+                        email=f"user{uid}@example.com", fields=fields))
+                cases.append((name, full, projected))
+
+            # 历史分页：会话双方交替发言
+            def _page_senders(uid: int) -> List[int]:
+                agent = (uid // 10 + 1) * 10
+                return [uid if i % 2 else agent for i in range(args.page_size)]
+
+            async def per_message(uid: int) -> Dict[int, Dict[str, Any]]:
+                rows = [await db.get_user_fields(sender, fields=_FULL_BY_ID) for sender in _page_senders(uid)]
+                return {i: row for i, row in enumerate(rows) if row}
+
+            async def batched(uid: int) -> Dict[int, Dict[str, Any]]:
+                return await db.get_users_fields(_page_senders(uid), fields=("id", "username", "avatar"))
+
+            cases.append((f"get_session_messages 发送者（每页 {args.page_size} 条）", per_message, batched))
+
+            for name, full, projected in cases:
+                calls = args.calls if "get_session_messages" not in name else max(1, args.calls // 10)
+                full_bytes, full_ms = await _measure(calls, full, args.users)
+                projected_bytes, projected_ms = await _measure(calls, projected, args.users)
+                print(f"{name:<40}{full_bytes:>14,.0f}{projected_bytes:>14,.0f}"
+                      f"{1 - projected_bytes / full_bytes:>8.1%}{full_ms:>12.2f}{projected_ms:>12.2f}")
+        finally:
+            await db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="用户查询列投影测试：各处理器每次读取的字节数")
+    parser.add_argument("--users", type=int, default=200, help="用户数")
+    parser.add_argument("--avatar-kb", type=int, default=500, help="头像大小（KB）")
+    parser.add_argument("--calls", type=int, default=200, help="每个处理器的调用次数")
+    parser.add_argument("--page-size", type=int, default=50, help="历史分页的消息数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    logging.getLogger("backend").setLevel(logging.WARNING)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
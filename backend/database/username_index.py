@@ -0,0 +1,115 @@
+"""
+用户名前缀索引（进程内）
+
+- 用于把消息中的 @提及 解析为用户ID，以及提及输入时的用户名补全，不再每次查询 users 表
+- 启动时整体加载一次，之后在注册 / 改名时增量更新
+- 用户名比较不区分大小写；同名用户会同时返回
+- 解析：按提及文本从长到短尝试前缀的字典查找，尝试次数不超过最长用户名长度
+- 补全：键有序数组上二分定位前缀，之后顺序取出，耗时 O(log n + limit)
+"""
+
+from __future__ import annotations
+
+import bisect
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class UsernameIndex:
+    """用户名 -> 用户ID 的前缀索引（仅在事件循环线程中使用）"""
+
+    def __init__(self) -> None:
+        # 规范化用户名 -> 用户ID 列表（升序）
+        self._ids_by_key: Dict[str, List[int]] = {}
+        # 规范化用户名的有序数组，用于前缀补全
+        self._keys: List[str] = []
+        # 用户ID -> 原始用户名
+        self._names: Dict[int, str] = {}
+        self._max_key_length = 0
+
+    @staticmethod
+    def normalize(username: str) -> str:
+        return (username or "").strip().casefold()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def load(self, users: Iterable[Tuple[int, str]]) -> None:
+        """用 (user_id, username) 全量重建索引"""
+        ids_by_key: Dict[str, List[int]] = {}
+        names: Dict[int, str] = {}
+        for user_id, username in users:
+            key = self.normalize(username)
+            if not key:
+                continue
+            names[int(user_id)] = username
+            ids_by_key.setdefault(key, []).append(int(user_id))
+        for ids in ids_by_key.values():
+            ids.sort()
+        self._ids_by_key = ids_by_key
+        self._keys = sorted(ids_by_key)
+        self._names = names
+        self._max_key_length = max((len(key) for key in self._keys), default=0)
+
+    def add(self, user_id: int, username: str) -> None:
+        """新增用户或更新用户名（改名时旧用户名自动移除）"""
+        user_id = int(user_id)
+        self.remove(user_id)
+        key = self.normalize(username)
+        if not key:
+            return
+        self._names[user_id] = username
+        ids = self._ids_by_key.get(key)
+        if ids is None:
+            self._ids_by_key[key] = [user_id]
+            bisect.insort(self._keys, key)
+            self._max_key_length = max(self._max_key_length, len(key))
+        else:
+            bisect.insort(ids, user_id)
+
+    def remove(self, user_id: int) -> None:
+        """移除用户（不存在时忽略）"""
+        username = self._names.pop(int(user_id), None)
+        if username is None:
+            return
+        key = self.normalize(username)
+        ids = self._ids_by_key.get(key)
+        if not ids:
+            return
+        if int(user_id) in ids:
+            ids.remove(int(user_id))
+        if not ids:
+            del self._ids_by_key[key]
+            pos = bisect.bisect_left(self._keys, key)
+            if pos < len(self._keys) and self._keys[pos] == key:
+                del self._keys[pos]
+
+    def resolve(self, text: str) -> Optional[Tuple[str, List[int]]]:
+        """
+        解析提及文本：返回以 text 开头的最长用户名及其用户ID列表，没有匹配时返回 None。
+
+        例如存在用户 "张三" 时，"@张三你好" 中的 "张三你好" 解析为 ("张三", [id])。
+        """
+        key = self.normalize(text)
+        for length in range(min(len(key), self._max_key_length), 0, -1):
+            ids = self._ids_by_key.get(key[:length])
+            if ids:
+                return self._names[ids[0]], list(ids)
+        return None
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Dict[str, object]]:
+        """返回用户名以 prefix 开头的用户（按用户名排序，最多 limit 个）"""
+        key = self.normalize(prefix)
+        if not key or limit <= 0:
+            return []
+        results: List[Dict[str, object]] = []
+        pos = bisect.bisect_left(self._keys, key)
+        while pos < len(self._keys) and len(results) < limit:
+            candidate = self._keys[pos]
+            if not candidate.startswith(key):
+                break
+            for user_id in self._ids_by_key[candidate]:
+                results.append({"id": user_id, "username": self._names[user_id]})
+                if len(results) >= limit:
+                    break
+            pos += 1
+        return results
@@ -2,10 +2,15 @@ import base64
 import hashlib
 import hmac
 import json
+import secrets
 import time
 from typing import Any, Dict, Optional
 
-from backend.config.config import SECRET_KEY
+from backend.config.config import SECRET_KEY, ACCESS_TOKEN_EXPIRE_SECONDS, REFRESH_TOKEN_EXPIRE_SECONDS
+
+# token 类型：access 用于接口鉴权（短有效期），refresh 仅用于换取新的 access token
+TOKEN_TYPE_ACCESS = "access"
+TOKEN_TYPE_REFRESH = "refresh"
 
 
 def _b64url_encode(data: bytes) -> str:
@@ -23,11 +28,9 @@ def _sign(message: bytes, secret: bytes) -> str:
     return _b64url_encode(sig)
 
 
-def generate_token(email: str) -> str:
-    """生成包含用户邮箱和过期时间的令牌（JWT HS256 兼容实现，避免第三方 jwt 包冲突）"""
-    exp = int(time.time()) + 7 * 24 * 60 * 60  # 7 天
+def _encode(payload: Dict[str, Any]) -> str:
+    """按 JWT HS256 格式签名 payload（避免第三方 jwt 包冲突）"""
     header = {"alg": "HS256", "typ": "JWT"}
-    payload = {"email": email, "exp": exp}
 
     header_b64 = _b64url_encode(json.dumps(header, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
     payload_b64 = _b64url_encode(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
@@ -38,8 +41,63 @@ def generate_token(email: str) -> str:
     return f"{header_b64}.{payload_b64}.{signature_b64}"
 
 
-def verify_token(token: str) -> Optional[Dict[str, Any]]:
-    """验证令牌有效性，成功返回 payload dict，失败返回 None"""
+def generate_token(
+    email: str,
+    user_id: Optional[int] = None,
+    role: Optional[str] = None,
+    token_version: int = 0,
+) -> str:
+    """生成短有效期的 access token。
+
+    payload 携带 user_id / role / 令牌版本，服务端可以仅凭声明完成鉴权，无需查库。
+    """
+    now = int(time.time())
+    payload: Dict[str, Any] = {
+        "typ": TOKEN_TYPE_ACCESS,
+        "email": email,
+        "iat": now,
+        "exp": now + ACCESS_TOKEN_EXPIRE_SECONDS,
+        "ver": int(token_version or 0),
+    }
+    if user_id is not None:
+        payload["user_id"] = int(user_id)
+    if role:
+        payload["role"] = role
+    return _encode(payload)
+
+
+def generate_refresh_token(email: str, user_id: int, token_version: int = 0) -> str:
+    """生成 refresh token（长有效期，仅能用于 /api/refresh_token 换取新令牌）"""
+    now = int(time.time())
+    payload = {
+        "typ": TOKEN_TYPE_REFRESH,
+        "email": email,
+        "user_id": int(user_id),
+        "ver": int(token_version or 0),
+        "jti": secrets.token_urlsafe(12),
+        "iat": now,
+        "exp": now + REFRESH_TOKEN_EXPIRE_SECONDS,
+    }
+    return _encode(payload)
+
+
+def generate_token_pair(user_row: Dict[str, Any]) -> Dict[str, Any]:
+    """根据用户行生成 access / refresh 令牌对（登录、注册、刷新接口统一使用）"""
+    email = user_row.get("email")
+    user_id = user_row.get("id")
+    version = int(user_row.get("token_version", 0) or 0)
+    return {
+        "token": generate_token(email, user_id=user_id, role=user_row.get("role"), token_version=version),
+        "refresh_token": generate_refresh_token(email, user_id, token_version=version),
+        "expires_in": ACCESS_TOKEN_EXPIRE_SECONDS,
+    }
+
+
+def verify_token(token: str, token_type: str = TOKEN_TYPE_ACCESS) -> Optional[Dict[str, Any]]:
+    """验证令牌有效性，成功返回 payload dict，失败返回 None
+
+    旧版 token 没有 typ 声明，按 access token 处理；refresh token 不能用于接口鉴权。
+    """
     try:
         parts = token.split(".")
         if len(parts) != 3:
@@ -57,6 +115,8 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
             return None
 
         payload: Dict[str, Any] = json.loads(_b64url_decode(payload_b64).decode("utf-8"))
+        if payload.get("typ", TOKEN_TYPE_ACCESS) != token_type:
+            return None
         exp = payload.get("exp")
         if not isinstance(exp, int):
             return None
@@ -64,4 +124,9 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
             return None
         return payload
     except Exception:
-        return None
\ No newline at end of file
+        return None
+
+
+def verify_refresh_token(token: str) -> Optional[Dict[str, Any]]:
+    """验证 refresh token，成功返回 payload dict，失败返回 None"""
+    return verify_token(token, token_type=TOKEN_TYPE_REFRESH)
@@ -1,17 +1,25 @@
 """
 异步链接预览模块
 获取链接的元数据（标题、描述、图片等）
-使用 httpx 异步 HTTP 客户端
+使用共享连接池的 httpx 异步 HTTP 客户端，结果带缓存
 """
-import re
+import asyncio
+import ipaddress
 import logging
-from typing import Dict, Optional
+import socket
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
 from urllib.parse import urlparse
+import httpcore
 import httpx
-from bs4 import BeautifulSoup
+
+from backend.utils.html_head_extractor import HeadMetaExtractor
 
 logger = logging.getLogger(__name__)
 
+_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
 
 def is_valid_url(url: str) -> bool:
     """检查URL是否有效"""
@@ -22,130 +30,268 @@ def is_valid_url(url: str) -> bool:
         return False
 
 
-async def fetch_link_preview(url: str, timeout: float = 5.0) -> Dict[str, any]:
+class BlockedAddressError(httpcore.ConnectError):
+    """链接的主机解析到回环 / 私有 / 链路本地等非公网地址，拒绝抓取"""
+
+
+def _is_public_address(address: str) -> bool:
+    """解析得到的 IP 是否为公网地址（IPv4 映射的 IPv6 地址按 IPv4 判断）"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def _resolve_public_address(host: str, port: int, timeout: Optional[float]) -> str:
+    """解析主机，任一地址不是公网地址即拒绝；返回用于建立连接的已校验地址"""
+    try:
+        infos = await asyncio.wait_for(
+            asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM), timeout
+        )
+    except asyncio.TimeoutError as e:
+        raise httpcore.ConnectTimeout(f"解析主机超时: {host}") from e
+    except socket.gaierror as e:
+        raise httpcore.ConnectError(f"无法解析主机: {host}") from e
+    for info in infos:
+        address = info[4][0]
+        if not _is_public_address(address):
+            raise BlockedAddressError(f"拒绝访问非公网地址: {host} -> {address}")
+    if not infos:
+        raise httpcore.ConnectError(f"无法解析主机: {host}")
+    return infos[0][4][0]
+
+
+class _PublicAddressBackend(httpcore.AsyncNetworkBackend):
     """
-    获取链接预览信息（异步）
-    
-    Args:
-        url: 链接URL
-        timeout: 请求超时时间（秒）
-    
-    Returns:
-        {
-            "url": 原始URL,
-            "title": 页面标题,
-            "description": 页面描述,
-            "image": 预览图片URL,
-            "site_name": 网站名称,
-            "success": 是否成功
-        }
+    网络后端：建立 TCP 连接时自行解析主机并校验地址，直接连接校验过的 IP。
+
+    校验与连接使用同一次解析结果，避免先校验、连接时再次解析被 DNS rebinding 换成内网地址；
+    TLS 的 SNI 与 Host 请求头仍使用原始主机名。每条新连接（包括跟随的重定向）都会经过这里。
     """
-    if not is_valid_url(url):
-        return {
-            "url": url,
-            "title": None,
-            "description": None,
-            "image": None,
-            "site_name": None,
-            "success": False
-        }
-    
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend) -> None:
+        self._backend = backend
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        address = await _resolve_public_address(host, port, timeout)
+        return await self._backend.connect_tcp(
+            address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+        )
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise BlockedAddressError(f"拒绝访问本地套接字: {path}")
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class _PublicAddressTransport(httpx.AsyncHTTPTransport):
+    """只连接公网地址的 httpx 传输层：在连接池的网络后端外包一层 _PublicAddressBackend"""
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._pool._network_backend = _PublicAddressBackend(self._pool._network_backend)
+
+
+def _failed_preview(url: str) -> Dict[str, Any]:
+    """获取失败时的预览结构"""
+    site_name = None
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        
-        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            
-            # 解析HTML
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # 提取标题
-            title = None
-            # 优先使用 og:title
-            og_title = soup.find("meta", property="og:title")
-            if og_title and og_title.get("content"):
-                title = og_title.get("content").strip()
-            # 其次使用 title 标签
-            if not title:
-                title_tag = soup.find("title")
-                if title_tag:
-                    title = title_tag.get_text().strip()
-            
-            # 提取描述
-            description = None
-            # 优先使用 og:description
-            og_desc = soup.find("meta", property="og:description")
-            if og_desc and og_desc.get("content"):
-                description = og_desc.get("content").strip()
-            # 其次使用 description meta
-            if not description:
-                desc_meta = soup.find("meta", attrs={"name": "description"})
-                if desc_meta and desc_meta.get("content"):
-                    description = desc_meta.get("content").strip()
-            
-            # 提取图片
-            image = None
-            og_image = soup.find("meta", property="og:image")
-            if og_image and og_image.get("content"):
-                image_url = og_image.get("content").strip()
-                # 如果是相对路径，转换为绝对路径
-                if image_url.startswith("//"):
-                    image_url = f"{urlparse(url).scheme}:{image_url}"
-                elif image_url.startswith("/"):
-                    parsed = urlparse(url)
-                    image_url = f"{parsed.scheme}://{parsed.netloc}{image_url}"
-                image = image_url
-            
-            # 提取网站名称
-            site_name = None
-            og_site = soup.find("meta", property="og:site_name")
-            if og_site and og_site.get("content"):
-                site_name = og_site.get("content").strip()
-            if not site_name:
-                parsed = urlparse(url)
-                site_name = parsed.netloc
-            
-            return {
-                "url": url,
-                "title": title or "无标题",
-                "description": description or "",
-                "image": image,
-                "site_name": site_name or urlparse(url).netloc,
-                "success": True
+        site_name = urlparse(url).netloc or None
+    except Exception:
+        pass
+    return {
+        "url": url,
+        "title": None,
+        "description": None,
+        "image": None,
+        "site_name": site_name,
+        "success": False
+    }
+
+
+def _build_preview(url: str, title: Optional[str], meta: Dict[str, str]) -> Dict[str, Any]:
+    """根据提取到的 <title> 与 meta 生成预览结构"""
+    # 标题：优先使用 og:title，其次使用 title 标签
+    title = (meta.get("og:title") or "").strip() or (title or "").strip()
+
+    # 描述：优先使用 og:description，其次使用 description meta
+    description = (meta.get("og:description") or "").strip() or (meta.get("description") or "").strip()
+
+    # 图片：相对路径转换为绝对路径
+    image = None
+    image_url = (meta.get("og:image") or "").strip()
+    if image_url:
+        if image_url.startswith("//"):
+            image_url = f"{urlparse(url).scheme}:{image_url}"
+        elif image_url.startswith("/"):
+            parsed = urlparse(url)
+            image_url = f"{parsed.scheme}://{parsed.netloc}{image_url}"
+        image = image_url
+
+    # 网站名称
+    site_name = (meta.get("og:site_name") or "").strip() or urlparse(url).netloc
+
+    return {
+        "url": url,
+        "title": title or "无标题",
+        "description": description,
+        "image": image,
+        "site_name": site_name,
+        "success": True
+    }
+
+
+class LinkPreviewService:
+    """
+    链接预览服务
+
+    - 全局共享一个 httpx.AsyncClient（连接池复用 TCP / TLS 连接）
+    - 结果缓存：LRU + TTL；失败结果也缓存（较短 TTL），避免反复请求打不开的链接
+    - single-flight：同一 URL 的并发请求只发起一次抓取
+    - 流式读取并增量解析响应，读到 </head> 或达到字节上限即停止，不下载整页、不构建 DOM
+    - 解析在线程池中执行，不阻塞事件循环
+    - 只访问公网地址：每条连接（含重定向）建立前解析主机，拒绝回环 / 私有 / 链路本地地址，并直接连接校验过的 IP
+    """
+
+    def __init__(
+        self,
+        max_size: int = 2048,
+        ttl: float = 3600.0,
+        negative_ttl: float = 120.0,
+        max_bytes: int = 512 * 1024,
+        timeout: float = 5.0,
+        max_connections: int = 20,
+        allow_private_addresses: bool = False,
+    ) -> None:
+        self.max_size = max(int(max_size), 1)
+        self.ttl = float(ttl)
+        self.negative_ttl = float(negative_ttl)
+        self.max_bytes = max(int(max_bytes), 1024)
+        self.timeout = float(timeout)
+        self.max_connections = max(int(max_connections), 1)
+        # 仅供本地测试替身使用，生产环境保持 False
+        self.allow_private_addresses = bool(allow_private_addresses)
+        self._client: Optional[httpx.AsyncClient] = None
+        # url -> (过期时间, 预览结果)
+        self._cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetch_errors = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            )
+            transport_class = httpx.AsyncHTTPTransport if self.allow_private_addresses else _PublicAddressTransport
+            # 显式传入 transport 时 httpx 不再使用环境变量中的代理，所有连接都经过地址校验
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                headers={"User-Agent": _USER_AGENT},
+                transport=transport_class(limits=limits),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """关闭连接池（应用关闭时调用）"""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_preview(self, url: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        获取链接预览信息（异步）
+
+        Returns:
+            {
+                "url": 原始URL,
+                "title": 页面标题,
+                "description": 页面描述,
+                "image": 预览图片URL,
+                "site_name": 网站名称,
+                "success": 是否成功
             }
-            
-    except httpx.TimeoutException:
-        logger.warning(f"获取链接预览超时: {url}")
-        return {
-            "url": url,
-            "title": None,
-            "description": None,
-            "image": None,
-            "site_name": urlparse(url).netloc,
-            "success": False
-        }
-    except httpx.RequestError as e:
-        logger.warning(f"获取链接预览失败: {url}, 错误: {e}")
-        return {
-            "url": url,
-            "title": None,
-            "description": None,
-            "image": None,
-            "site_name": urlparse(url).netloc,
-            "success": False
-        }
-    except Exception as e:
-        logger.error(f"解析链接预览时出错: {url}, 错误: {e}", exc_info=True)
+            返回的是副本，调用方可以修改。
+        """
+        if not is_valid_url(url):
+            return _failed_preview(url)
+
+        entry = self._cache.get(url)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._cache.move_to_end(url)
+                self.hits += 1
+                return dict(entry[1])
+            del self._cache[url]
+
+        task = self._inflight.get(url)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(url, timeout or self.timeout))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _t, key=url: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield：单个调用方被取消不影响抓取，结果仍会写入缓存供其他调用方使用
+        return dict(await asyncio.shield(task))
+
+    async def _load(self, url: str, timeout: float) -> Dict[str, Any]:
+        preview = await self._fetch(url, timeout)
+        ttl = self.ttl if preview.get("success") else self.negative_ttl
+        self._cache[url] = (time.monotonic() + ttl, preview)
+        self._cache.move_to_end(url)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return preview
+
+    async def _fetch(self, url: str, timeout: float) -> Dict[str, Any]:
+        try:
+            async with self._get_client().stream("GET", url, timeout=timeout) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("content-type", "").lower()
+                if content_type and "html" not in content_type:
+                    # 图片、文件等非 HTML 资源没有可提取的元数据
+                    return _failed_preview(url)
+                extractor = HeadMetaExtractor(http_charset=response.charset_encoding)
+                async for chunk in response.aiter_bytes():
+                    done = await asyncio.to_thread(extractor.feed, chunk)
+                    if done or extractor.bytes_read >= self.max_bytes:
+                        break
+            extractor.close()
+            return _build_preview(url, extractor.title, extractor.meta)
+        except httpx.TimeoutException:
+            self.fetch_errors += 1
+            logger.warning(f"获取链接预览超时: {url}")
+        except httpx.HTTPError as e:
+            self.fetch_errors += 1
+            logger.warning(f"获取链接预览失败: {url}, 错误: {e}")
+        except Exception as e:
+            self.fetch_errors += 1
+            logger.error(f"解析链接预览时出错: {url}, 错误: {e}", exc_info=True)
+        return _failed_preview(url)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存与抓取统计"""
+        lookups = self.hits + self.misses + self.coalesced
         return {
-            "url": url,
-            "title": None,
-            "description": None,
-            "image": None,
-            "site_name": urlparse(url).netloc,
-            "success": False
+            "name": "link_preview",
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "fetch_errors": self.fetch_errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
         }
 
 
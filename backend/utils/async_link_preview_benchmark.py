@@ -0,0 +1,262 @@
+"""
+链接预览服务测试：本地 HTTP 替身
+
+在本机启动一个 HTTP 替身服务器（标准库 ThreadingHTTPServer，支持 keep-alive），对 LinkPreviewService 校验：
+- 缓存：同一 URL 重复请求只抓取一次；失败结果（404、非 HTML）也缓存；
+- single-flight：同一 URL 的 --concurrency 个并发请求只抓取一次；
+- 连接池：抓取 --pages 个不同页面复用少量 TCP 连接，并与每次请求新建 httpx.AsyncClient（旧实现）对比耗时；
+- 流式读取：5 MB 的页面读到 </head> 即停止，统计服务端实际发出的字节数；
+- 超时与编码：慢响应按超时返回失败结果；GBK 页面按 <meta charset> 正确解码；
+- 内网地址：默认配置拒绝抓取解析到回环地址的链接（替身本身在 127.0.0.1 上，其余检查放开该限制）；
+- DNS rebinding：主机第二次解析换成内网地址时，连接仍使用校验时的那次解析结果。
+
+用法：python backend/utils/async_link_preview_benchmark.py [--pages 200] [--concurrency 100]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+# 确保项目根目录在 sys.path 中，便于导入 backend 包
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import httpx
+
+from backend.utils import async_link_preview
+from backend.utils.async_link_preview import LinkPreviewService, _is_public_address
+from backend.utils.html_head_extractor import HeadMetaExtractor
+
+_BIG_BODY_BYTES = 5 * 1024 * 1024
+_SLOW_SECONDS = 2.0
+
+
+def _page(title: str, extra_head: str = "") -> bytes:
+    return (
+        "<!doctype html><html><head><meta charset=\"utf-8\">"
+        f"<title>{title}</title>"
+        f"<meta property=\"og:title\" content=\"{title}\">"
+        "<meta property=\"og:description\" content=\"本地替身页面\">"
+        "<meta property=\"og:image\" content=\"/cover.png\">"
+        f"{extra_head}</head><body><p>正文</p></body></html>"
+    ).encode("utf-8")
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.connections = 0
+        self.big_bytes_sent = 0
+
+    def count(self, path: str) -> None:
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def reset(self) -> None:
+        with self.lock:
+            self.requests.clear()
+            self.connections = 0
+            self.big_bytes_sent = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stats: _Stats
+
+    def setup(self) -> None:
+        super().setup()
+        # 较小的发送缓冲区：客户端停止读取后，服务端很快就会感知到
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 64 * 1024)
+        # 响应头与正文分两次写出，关闭 Nagle 以免测到的是延迟确认的等待时间
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.stats.lock:
+            self.stats.connections += 1
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "text/html; charset=utf-8") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0]
+        self.stats.count(path)
+        if path.startswith("/page/"):
+            self._send(200, _page(f"页面 {path[6:]}"))
+        elif path == "/missing":
+            self._send(404, b"not found")
+        elif path == "/image":
+            self._send(200, b"\x89PNG\r\n\x1a\n" + b"\x00" * 1024, "image/png")
+        elif path == "/gbk":
+            body = ("<html><head><meta charset=\"gbk\"><title>中文编码页面</title></head><body></body></html>").encode("gbk")
+            self._send(200, body, "text/html")
+        elif path == "/slow":
+            time.sleep(_SLOW_SECONDS)
+            self._send(200, _page("慢页面"))
+        elif path == "/big":
+            head = _page("大页面").split(b"<body>")[0] + b"<body>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(head) + _BIG_BODY_BYTES))
+            self.end_headers()
+            sent = 0
+            try:
+                self.wfile.write(head)
+                sent = len(head)
+                block = b"<p>" + b"x" * 16377 + b"</p>"
+                while sent < len(head) + _BIG_BODY_BYTES:
+                    self.wfile.write(block)
+                    sent += len(block)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                with self.stats.lock:
+                    self.stats.big_bytes_sent = sent
+            self.close_connection = True
+        else:
+            self._send(404, b"not found")
+
+
+async def _old_fetch(url: str, timeout: float) -> None:
+    """旧实现的请求方式：每次新建客户端并下载整个响应"""
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+        response = await client.get(url)
+        extractor = HeadMetaExtractor(http_charset=response.charset_encoding)
+        extractor.feed(response.content)
+        extractor.close()
+
+
+async def _run(base: str, stats: _Stats, args) -> None:
+    # 替身服务器在 127.0.0.1 上，需放开内网地址限制；限制本身单独校验
+    for address in ("127.0.0.1", "10.1.2.3", "192.168.0.1", "169.254.169.254", "::1", "fe80::1%eth0", "::ffff:127.0.0.1"):
+        assert not _is_public_address(address), address
+    assert _is_public_address("93.184.216.34") and _is_public_address("2606:2800:220:1::1")
+    strict = LinkPreviewService(timeout=1.0)
+    try:
+        blocked = await strict.get_preview(f"{base}/page/blocked")
+    finally:
+        await strict.close()
+    assert not blocked["success"] and not stats.requests, stats.requests
+    print("内网地址：回环 / 私有 / 链路本地地址均被拒绝，默认配置抓取 127.0.0.1 时服务端未收到请求")
+
+    # DNS rebinding：首次解析得到“公网”地址（替身所在的 127.0.0.1 视为公网），之后的解析都换成内网地址
+    port = int(base.rsplit(":", 1)[1])
+    loop = asyncio.get_running_loop()
+    resolutions = []
+
+    async def rebinding_getaddrinfo(host, port, **kwargs):
+        resolutions.append(host)
+        address = "127.0.0.1" if len(resolutions) == 1 else "10.1.2.3"
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))]
+
+    loop.getaddrinfo = rebinding_getaddrinfo
+    async_link_preview._is_public_address = lambda address: address == "127.0.0.1"
+    strict = LinkPreviewService(timeout=1.0)
+    try:
+        rebound = await strict.get_preview(f"http://rebind.test:{port}/page/rebind")
+    finally:
+        await strict.close()
+        del loop.getaddrinfo
+        async_link_preview._is_public_address = _is_public_address
+    assert rebound["success"] and len(resolutions) == 1, (rebound, resolutions)
+    stats.reset()
+    print("DNS rebinding：每条连接只解析一次，直接连接校验过的地址")
+
+    service = LinkPreviewService(timeout=1.0, allow_private_addresses=True)
+    try:
+        # 缓存与 single-flight
+        stats.reset()
+        results = await asyncio.gather(*(service.get_preview(f"{base}/page/shared") for _ in range(args.concurrency)))
+        assert all(r["success"] and r["title"] == "页面 shared" for r in results)
+        assert results[0]["image"] == f"{base}/cover.png"
+        for _ in range(args.concurrency):
+            await service.get_preview(f"{base}/page/shared")
+        assert stats.requests.get("/page/shared") == 1, stats.requests
+        print(f"single-flight + 缓存：{args.concurrency} 个并发请求与 {args.concurrency} 次重复请求，"
+              f"服务端收到 {stats.requests['/page/shared']} 次请求")
+
+        # 失败结果缓存
+        for path in ("/missing", "/image"):
+            for _ in range(3):
+                assert not (await service.get_preview(f"{base}{path}"))["success"]
+            assert stats.requests.get(path) == 1, stats.requests
+        print("失败结果缓存：404 与非 HTML 资源各请求 3 次，服务端各收到 1 次请求")
+
+        # 连接池：顺序抓取不同页面
+        stats.reset()
+        start = time.perf_counter()
+        for i in range(args.pages):
+            assert (await service.get_preview(f"{base}/page/{i}"))["success"]
+        pooled_ms = (time.perf_counter() - start) * 1000
+        pooled_connections = stats.connections
+        stats.reset()
+        start = time.perf_counter()
+        for i in range(args.pages):
+            await _old_fetch(f"{base}/page/old-{i}", 1.0)
+        old_ms = (time.perf_counter() - start) * 1000
+        print(f"连接池：{args.pages} 个页面，新建 TCP 连接 {pooled_connections} 个、耗时 {pooled_ms:.0f} ms；"
+              f"每次新建客户端 {stats.connections} 个、耗时 {old_ms:.0f} ms")
+        assert pooled_connections <= service.max_connections
+
+        # 流式读取
+        stats.reset()
+        preview = await service.get_preview(f"{base}/big")
+        assert preview["success"] and preview["title"] == "大页面"
+        for _ in range(100):
+            if stats.big_bytes_sent:
+                break
+            await asyncio.sleep(0.05)
+        print(f"流式读取：{_BIG_BODY_BYTES // (1024 * 1024)} MB 页面读到 </head> 即停止，"
+              f"服务端共发出 {stats.big_bytes_sent / 1024:.0f} KB")
+        assert 0 < stats.big_bytes_sent < _BIG_BODY_BYTES // 2
+
+        # 超时
+        start = time.perf_counter()
+        assert not (await service.get_preview(f"{base}/slow"))["success"]
+        elapsed = time.perf_counter() - start
+        assert elapsed < _SLOW_SECONDS
+        print(f"超时：慢响应 {elapsed:.1f} s 后返回失败结果（超时 {service.timeout:.0f} s）")
+
+        # 编码
+        preview = await service.get_preview(f"{base}/gbk")
+        assert preview["title"] == "中文编码页面", preview
+        print("编码：GBK 页面按 <meta charset> 正确解码")
+        print(f"统计: {service.stats()}")
+    finally:
+        await service.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="链接预览服务测试：本地 HTTP 替身")
+    parser.add_argument("--pages", type=int, default=200, help="连接池测试抓取的页面数")
+    parser.add_argument("--concurrency", type=int, default=100, help="single-flight 测试的并发请求数")
+    args = parser.parse_args()
+    # 404、超时等预期内的失败不输出告警
+    logging.getLogger("backend").setLevel(logging.ERROR)
+
+    stats = _Stats()
+    _Handler.stats = stats
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        asyncio.run(_run(f"http://127.0.0.1:{server.server_address[1]}", stats, args))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
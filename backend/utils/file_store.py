@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+聊天文件存储：可续传的分块上传
+
+上传流程（HTTP 偏移量协议）：
+1. 客户端声明文件名、大小与 sha256，创建上传任务，得到 upload_id 与已上传的偏移量；
+2. 按偏移量逐块追加写入暂存区，偏移量不一致时返回服务端的当前偏移量，客户端从该处继续；
+3. 写满后校验 sha256，通过则移入正式存储并分配不可猜测的 file_id，消息中只引用文件地址。
+
+同一用户对同一文件（大小 + sha256 相同）得到同一个 upload_id，客户端重启或断线后重新创建即可续传；
+上传完成后任务信息中记录 file，在暂存期内重复创建或重发最后一块会直接返回已存储的文件。
+每个用户未完成的上传任务数与声明的总字节数有上限，超出时拒绝创建新任务（续传不受影响）。
+所有方法都是阻塞的文件操作，异步接口中通过 asyncio.to_thread 调用。
+"""
+
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 暂存区中超过此时长未写入的上传任务会被清理（秒）
+DEFAULT_STAGING_TTL = 24 * 3600
+# 每个用户未完成的上传任务数、声明的总字节数上限
+DEFAULT_MAX_PENDING_PER_USER = 10
+DEFAULT_MAX_PENDING_BYTES_PER_USER = 1024 * 1024 * 1024
+# 清理暂存区的最短间隔（秒）
+_CLEANUP_INTERVAL = 600
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_FILE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class FileStoreError(Exception):
+    """上传参数或状态错误；status 为对应的 HTTP 状态码"""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        # 偏移量不一致时附带服务端当前偏移量，客户端从该处继续
+        self.offset = offset
+
+
+def _safe_filename(filename: str) -> str:
+    """去掉路径部分与控制字符，只保留展示用的文件名"""
+    name = os.path.basename(str(filename or "").replace("\\", "/")).strip()
+    name = "".join(ch for ch in name if ch >= " " and ch != "\x7f")
+    return name[:200] or "file"
+
+
+class FileStore:
+    """
+    文件存储目录结构：
+    - staging/<upload_id>.part / .json：上传中的数据与任务信息（所属用户、文件名、大小、sha256）
+    - files/<file_id> / .json：校验通过的文件与元数据
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        max_size: int,
+        staging_ttl: float = DEFAULT_STAGING_TTL,
+        max_pending_per_user: int = DEFAULT_MAX_PENDING_PER_USER,
+        max_pending_bytes_per_user: int = DEFAULT_MAX_PENDING_BYTES_PER_USER,
+    ):
+        self.root = Path(root)
+        self.staging_dir = self.root / "staging"
+        self.files_dir = self.root / "files"
+        self.max_size = max_size
+        self.staging_ttl = staging_ttl
+        self.max_pending_per_user = max_pending_per_user
+        self.max_pending_bytes_per_user = max_pending_bytes_per_user
+        self._lock = threading.Lock()
+        # 创建新任务时串行检查各用户的未完成任务上限
+        self._create_lock = threading.Lock()
+        # upload_id -> 锁：同一上传任务的分块串行写入
+        self._upload_locks: Dict[str, threading.Lock] = {}
+        self._next_cleanup = 0.0
+
+    # ---- 上传 ----
+
+    def create_upload(self, user_id: int, filename: str, size: int, sha256: str) -> Dict[str, Any]:
+        """创建（或恢复）上传任务，返回 {upload_id, offset, size, file}"""
+        sha256 = str(sha256 or "").lower()
+        if not _SHA256_RE.match(sha256):
+            raise FileStoreError("sha256 格式错误")
+        if size <= 0:
+            raise FileStoreError("不能上传空文件")
+        if size > self.max_size:
+            raise FileStoreError(f"文件大小超过 {self.max_size // (1024 * 1024)} MB 限制", status=413)
+
+        self._cleanup_staging()
+        upload_id = hashlib.sha256(f"{int(user_id)}:{size}:{sha256}".encode("utf-8")).hexdigest()[:32]
+        with self._create_lock, self._upload_lock(upload_id):
+            meta = self._read_json(self._staging_meta(upload_id))
+            if meta is None:
+                self._check_pending_quota(int(user_id), size)
+                meta = {
+                    "upload_id": upload_id,
+                    "user_id": int(user_id),
+                    "filename": _safe_filename(filename),
+                    "size": size,
+                    "sha256": sha256,
+                    "created_at": time.time(),
+                }
+                self.staging_dir.mkdir(parents=True, exist_ok=True)
+                self._write_json(self._staging_meta(upload_id), meta)
+                self._staging_part(upload_id).touch()
+            elif not meta.get("file"):
+                # 续传时允许更换展示用的文件名
+                meta["filename"] = _safe_filename(filename)
+                self._write_json(self._staging_meta(upload_id), meta)
+            return self._state(meta)
+
+    def get_upload(self, upload_id: str, user_id: int) -> Dict[str, Any]:
+        """查询上传任务的当前偏移量（续传前调用）"""
+        return self._state(self._owned_upload(upload_id, user_id))
+
+    def write_chunk(self, upload_id: str, user_id: int, offset: int, data: bytes) -> Dict[str, Any]:
+        """
+        在 offset 处追加一块数据。
+
+        Returns:
+            {upload_id, offset, size, file}：file 在最后一块写入并校验通过后给出，否则为 None
+        """
+        with self._upload_lock(upload_id):
+            meta = self._owned_upload(upload_id, user_id)
+            if meta.get("file"):
+                # 已完成（如最后一块的响应丢失后重发）
+                return self._state(meta)
+            current = self._offset(upload_id)
+            if offset != current:
+                raise FileStoreError("上传偏移量不一致", status=409, offset=current)
+            if current + len(data) > meta["size"]:
+                raise FileStoreError("上传数据超出声明的文件大小", status=413, offset=current)
+            if data:
+                with open(self._staging_part(upload_id), "ab") as f:
+                    f.write(data)
+            if current + len(data) == meta["size"]:
+                self._finish(meta)
+            return self._state(meta)
+
+    # ---- 已存储的文件 ----
+
+    def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """返回文件元数据（含本地路径 path），不存在时返回 None"""
+        if not _FILE_ID_RE.match(str(file_id or "")):
+            return None
+        meta = self._read_json(self.files_dir / f"{file_id}.json")
+        path = self.files_dir / file_id
+        if meta is None or not path.is_file():
+            return None
+        return dict(meta, path=str(path))
+
+    # ---- 内部实现 ----
+
+    def _state(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        file_info = meta.get("file")
+        offset = meta["size"] if file_info else self._offset(meta["upload_id"])
+        return {"upload_id": meta["upload_id"], "offset": offset, "size": meta["size"], "file": file_info}
+
+    def _finish(self, meta: Dict[str, Any]) -> None:
+        """校验 sha256 并移入正式存储（结果记入 meta["file"]）；校验失败时丢弃已上传的数据"""
+        upload_id = meta["upload_id"]
+        part = self._staging_part(upload_id)
+        digest = hashlib.sha256()
+        with open(part, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+        if digest.hexdigest() != meta["sha256"]:
+            self._remove_upload(upload_id)
+            raise FileStoreError("文件校验失败，请重新上传", status=422, offset=0)
+
+        file_id = secrets.token_urlsafe(18)
+        mime_type, _ = mimetypes.guess_type(meta["filename"])
+        file_meta = {
+            "file_id": file_id,
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "sha256": meta["sha256"],
+            "mime_type": mime_type or "application/octet-stream",
+            "user_id": meta["user_id"],
+            "created_at": time.time(),
+        }
+        self.files_dir.mkdir(parents=True, exist_ok=True)
+        os.replace(part, self.files_dir / file_id)
+        self._write_json(self.files_dir / f"{file_id}.json", file_meta)
+        meta["file"] = file_meta
+        self._write_json(self._staging_meta(upload_id), meta)
+        logger.info("文件上传完成: file_id=%s, size=%s, user_id=%s", file_id, meta["size"], meta["user_id"])
+
+    def _check_pending_quota(self, user_id: int, size: int) -> None:
+        """统计暂存区中该用户未完成的上传任务（按声明的大小计），加上新任务后超出上限时拒绝创建"""
+        count = 0
+        pending_bytes = 0
+        if self.staging_dir.is_dir():
+            for meta_path in self.staging_dir.glob("*.json"):
+                meta = self._read_json(meta_path)
+                if meta is None or meta.get("file") or int(meta.get("user_id", 0)) != user_id:
+                    continue
+                count += 1
+                pending_bytes += int(meta.get("size", 0))
+        if count >= self.max_pending_per_user:
+            raise FileStoreError(f"未完成的上传任务过多（最多 {self.max_pending_per_user} 个），请稍后再试", status=429)
+        if pending_bytes + size > self.max_pending_bytes_per_user:
+            raise FileStoreError(
+                f"未完成的上传总大小超过 {self.max_pending_bytes_per_user // (1024 * 1024)} MB 限制，请稍后再试",
+                status=429,
+            )
+
+    def _owned_upload(self, upload_id: str, user_id: int) -> Dict[str, Any]:
+        meta = None
+        if _UPLOAD_ID_RE.match(str(upload_id or "")):
+            meta = self._read_json(self._staging_meta(upload_id))
+        if meta is None:
+            raise FileStoreError("上传任务不存在或已过期", status=404)
+        if int(meta.get("user_id", 0)) != int(user_id):
+            raise FileStoreError("无权访问该上传任务", status=403)
+        return meta
+
+    def _offset(self, upload_id: str) -> int:
+        try:
+            return self._staging_part(upload_id).stat().st_size
+        except OSError:
+            return 0
+
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+
+    def _remove_upload(self, upload_id: str) -> None:
+        for path in (self._staging_part(upload_id), self._staging_meta(upload_id)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._upload_locks.pop(upload_id, None)
+
+    def _cleanup_staging(self) -> None:
+        """删除长时间未写入的上传任务"""
+        now = time.time()
+        with self._lock:
+            if now < self._next_cleanup:
+                return
+            self._next_cleanup = now + _CLEANUP_INTERVAL
+        if not self.staging_dir.is_dir():
+            return
+        for meta_path in self.staging_dir.glob("*.json"):
+            upload_id = meta_path.stem
+            part = self._staging_part(upload_id)
+            try:
+                last_write = max(meta_path.stat().st_mtime, part.stat().st_mtime if part.exists() else 0)
+            except OSError:
+                continue
+            if now - last_write > self.staging_ttl:
+                self._remove_upload(upload_id)
+                logger.info("清理过期的上传任务: upload_id=%s", upload_id)
+
+    def _staging_part(self, upload_id: str) -> Path:
+        return self.staging_dir / f"{upload_id}.part"
+
+    def _staging_meta(self, upload_id: str) -> Path:
+        return self.staging_dir / f"{upload_id}.json"
+
+    @staticmethod
+    def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_json(path: Path, data: Dict[str, Any]) -> None:
+        """先写临时文件再替换，避免读到写了一半的内容"""
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
@@ -0,0 +1,192 @@
+"""
+聊天文件分块续传测试
+
+对比两种发送文件的方式：
+- 内联：整个文件读入内存，base64 编码后放进一条 send_message 的 JSON 消息；
+- 分块：按块（--chunk）写入 FileStore 暂存区，写满后校验 sha256 并移入正式存储，消息中只发送文件地址。
+统计内存峰值（tracemalloc）、耗时与消息大小；分块上传中途按 --fail-rate 模拟请求丢失、
+写入成功但响应丢失与客户端重启，均按服务端偏移量续传；最后校验存储的文件与原文件一致，
+并校验偏移量不一致、sha256 不一致与越权访问的处理。
+
+用法：python backend/utils/file_store_benchmark.py [--size-mb 20] [--chunk 1024] [--fail-rate 0.2]
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# 确保项目根目录在 sys.path 中，便于导入 backend 包
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from backend.utils.file_store import FileStore, FileStoreError
+
+
+def _make_file(path: Path, size: int) -> None:
+    """半随机内容（接近真实附件的可压缩程度）"""
+    rng = random.Random(7)
+    with open(path, "wb") as f:
+        written = 0
+        while written < size:
+            block = bytes(rng.getrandbits(8) for _ in range(4096)) * 16
+            block = block[: size - written]
+            f.write(block)
+            written += len(block)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _inline(path: Path) -> int:
+    """旧方式：整文件 base64 后作为一条消息发送，返回消息字节数"""
+    with open(path, "rb") as f:
+        content = f.read()
+    data_url = f"data:application/octet-stream;base64,{base64.b64encode(content).decode('utf-8')};filename=\"{path.name}\""
+    frame = "42" + json.dumps(["send_message", {"session_id": "chat_1", "message": data_url, "message_type": "file"}])
+    return len(frame.encode("utf-8"))
+
+
+def _chunked(store: FileStore, path: Path, chunk_size: int, fail_rate: float, rng: random.Random):
+    """按上传协议分块写入，模拟网络故障与客户端重启；返回 (文件信息, 请求次数, 续传次数)"""
+    size = path.stat().st_size
+    sha256 = _sha256(path)
+    state = store.create_upload(1, path.name, size, sha256)
+    offset = state["offset"]
+    requests = resumes = 0
+    restarted = False
+    with open(path, "rb") as f:
+        while state["file"] is None:
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            requests += 1
+            roll = rng.random()
+            if roll < fail_rate / 2:
+                # 请求丢失：查询服务端偏移量后续传
+                resumes += 1
+                offset = store.get_upload(state["upload_id"], 1)["offset"]
+                continue
+            try:
+                result = store.write_chunk(state["upload_id"], 1, offset, chunk)
+            except FileStoreError as e:
+                assert e.status == 409, e
+                offset = e.offset
+                continue
+            if roll < fail_rate:
+                # 写入成功但响应丢失：客户端按旧偏移量重发，服务端返回 409 与当前偏移量
+                resumes += 1
+                continue
+            state, offset = result, result["offset"]
+            if not restarted and offset >= size // 2:
+                # 客户端中途重启：重新创建上传任务，从服务端记录的偏移量继续
+                restarted = True
+                resumes += 1
+                state = store.create_upload(1, path.name, size, sha256)
+                offset = state["offset"]
+    assert restarted or size <= chunk_size
+    return state["file"], requests, resumes
+
+
+def _check_errors(store: FileStore) -> None:
+    data = os.urandom(300 * 1024)
+    good = hashlib.sha256(data).hexdigest()
+    state = store.create_upload(2, "a.bin", len(data), good)
+    # 其他用户不能查询或写入
+    for call in (lambda: store.get_upload(state["upload_id"], 3), lambda: store.write_chunk(state["upload_id"], 3, 0, data)):
+        try:
+            call()
+            raise AssertionError("越权访问未被拒绝")
+        except FileStoreError as e:
+            assert e.status == 403
+    # 超出声明大小
+    try:
+        store.write_chunk(state["upload_id"], 2, 0, data + b"x")
+        raise AssertionError("超出声明大小未被拒绝")
+    except FileStoreError as e:
+        assert e.status == 413 and e.offset == 0
+    # 完成后重发最后一块（响应丢失）直接返回同一文件
+    done = store.write_chunk(state["upload_id"], 2, 0, data)
+    again = store.write_chunk(state["upload_id"], 2, 0, data)
+    assert done["file"] and again["file"]["file_id"] == done["file"]["file_id"]
+    assert store.create_upload(2, "a.bin", len(data), good)["file"]["file_id"] == done["file"]["file_id"]
+
+    # 内容与声明的 sha256 不一致：丢弃并要求重新上传
+    state = store.create_upload(2, "b.bin", len(data), hashlib.sha256(b"other").hexdigest())
+    try:
+        store.write_chunk(state["upload_id"], 2, 0, data)
+        raise AssertionError("sha256 不一致未被拒绝")
+    except FileStoreError as e:
+        assert e.status == 422
+    try:
+        store.get_upload(state["upload_id"], 2)
+        raise AssertionError("校验失败的上传任务未被清理")
+    except FileStoreError as e:
+        assert e.status == 404
+    # 文件大小上限
+    try:
+        store.create_upload(2, "big.bin", store.max_size + 1, good)
+        raise AssertionError("超过大小上限未被拒绝")
+    except FileStoreError as e:
+        assert e.status == 413
+    assert store.get_file("../../etc/passwd") is None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="聊天文件分块续传测试")
+    parser.add_argument("--size-mb", type=float, default=20, help="测试文件大小（MB）")
+    parser.add_argument("--chunk", type=int, default=1024, help="分块大小（KB）")
+    parser.add_argument("--fail-rate", type=float, default=0.2, help="每次分块请求失败的概率")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        path = tmp / "附件 测试.bin"
+        _make_file(path, size)
+        store = FileStore(tmp / "store", max_size=max(size, 1024 * 1024) * 2)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        frame_bytes = _inline(path)
+        inline_ms = (time.perf_counter() - start) * 1000
+        inline_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        file_info, requests, resumes = _chunked(store, path, args.chunk * 1024, args.fail_rate, random.Random(args.seed))
+        chunked_ms = (time.perf_counter() - start) * 1000
+        chunked_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        stored = store.get_file(file_info["file_id"])
+        assert stored and _sha256(Path(stored["path"])) == _sha256(path)
+        assert stored["filename"] == path.name and stored["size"] == size
+        message = json.dumps({"message": f"/api/files/{file_info['file_id']}/{path.name}", "message_type": "file"})
+
+        print(f"文件大小: {size / 1024 / 1024:.1f} MB，分块: {args.chunk} KB，失败率: {args.fail_rate:.0%}")
+        print(f"[内联] 消息 {frame_bytes / 1024 / 1024:.1f} MB，内存峰值 {inline_peak / 1024 / 1024:.1f} MB"
+              f"（文件的 {inline_peak / size:.1f} 倍），耗时 {inline_ms:.0f} ms")
+        print(f"[分块] 消息 {len(message)} B，内存峰值 {chunked_peak / 1024 / 1024:.1f} MB，耗时 {chunked_ms:.0f} ms，"
+              f"请求 {requests} 次（续传 {resumes} 次，含一次客户端重启）")
+        print("  存储的文件与原文件 sha256 一致")
+
+        _check_errors(store)
+        print("  越权访问、超出大小、sha256 不一致与重复完成的处理正确")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+流式 <head> 元数据提取器
+
+链接预览只需要 <title> 和少量 <meta>（og:*、description），不必下载整页、构建完整 DOM。
+HeadMetaExtractor 按块接收响应字节：
+- 先根据 BOM / HTTP 头 / 前 1024 字节中的 <meta charset> 确定编码，再增量解码；
+- 基于标准库 HTMLParser 增量解析，只处理 title 与 meta 标签；
+- 遇到 </head>、<body> 或其他不属于 <head> 的元素即结束，调用方据此停止读取。
+"""
+
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+# 编码预扫描的字节数（与 HTML 规范的 prescan 长度一致）
+PRESCAN_BYTES = 1024
+# 每次交给解析器的字符数：<head> 结束后最多多解析这么多内容
+_FEED_SLICE = 2048
+
+_META_CHARSET_PATTERN = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:\-]+)""", re.IGNORECASE
+)
+
+_BOMS: Tuple[Tuple[bytes, str], ...] = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# 常见的"声明编码 → 实际应使用的超集编码"
+_CHARSET_ALIASES = {
+    "gb2312": "gb18030",
+    "gbk": "gb18030",
+    "x-gbk": "gb18030",
+}
+
+# 可以出现在 <head> 中的元素；遇到其他元素说明 <head> 已经结束
+_HEAD_TAGS = frozenset({
+    "html", "head", "title", "meta", "link", "base", "script", "style", "noscript", "template",
+})
+
+# 需要提取的 meta 键：og:* 取 property，description 取 name
+_META_KEYS = frozenset({"og:title", "og:description", "og:image", "og:site_name", "description"})
+
+
+def _normalize_charset(charset: Optional[str]) -> Optional[str]:
+    """校验并规范化编码名，无法识别返回 None"""
+    if not charset:
+        return None
+    charset = charset.strip().strip("\"'").lower()
+    charset = _CHARSET_ALIASES.get(charset, charset)
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+
+def detect_charset(prefix: bytes, http_charset: Optional[str] = None) -> str:
+    """
+    确定页面编码，优先级：BOM > HTTP Content-Type 中的 charset > <meta charset> > utf-8
+
+    Args:
+        prefix: 响应体的前若干字节（至少 PRESCAN_BYTES，除非页面更短）
+        http_charset: HTTP 头中声明的编码
+    """
+    for bom, encoding in _BOMS:
+        if prefix.startswith(bom):
+            return encoding
+    charset = _normalize_charset(http_charset)
+    if charset:
+        return charset
+    match = _META_CHARSET_PATTERN.search(prefix[:PRESCAN_BYTES])
+    if match:
+        charset = _normalize_charset(match.group(1).decode("ascii", "ignore"))
+        if charset:
+            return charset
+    return "utf-8"
+
+
+class _HeadParser(HTMLParser):
+    """只关心 title 与 meta 的增量解析器"""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.done = False
+        self.meta: Dict[str, str] = {}
+        self._title_parts: List[str] = []
+        self._title_state = 0  # 0: 未遇到 1: 正在读取 2: 已读完
+
+    @property
+    def title(self) -> Optional[str]:
+        return "".join(self._title_parts) if self._title_state else None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag not in _HEAD_TAGS:
+            self.done = True
+        elif tag == "meta":
+            self._handle_meta(attrs)
+        elif tag == "title" and self._title_state == 0:
+            self._title_state = 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._title_state == 1:
+            self._title_state = 2
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._title_state == 1 and not self.done:
+            self._title_parts.append(data)
+
+    def _handle_meta(self, attrs) -> None:
+        attr_map = {name.lower(): value for name, value in attrs if value is not None}
+        key = (attr_map.get("property") or attr_map.get("name") or "").strip().lower()
+        content = attr_map.get("content")
+        # 与 find() 语义一致：同名 meta 取第一个
+        if key in _META_KEYS and content and key not in self.meta:
+            self.meta[key] = content
+
+
+class HeadMetaExtractor:
+    """
+    增量提取页面 <head> 中的预览元数据。
+
+    用法：
+        extractor = HeadMetaExtractor(http_charset=response.charset_encoding)
+        async for chunk in response.aiter_bytes():
+            if extractor.feed(chunk) or extractor.bytes_read >= max_bytes:
+                break
+        extractor.close()
+        extractor.title / extractor.meta
+    """
+
+    def __init__(self, http_charset: Optional[str] = None) -> None:
+        self.http_charset = http_charset
+        self.encoding: Optional[str] = None
+        self.bytes_read = 0
+        self._pending = bytearray()
+        self._decoder = None
+        self._parser = _HeadParser()
+
+    @property
+    def done(self) -> bool:
+        return self._parser.done
+
+    @property
+    def title(self) -> Optional[str]:
+        return self._parser.title
+
+    @property
+    def meta(self) -> Dict[str, str]:
+        return self._parser.meta
+
+    def feed(self, chunk: bytes) -> bool:
+        """输入一块响应字节，返回是否已读完 <head>（可以停止读取）"""
+        if self.done or not chunk:
+            return self.done
+        self.bytes_read += len(chunk)
+        if self._decoder is None:
+            # 凑够预扫描长度后再确定编码
+            self._pending += chunk
+            if len(self._pending) < PRESCAN_BYTES:
+                return False
+            self._start_decoding()
+        else:
+            self._feed_text(self._decoder.decode(chunk))
+        return self.done
+
+    def close(self) -> None:
+        """输入结束（读完或提前停止）时调用，处理剩余的缓冲数据"""
+        if self._decoder is None:
+            self._start_decoding()
+        if not self.done:
+            self._feed_text(self._decoder.decode(b"", final=True))
+        self._parser.close()
+
+    def _start_decoding(self) -> None:
+        pending = bytes(self._pending)
+        self._pending.clear()
+        self.encoding = detect_charset(pending, self.http_charset)
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        self._feed_text(self._decoder.decode(pending))
+
+    def _feed_text(self, text: str) -> None:
+        """分片交给解析器，<head> 结束后立即停止，不解析块中剩余的正文"""
+        for start in range(0, len(text), _FEED_SLICE):
+            if self.done:
+                break
+            self._parser.feed(text[start:start + _FEED_SLICE])
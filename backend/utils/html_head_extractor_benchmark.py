@@ -0,0 +1,178 @@
+"""
+链接预览元数据提取测试：HeadMetaExtractor 与 BeautifulSoup 对比
+
+用合成页面（正文约 --body-kb KB）对比三种提取方式每个页面读取的字节数、耗时（中位数）与 Python 分配峰值（tracemalloc）：
+- BeautifulSoup 整页：下载整个响应后构建完整 DOM（最初的实现）；
+- BeautifulSoup 截取 head：流式读到 </head> 或 max_bytes 后构建 DOM（改为流式读取后、引入提取器前的实现）；
+- HeadMetaExtractor：按 --chunk-kb KB 分块增量解析，读完 <head> 即停止（现有实现）。
+同时校验三种方式生成的预览结果一致。beautifulsoup4 不是后端依赖，未安装时只测 HeadMetaExtractor。
+
+用法：python backend/utils/html_head_extractor_benchmark.py [--body-kb 1600] [--chunk-kb 16] [--rounds 3]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 确保项目根目录在 sys.path 中，便于导入 backend 包
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from backend.utils.async_link_preview import _build_preview
+from backend.utils.html_head_extractor import HeadMetaExtractor
+
+try:
+    from bs4 import BeautifulSoup
+    BS4_AVAILABLE = True
+except ImportError:
+    BS4_AVAILABLE = False
+
+_URL = "https://example.com/article/1"
+_HEAD_END = b"</head>"
+# LinkPreviewService 的默认字节上限
+_MAX_BYTES = 512 * 1024
+
+
+def _body(kb: int) -> str:
+    paragraph = "<div class=\"post\"><p>正文段落，包含<a href=\"/x\">链接</a>与<b>加粗</b>。</p></div>\n"
+    return paragraph * (kb * 1024 // len(paragraph.encode("utf-8")))
+
+
+def _pages(body_kb: int) -> Dict[str, Tuple[bytes, Optional[str]]]:
+    """页面名 -> (响应字节, HTTP 头中的 charset)"""
+    meta = (
+        "<meta property=\"og:title\" content=\"  合成页面标题  \">"
+        "<meta property=\"og:description\" content=\"合成页面描述\">"
+        "<meta name=\"description\" content=\"普通描述\">"
+        "<meta property=\"og:image\" content=\"/cover.png\">"
+        "<meta property=\"og:site_name\" content=\"示例站点\">"
+    )
+    body = _body(body_kb)
+    inline_script = "<script>" + "var x = 1;\n" * 6000 + "</script>"
+    inline_style = "<style>" + ".c { color: red; }\n" * 2000 + "</style>"
+    return {
+        "普通页面": (
+            f"<!doctype html><html><head><meta charset=\"utf-8\"><title>标题</title>{meta}</head>"
+            f"<body>{body}</body></html>".encode("utf-8"), "utf-8"),
+        "head 内大段脚本与样式": (
+            f"<!doctype html><html><head><meta charset=\"utf-8\">{inline_script}{inline_style}"
+            f"<title>标题</title>{meta}</head><body>{body}</body></html>".encode("utf-8"), None),
+        "省略 </head>": (
+            f"<html><meta charset=\"utf-8\"><title>只有 title 的页面</title>"
+            f"<div>{body}</div></html>".encode("utf-8"), None),
+        "GBK（<meta charset>）": (
+            f"<html><head><meta charset=\"gbk\"><title>中文编码页面</title>{meta}</head>"
+            f"<body>{body}</body></html>".encode("gbk"), None),
+        "没有元数据": (f"<html><body>{body}</body></html>".encode("utf-8"), "utf-8"),
+    }
+
+
+def _legacy_parse(content: bytes, url: str, encoding: Optional[str] = None) -> Dict[str, Any]:
+    """BeautifulSoup 实现的 _parse_preview_html，仅作为对比基准"""
+    soup = BeautifulSoup(content, "html.parser", from_encoding=encoding)
+    meta: Dict[str, str] = {}
+    for key, attrs in (("og:title", {"property": "og:title"}),
+                       ("og:description", {"property": "og:description"}),
+                       ("description", {"name": "description"}),
+                       ("og:image", {"property": "og:image"}),
+                       ("og:site_name", {"property": "og:site_name"})):
+        tag = soup.find("meta", attrs=attrs)
+        if tag and tag.get("content"):
+            meta[key] = tag.get("content")
+    title_tag = soup.find("title")
+    title = title_tag.get_text() if title_tag else None
+    return _build_preview(url, title, meta)
+
+
+def _legacy_read_head(chunks: List[bytes]) -> bytes:
+    """旧实现的 _read_head：读到 </head> 或 max_bytes 后停止"""
+    buf = bytearray()
+    for chunk in chunks:
+        search_from = max(len(buf) - len(_HEAD_END) + 1, 0)
+        buf += chunk
+        pos = bytes(buf[search_from:]).lower().find(_HEAD_END)
+        if pos != -1:
+            return bytes(buf[:search_from + pos + len(_HEAD_END)])
+        if len(buf) >= _MAX_BYTES:
+            return bytes(buf[:_MAX_BYTES])
+    return bytes(buf)
+
+
+def _bs4_full(chunks: List[bytes], charset: Optional[str]) -> Tuple[Dict[str, Any], int]:
+    content = b"".join(chunks)
+    return _legacy_parse(content, _URL, charset), len(content)
+
+
+def _bs4_head(chunks: List[bytes], charset: Optional[str]) -> Tuple[Dict[str, Any], int]:
+    head = _legacy_read_head(chunks)
+    # 旧实现按 chunk 边界停止读取，实际读取的字节数按块向上取整
+    read = 0
+    for chunk in chunks:
+        read += len(chunk)
+        if read >= len(head):
+            break
+    return _legacy_parse(head, _URL, charset), read
+
+
+def _extractor(chunks: List[bytes], charset: Optional[str]) -> Tuple[Dict[str, Any], int]:
+    extractor = HeadMetaExtractor(http_charset=charset)
+    for chunk in chunks:
+        if extractor.feed(chunk) or extractor.bytes_read >= _MAX_BYTES:
+            break
+    extractor.close()
+    return _build_preview(_URL, extractor.title, extractor.meta), extractor.bytes_read
+
+
+def _measure(method: Callable, chunks: List[bytes], charset: Optional[str], rounds: int):
+    """返回 (预览结果, 读取字节数, 耗时 ms 中位数, 分配峰值 KB)"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        preview, read = method(chunks, charset)
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    method(chunks, charset)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return preview, read, statistics.median(timings), peak / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="链接预览元数据提取测试：HeadMetaExtractor 与 BeautifulSoup 对比")
+    parser.add_argument("--body-kb", type=int, default=1600, help="合成页面正文大小（KB）")
+    parser.add_argument("--chunk-kb", type=int, default=16, help="模拟响应流的分块大小（KB）")
+    parser.add_argument("--rounds", type=int, default=3, help="重复次数（取中位数）")
+    args = parser.parse_args()
+    # 截取到 max_bytes 时可能切断多字节字符，BeautifulSoup 会为此输出告警
+    logging.getLogger("bs4").setLevel(logging.ERROR)
+
+    methods: List[Tuple[str, Callable]] = []
+    if BS4_AVAILABLE:
+        methods += [("BeautifulSoup 整页", _bs4_full), ("BeautifulSoup 截取 head", _bs4_head)]
+    else:
+        print("未安装 beautifulsoup4，只测 HeadMetaExtractor")
+    methods.append(("HeadMetaExtractor", _extractor))
+
+    chunk_size = args.chunk_kb * 1024
+    print(f"{'':<26}{'读取 KB':>10}{'耗时 ms':>10}{'峰值 KB':>10}")
+    for name, (content, charset) in _pages(args.body_kb).items():
+        chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        print(f"[{name}] {len(content) / 1024:.0f} KB")
+        previews = []
+        for label, method in methods:
+            preview, read, ms, peak_kb = _measure(method, chunks, charset, args.rounds)
+            previews.append(preview)
+            print(f"  {label:<24}{read / 1024:>10.0f}{ms:>10.1f}{peak_kb:>10.0f}")
+        assert all(p == previews[-1] for p in previews), f"预览结果不一致: {previews}"
+    if BS4_AVAILABLE:
+        print("三种方式的预览结果一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+线性时间 Markdown 渲染器
+
+替代原先串行执行的十余次 re.sub：每种语法都由手写扫描器处理，查找配对分隔符时
+复用"下一个分隔符位置"缓存，最坏情况下也是 O(n)，不会因恶意输入退化为平方复杂度。
+
+执行顺序与旧实现保持一致（代码块 → 行内代码 → 标题/列表 → 加粗 → 斜体 → 链接与换行），
+因此输出的 HTML 与旧实现逐字节相同，包括以下历史行为：
+- 先转义 HTML，因此以 "> " 开头的引用不会被渲染；
+- 代码块 / 行内代码内部同样会处理标题、列表、加粗等标记；
+- 无序列表外层为 <ul><ol>…</ol></ul>（旧实现包裹有序列表时会再包裹一次）。
+
+唯一的差异：旧实现的 \\s+ 可以跨越换行，"#" 或 "-" 后只有空白时会吞并下一行作为内容；
+现在只在本行内匹配，这类行按普通文本输出。
+
+样式由调用方通过 theme 传入（后端与桌面端样式不同）：
+    code_block / inline_code / strong / em: 含一个 {} 占位的模板
+    heading: 含 {level}、{size}、{content} 的模板；heading_size(level) 计算字号
+    li: 含一个 {} 占位的模板；ul_open / ol_open: 列表开始标签
+    link: 含 {href}、{label} 的模板
+"""
+
+from typing import Any, Dict, List
+
+
+def escape_html(text: str) -> str:
+    """转义 HTML 特殊字符"""
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+        .replace("'", "&#39;")
+    )
+
+
+class _Finder:
+    """带缓存的 str.find：同一字符的连续查找只扫描一次，保证整体线性"""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self._cache: Dict[str, tuple] = {}
+
+    def find(self, ch: str, start: int) -> int:
+        cached = self._cache.get(ch)
+        if cached is not None:
+            searched_from, pos = cached
+            # [searched_from, pos) 区间内没有 ch，start 落在其中时结果不变
+            if searched_from <= start and (pos == -1 or start <= pos):
+                return pos
+        pos = self.text.find(ch, start)
+        self._cache[ch] = (start, pos)
+        return pos
+
+
+def _render_code_blocks(text: str, template: str) -> str:
+    """```代码块```：从左到右取最近的一对 ```"""
+    parts: List[str] = []
+    pos = 0
+    while True:
+        start = text.find("```", pos)
+        if start == -1:
+            break
+        end = text.find("```", start + 3)
+        if end == -1:
+            break
+        parts.append(text[pos:start])
+        parts.append(template.format(text[start + 3:end]))
+        pos = end + 3
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _render_inline_code(text: str, template: str) -> str:
+    """`行内代码`：内容至少一个字符，可以跨行"""
+    parts: List[str] = []
+    pos = 0
+    start = text.find("`")
+    while start != -1:
+        end = text.find("`", start + 1)
+        if end == -1:
+            break
+        if end == start + 1:
+            # 空内容：当前反引号按普通字符处理，从下一个反引号重新开始
+            start = end
+            continue
+        parts.append(text[pos:start])
+        parts.append(template.format(text[start + 1:end]))
+        pos = end + 1
+        start = text.find("`", pos)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _marker_content_start(line: str, marker_end: int) -> int:
+    """等价于行内的 \\s+(.+)$：标记后至少一个空白，且空白后至少还剩一个字符；不满足返回 -1"""
+    if marker_end >= len(line) or not line[marker_end].isspace():
+        return -1
+    i = marker_end + 1
+    while i < len(line) - 1 and line[i].isspace():
+        i += 1
+    return i if i < len(line) else -1
+
+
+def _classify_line(line: str):
+    """识别行类型，返回 (类型, 参数, 内容起点)；类型为 heading / ul / ol / None"""
+    if not line:
+        return None, None, -1
+    first = line[0]
+    if first == "#":
+        level = len(line) - len(line.lstrip("#"))
+        if level <= 6:
+            start = _marker_content_start(line, level)
+            if start != -1:
+                return "heading", level, start
+        return None, None, -1
+    if first in "-*":
+        start = _marker_content_start(line, 1)
+        if start != -1:
+            return "ul", None, start
+        return None, None, -1
+    if first.isdecimal():
+        i = 1
+        while i < len(line) and line[i].isdecimal():
+            i += 1
+        if i < len(line) and line[i] == ".":
+            start = _marker_content_start(line, i + 1)
+            if start != -1:
+                return "ol", None, start
+    return None, None, -1
+
+
+def _render_blocks(text: str, theme: Dict[str, Any]) -> str:
+    """逐行扫描一次，处理标题与列表，并把连续的同类列表项（中间可隔空白行）包裹起来"""
+    lines = text.split("\n")
+    out: List[str] = []
+    # 当前列表：(类型, 列表开始处在 out 中的下标, 最后一个列表项在 out 中的下标)
+    run_kind = None
+    run_start = run_last = -1
+
+    def _close_run() -> None:
+        if run_kind == "ul":
+            out[run_start] = theme["ul_open"] + theme["ol_open"] + out[run_start]
+            out[run_last] += "</ol></ul>"
+        elif run_kind == "ol":
+            out[run_start] = theme["ol_open"] + out[run_start]
+            out[run_last] += "</ol>"
+
+    for line in lines:
+        kind, level, start = _classify_line(line)
+        if kind == "heading":
+            line = theme["heading"].format(
+                level=level, size=theme["heading_size"](level), content=line[start:]
+            )
+        elif kind in ("ul", "ol"):
+            line = theme["li"].format(line[start:])
+
+        if kind in ("ul", "ol"):
+            if kind != run_kind:
+                _close_run()
+                run_kind, run_start = kind, len(out)
+            run_last = len(out)
+        elif run_kind is not None and line.strip():
+            _close_run()
+            run_kind = None
+        out.append(line)
+
+    _close_run()
+    return "\n".join(out)
+
+
+def _next_delimiter(finder: _Finder, start: int) -> int:
+    """下一个 * 或 _ 的位置，没有返回 -1"""
+    star = finder.find("*", start)
+    under = finder.find("_", start)
+    if star == -1:
+        return under
+    if under == -1:
+        return star
+    return min(star, under)
+
+
+def _render_strong(text: str, template: str) -> str:
+    """**加粗** 或 __加粗__"""
+    finder = _Finder(text)
+    parts: List[str] = []
+    pos = 0
+    n = len(text)
+    i = _next_delimiter(finder, 0)
+    while i != -1 and i < n - 1:
+        ch = text[i]
+        if text[i + 1] == ch:
+            end = finder.find(ch, i + 2)
+            if end > i + 2 and end + 1 < n and text[end + 1] == ch:
+                parts.append(text[pos:i])
+                parts.append(template.format(text[i + 2:end]))
+                pos = end + 2
+                i = _next_delimiter(finder, pos)
+                continue
+        i = _next_delimiter(finder, i + 1)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _render_em(text: str, template: str) -> str:
+    """*斜体* 或 _斜体_（前后不能紧挨同一符号）"""
+    finder = _Finder(text)
+    parts: List[str] = []
+    pos = 0
+    n = len(text)
+    i = _next_delimiter(finder, 0)
+    while i != -1:
+        ch = text[i]
+        if i == 0 or text[i - 1] != ch:
+            end = finder.find(ch, i + 1)
+            if end > i + 1 and (end + 1 >= n or text[end + 1] != ch):
+                parts.append(text[pos:i])
+                parts.append(template.format(text[i + 1:end]))
+                pos = end + 1
+                i = _next_delimiter(finder, pos)
+                continue
+        i = _next_delimiter(finder, i + 1)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _render_links(text: str, template: str) -> str:
+    """[链接文本](url)，同时把换行转换为 <br/>"""
+    finder = _Finder(text)
+    parts: List[str] = []
+    pos = 0
+    i = finder.find("[", 0)
+    n = len(text)
+    while i != -1:
+        label_end = finder.find("]", i + 1)
+        if label_end == -1:
+            break
+        if label_end > i + 1 and label_end + 1 < n and text[label_end + 1] == "(":
+            url_end = finder.find(")", label_end + 2)
+            if url_end == -1:
+                break
+            if url_end > label_end + 2:
+                label = text[i + 1:label_end]
+                url = text[label_end + 2:url_end]
+                href = url if url[:7].lower() == "http://" or url[:8].lower() == "https://" else f"http://{url}"
+                parts.append(text[pos:i])
+                parts.append(template.format(href=href, label=label))
+                pos = url_end + 1
+                i = finder.find("[", pos)
+                continue
+        i = finder.find("[", i + 1)
+    parts.append(text[pos:])
+    return "".join(parts).replace("\n", "<br/>")
+
+
+def render_markdown(text: str, theme: Dict[str, Any]) -> str:
+    """将纯文本渲染为 HTML（先转义），总耗时与文本长度成线性关系"""
+    html = escape_html(text)
+    html = _render_code_blocks(html, theme["code_block"])
+    html = _render_inline_code(html, theme["inline_code"])
+    html = _render_blocks(html, theme)
+    html = _render_strong(html, theme["strong"])
+    html = _render_em(html, theme["em"])
+    return _render_links(html, theme["link"])
@@ -0,0 +1,230 @@
+"""
+Markdown 渲染器测试：黄金用例、与旧实现的差分对比和吞吐量
+
+- 黄金用例：markdown_renderer_golden.json 中每条输入的期望 HTML 由旧的逐条正则替换实现生成，
+  校验后端 _apply_markdown 与桌面端渲染器（client/utils/markdown_renderer.py）的输出逐字节一致；
+- 差分对比：随机生成 --random 条由 Markdown 标记拼成的输入，逐条与旧实现（本文件中的 _legacy_apply_markdown）
+  比较，跳过已知差异（"#" / "-" / "1." 后只有空白时旧实现会吞并下一行）；
+- 吞吐量：典型聊天消息的每秒渲染条数（目标 --target 条/秒）与旧实现对比，
+  以及对抗输入（长串 "[" / "*" / "`" 等）随长度增长的耗时，确认线性。
+
+用法：python backend/utils/markdown_renderer_benchmark.py [--random 300000] [--seconds 2] [--target 10000]
+      python backend/utils/markdown_renderer_benchmark.py --regenerate   # 用旧实现重新生成黄金用例
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List
+
+# 确保项目根目录在 sys.path 中，便于导入 backend / client 包
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from backend.utils.rich_text_processor import MARKDOWN_THEME, _apply_markdown
+from client.utils.markdown_renderer import render_markdown as client_render_markdown
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "markdown_renderer_golden.json")
+
+# 已知差异：标记后只有空白（\s+ 跨越换行）
+_KNOWN_DEVIATION = re.compile(r"(?m)^(?:#{1,6}|[-*]|\d+\.)[^\S\n]*\n")
+
+
+def _legacy_apply_markdown(text: str) -> str:
+    """旧实现（逐条正则替换），仅作为对比基准"""
+    escaped = (
+        text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        .replace('"', "&quot;").replace("'", "&#39;")
+    )
+    escaped = re.sub(
+        r"```([\s\S]*?)```",
+        lambda m: f'<pre style="background-color:#f3f4f6;padding:8px;border-radius:4px;overflow-x:auto;"><code>{m.group(1)}</code></pre>',
+        escaped,
+    )
+    escaped = re.sub(
+        r"`([^`]+)`",
+        lambda m: f'<code style="background-color:#f3f4f6;padding:2px 4px;border-radius:3px;font-family:monospace;">{m.group(1)}</code>',
+        escaped,
+    )
+    for i in range(1, 7):
+        escaped = re.sub(
+            rf"^{'#' * i}\s+(.+)$",
+            lambda m, level=i: f"<h{level} style='margin:8px 0;font-size:{18-level*2}px;font-weight:bold;'>{m.group(1)}</h{level}>",
+            escaped,
+            flags=re.MULTILINE,
+        )
+    escaped = re.sub(
+        r"^>\s+(.+)$",
+        lambda m: f'<blockquote style="border-left:3px solid #d1d5db;padding-left:12px;margin:8px 0;color:#6b7280;">{m.group(1)}</blockquote>',
+        escaped,
+        flags=re.MULTILINE,
+    )
+    escaped = re.sub(r"^[-*]\s+(.+)$", lambda m: f'<li style="margin:4px 0;">{m.group(1)}</li>', escaped, flags=re.MULTILINE)
+    escaped = re.sub(
+        r"(<li[^>]*>.*?</li>(?:\s*<li[^>]*>.*?</li>)*)",
+        lambda m: f'<ul style="margin:8px 0;padding-left:20px;">{m.group(1)}</ul>',
+        escaped,
+    )
+    escaped = re.sub(r"^\d+\.\s+(.+)$", lambda m: f'<li style="margin:4px 0;">{m.group(1)}</li>', escaped, flags=re.MULTILINE)
+    escaped = re.sub(
+        r"(<li[^>]*>.*?</li>(?:\s*<li[^>]*>.*?</li>)*)",
+        lambda m: f'<ol style="margin:8px 0;padding-left:20px;">{m.group(1)}</ol>',
+        escaped,
+    )
+    escaped = re.sub(r"\*\*([^*]+)\*\*|__([^_]+)__", lambda m: f"<strong>{m.group(1) or m.group(2)}</strong>", escaped)
+    escaped = re.sub(
+        r"(?<!\*)\*([^*]+)\*(?!\*)|(?<!_)_([^_]+)_(?!_)",
+        lambda m: f"<em>{m.group(1) or m.group(2)}</em>",
+        escaped,
+    )
+
+    def _md_link_repl(m: re.Match) -> str:
+        url = m.group(2)
+        href = url if re.match(r"^https?://", url, re.IGNORECASE) else f"http://{url}"
+        return f'<a href="{href}" target="_blank" rel="noopener noreferrer" style="color:#2563eb;text-decoration:none;">{m.group(1)}</a>'
+
+    escaped = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", _md_link_repl, escaped)
+    return escaped.replace("\n", "<br/>")
+
+
+# 黄金用例的输入：覆盖每种语法、组合与历史行为
+GOLDEN_INPUTS: Dict[str, str] = {
+    "纯文本": "你好，请问怎么退款？",
+    "HTML 转义": "<script>alert('x')</script> & \"quoted\"",
+    "加粗": "这是**重点**和__另一种加粗__",
+    "斜体": "这是*斜体*和_另一种斜体_",
+    "加粗内含斜体标记": "**a_b_c**",
+    "未闭合的加粗": "**没有闭合",
+    "行内代码": "运行 `pip install -r requirements.txt` 即可",
+    "行内代码内的标记": "`**不是加粗**`",
+    "代码块": "```\ndef f():\n    return 1\n```",
+    "代码块内的列表与标题": "```\n# 标题\n- 项\n```",
+    "未闭合的代码块": "```代码没有结束",
+    "各级标题": "# 一\n## 二\n### 三\n#### 四\n##### 五\n###### 六\n####### 七",
+    "标题后无空格": "#不是标题",
+    "引用不渲染": "> 引用的内容",
+    "无序列表": "- 苹果\n- 香蕉\n* 橙子",
+    "有序列表": "1. 第一步\n2. 第二步\n10. 第十步",
+    "列表间隔空行": "- a\n\n- b",
+    "列表后接正文": "- a\n- b\n正文",
+    "无序接有序": "- a\n1. b",
+    "链接": "[官网](https://example.com) 和 [文档](docs.example.com/a)",
+    "链接大写协议": "[x](HTTPS://EXAMPLE.COM)",
+    "链接文本含加粗": "[**粗体链接**](https://example.com)",
+    "不完整的链接": "[只有文本] (https://example.com) [x](",
+    "换行": "第一行\n第二行\n\n第四行",
+    "混合消息": "# 问题汇总\n1. 登录失败，提示 `E1001`\n2. **充值**未到账\n- 见 [帮助](https://help.example.com)\n请 _尽快_ 处理",
+    "中文与表情": "**重要**：请查看附件 😀",
+    "长串左方括号": "[" * 50,
+    "长串星号": "*" * 51,
+    "交替下划线": "_a" * 30,
+}
+
+
+def _load_golden() -> List[Dict[str, str]]:
+    with open(GOLDEN_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _regenerate() -> None:
+    cases = [{"name": name, "input": text, "html": _legacy_apply_markdown(text)} for name, text in GOLDEN_INPUTS.items()]
+    with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+        json.dump(cases, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"已用旧实现生成 {len(cases)} 条黄金用例: {GOLDEN_PATH}")
+
+
+def _check_golden() -> None:
+    cases = _load_golden()
+    for case in cases:
+        for label, render in (("后端", _apply_markdown),
+                              ("桌面端", lambda text: client_render_markdown(text, MARKDOWN_THEME))):
+            html = render(case["input"])
+            assert html == case["html"], f"[{label}] 黄金用例不一致: {case['name']}\n期望: {case['html']}\n实际: {html}"
+    print(f"黄金用例: {len(cases)} 条，后端与桌面端渲染器输出与期望逐字节一致")
+
+
+_TOKENS = ["#", "##", "###", "-", "*", "**", "_", "__", "`", "```", "[", "]", "(", ")", "https://a.cn",
+           "x.com", "1.", "12.", "\n", "\n", " ", " ", "\t", "a", "文", "<", ">", "&", "'", '"', "&amp;"]
+
+
+def _random_diff(count: int, seed: int) -> None:
+    rng = random.Random(seed)
+    compared = skipped = 0
+    for _ in range(count):
+        text = "".join(rng.choice(_TOKENS) for _ in range(rng.randint(1, 40)))
+        if _KNOWN_DEVIATION.search(text):
+            skipped += 1
+            continue
+        expected = _legacy_apply_markdown(text)
+        actual = _apply_markdown(text)
+        assert actual == expected, f"与旧实现不一致: {text!r}\n旧: {expected}\n新: {actual}"
+        compared += 1
+    print(f"差分对比: {compared} 条随机输入与旧实现逐字节一致（跳过已知差异 {skipped} 条）")
+
+
+_TYPICAL_MESSAGES = [
+    "您好，我的账号登录不上了，提示密码错误，但我确定密码是对的",
+    "请先在设置里把输入设备切换为**虚拟麦克风**，然后重启游戏试试",
+    "订单号：`20240501123456`，麻烦帮忙查一下",
+    "处理步骤：\n1. 退出登录\n2. 清除缓存\n3. 重新登录",
+    "详情见 [帮助中心](https://help.example.com/faq)，有问题随时联系我们",
+    "- 充值未到账\n- 钻石数量不对\n- VIP 没有生效",
+    "好的，谢谢 _客服小王_",
+    "# 公告\n今晚 **22:00** 维护，预计 2 小时",
+]
+
+
+def _throughput(render: Callable[[str], str], seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for message in _TYPICAL_MESSAGES:
+            render(message)
+        count += len(_TYPICAL_MESSAGES)
+    return count / (time.perf_counter() - start)
+
+
+def _adversarial() -> None:
+    patterns = {"[": "[", "*": "*a", "`": "`a", "_": "_", "列表": "- a\n"}
+    print(f"{'对抗输入':<10}" + "".join(f"{f'{n // 1000}k 字符':>14}" for n in (5000, 10000, 20000)))
+    for label, unit in patterns.items():
+        line = f"{label:<12}"
+        for n in (5000, 10000, 20000):
+            text = unit * (n // len(unit))
+            start = time.perf_counter()
+            _apply_markdown(text)
+            line += f"{(time.perf_counter() - start) * 1000:>11.1f} ms"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Markdown 渲染器测试：黄金用例、差分对比和吞吐量")
+    parser.add_argument("--random", type=int, default=300000, help="差分对比的随机输入条数")
+    parser.add_argument("--seconds", type=float, default=2.0, help="每项吞吐量测试的时长（秒）")
+    parser.add_argument("--target", type=int, default=10000, help="吞吐量目标（条/秒）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--regenerate", action="store_true", help="用旧实现重新生成黄金用例后退出")
+    args = parser.parse_args()
+
+    if args.regenerate:
+        _regenerate()
+        return
+    _check_golden()
+    _random_diff(args.random, args.seed)
+
+    current = _throughput(_apply_markdown, args.seconds)
+    legacy = _throughput(_legacy_apply_markdown, args.seconds)
+    print(f"吞吐量（典型聊天消息）: {current:,.0f} 条/秒，旧实现 {legacy:,.0f} 条/秒，目标 {args.target:,} 条/秒")
+    assert current >= args.target, "吞吐量未达到目标"
+    _adversarial()
+
+
+if __name__ == "__main__":
+    main()
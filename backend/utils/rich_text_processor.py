@@ -2,10 +2,14 @@
 富文本消息处理模块
 支持 Markdown 格式、@提及功能、链接预览
 """
+import hashlib
 import re
-from typing import List, Tuple, Dict, Optional
+from collections import OrderedDict
+from typing import Any, List, Tuple, Dict, Optional
 from urllib.parse import urlparse
 
+from backend.utils.markdown_renderer import escape_html, render_markdown
+
 
 # @提及模式：@用户名 或 @客服
 MENTION_PATTERN = re.compile(r"@([\u4e00-\u9fa5A-Za-z0-9_]+)")
@@ -16,15 +20,24 @@ URL_PATTERN = re.compile(
 )
 
 
+# Markdown 渲染样式（供 markdown_renderer 使用）
+MARKDOWN_THEME = {
+    "code_block": '<pre style="background-color:#f3f4f6;padding:8px;border-radius:4px;overflow-x:auto;"><code>{}</code></pre>',
+    "inline_code": '<code style="background-color:#f3f4f6;padding:2px 4px;border-radius:3px;font-family:monospace;">{}</code>',
+    "heading": "<h{level} style='margin:8px 0;font-size:{size}px;font-weight:bold;'>{content}</h{level}>",
+    "heading_size": lambda level: 18 - level * 2,
+    "li": '<li style="margin:4px 0;">{}</li>',
+    "ul_open": '<ul style="margin:8px 0;padding-left:20px;">',
+    "ol_open": '<ol style="margin:8px 0;padding-left:20px;">',
+    "strong": "<strong>{}</strong>",
+    "em": "<em>{}</em>",
+    "link": '<a href="{href}" target="_blank" rel="noopener noreferrer" style="color:#2563eb;text-decoration:none;">{label}</a>',
+}
+
+
 def _escape_html(text: str) -> str:
     """转义 HTML 特殊字符"""
-    return (
-        text.replace("&", "&amp;")
-        .replace("<", "&lt;")
-        .replace(">", "&gt;")
-        .replace('"', "&quot;")
-        .replace("'", "&#39;")
-    )
+    return escape_html(text)
 
 
 def _apply_markdown(text: str) -> str:
@@ -36,105 +49,11 @@ def _apply_markdown(text: str) -> str:
     - ```代码块```
     - [链接文本](https://example.com)
     - # 标题
-    - > 引用
     - - 列表项
+
+    由 markdown_renderer 线性扫描完成，输出与原先逐条正则替换的实现一致。
     """
-    escaped = _escape_html(text)
-    
-    # 代码块（多行）
-    def _code_block_repl(m: re.Match) -> str:
-        code = m.group(1)
-        return f'<pre style="background-color:#f3f4f6;padding:8px;border-radius:4px;overflow-x:auto;"><code>{code}</code></pre>'
-    
-    escaped = re.sub(
-        r"```([\s\S]*?)```",
-        _code_block_repl,
-        escaped
-    )
-    
-    # 行内代码
-    escaped = re.sub(
-        r"`([^`]+)`",
-        lambda m: f'<code style="background-color:#f3f4f6;padding:2px 4px;border-radius:3px;font-family:monospace;">{m.group(1)}</code>',
-        escaped
-    )
-    
-    # 标题（# 到 ######）
-    for i in range(1, 7):
-        escaped = re.sub(
-            rf"^{'#' * i}\s+(.+)$",
-            lambda m, level=i: f"<h{level} style='margin:8px 0;font-size:{18-level*2}px;font-weight:bold;'>{m.group(1)}</h{level}>",
-            escaped,
-            flags=re.MULTILINE
-        )
-    
-    # 引用
-    escaped = re.sub(
-        r"^>\s+(.+)$",
-        lambda m: f'<blockquote style="border-left:3px solid #d1d5db;padding-left:12px;margin:8px 0;color:#6b7280;">{m.group(1)}</blockquote>',
-        escaped,
-        flags=re.MULTILINE
-    )
-    
-    # 无序列表
-    escaped = re.sub(
-        r"^[-*]\s+(.+)$",
-        lambda m: f'<li style="margin:4px 0;">{m.group(1)}</li>',
-        escaped,
-        flags=re.MULTILINE
-    )
-    # 将连续的 <li> 包裹在 <ul> 中
-    escaped = re.sub(
-        r"(<li[^>]*>.*?</li>(?:\s*<li[^>]*>.*?</li>)*)",
-        lambda m: f'<ul style="margin:8px 0;padding-left:20px;">{m.group(1)}</ul>',
-        escaped
-    )
-    
-    # 有序列表
-    escaped = re.sub(
-        r"^\d+\.\s+(.+)$",
-        lambda m: f'<li style="margin:4px 0;">{m.group(1)}</li>',
-        escaped,
-        flags=re.MULTILINE
-    )
-    # 将连续的 <li> 包裹在 <ol> 中
-    escaped = re.sub(
-        r"(<li[^>]*>.*?</li>(?:\s*<li[^>]*>.*?</li>)*)",
-        lambda m: f'<ol style="margin:8px 0;padding-left:20px;">{m.group(1)}</ol>',
-        escaped
-    )
-    
-    # 加粗 **text** 或 __text__
-    escaped = re.sub(
-        r"\*\*([^*]+)\*\*|__([^_]+)__",
-        lambda m: f"<strong>{m.group(1) or m.group(2)}</strong>",
-        escaped
-    )
-    
-    # 斜体 *text* 或 _text_（但不在加粗中）
-    escaped = re.sub(
-        r"(?<!\*)\*([^*]+)\*(?!\*)|(?<!_)_([^_]+)_(?!_)",
-        lambda m: f"<em>{m.group(1) or m.group(2)}</em>",
-        escaped
-    )
-    
-    # Markdown 链接 [text](url)
-    def _md_link_repl(m: re.Match) -> str:
-        label = m.group(1)
-        url = m.group(2)
-        href = url if re.match(r"^https?://", url, re.IGNORECASE) else f"http://{url}"
-        return f'<a href="{href}" target="_blank" rel="noopener noreferrer" style="color:#2563eb;text-decoration:none;">{label}</a>'
-    
-    escaped = re.sub(
-        r"\[([^\]]+)\]\(([^)]+)\)",
-        _md_link_repl,
-        escaped
-    )
-    
-    # 换行
-    escaped = escaped.replace("\n", "<br/>")
-    
-    return escaped
+    return render_markdown(text, MARKDOWN_THEME)
 
 
 def _apply_mentions(html: str, user_id: Optional[int] = None) -> Tuple[str, List[Dict[str, str]]]:
@@ -258,6 +177,54 @@ def process_rich_text(
     }
 
 
+class RichTextCache:
+    """
+    富文本渲染结果的 LRU 缓存，以消息内容的 SHA-1 为键。
+
+    渲染结果只取决于消息内容，因此发送 / 编辑时渲染一次，之后推送、加载历史、
+    重连重新拉取都直接命中缓存，不再重复解析。缓存的结果是共享对象，调用方不要修改。
+    """
+
+    def __init__(self, max_size: int = 5000) -> None:
+        self.max_size = max(int(max_size), 1)
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def get(self, content: str) -> Dict[str, Any]:
+        """返回 content 的渲染结果，未命中时渲染并写入缓存"""
+        if not content:
+            return process_rich_text(content)
+        key = self.content_hash(content)
+        result = self._data.get(key)
+        if result is not None:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = process_rich_text(content)
+        self._data[key] = result
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "name": "rich_text",
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
 def extract_urls_from_text(text: str) -> List[str]:
     """从文本中提取所有URL"""
     urls = []
@@ -281,3 +248,22 @@ def extract_mentions_from_text(text: str) -> List[Dict[str, str]]:
         })
     return mentions
 
+
+def resolve_mentions(rich: Dict[str, Any], username_index: Any) -> Dict[str, Any]:
+    """
+    把渲染结果中的 @用户 提及解析为真实用户。
+
+    每个 user 类型的提及补充 username（匹配到的最长用户名，未匹配为 None）与 user_ids（同名用户可能有多个）。
+    rich 可能是缓存中的共享对象，因此返回新字典，不修改原对象。
+    """
+    mentions = rich.get("mentions")
+    if not mentions:
+        return rich
+    resolved = []
+    for mention in mentions:
+        mention = dict(mention)
+        if mention.get("type") == "user":
+            match = username_index.resolve(mention.get("name", ""))
+            mention["username"], mention["user_ids"] = match if match else (None, [])
+        resolved.append(mention)
+    return {**rich, "mentions": resolved}
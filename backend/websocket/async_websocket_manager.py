@@ -7,7 +7,7 @@
 
 import asyncio
 import logging
-from typing import Dict, Optional, Set, Any, TYPE_CHECKING
+from typing import Dict, Iterable, List, Optional, Set, Any, TYPE_CHECKING
 from datetime import datetime
 
 if TYPE_CHECKING:
@@ -15,21 +15,43 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# 连接注册时可以声明的客户端能力
+# new_messages：新消息按用户合并为 new_messages 批量推送（{messages: [...]}），否则逐条推送 new_message
+# msgpack：该连接之后的包改用 msgpack 二进制帧（需要 PackedAsyncServer 且已安装 msgpack）
+# deflate：该连接之后超过阈值的帧以 zlib 压缩（需要 PackedAsyncServer 且启用帧压缩）
+SUPPORTED_CAPABILITIES = frozenset({"new_messages", "msgpack", "deflate"})
+
 
 class AsyncWebSocketManager:
     """异步 WebSocket 连接管理器"""
     
-    def __init__(self, socketio_server: 'socketio.AsyncServer', db_manager):
+    def __init__(
+        self,
+        socketio_server: 'socketio.AsyncServer',
+        db_manager,
+        batch_interval: float = 0.02,
+        max_batch: int = 50,
+    ):
         """
         初始化异步 WebSocket 管理器
         
         Args:
             socketio_server: python-socketio AsyncServer 实例
             db_manager: 异步数据库管理器实例
+            batch_interval: new_messages 批量推送的合并时间窗口（秒）
+            max_batch: 单个 new_messages 批次最多的消息条数，攒满立即推送
         """
         self.sio = socketio_server
         self.db = db_manager
         
+        # 新消息批量推送：{user_id: [待推送消息]}，每个用户最多一个延迟推送任务
+        self.batch_interval = batch_interval
+        self.max_batch = max(int(max_batch), 1)
+        self._pending_messages: Dict[int, List[dict]] = {}
+        self._flush_tasks: Dict[int, asyncio.Task] = {}
+        self.batches_sent = 0
+        self.batched_messages = 0
+        
         # 连接映射：{connection_id: {user_id, socket_id, device_id, ...}}
         self.connections: Dict[str, Dict[str, Any]] = {}
         
@@ -60,7 +82,9 @@ class AsyncWebSocketManager:
             logger.info("WebSocket 心跳检测任务已启动")
     
     async def stop(self):
-        """停止心跳检测任务"""
+        """停止心跳检测任务，并推送尚未发出的批量消息"""
+        for user_id in list(self._pending_messages):
+            await self._flush_new_messages(user_id)
         self.running = False
         if self.heartbeat_task:
             self.heartbeat_task.cancel()
@@ -110,7 +134,9 @@ class AsyncWebSocketManager:
         connection_id: str,
         device_id: str = None,
         ip_address: str = None,
-        user_agent: str = None
+        user_agent: str = None,
+        role: str = None,
+        capabilities: Optional[Iterable[str]] = None,
     ) -> bool:
         """
         注册新连接（异步）
@@ -122,11 +148,14 @@ class AsyncWebSocketManager:
             device_id: 设备ID
             ip_address: IP 地址
             user_agent: User-Agent
+            role: 用户角色（来自 token 声明，断开时据此判断是否需要更新客服状态）
+            capabilities: 客户端声明的能力（见 SUPPORTED_CAPABILITIES），未声明的按旧协议推送
             
         Returns:
             bool: 是否成功
         """
         try:
+            capabilities = self.accepted_capabilities(capabilities)
             async with self.lock:
                 # 创建连接信息
                 conn_info = {
@@ -135,6 +164,8 @@ class AsyncWebSocketManager:
                     'device_id': device_id,
                     'ip_address': ip_address,
                     'user_agent': user_agent,
+                    'role': role,
+                    'capabilities': capabilities,
                     'connected_at': asyncio.get_event_loop().time(),
                     'last_heartbeat': asyncio.get_event_loop().time(),
                 }
@@ -158,20 +189,37 @@ class AsyncWebSocketManager:
                 user_agent=user_agent
             )
             
-            # 加入用户房间（用于广播）
+            # 加入用户房间（用于广播），新消息按是否支持批量推送分到两个房间
             try:
                 room_name = f"user_{user_id}"
                 await self.sio.enter_room(socket_id, room_name, namespace="/")
-                logger.debug(f"成功将 socket {socket_id} 加入房间 {room_name}")
+                message_room = self._batch_room(user_id) if "new_messages" in capabilities else self._single_room(user_id)
+                await self.sio.enter_room(socket_id, message_room, namespace="/")
+                logger.debug(f"成功将 socket {socket_id} 加入房间 {room_name}, {message_room}")
             except Exception as e:
                 logger.error(f"将 socket {socket_id} 加入房间 user_{user_id} 失败: {e}", exc_info=True)
             
+            # 注册结果（ack）起即按 msgpack 编码 / 压缩；客户端按帧类型解码，切换时在途的包不受影响
+            if "msgpack" in capabilities:
+                self.sio.set_packed(socket_id, namespace="/")
+            if "deflate" in capabilities:
+                self.sio.set_compressed(socket_id, namespace="/")
+            
             logger.debug(f"用户 {user_id} 建立连接: {connection_id} (socket: {socket_id})")
             return True
         except Exception as e:
             logger.error(f"注册连接失败: {e}", exc_info=True)
             return False
     
+    def accepted_capabilities(self, capabilities: Optional[Iterable[str]]) -> Set[str]:
+        """客户端声明的能力中本服务端支持的部分"""
+        accepted = set(capabilities or ()) & SUPPORTED_CAPABILITIES
+        if not getattr(self.sio, "packed_serializer_available", False):
+            accepted.discard("msgpack")
+        if not getattr(self.sio, "frame_compression_available", False):
+            accepted.discard("deflate")
+        return accepted
+    
     async def disconnect(self, connection_id: str = None, socket_id: str = None) -> bool:
         """
         断开连接（异步）
@@ -204,6 +252,7 @@ class AsyncWebSocketManager:
                 
                 user_id = conn_info['user_id']
                 socket_id = conn_info['socket_id']
+                role = conn_info.get('role')
                 
                 # 移除连接映射
                 del self.connections[connection_id]
@@ -226,24 +275,26 @@ class AsyncWebSocketManager:
             
             # 离开用户房间
             try:
-                await self.sio.leave_room(socket_id, f"user_{user_id}", namespace="/")
+                for room_name in (f"user_{user_id}", self._batch_room(user_id), self._single_room(user_id)):
+                    await self.sio.leave_room(socket_id, room_name, namespace="/")
             except Exception as e:
                 logger.error(f"将 socket {socket_id} 从房间 user_{user_id} 移除失败: {e}", exc_info=True)
             
             # 如果这是客服账号，并且已经没有任何活跃连接，则自动将其状态标记为 offline
             if no_more_connections:
-                try:
-                    user_row = await self.db.get_user_by_id(user_id)
-                except Exception as e:
-                    logger.error(f"获取用户 {user_id} 信息失败: {e}", exc_info=True)
-                    user_row = None
+                # 注册时未携带角色（旧版 token）才需要查库
+                if not role:
+                    try:
+                        user_row = await self.db.get_user_fields(user_id, fields=("role",))
+                    except Exception as e:
+                        logger.error(f"获取用户 {user_id} 信息失败: {e}", exc_info=True)
+                        user_row = None
+                    role = user_row.get("role", "user") if user_row else None
                 
-                if user_row:
-                    role = user_row.get("role", "user")
-                    if role in ("customer_service", "admin"):
-                        # 异步更新客服状态
-                        await self.db.update_agent_status(user_id, "offline")
-                        logger.info(f"客服 {user_id} 所有连接已断开，状态自动置为 offline")
+                if role in ("customer_service", "admin"):
+                    # 异步更新客服状态
+                    await self.db.update_agent_status(user_id, "offline")
+                    logger.info(f"客服 {user_id} 所有连接已断开，状态自动置为 offline")
             
             logger.debug(f"用户 {user_id} 断开连接: {connection_id}")
             return True
@@ -323,6 +374,8 @@ class AsyncWebSocketManager:
         """
         向指定用户的所有连接发送消息（异步）
         
+        先推送该用户攒下的 new_messages，保证撤回、编辑、链接预览等事件不会早于对应的新消息到达。
+        
         Args:
             user_id: 用户ID
             event: 事件名称
@@ -332,6 +385,8 @@ class AsyncWebSocketManager:
             int: 成功发送的连接数
         """
         try:
+            if user_id in self._pending_messages:
+                await self._flush_new_messages(user_id)
             connections = self.get_user_connections(user_id)
             message_id = data.get("id", "unknown")
             
@@ -355,6 +410,67 @@ class AsyncWebSocketManager:
             logger.error(f"发送消息失败: {e}, user_id={user_id}, event={event}", exc_info=True)
             return 0
     
+    @staticmethod
+    def _batch_room(user_id: int) -> str:
+        return f"user_{user_id}_batch"
+    
+    @staticmethod
+    def _single_room(user_id: int) -> str:
+        return f"user_{user_id}_single"
+    
+    async def push_new_message(self, user_id: int, data: dict) -> int:
+        """
+        推送新消息给指定用户的所有连接（异步）
+        
+        旧客户端立即收到 new_message；声明了 new_messages 能力的连接在 batch_interval 内合并，
+        攒满 max_batch 条、时间窗口结束或向该用户发送其他事件（send_message_to_user）前以一个 new_messages 事件推送，
+        按产生顺序排列。
+        
+        Args:
+            user_id: 用户ID
+            data: 与 new_message 结构一致的消息负载
+            
+        Returns:
+            int: 用户的连接数（与 send_message_to_user 一致，房间广播时至少为 1）
+        """
+        try:
+            await self.sio.emit("new_message", data, room=self._single_room(user_id), namespace="/")
+        except Exception as e:
+            logger.error(f"推送新消息到房间 {self._single_room(user_id)} 失败: {e}, message_id={data.get('id')}", exc_info=True)
+            return 0
+        
+        pending = self._pending_messages.setdefault(user_id, [])
+        pending.append(data)
+        if len(pending) >= self.max_batch:
+            await self._flush_new_messages(user_id)
+        elif user_id not in self._flush_tasks:
+            self._flush_tasks[user_id] = asyncio.create_task(self._delayed_flush(user_id))
+        return len(self.get_user_connections(user_id)) or 1
+    
+    async def _delayed_flush(self, user_id: int):
+        try:
+            await asyncio.sleep(self.batch_interval)
+        except asyncio.CancelledError:
+            return
+        self._flush_tasks.pop(user_id, None)
+        await self._flush_new_messages(user_id)
+    
+    async def _flush_new_messages(self, user_id: int):
+        """立即推送该用户攒下的新消息"""
+        task = self._flush_tasks.pop(user_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        messages = self._pending_messages.pop(user_id, None)
+        if not messages:
+            return
+        try:
+            await self.sio.emit("new_messages", {"messages": messages}, room=self._batch_room(user_id), namespace="/")
+            self.batches_sent += 1
+            self.batched_messages += len(messages)
+            logger.debug(f"向用户 {user_id} 批量推送 {len(messages)} 条新消息")
+        except Exception as e:
+            logger.error(f"批量推送新消息失败: user_id={user_id}, count={len(messages)}, error={e}", exc_info=True)
+    
     async def send_message_to_connection(self, connection_id: str, event: str, data: dict) -> bool:
         """
         向指定连接发送消息（异步）
@@ -555,7 +671,8 @@ class AsyncWebSocketManager:
         session_id: str,
         message_id: int,
         new_content: str,
-        edited_at: str
+        edited_at: str,
+        rich: Optional[Dict[str, Any]] = None
     ):
         """
         推送消息编辑给会话中的所有用户（异步）
@@ -565,6 +682,7 @@ class AsyncWebSocketManager:
             message_id: 消息ID
             new_content: 新内容
             edited_at: 编辑时间
+            rich: 新内容的预渲染富文本结果（可选）
         """
         try:
             # 获取会话信息
@@ -580,7 +698,8 @@ class AsyncWebSocketManager:
                 "message_id": message_id,
                 "session_id": session_id,
                 "new_content": new_content,
-                "edited_at": edited_at
+                "edited_at": edited_at,
+                "rich": rich,
             }
             
             # 推送给用户和客服
@@ -593,6 +712,40 @@ class AsyncWebSocketManager:
         except Exception as e:
             logger.error(f"推送消息编辑失败: {e}", exc_info=True)
     
+    async def push_message_preview_ready(
+        self,
+        session_id: str,
+        message_id: int,
+        preview: Dict[str, Any]
+    ):
+        """
+        推送消息的链接预览给会话中的所有用户（异步）
+        
+        Args:
+            session_id: 会话ID
+            message_id: 消息ID
+            preview: 链接预览 {url, title, description, image, site_name}
+        """
+        try:
+            session = await self.db.get_chat_session_by_id(session_id)
+            if not session:
+                logger.warning(f"推送链接预览失败：会话不存在: session_id={session_id}")
+                return
+            
+            data = {
+                "message_id": message_id,
+                "session_id": session_id,
+                "preview": preview,
+            }
+            
+            for user_id in {session.get('user_id'), session.get('agent_id')}:
+                if user_id:
+                    await self.send_message_to_user(user_id, "message_preview_ready", data)
+            
+            logger.debug(f"推送链接预览: session_id={session_id}, message_id={message_id}")
+        except Exception as e:
+            logger.error(f"推送链接预览失败: {e}", exc_info=True)
+    
     async def push_session_status_update(
         self,
         session_id: str,
@@ -709,5 +862,9 @@ class AsyncWebSocketManager:
                 user_id: len(conns) 
                 for user_id, conns in self.user_connections.items()
             },
+            'new_messages_batches': self.batches_sent,
+            'new_messages_batched': self.batched_messages,
+            'packed_connections': len(getattr(self.sio, "packed_eio_sids", ())),
+            'compressed_connections': len(getattr(self.sio, "compressed_eio_sids", ())),
         }
 
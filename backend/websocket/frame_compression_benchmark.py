@@ -0,0 +1,213 @@
+"""
+Socket.IO 帧压缩测试：历史消息加载的带宽与 CPU
+
+按打开会话时的历史分页（get_session_messages 的 ack，每页 --page-size 条）构造样本，分两组：
+纯文本历史（每条消息带头像 data URL，与现有推送一致）与含图片的历史（每 --image-every 条一张图片）。
+对比以下帧格式：
+- JSON / msgpack：不压缩；
+- + zlib-N：应用层帧压缩（声明 "deflate" 的桌面客户端），每帧独立压缩，N 为压缩级别；
+- + permessage-deflate：浏览器与 uvicorn 协商的 WebSocket 压缩（原始 deflate，跨帧保留上下文），
+  用 zlib 按 websockets 的默认参数模拟。
+统计每页字节数、编码（含压缩）与解码（含解压）的 CPU 耗时，并按 --mbps 给出的带宽估算
+加载全部分页的总耗时（CPU + 传输）；同时校验解码结果与原数据完全一致。
+
+用法：python backend/websocket/frame_compression_benchmark.py [--pages 10] [--page-size 50] [--mbps 2,20,100]
+"""
+
+import argparse
+import base64
+import os
+import random
+import statistics
+import sys
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Tuple
+
+# 确保项目根目录在 sys.path 中，便于导入 backend 包
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from socketio import packet as sio_packet
+
+from backend.websocket.packed_serializer import (
+    MSGPACK_AVAILABLE, PackedPacket, compress_frame, decompress_frame, encode_packed,
+)
+
+_PHRASES = [
+    "您好，请问有什么可以帮您？", "我的账号登录不上了", "请提供一下您的订单号", "已经帮您提交工单，预计 24 小时内处理",
+    "游戏里的语音没有声音", "请先在设置里把输入设备切换为“虚拟麦克风”，然后重启游戏试试", "好的谢谢",
+    "退款一般 3 到 5 个工作日到账", "截图发您了", "这个问题我们已经反馈给技术同事", "还有其他问题吗？",
+    "充值成功但是钻石没到账", "麻烦稍等，我查询一下", "您的会员将于下月 1 日到期", "可以的",
+]
+
+
+def _data_url(rng: random.Random, size: int, mime: str) -> str:
+    # 随机字节：与 JPEG / PNG 一样几乎不可压缩
+    return f"data:{mime};base64,{base64.b64encode(rng.randbytes(size)).decode('ascii')}"
+
+
+def _history_pages(rng: random.Random, pages: int, page_size: int, image_every: int) -> List[Dict[str, Any]]:
+    avatars = [_data_url(rng, 6 * 1024, "image/png"), _data_url(rng, 6 * 1024, "image/png")]
+    result = []
+    message_id = 100000
+    for page in range(pages):
+        messages = []
+        for i in range(page_size):
+            message_id -= 1
+            from_agent = rng.random() < 0.5
+            image = image_every and i % image_every == image_every - 1
+            text = (_data_url(rng, rng.randint(30, 120) * 1024, "image/jpeg") if image
+                    else "，".join(rng.sample(_PHRASES, rng.randint(1, 3))) + f"（#{rng.randint(1000, 99999)}）")
+            messages.append({
+                "id": str(message_id),
+                "session_id": "chat_1024_1700000000",
+                "from": "agent" if from_agent else "user",
+                "from_user_id": 2 if from_agent else 1024,
+                "to_user_id": 1024 if from_agent else 2,
+                "text": text,
+                "time": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+                "created_at": f"2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z",
+                "avatar": avatars[from_agent],
+                "username": "客服小王" if from_agent else "玩家1024",
+                "message_type": "image" if image else "text",
+                "reply_to_message_id": None,
+                "status": "sent",
+                "is_from_self": not from_agent,
+                "rich": None if image else {"html": None, "is_rich": False, "urls": [], "mentions": []},
+            })
+        result.append({"success": True, "messages": messages, "has_more": page < pages - 1})
+    return result
+
+
+# ---- 帧格式：(名称, 编码器工厂, 解码器工厂)，工厂每次加载新建，permessage-deflate 的上下文在一次加载内保留 ----
+
+def _plain(packed: bool):
+    def encoder():
+        def encode(pkt):
+            if packed:
+                return encode_packed(pkt)
+            return pkt.encode()
+        return encode
+    return encoder
+
+
+def _zlib(packed: bool, level: int):
+    plain = _plain(packed)
+
+    def encoder():
+        encode = plain()
+        return lambda pkt: compress_frame(encode(pkt), threshold=1024, level=level)
+    return encoder
+
+
+def _plain_decoder():
+    def decode(frame):
+        if isinstance(frame, (bytes, bytearray)) and frame[:1] == b"\xc1":
+            frame = decompress_frame(frame, 1 << 30)
+        return PackedPacket(encoded_packet=frame).data
+    return decode
+
+
+def _permessage_deflate(packed: bool):
+    plain = _plain(packed)
+
+    def encoder():
+        encode = plain()
+        # websockets 默认：zlib 默认级别、memLevel 5、双向保留上下文
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15, 5)
+
+        def compress(pkt):
+            frame = encode(pkt)
+            data = frame.encode("utf-8") if isinstance(frame, str) else frame
+            out = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            return (isinstance(frame, str), out[:-4])
+        return compress
+    return encoder
+
+
+def _permessage_deflate_decoder():
+    decompressor = zlib.decompressobj(-15)
+
+    def decode(frame):
+        is_text, data = frame
+        payload = decompressor.decompress(data + b"\x00\x00\xff\xff")
+        return PackedPacket(encoded_packet=payload.decode("utf-8") if is_text else payload).data
+    return decode
+
+
+def _frame_size(frame) -> int:
+    if isinstance(frame, tuple):
+        frame = frame[1]
+    return len(frame.encode("utf-8") if isinstance(frame, str) else frame)
+
+
+def _formats(levels: List[int]) -> List[Tuple[str, Callable, Callable]]:
+    formats = [("JSON", _plain(False), _plain_decoder)]
+    formats += [(f"JSON + zlib-{level}", _zlib(False, level), _plain_decoder) for level in levels]
+    formats.append(("JSON + permessage-deflate", _permessage_deflate(False), _permessage_deflate_decoder))
+    if MSGPACK_AVAILABLE:
+        formats.append(("msgpack", _plain(True), _plain_decoder))
+        formats += [(f"msgpack + zlib-{level}", _zlib(True, level), _plain_decoder) for level in levels]
+    return formats
+
+
+def _measure(pages, encoder_factory, decoder_factory, rounds: int):
+    """返回 (编码 ms, 解码 ms, 总字节数)，取中位数"""
+    encode_ms, decode_ms = [], []
+    total_bytes = 0
+    decoded = []
+    for _ in range(rounds):
+        packets = [sio_packet.Packet(sio_packet.ACK, data=[page], namespace="/", id=i) for i, page in enumerate(pages)]
+        encode = encoder_factory()
+        start = time.perf_counter()
+        frames = [encode(pkt) for pkt in packets]
+        encode_ms.append((time.perf_counter() - start) * 1000)
+        decode = decoder_factory()
+        start = time.perf_counter()
+        decoded = [decode(frame) for frame in frames]
+        decode_ms.append((time.perf_counter() - start) * 1000)
+        total_bytes = sum(_frame_size(frame) for frame in frames)
+    for page, result in zip(pages, decoded):
+        assert result == [page], "解码结果与原数据不一致"
+    return statistics.median(encode_ms), statistics.median(decode_ms), total_bytes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Socket.IO 帧压缩测试：历史消息加载的带宽与 CPU")
+    parser.add_argument("--pages", type=int, default=10, help="历史分页数")
+    parser.add_argument("--page-size", type=int, default=50, help="每页消息数")
+    parser.add_argument("--image-every", type=int, default=10, help="含图片的历史中每多少条一张图片")
+    parser.add_argument("--levels", default="1,6", help="zlib 压缩级别（逗号分隔）")
+    parser.add_argument("--mbps", default="2,20,100", help="估算总耗时用的带宽（Mbit/s，逗号分隔）")
+    parser.add_argument("--rounds", type=int, default=5, help="重复次数（取中位数）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    bandwidths = [float(mbps) for mbps in args.mbps.split(",")]
+    scenarios = {
+        "纯文本历史": _history_pages(random.Random(args.seed), args.pages, args.page_size, 0),
+        "含图片历史": _history_pages(random.Random(args.seed), args.pages, args.page_size, args.image_every),
+    }
+    for label, pages in scenarios.items():
+        print(f"\n[{label}] {args.pages} 页 × {args.page_size} 条")
+        header = f"{'':<28}{'每页 KB':>9}{'比例':>7}{'编码 ms':>9}{'解码 ms':>9}"
+        header += "".join(f"{f'总耗时@{mbps:g}M':>14}" for mbps in bandwidths)
+        print(header)
+        baseline = None
+        for name, encoder_factory, decoder_factory in _formats(levels):
+            encode_ms, decode_ms, total_bytes = _measure(pages, encoder_factory, decoder_factory, args.rounds)
+            baseline = baseline or total_bytes
+            line = (f"{name:<28}{total_bytes / len(pages) / 1024:>9.0f}{total_bytes / baseline:>7.0%}"
+                    f"{encode_ms:>9.1f}{decode_ms:>9.1f}")
+            for mbps in bandwidths:
+                transfer_ms = total_bytes * 8 / (mbps * 1e6) * 1000
+                line += f"{encode_ms + decode_ms + transfer_ms:>12.0f}ms"
+            print(line)
+    print("\n  解码结果与原数据一致")
+
+
+if __name__ == "__main__":
+    main()
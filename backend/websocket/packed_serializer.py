@@ -0,0 +1,291 @@
+"""
+Socket.IO 按连接协商的二进制序列化（msgpack）与帧压缩
+
+默认所有 Socket.IO 包都是 JSON 文本帧；客户端在 register 时声明 "msgpack" 能力后，
+服务端发往该连接的包改为 msgpack 二进制帧，客户端收到注册结果后也改为发送 msgpack：
+- 解码按帧类型区分（文本帧为 JSON，二进制帧为 msgpack），切换前后在途的包都能正确解码，无需同步切换时机；
+- base64 data URL（图片 / 文件 / 头像）在 msgpack 中以原始字节（扩展类型）传输，收到后还原为原字符串，
+  业务代码看到的数据与 JSON 连接完全一致；
+- 未声明的连接（如网页工作台）以及未安装 msgpack 时保持 JSON，行为不变。
+
+声明 "deflate" 能力的连接，超过阈值的帧（JSON 或 msgpack）以 zlib 压缩后作为二进制帧发送，
+帧首字节为 COMPRESSED_FRAME_MARKER（msgpack 中从不使用的 0xc1），解压后按内容区分 JSON 与 msgpack；
+压缩后不更小的帧按原样发送。桌面客户端使用的 websocket-client 不支持 WebSocket 的 permessage-deflate，
+因此在应用层压缩；浏览器（网页工作台）由 uvicorn 协商 permessage-deflate，不需要声明。
+客户端的对应实现见 client/utils/packed_serializer.py，两边的编码格式需保持一致。
+"""
+
+import asyncio
+import base64
+import binascii
+import logging
+import struct
+import zlib
+from typing import Any, List, Optional, Set, Tuple, Union
+
+import socketio as sio_lib
+from engineio import packet as eio_packet
+from socketio import packet as sio_packet
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# msgpack 扩展类型：data URL，内容为 前缀长度、后缀长度（各 2 字节）+ 前缀（data:...;base64）+ 后缀（如 ;filename="..."）+ 原始字节
+EXT_DATA_URL = 1
+# 短于此长度的 data URL 按普通字符串传输
+_MIN_DATA_URL_LENGTH = 128
+# 压缩帧的首字节：0xc1 在 msgpack 中从不使用，Socket.IO 文本包以数字开头，均不会与之混淆
+COMPRESSED_FRAME_MARKER = b"\xc1"
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+DEFAULT_COMPRESSION_LEVEL = 1
+
+
+def _pack_data_url(value: str) -> Optional[Any]:
+    """base64 data URL 转为扩展类型；不是规范的 base64（还原后与原字符串不一致）时返回 None"""
+    head, sep, rest = value.partition(",")
+    if not sep or not head.endswith(";base64"):
+        return None
+    content, semi, suffix = rest.partition(";")
+    try:
+        raw = base64.b64decode(content, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    # 长度与末尾一组都一致时，重新编码得到的字符串与原字符串相同
+    tail = raw[(len(raw) - 1) // 3 * 3:]
+    if len(content) != (len(raw) + 2) // 3 * 4 or base64.b64encode(tail) != content[-4:].encode("ascii"):
+        return None
+    head_bytes, suffix_bytes = head.encode("utf-8"), (semi + suffix).encode("utf-8")
+    if len(head_bytes) > 0xFFFF or len(suffix_bytes) > 0xFFFF:
+        return None
+    header = struct.pack("!HH", len(head_bytes), len(suffix_bytes))
+    return msgpack.ExtType(EXT_DATA_URL, b"".join((header, head_bytes, suffix_bytes, raw)))
+
+
+def _to_wire(value: Any) -> Any:
+    if isinstance(value, str):
+        if len(value) >= _MIN_DATA_URL_LENGTH and value.startswith("data:"):
+            packed = _pack_data_url(value)
+            if packed is not None:
+                return packed
+        return value
+    if isinstance(value, dict):
+        return {key: _to_wire(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_wire(item) for item in value]
+    return value
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == EXT_DATA_URL:
+        head_len, suffix_len = struct.unpack_from("!HH", data)
+        head = data[4:4 + head_len].decode("utf-8")
+        suffix = data[4 + head_len:4 + head_len + suffix_len].decode("utf-8")
+        raw = memoryview(data)[4 + head_len + suffix_len:]
+        return f"{head},{base64.b64encode(raw).decode('ascii')}{suffix}"
+    return msgpack.ExtType(code, data)
+
+
+def pack(value: Any) -> bytes:
+    """编码为 msgpack（data URL 以原始字节传输）"""
+    return msgpack.packb(_to_wire(value), use_bin_type=True)
+
+
+def unpack(data: bytes) -> Any:
+    """解码 msgpack（data URL 还原为原字符串）"""
+    return msgpack.unpackb(data, raw=False, ext_hook=_ext_hook, strict_map_key=False)
+
+
+def encode_packed(pkt: sio_packet.Packet) -> bytes:
+    """将 Socket.IO 包编码为一个 msgpack 二进制帧（字节数据直接内嵌，不使用附件）"""
+    packet_type = pkt.packet_type
+    if packet_type == sio_packet.BINARY_EVENT:
+        packet_type = sio_packet.EVENT
+    elif packet_type == sio_packet.BINARY_ACK:
+        packet_type = sio_packet.ACK
+    data = {"type": packet_type, "data": pkt.data, "nsp": pkt.namespace}
+    if pkt.id is not None:
+        data["id"] = pkt.id
+    return pack(data)
+
+
+def compress_frame(frame: Union[str, bytes], threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+                   level: int = DEFAULT_COMPRESSION_LEVEL) -> Union[str, bytes]:
+    """达到阈值（字节）且压缩后更小时返回压缩帧，否则原样返回"""
+    payload = frame.encode("utf-8") if isinstance(frame, str) else frame
+    if len(payload) < threshold:
+        return frame
+    compressed = zlib.compress(payload, level)
+    if len(compressed) + 1 >= len(payload):
+        return frame
+    return COMPRESSED_FRAME_MARKER + compressed
+
+
+def decompress_frame(data: bytes, max_size: int) -> Union[str, bytes]:
+    """
+    解压压缩帧：内容为 Socket.IO 文本包时返回 str，否则（msgpack）返回 bytes。
+
+    Raises:
+        ValueError: 数据损坏，或解压后超过 max_size 字节
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        payload = decompressor.decompress(memoryview(data)[1:], max_size)
+    except zlib.error as e:
+        raise ValueError(f"压缩帧解压失败: {e}") from e
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError("压缩帧不完整或解压后超过大小上限")
+    return payload.decode("utf-8") if payload[:1].isdigit() else payload
+
+
+class PackedPacket(sio_packet.Packet):
+    """编码为 JSON；解码时二进制帧按 msgpack、文本帧按 JSON 处理"""
+
+    def decode(self, encoded_packet):
+        if isinstance(encoded_packet, (bytes, bytearray)) and MSGPACK_AVAILABLE:
+            decoded = unpack(encoded_packet)
+            if not isinstance(decoded, dict) or "type" not in decoded:
+                raise ValueError("msgpack 帧不是有效的 Socket.IO 包")
+            self.packet_type = decoded["type"]
+            self.data = decoded.get("data")
+            self.id = decoded.get("id")
+            self.namespace = decoded.get("nsp")
+            return 0
+        return super().decode(encoded_packet)
+
+
+class PackedAsyncManager(sio_lib.AsyncManager):
+    """房间广播时每种帧格式（JSON / msgpack，是否压缩）只编码一次，按接收方的连接分别发送"""
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None,
+                   callback=None, to=None, **kwargs):
+        if callback or not (getattr(self.server, "packed_eio_sids", None)
+                            or getattr(self.server, "compressed_eio_sids", None)):
+            # 带回调的包每个接收方都不同，由 server._send_packet 按连接编码
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                      callback=callback, to=to, **kwargs)
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        pkt = self.server.packet_class(sio_packet.EVENT, namespace=namespace, data=[event] + data)
+        packets_by_format = {}
+        tasks = []
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+            frame_format = self.server.frame_format(eio_sid)
+            packets = packets_by_format.get(frame_format)
+            if packets is None:
+                packets = packets_by_format[frame_format] = [
+                    eio_packet.Packet(eio_packet.MESSAGE, frame) for frame in self.server.encode_frames(pkt, *frame_format)
+                ]
+            for p in packets:
+                tasks.append(asyncio.create_task(self.server._send_eio_packet(eio_sid, p)))
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+class PackedAsyncServer(sio_lib.AsyncServer):
+    """
+    支持按连接切换为 msgpack 编码与帧压缩的 AsyncServer（见模块说明）
+
+    Args:
+        msgpack_enabled: 是否允许连接切换为 msgpack（还需要安装 msgpack）
+        frame_compression: 是否允许连接启用帧压缩
+        frame_compression_threshold: 达到此字节数的帧才压缩
+        frame_compression_level: zlib 压缩级别（1 最快，9 最小）
+        其余参数同 socketio.AsyncServer
+    """
+
+    def __init__(self, *args, msgpack_enabled: bool = True, frame_compression: bool = True,
+                 frame_compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+                 frame_compression_level: int = DEFAULT_COMPRESSION_LEVEL, **kwargs):
+        kwargs.setdefault("serializer", PackedPacket)
+        kwargs.setdefault("client_manager", PackedAsyncManager())
+        super().__init__(*args, **kwargs)
+        self.msgpack_enabled = msgpack_enabled
+        self.frame_compression = frame_compression
+        self.frame_compression_threshold = frame_compression_threshold
+        self.frame_compression_level = frame_compression_level
+        # 已切换为 msgpack 编码 / 已启用帧压缩的 Engine.IO 连接
+        self.packed_eio_sids: Set[str] = set()
+        self.compressed_eio_sids: Set[str] = set()
+
+    @property
+    def packed_serializer_available(self) -> bool:
+        return self.msgpack_enabled and MSGPACK_AVAILABLE
+
+    @property
+    def frame_compression_available(self) -> bool:
+        return self.frame_compression
+
+    def set_packed(self, sid: str, namespace: str = "/") -> bool:
+        """之后发往该连接的包使用 msgpack 编码；不可用或连接不存在时返回 False"""
+        if not self.packed_serializer_available:
+            return False
+        eio_sid = self.manager.eio_sid_from_sid(sid, namespace)
+        if not eio_sid:
+            return False
+        self.packed_eio_sids.add(eio_sid)
+        return True
+
+    def set_compressed(self, sid: str, namespace: str = "/") -> bool:
+        """之后发往该连接的大帧使用 zlib 压缩；未启用或连接不存在时返回 False"""
+        if not self.frame_compression:
+            return False
+        eio_sid = self.manager.eio_sid_from_sid(sid, namespace)
+        if not eio_sid:
+            return False
+        self.compressed_eio_sids.add(eio_sid)
+        return True
+
+    def frame_format(self, eio_sid: str) -> Tuple[bool, bool]:
+        """连接的帧格式：(是否 msgpack, 是否压缩)"""
+        return eio_sid in self.packed_eio_sids, eio_sid in self.compressed_eio_sids
+
+    def encode_frames(self, pkt: sio_packet.Packet, packed: bool, compressed: bool) -> List[Union[str, bytes]]:
+        """按帧格式编码一个 Socket.IO 包（JSON 包带二进制附件时为多帧，不压缩）"""
+        if packed:
+            frames = [encode_packed(pkt)]
+        else:
+            encoded = pkt.encode()
+            frames = encoded if isinstance(encoded, list) else [encoded]
+        if compressed and len(frames) == 1:
+            frames = [compress_frame(frames[0], self.frame_compression_threshold, self.frame_compression_level)]
+        return frames
+
+    async def _send_packet(self, eio_sid, pkt):
+        for frame in self.encode_frames(pkt, *self.frame_format(eio_sid)):
+            await self.eio.send(eio_sid, frame)
+
+    async def _handle_eio_message(self, eio_sid, data):
+        # 二进制附件原样交给父类；压缩帧解压后与未压缩的帧一样解码，解压后的大小同样受 max_http_buffer_size 限制
+        if (isinstance(data, bytes) and data[:1] == COMPRESSED_FRAME_MARKER
+                and eio_sid not in self._binary_packet):
+            try:
+                data = decompress_frame(data, self.eio.max_http_buffer_size)
+            except ValueError as e:
+                logger.warning("丢弃无法解压的帧: eio_sid=%s, %s", eio_sid, e)
+                return
+        await super()._handle_eio_message(eio_sid, data)
+
+    async def _handle_eio_disconnect(self, eio_sid, *args):
+        try:
+            await super()._handle_eio_disconnect(eio_sid, *args)
+        finally:
+            self.packed_eio_sids.discard(eio_sid)
+            self.compressed_eio_sids.discard(eio_sid)
@@ -0,0 +1,148 @@
+"""
+Socket.IO 序列化对比测试：JSON 与 msgpack
+
+按一段典型的客服会话流量（心跳、文本消息推送、带头像的历史分页、图片消息、会话列表）构造样本，
+也可以用 --sample 指定录制的流量（JSON Lines，每行一个 [event, data]）。对每个包分别用
+- JSON：python-socketio 默认的 Packet（文本帧）；
+- msgpack：PackedPacket / encode_packed（二进制帧，data URL 以原始字节传输）
+编码与解码，统计字节数与 CPU 耗时，并校验解码结果与原数据完全一致。
+
+用法：python backend/websocket/packed_serializer_benchmark.py [--rounds 5] [--images 20] [--sample traffic.jsonl]
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, List, Tuple
+
+# 确保项目根目录在 sys.path 中，便于导入 backend 包
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from socketio import packet as sio_packet
+
+from backend.websocket.packed_serializer import MSGPACK_AVAILABLE, PackedPacket, encode_packed
+
+
+def _data_url(rng: random.Random, size: int, mime: str) -> str:
+    # 随机字节：与 JPEG / PNG 一样几乎不可压缩
+    return f"data:{mime};base64,{base64.b64encode(rng.randbytes(size)).decode('ascii')}"
+
+
+def _message(rng: random.Random, message_id: int, avatars: List[str], image: str = None) -> dict:
+    from_agent = message_id % 2 == 0
+    return {
+        "id": str(message_id),
+        "session_id": "chat_1024_1700000000",
+        "from": "agent" if from_agent else "user",
+        "from_user_id": 2 if from_agent else 1024,
+        "to_user_id": 1024 if from_agent else 2,
+        "text": image or f"第 {message_id} 条消息：请先在设置里把输入设备切换为“虚拟麦克风”，然后重启游戏试试。",
+        "time": "刚刚",
+        "created_at": "2024-05-01T12:00:00Z",
+        "avatar": avatars[from_agent],
+        "username": "客服小王" if from_agent else "玩家1024",
+        "message_type": "image" if image else "text",
+        "reply_to_message_id": None,
+        "status": "sent",
+        "is_from_self": not from_agent,
+        "rich": None if image else {"html": None, "is_rich": False, "urls": [], "mentions": []},
+    }
+
+
+def _sample(images: int, seed: int) -> List[Tuple[str, Any]]:
+    """一段典型会话：[(event, data)]"""
+    rng = random.Random(seed)
+    avatars = [_data_url(rng, 6 * 1024, "image/png"), _data_url(rng, 6 * 1024, "image/png")]
+    traffic: List[Tuple[str, Any]] = []
+    # 打开会话：两页历史（每页 50 条，含少量图片）
+    for page in range(2):
+        messages = [
+            _message(rng, page * 50 + i, avatars, _data_url(rng, 60 * 1024, "image/jpeg") if i % 25 == 24 else None)
+            for i in range(50)
+        ]
+        traffic.append(("get_session_messages", {"success": True, "messages": messages, "has_more": page == 0}))
+    # 会话列表推送
+    traffic.append(("session_list_updated", {"sessions": [
+        {"session_id": f"chat_{i}", "user_id": i, "username": f"玩家{i}", "last_message": "你好，请问怎么退款？",
+         "unread": i % 3, "status": "active", "avatar": avatars[0]} for i in range(30)
+    ]}))
+    # 实时消息：文本为主，穿插图片发送与心跳
+    for i in range(200):
+        traffic.append(("new_message", _message(rng, 1000 + i, avatars)))
+        if i % 10 == 0:
+            traffic.append(("heartbeat", {"connection_id": "5f1c0e1e-8d7a-4a55-9d9e-1c2b3a4d5e6f"}))
+    for i in range(images):
+        image = _data_url(rng, 150 * 1024, "image/jpeg")
+        traffic.append(("send_message", {"session_id": "chat_1024_1700000000", "message": image,
+                                         "message_type": "image", "client_message_id": f"{i:032x}"}))
+        traffic.append(("new_message", _message(rng, 2000 + i, avatars, image)))
+    return traffic
+
+
+def _load(path: str) -> List[Tuple[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [tuple(json.loads(line)) for line in f if line.strip()]
+
+
+def _json_codec(pkt):
+    encoded = pkt.encode()
+    frames = encoded if isinstance(encoded, list) else [encoded]
+    return frames, lambda: sio_packet.Packet(encoded_packet=frames[0]).data
+
+
+def _packed_codec(pkt):
+    frame = encode_packed(pkt)
+    return [frame], lambda: PackedPacket(encoded_packet=frame).data
+
+
+def _measure(traffic, codec, rounds: int):
+    encode_ms, decode_ms = [], []
+    total_bytes = 0
+    for _ in range(rounds):
+        packets = [sio_packet.Packet(sio_packet.EVENT, data=[event, data], namespace="/") for event, data in traffic]
+        start = time.perf_counter()
+        encoded = [codec(pkt) for pkt in packets]
+        encode_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        decoded = [decode() for _, decode in encoded]
+        decode_ms.append((time.perf_counter() - start) * 1000)
+        total_bytes = sum(len(f.encode("utf-8") if isinstance(f, str) else f) for frames, _ in encoded for f in frames)
+    for (event, data), result in zip(traffic, decoded):
+        assert result == [event, data], f"{event} 解码结果与原数据不一致"
+    return statistics.median(encode_ms), statistics.median(decode_ms), total_bytes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Socket.IO 序列化对比测试：JSON 与 msgpack")
+    parser.add_argument("--rounds", type=int, default=5, help="重复次数（取中位数）")
+    parser.add_argument("--images", type=int, default=20, help="样本中的图片消息数")
+    parser.add_argument("--sample", help="录制的流量（JSON Lines，每行 [event, data]）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+    if not MSGPACK_AVAILABLE:
+        sys.exit("未安装 msgpack：pip install msgpack")
+
+    traffic = _load(args.sample) if args.sample else _sample(args.images, args.seed)
+    groups = {"全部": traffic}
+    for event, _ in traffic:
+        groups.setdefault(event, [item for item in traffic if item[0] == event])
+
+    print(f"{'':<22}{'JSON':>10}{'msgpack':>10}{'字节':>8}{'编码 ms':>16}{'解码 ms':>16}")
+    for label, items in groups.items():
+        json_enc, json_dec, json_bytes = _measure(items, _json_codec, args.rounds)
+        packed_enc, packed_dec, packed_bytes = _measure(items, _packed_codec, args.rounds)
+        print(f"{label:<16}{len(items):>4} 个 {json_bytes / 1024:>8.0f}KB {packed_bytes / 1024:>8.0f}KB "
+              f"{(packed_bytes / json_bytes - 1) * 100:>+6.0f}%   {json_enc:>6.1f} → {packed_enc:<6.1f}   "
+              f"{json_dec:>6.1f} → {packed_dec:<6.1f}")
+    print("  解码结果与原数据一致")
+
+
+if __name__ == "__main__":
+    main()
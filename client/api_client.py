@@ -1,17 +1,48 @@
 import base64
-from typing import Any, Dict, Optional
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import requests
 
+from client.config.config import CACHE_DIR
+from client.login.token_utils import seconds_until_expiry
+
 
 # 后端基础地址：开发阶段使用本机端口，部署时改为服务器 IP / 域名
 BASE_URL = "http://127.0.0.1:8000"
 
+# access token 剩余有效期低于该值时提前刷新（秒）
+TOKEN_REFRESH_MARGIN = 120
+# 后台刷新失败（如网络中断）后的重试间隔（秒）
+TOKEN_REFRESH_RETRY_INTERVAL = 30
+
+_refresh_lock = threading.Lock()
+_refresh_timer_lock = threading.Lock()
+_refresh_timer: Optional[threading.Timer] = None
+
+# 头像本地缓存目录：avatar_url 带版本参数，同一地址内容不变，可直接复用
+AVATAR_CACHE_DIR = CACHE_DIR / "avatars"
+
+# 聊天文件大小上限（与服务端 FILE_UPLOAD_MAX_SIZE 默认值一致）
+FILE_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+# 文件上传：单块连续失败（网络异常 / 服务端错误）的最多重试次数，重试间隔上限（秒）
+FILE_UPLOAD_MAX_RETRIES = 5
+FILE_UPLOAD_MAX_RETRY_DELAY = 10.0
+
 
 class ApiError(RuntimeError):
     """后端接口调用错误（HTTP 层或业务层）。"""
 
 
+class UploadCanceled(ApiError):
+    """文件上传被用户取消。"""
+
+
 def _full_url(path: str) -> str:
     if not path.startswith("/"):
         path = "/" + path
@@ -69,9 +100,97 @@ def login_user(email: str, password: str, code: str) -> Dict[str, Any]:
     )
 
 
+def refresh_access_token() -> Optional[str]:
+    """使用本地 refresh token 换取新的 access token，成功返回新 token，失败返回 None"""
+    from client.login.token_storage import read_refresh_token, save_token
+
+    # 加锁避免后台定时器与前台调用同时刷新（refresh token 会被轮换）
+    with _refresh_lock:
+        refresh_token = read_refresh_token()
+        if not refresh_token:
+            return None
+        try:
+            data = _post("/api/refresh_token", {"refresh_token": refresh_token})
+        except Exception as e:
+            logging.warning("刷新 token 失败：%s", e)
+            return None
+        token = data.get("token")
+        if not data.get("success") or not token:
+            return None
+        save_token(token, data.get("refresh_token"))
+        return token
+
+
+def get_valid_token() -> Optional[str]:
+    """返回可用的 access token：即将过期时先用 refresh token 换新"""
+    from client.login.token_storage import read_token
+
+    token = read_token()
+    remaining = seconds_until_expiry(token) if token else None
+    if remaining is not None and remaining > TOKEN_REFRESH_MARGIN:
+        return token
+    refreshed = refresh_access_token()
+    if refreshed:
+        return refreshed
+    # 刷新失败但旧 token 尚未过期时仍可继续使用
+    if remaining is not None and remaining > 0:
+        return token
+    return None
+
+
+def _schedule_token_refresh(delay: float) -> None:
+    global _refresh_timer
+    with _refresh_timer_lock:
+        if _refresh_timer:
+            _refresh_timer.cancel()
+        _refresh_timer = threading.Timer(delay, _auto_refresh_worker)
+        _refresh_timer.daemon = True
+        _refresh_timer.start()
+
+
+def _auto_refresh_worker() -> None:
+    from client.login.token_storage import read_refresh_token
+
+    if refresh_access_token():
+        start_token_auto_refresh()
+    elif read_refresh_token():
+        _schedule_token_refresh(TOKEN_REFRESH_RETRY_INTERVAL)
+    # 已退出登录（本地无 refresh token）时停止续期
+
+
+def start_token_auto_refresh() -> None:
+    """在后台线程中于 access token 过期前自动续期（重复调用只保留一个定时器）"""
+    from client.login.token_storage import read_token
+
+    token = read_token()
+    remaining = seconds_until_expiry(token) if token else None
+    if remaining is None:
+        return
+    _schedule_token_refresh(max(remaining - TOKEN_REFRESH_MARGIN, 0))
+
+
+def stop_token_auto_refresh() -> None:
+    """停止后台 token 续期（退出登录时调用）"""
+    global _refresh_timer
+    with _refresh_timer_lock:
+        if _refresh_timer:
+            _refresh_timer.cancel()
+            _refresh_timer = None
+
+
 def check_token(token: str) -> Dict[str, Any]:
-    """校验 token 并获取用户信息"""
-    return _post("/api/check_token", {"token": token})
+    """
+    校验 token 并获取用户信息。
+
+    access token 即将过期时先用 refresh token 换新；校验成功后在后台定时续期。
+    """
+    remaining = seconds_until_expiry(token)
+    if remaining is None or remaining <= TOKEN_REFRESH_MARGIN:
+        token = refresh_access_token() or token
+    data = _post("/api/check_token", {"token": token})
+    if data.get("success"):
+        start_token_auto_refresh()
+    return data
 
 
 def get_vip_info(user_id: int) -> Dict[str, Any]:
@@ -112,6 +231,63 @@ def get_diamond_balance(user_id: int) -> int:
         return 0
 
 
+def fetch_avatar(avatar_url: str, user_id: Any, token: str) -> Optional[bytes]:
+    """按引用地址下载头像（需要登录），优先使用本地缓存；失败返回 None"""
+    if not avatar_url:
+        return None
+    cache_file = AVATAR_CACHE_DIR / hashlib.sha1(avatar_url.encode("utf-8")).hexdigest()
+    try:
+        if cache_file.exists():
+            return cache_file.read_bytes()
+    except OSError:
+        pass
+    try:
+        headers = {"Authorization": f"Bearer {token}", "X-User-Id": str(user_id)}
+        resp = requests.get(_full_url(avatar_url), headers=headers, timeout=5.0)
+        resp.raise_for_status()
+        data = resp.content
+    except Exception as e:
+        logging.warning("下载头像失败：%s", e)
+        return None
+    try:
+        AVATAR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cache_file.write_bytes(data)
+    except OSError:
+        pass
+    return data
+
+
+def build_user_profile(resp: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    由 login / register / check_token 的响应直接组装 {"user", "vip"} 资料，
+    无需再次请求后端；并为桌面端补充 avatar_bytes 字段。
+    """
+    user = dict(resp.get("user") or {})
+    vip = resp.get("vip") or {}
+    if not user.get("avatar_bytes"):
+        avatar_url = user.get("avatar_url")
+        avatar_b64 = user.get("avatar_base64")
+        if avatar_url:
+            # 新接口按引用返回头像（带版本），本地缓存命中时不产生网络请求
+            token = resp.get("token")
+            if not token:
+                from client.login.token_storage import read_token
+                token = read_token()
+            avatar_bytes = fetch_avatar(avatar_url, user.get("id"), token or "")
+            if avatar_bytes:
+                user["avatar_bytes"] = avatar_bytes
+        elif avatar_b64:
+            try:
+                b64 = avatar_b64
+                if isinstance(b64, str) and b64.startswith("data:image"):
+                    b64 = b64.split(",", 1)[1]
+                user["avatar_bytes"] = base64.b64decode(b64)
+            except Exception:
+                # 解码失败时忽略，保持兼容
+                pass
+    return {"user": user, "vip": vip}
+
+
 def get_user_profile(user_id: int) -> Dict[str, Any]:
     """
     获取用户资料（包含 avatar 等）。
@@ -126,22 +302,8 @@ def get_user_profile(user_id: int) -> Dict[str, Any]:
         data = check_token(token)
         if not data.get("success"):
             return {}
-        user = data.get("user") or {}
-        vip = data.get("vip") or {}
-        token_user_id = user.get("id")
-
-        # 后端统一返回 avatar_base64，这里为桌面端补充 avatar_bytes 字段，便于现有代码复用
-        avatar_b64 = user.get("avatar_base64")
-        if avatar_b64 and not user.get("avatar_bytes"):
-            try:
-                b64 = avatar_b64
-                if isinstance(b64, str) and b64.startswith("data:image"):
-                    b64 = b64.split(",", 1)[1]
-                avatar_bytes = base64.b64decode(b64)
-                user["avatar_bytes"] = avatar_bytes
-            except Exception:
-                # 解码失败时忽略，保持兼容
-                pass
+        profile = build_user_profile(data)
+        token_user_id = profile["user"].get("id")
         if token_user_id is not None:
             try:
                 if int(token_user_id) != int(user_id):
@@ -149,7 +311,7 @@ def get_user_profile(user_id: int) -> Dict[str, Any]:
             except Exception:
                 return {}
         # 兼容桌面端历史调用：上层期望 profile 结构包含 user/vip 两个字段
-        return {"user": user, "vip": vip}
+        return profile
     except Exception:
         return {}
 
@@ -171,6 +333,23 @@ def update_avatar(user_id: int, avatar_bytes: bytes) -> Dict[str, Any]:
     }
 
 
+def fetch_knowledge_base(etag: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    下载编译好的客服知识库索引，etag 为本地缓存版本。
+
+    返回 (索引, 新 ETag)；服务端返回 304（本地缓存仍是最新）时索引为 None。
+    """
+    headers = {"If-None-Match": etag} if etag else {}
+    resp = requests.get(_full_url("/api/customer_service/knowledge_base"), headers=headers, timeout=5.0)
+    if resp.status_code == 304:
+        return None, etag
+    resp.raise_for_status()
+    data = resp.json()
+    if not data.get("success") or not isinstance(data.get("index"), dict):
+        raise ApiError("知识库数据无效")
+    return data["index"], resp.headers.get("ETag")
+
+
 def get_latest_announcement() -> Optional[str]:
     """获取最新公告"""
     try:
@@ -184,12 +363,154 @@ def get_latest_announcement() -> Optional[str]:
 
 
 
-def purchase_membership(user_id: int, card_info: Dict[str, Any]) -> Dict[str, Any]:
-    """购买会员套餐"""
-    return _post(
-        "/api/vip/purchase",
-        {"user_id": user_id, "card": card_info},
-    )
+def file_sha256(file_path: str, should_cancel: Optional[Callable[[], bool]] = None) -> str:
+    """按块计算文件的 sha256（不整体读入内存）"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            if should_cancel and should_cancel():
+                raise UploadCanceled("上传已取消")
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _upload_call(method: str, path: str, headers: Dict[str, str], **kwargs) -> Tuple[int, Dict[str, Any]]:
+    """文件上传接口调用，返回 (HTTP 状态码, 响应 JSON)；网络异常原样抛出"""
+    resp = requests.request(method, _full_url(path), headers=headers, **kwargs)
+    try:
+        data = resp.json()
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    return resp.status_code, data
+
+
+def upload_file(
+    file_path: str,
+    user_id: int,
+    token: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+) -> Dict[str, Any]:
+    """
+    分块续传上传文件，返回服务端文件信息 {file_id, filename, size, sha256, mime_type, url}（url 为完整地址）。
+
+    先按块计算 sha256 并创建上传任务：同一文件之前上传到一半时从服务端记录的偏移量继续；
+    之后每次只读取一块（大小由服务端给出）以 PATCH + Upload-Offset 追加，内存占用与文件大小无关。
+    网络异常或服务端错误时按指数退避重试，并以服务端的偏移量为准继续；服务端校验 sha256 后完成。
+
+    Args:
+        on_progress: 进度回调 (已上传字节数, 文件大小)，在调用线程中执行
+        should_cancel: 返回 True 时停止上传并抛出 UploadCanceled
+
+    Raises:
+        UploadCanceled: 用户取消
+        ApiError: 服务端拒绝（文件过大、校验失败等）或重试次数用尽
+        OSError: 读取本地文件失败
+    """
+    size = os.path.getsize(file_path)
+    filename = os.path.basename(file_path)
+    headers = {"Authorization": f"Bearer {token}", "X-User-Id": str(user_id)}
+    sha256 = file_sha256(file_path, should_cancel)
+
+    failures = 0
+
+    def _retry_or_raise(reason: str) -> None:
+        nonlocal failures
+        failures += 1
+        if failures > FILE_UPLOAD_MAX_RETRIES:
+            raise ApiError(f"上传失败：{reason}")
+        logging.warning("文件上传失败（第 %s 次），稍后重试：%s", failures, reason)
+        time.sleep(min(2 ** (failures - 1), FILE_UPLOAD_MAX_RETRY_DELAY))
+
+    state: Optional[Dict[str, Any]] = None
+    while state is None:
+        try:
+            status, data = _upload_call(
+                "POST", "/api/files/uploads", headers,
+                json={"filename": filename, "size": size, "sha256": sha256}, timeout=10.0,
+            )
+        except requests.RequestException as e:
+            _retry_or_raise(str(e))
+            continue
+        if status >= 500:
+            _retry_or_raise(f"HTTP {status}")
+            continue
+        if status != 200 or not data.get("success"):
+            raise ApiError(data.get("message") or data.get("detail") or f"HTTP {status}")
+        state = data
+
+    upload_path = f"/api/files/uploads/{state['upload_id']}"
+    chunk_size = max(int(state.get("chunk_size") or 0), 64 * 1024)
+    offset = int(state.get("offset", 0))
+    if on_progress:
+        on_progress(offset, size)
+
+    with open(file_path, "rb") as f:
+        while not state.get("completed"):
+            if should_cancel and should_cancel():
+                raise UploadCanceled("上传已取消")
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ApiError("文件在上传过程中被修改")
+            try:
+                status, data = _upload_call(
+                    "PATCH", upload_path,
+                    dict(headers, **{"Upload-Offset": str(offset), "Content-Type": "application/octet-stream"}),
+                    data=chunk, timeout=30.0,
+                )
+            except requests.RequestException as e:
+                _retry_or_raise(str(e))
+                # 请求可能已写入服务端：查询服务端偏移量后续传
+                try:
+                    status, data = _upload_call("GET", upload_path, headers, timeout=10.0)
+                except requests.RequestException:
+                    continue
+                if status == 200 and data.get("success"):
+                    state = data
+                    offset = int(data.get("offset", offset))
+                continue
+            if status == 409 and "offset" in data:
+                # 偏移量不一致：以服务端为准
+                offset = int(data["offset"])
+                continue
+            if status >= 500:
+                _retry_or_raise(f"HTTP {status}")
+                continue
+            if status != 200 or not data.get("success"):
+                raise ApiError(data.get("message") or data.get("detail") or f"HTTP {status}")
+            state = data
+            offset = int(data.get("offset", offset))
+            failures = 0
+            if on_progress:
+                on_progress(offset, size)
+
+    file_info = dict(state.get("file") or {})
+    if not file_info.get("url"):
+        raise ApiError("上传结果无效")
+    file_info["url"] = _full_url(file_info["url"])
+    return file_info
+
+
+def purchase_membership(
+    user_id: int,
+    card_info: Dict[str, Any],
+    idempotency_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    购买会员套餐。
+
+    每次购买生成一个幂等键；网络异常时用同一个键重试一次，服务端保证不会重复扣费。
+    """
+    idempotency_key = idempotency_key or uuid.uuid4().hex
+    payload = {"user_id": user_id, "card": card_info, "idempotency_key": idempotency_key}
+    try:
+        return _post("/api/vip/purchase", payload)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        logging.warning("购买会员请求失败，使用相同幂等键重试：%s", e)
+        return _post("/api/vip/purchase", payload)
 
 
 def forgot_password(email: str) -> Dict[str, Any]:
@@ -1,6 +1,24 @@
 """客户端配置（仅包含客户端需要的配置，不包含后端密钥）"""
 
+import os
+import sys
+from pathlib import Path
+
 # 加密密钥（用于本地 token 加密，与后端共享）
 # 注意：这个密钥应该与后端保持一致，用于加密本地存储的 token
 ENCRYPTION_KEY = "QE_6CbrJ7eIMdVT_S4xPLszMr645ohkGims5qLqpSLI="
 
+
+def _default_cache_dir() -> Path:
+    """当前用户的应用缓存目录（Windows: %LOCALAPPDATA%，macOS: ~/Library/Caches，其余: $XDG_CACHE_HOME 或 ~/.cache）"""
+    if sys.platform == "win32":
+        base = os.getenv("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+    else:
+        base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "VoiceChange"
+
+
+# 本地缓存目录（头像、知识库、聊天记录、待发送消息），不写入源码目录；可用环境变量 VOICE_CHANGE_CACHE_DIR 指定
+CACHE_DIR = Path(os.getenv("VOICE_CHANGE_CACHE_DIR") or _default_cache_dir())
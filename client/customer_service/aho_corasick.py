@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Aho–Corasick 多模式匹配自动机
+一次扫描文本即可找出其中出现的全部关键词，耗时与文本长度成线性关系，与关键词数量无关
+"""
+
+from collections import deque
+from typing import Any, Dict, Iterable, List, Set
+
+
+class AhoCorasick:
+    """多模式子串匹配自动机（构建后只读，可在多线程间共享）"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        # 每个节点：子节点跳转表、失败指针、在此结束的模式编号（含失败链上的输出）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出构建好的跳转表，可 JSON 序列化；加载方无需重新构建"""
+        return {
+            "patterns": self.patterns,
+            "goto": self._goto,
+            "fail": self._fail,
+            "out": self._out,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AhoCorasick":
+        """由 to_dict() 的结果恢复自动机"""
+        automaton = cls.__new__(cls)
+        automaton.patterns = list(data["patterns"])
+        automaton._goto = [dict(table) for table in data["goto"]]
+        automaton._fail = list(data["fail"])
+        automaton._out = [list(out) for out in data["out"]]
+        if not (len(automaton._goto) == len(automaton._fail) == len(automaton._out)):
+            raise ValueError("自动机数据不完整")
+        return automaton
+
+    def _add(self, pattern: str) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _build(self) -> None:
+        """按层（BFS）计算失败指针，并把失败链上的输出合并到当前节点"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_all(self, text: str) -> Set[int]:
+        """返回 text 中出现过的全部模式编号（去重）"""
+        goto, fail, out = self._goto, self._fail, self._out
+        # 空模式串是任何文本的子串
+        found: Set[int] = set(out[0])
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
@@ -0,0 +1,135 @@
+"""
+新消息批量推送测试
+
+模拟断线重连或多会话突发时短时间内到达大量新消息，对比两种处理方式：
+- 逐条：每条 new_message 单独一帧、单独切换到主线程、单独追加一行并布局重绘；
+- 批量：服务端每 --batch 条合并为一个 new_messages 帧，客户端每批在 batch_insert 中追加，只布局重绘一次。
+统计 Socket.IO 帧数与编码字节数、已送达回执帧数、rowsInserted 次数与主线程耗时，并校验两种方式的最终记录一致。
+
+用法：python client/gui/components/chat_batch_benchmark.py [--history 2000] [--burst 300] [--batch 50] [--rounds 3]
+（需要 PyQt6，可配合 QT_QPA_PLATFORM=offscreen）
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+# 与 main.py 一致：项目根目录与 client 目录都需要在 sys.path 中
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BASE_DIR = os.path.dirname(CLIENT_DIR)
+for path in (BASE_DIR, CLIENT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from PyQt6.QtWidgets import QApplication
+
+from gui.components.chat_transcript import KIND_TEXT, ChatMessage, ChatTranscriptModel, ChatTranscriptView
+
+
+def _payloads(count: int, first_id: int) -> List[Dict]:
+    """与服务端 new_message 负载结构一致的消息"""
+    return [{
+        "id": str(first_id + i),
+        "session_id": f"chat_{i % 5}",
+        "from": "agent",
+        "from_user_id": 2,
+        "to_user_id": 1,
+        "text": f"第 {first_id + i} 条消息：请先在设置里把输入设备切换为虚拟麦克风，然后重启一下游戏试试。",
+        "time": "刚刚",
+        "created_at": "2024-01-01T12:00:00Z",
+        "avatar": None,
+        "username": "客服",
+        "message_type": "text",
+        "reply_to_message_id": None,
+        "status": "sent",
+        "is_from_self": False,
+        "rich": None,
+    } for i in range(count)]
+
+
+def _record(payload: Dict) -> ChatMessage:
+    return ChatMessage(KIND_TEXT, payload["text"], from_self=False, message_id=payload["id"])
+
+
+def _frames(payloads: List[Dict], batch: int):
+    """Socket.IO 事件帧（42["event", data]）的数量与总字节数"""
+    if batch <= 1:
+        frames = ["42" + json.dumps(["new_message", p], ensure_ascii=False) for p in payloads]
+        acks = len(payloads)
+    else:
+        chunks = [payloads[i:i + batch] for i in range(0, len(payloads), batch)]
+        frames = ["42" + json.dumps(["new_messages", {"messages": c}], ensure_ascii=False) for c in chunks]
+        acks = len(chunks)
+    return len(frames), sum(len(f.encode("utf-8")) for f in frames), acks
+
+
+def _run(app: QApplication, history: int, payloads: List[Dict], batch: int):
+    model = ChatTranscriptModel()
+    view = ChatTranscriptView(model)
+    view.resize(720, 640)
+    view.show()
+    model.extend(_record(p) for p in _payloads(history, 1))
+    view.executeDelayedItemsLayout()
+    app.processEvents()
+
+    inserts = []
+    model.rowsInserted.connect(lambda *args: inserts.append(args))
+    start = time.perf_counter()
+    if batch <= 1:
+        for payload in payloads:
+            # 每条消息一次主线程调度：追加、滚动、布局重绘
+            if model.find(payload["id"]) is None:
+                model.append(_record(payload))
+            view.scroll_to_bottom()
+            app.processEvents()
+    else:
+        for i in range(0, len(payloads), batch):
+            with model.batch_insert():
+                for payload in payloads[i:i + batch]:
+                    if model.find(payload["id"]) is None:
+                        model.append(_record(payload))
+                        # 批量期间新记录已可按ID查找，但尚未通知视图
+                        assert model.find(payload["id"]) is not None
+                        assert not model.index_of(model.find(payload["id"])).isValid()
+            view.scroll_to_bottom()
+            app.processEvents()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    ids = [model.message_at(row).message_id for row in range(model.rowCount())]
+    view.close()
+    return elapsed_ms, len(inserts), ids
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="新消息批量推送测试")
+    parser.add_argument("--history", type=int, default=2000, help="已有的聊天记录条数")
+    parser.add_argument("--burst", type=int, default=300, help="突发到达的新消息条数")
+    parser.add_argument("--batch", type=int, default=50, help="单个 new_messages 帧最多的消息条数")
+    parser.add_argument("--rounds", type=int, default=3, help="重复次数（取中位数）")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    payloads = _payloads(args.burst, args.history + 1)
+
+    results = {}
+    for label, batch in (("逐条", 1), ("批量", args.batch)):
+        runs = [_run(app, args.history, payloads, batch) for _ in range(args.rounds)]
+        frames, frame_bytes, acks = _frames(payloads, batch)
+        results[label] = (statistics.median(r[0] for r in runs), runs[0][1], runs[0][2], frames, frame_bytes, acks)
+
+    print(f"已有记录: {args.history}，突发新消息: {args.burst}，批量上限: {args.batch}")
+    for label, (elapsed_ms, inserts, _, frames, frame_bytes, acks) in results.items():
+        print(f"[{label}] 推送帧 {frames} 个（{frame_bytes / 1024:.0f} KB），送达回执帧 {acks} 个，"
+              f"rowsInserted {inserts} 次，主线程耗时 {elapsed_ms:.1f} ms")
+
+    single, batched = results["逐条"], results["批量"]
+    assert single[2] == batched[2], "逐条与批量处理后的聊天记录不一致"
+    print(f"  最终记录一致，主线程耗时降低 {(1 - batched[0] / max(single[0], 1e-6)) * 100:.0f}%")
+    app.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 from typing import TYPE_CHECKING
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QScrollArea, QPushButton, QTextEdit
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTextEdit
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QCursor, QKeySequence, QShortcut, QKeyEvent
 from client.resources import get_default_avatar
 from gui.window_utils import set_icon_button
+from gui.components.chat_transcript import ChatTranscriptModel, ChatTranscriptView
 from gui.handlers import chat_handlers
 
 if TYPE_CHECKING:
@@ -153,18 +154,14 @@ def _create_chat_area(main_window: "MainWindow") -> QVBoxLayout:
     left_layout.setContentsMargins(0, 0, 0, 0)
     left_layout.setSpacing(0)
 
-    # 滚动区域
-    main_window.chat_scroll_area = QScrollArea()
-    main_window.chat_scroll_area.setWidgetResizable(True)
-    main_window.chat_scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-    main_window.chat_scroll_area.setStyleSheet("""
-        QScrollArea {
+    # 聊天记录：消息保存在模型中，由视图只绘制可见的行
+    main_window.chat_model = ChatTranscriptModel(main_window)
+    main_window.chat_view = ChatTranscriptView(main_window.chat_model)
+    main_window.chat_view.setStyleSheet("""
+        QListView {
             border: none;
             background-color: #f4f5f7;
         }
-        QScrollArea > QWidget > QWidget {
-            background-color: #f4f5f7;
-        }
         QScrollBar:vertical {
             width: 6px;
             background: transparent;
@@ -185,17 +182,12 @@ def _create_chat_area(main_window: "MainWindow") -> QVBoxLayout:
             background: transparent;
         }
     """)
-    main_window.chat_scroll_area.enterEvent = lambda e: chat_handlers.show_scrollbar_handle(main_window.chat_scroll_area)
-    main_window.chat_scroll_area.leaveEvent = lambda e: chat_handlers.hide_scrollbar_handle(main_window.chat_scroll_area)
-
-    main_window.chat_scroll_widget = QWidget()
-    main_window.chat_layout = QVBoxLayout(main_window.chat_scroll_widget)
-    main_window.chat_layout.setContentsMargins(10, 10, 10, 10)
-    main_window.chat_layout.setSpacing(8)
-    main_window.chat_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-
-    main_window.chat_scroll_area.setWidget(main_window.chat_scroll_widget)
-    left_layout.addWidget(main_window.chat_scroll_area, stretch=1)
+    main_window.chat_view.enterEvent = lambda e: chat_handlers.show_scrollbar_handle(main_window.chat_view)
+    main_window.chat_view.leaveEvent = lambda e: chat_handlers.hide_scrollbar_handle(main_window.chat_view)
+    main_window.chat_view.context_menu_requested.connect(
+        lambda message, pos: chat_handlers.show_message_context_menu(main_window, message, pos)
+    )
+    left_layout.addWidget(main_window.chat_view, stretch=1)
 
     # 初始化头像URL
     main_window._support_avatar_url = ""
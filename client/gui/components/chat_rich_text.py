@@ -1,6 +1,9 @@
 import re
+from functools import lru_cache
 from typing import List, Tuple, Dict, Optional
 
+from client.utils.markdown_renderer import escape_html, render_markdown
+
 
 MENTION_PATTERN = re.compile(r"@([\u4e00-\u9fa5A-Za-z0-9_]+)")
 URL_PATTERN = re.compile(
@@ -8,14 +11,23 @@ URL_PATTERN = re.compile(
 )
 
 
+# Markdown 渲染样式（供 markdown_renderer 使用）
+MARKDOWN_THEME = {
+    "code_block": '<pre style="background-color:#1e293b;padding:12px;border-radius:8px;overflow-x:auto;border:1px solid #334155;margin:8px 0;"><code style="color:#e2e8f0;font-family:\'Consolas\',\'Monaco\',\'Courier New\',monospace;font-size:0.9em;line-height:1.6;">{}</code></pre>',
+    "inline_code": '<code style="background-color:#f1f5f9;padding:3px 6px;border-radius:4px;font-family:\'Consolas\',\'Monaco\',\'Courier New\',monospace;font-size:0.9em;color:#e11d48;border:1px solid #e2e8f0;">{}</code>',
+    "heading": "<h{level} style='margin:12px 0 8px 0;font-size:{size}px;font-weight:700;color:#0f172a;line-height:1.3;'>{content}</h{level}>",
+    "heading_size": lambda level: 20 - level * 2,
+    "li": '<li style="margin:6px 0;line-height:1.6;">{}</li>',
+    "ul_open": '<ul style="margin:10px 0;padding-left:24px;list-style-type:disc;">',
+    "ol_open": '<ol style="margin:10px 0;padding-left:24px;list-style-type:decimal;">',
+    "strong": '<strong style="font-weight:700;color:#0f172a;">{}</strong>',
+    "em": '<em style="font-style:italic;color:#475569;">{}</em>',
+    "link": '<a href="{href}" target="_blank" rel="noopener noreferrer" style="color:#2563eb;text-decoration:none;font-weight:500;border-bottom:1px solid rgba(37,99,235,0.3);transition:all 0.2s ease;">{label}</a>',
+}
+
+
 def _escape_html(text: str) -> str:
-    return (
-        text.replace("&", "&amp;")
-        .replace("<", "&lt;")
-        .replace(">", "&gt;")
-        .replace('"', "&quot;")
-        .replace("'", "&#39;")
-    )
+    return escape_html(text)
 
 
 def _apply_basic_markdown(text: str) -> str:
@@ -26,107 +38,14 @@ def _apply_basic_markdown(text: str) -> str:
     - `行内代码`
     - ```代码块```
     - # 标题（1-6级）
-    - > 引用
     - - 无序列表
     - 1. 有序列表
     - [链接文本](https://example.com)
     并将换行替换为 <br/>。
+
+    由 markdown_renderer 线性扫描完成，输出与原先逐条正则替换的实现一致。
     """
-    escaped = _escape_html(text)
-    
-    # 代码块（多行）
-    def _code_block_repl(m: re.Match) -> str:
-        code = m.group(1)
-        return f'<pre style="background-color:#1e293b;padding:12px;border-radius:8px;overflow-x:auto;border:1px solid #334155;margin:8px 0;"><code style="color:#e2e8f0;font-family:\'Consolas\',\'Monaco\',\'Courier New\',monospace;font-size:0.9em;line-height:1.6;">{code}</code></pre>'
-    
-    escaped = re.sub(
-        r"```([\s\S]*?)```",
-        _code_block_repl,
-        escaped
-    )
-    
-    # 行内代码
-    escaped = re.sub(
-        r"`([^`]+)`",
-        lambda m: f'<code style="background-color:#f1f5f9;padding:3px 6px;border-radius:4px;font-family:\'Consolas\',\'Monaco\',\'Courier New\',monospace;font-size:0.9em;color:#e11d48;border:1px solid #e2e8f0;">{m.group(1)}</code>',
-        escaped
-    )
-    
-    # 标题（# 到 ######）
-    for i in range(1, 7):
-        escaped = re.sub(
-            rf"^{'#' * i}\s+(.+)$",
-            lambda m, level=i: f"<h{level} style='margin:12px 0 8px 0;font-size:{20-level*2}px;font-weight:700;color:#0f172a;line-height:1.3;'>{m.group(1)}</h{level}>",
-            escaped,
-            flags=re.MULTILINE
-        )
-    
-    # 引用
-    escaped = re.sub(
-        r"^>\s+(.+)$",
-        lambda m: f'<blockquote style="border-left:4px solid #3b82f6;padding:8px 12px;margin:8px 0;background-color:#f8fafc;border-radius:0 6px 6px 0;color:#475569;font-style:italic;">{m.group(1)}</blockquote>',
-        escaped,
-        flags=re.MULTILINE
-    )
-    
-    # 无序列表
-    escaped = re.sub(
-        r"^[-*]\s+(.+)$",
-        lambda m: f'<li style="margin:6px 0;line-height:1.6;">{m.group(1)}</li>',
-        escaped,
-        flags=re.MULTILINE
-    )
-    # 将连续的 <li> 包裹在 <ul> 中
-    escaped = re.sub(
-        r"(<li[^>]*>.*?</li>(?:\s*<li[^>]*>.*?</li>)*)",
-        lambda m: f'<ul style="margin:10px 0;padding-left:24px;list-style-type:disc;">{m.group(1)}</ul>',
-        escaped
-    )
-    
-    # 有序列表
-    escaped = re.sub(
-        r"^\d+\.\s+(.+)$",
-        lambda m: f'<li style="margin:6px 0;line-height:1.6;">{m.group(1)}</li>',
-        escaped,
-        flags=re.MULTILINE
-    )
-    # 将连续的 <li> 包裹在 <ol> 中
-    escaped = re.sub(
-        r"(<li[^>]*>.*?</li>(?:\s*<li[^>]*>.*?</li>)*)",
-        lambda m: f'<ol style="margin:10px 0;padding-left:24px;list-style-type:decimal;">{m.group(1)}</ol>',
-        escaped
-    )
-
-    # 加粗 **text** 或 __text__
-    escaped = re.sub(
-        r"\*\*([^*]+)\*\*|__([^_]+)__",
-        lambda m: f'<strong style="font-weight:700;color:#0f172a;">{m.group(1) or m.group(2)}</strong>',
-        escaped,
-    )
-
-    # 斜体 *text* 或 _text_（但不在加粗中）
-    escaped = re.sub(
-        r"(?<!\*)\*([^*]+)\*(?!\*)|(?<!_)_([^_]+)_(?!_)",
-        lambda m: f'<em style="font-style:italic;color:#475569;">{m.group(1) or m.group(2)}</em>',
-        escaped,
-    )
-
-    # Markdown 链接 [text](url)
-    def _md_link_repl(m: re.Match) -> str:
-        label = m.group(1)
-        url = m.group(2)
-        href = url if re.match(r"^https?://", url, re.IGNORECASE) else f"http://{url}"
-        return f'<a href="{href}" target="_blank" rel="noopener noreferrer" style="color:#2563eb;text-decoration:none;font-weight:500;border-bottom:1px solid rgba(37,99,235,0.3);transition:all 0.2s ease;">{label}</a>'
-
-    escaped = re.sub(
-        r"\[([^\]]+)\]\(([^)]+)\)",
-        _md_link_repl,
-        escaped,
-    )
-
-    # 换行
-    escaped = escaped.replace("\n", "<br/>")
-    return escaped
+    return render_markdown(text, MARKDOWN_THEME)
 
 
 def _apply_mentions(html: str) -> Tuple[str, List[Dict[str, str]]]:
@@ -202,29 +121,45 @@ def _apply_auto_link(html: str) -> Tuple[str, List[str]]:
     return new_html, urls
 
 
-def format_message_rich_text(content: str) -> Tuple[str, bool, List[str]]:
+def format_message_rich_text(content: str, rich: Optional[Dict] = None) -> Tuple[str, bool, List[str]]:
     """
     将原始纯文本消息转换为富文本 HTML。
 
     返回: (渲染内容, 是否为富文本, 需要预览的 URL 列表)
     - 对于不包含 Markdown/@/URL 的普通文本，保持原样并返回 is_rich=False；
     - 一旦检测到上述任一特性，则返回 HTML，并将 is_rich 设为 True。
+
+    rich 为服务端随消息下发的预渲染结果（{html, is_rich, urls, mentions}）：
+    服务端判定为普通文本时直接返回原文，不再解析；桌面端样式与服务端不同，
+    富文本仍在本地渲染，但按内容缓存，重复加载同一条消息不会重复解析。
     """
     if not content:
         return content, False, []
 
+    if rich is not None and not rich.get("is_rich"):
+        return content, False, []
+
+    html, is_rich, urls = _render_rich_text(content)
+    if rich is not None and rich.get("urls") is not None:
+        return html, is_rich, list(rich["urls"])
+    return html, is_rich, list(urls)
+
+
+@lru_cache(maxsize=2048)
+def _render_rich_text(content: str) -> Tuple[str, bool, Tuple[str, ...]]:
+    """按消息内容缓存的渲染结果（URL 列表转为元组，避免缓存对象被调用方修改）"""
     # 快速检测：若既无 markdown 符号、无 @、又无 URL 特征，则直接返回
     has_markdown = any(symbol in content for symbol in ["**", "*", "`", "#", ">", "-", "["])
     has_url = any(keyword in content.lower() for keyword in ["http", "www.", "ftp://"])
     has_mention = "@" in content
     
     if not (has_markdown or has_url or has_mention):
-        return content, False, []
+        return content, False, ()
 
     html = _apply_basic_markdown(content)
     html, mentions = _apply_mentions(html)
     html, urls = _apply_auto_link(html)
-    return html, True, urls
+    return html, True, tuple(urls)
 
 
 def extract_urls_from_text(text: str) -> List[str]:
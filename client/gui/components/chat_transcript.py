@@ -0,0 +1,805 @@
+"""
+聊天记录视图（模型 / 视图）
+
+消息以紧凑的 ChatMessage 记录保存在 ChatTranscriptModel 中，由 ChatBubbleDelegate 直接绘制，
+不再为每条消息创建一组 QWidget，只有可见行才会被绘制：
+- 记录及 消息ID / 临时ID 索引由 MessageStore（message_store.py）维护，按ID更新时无需扫描整个列表
+- 行高按文本可用宽度缓存在记录上，宽度或内容变化时才重新排版
+- 少数需要交互控件的行（如“联系人工客服”按钮）通过 setIndexWidget 放置真实控件
+"""
+
+import math
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from PyQt6.QtCore import (
+    QAbstractListModel, QModelIndex, QPoint, QPointF, QRect, QRectF, QSize, Qt, QUrl, pyqtSignal
+)
+from PyQt6.QtGui import (
+    QAbstractTextDocumentLayout, QColor, QDesktopServices, QFont, QFontMetrics, QLinearGradient,
+    QPainter, QPainterPath, QPalette, QPixmap, QTextDocument, QTextLayout, QTextOption
+)
+from PyQt6.QtWidgets import QAbstractItemView, QListView, QStyledItemDelegate, QStyleOptionViewItem
+
+from gui.components.message_store import (
+    KIND_FILE, KIND_IMAGE, KIND_NOTICE, KIND_SEPARATOR, KIND_TEXT, KIND_WIDGET, STYLE_MATCHING,
+    ChatMessage, MessageStore,
+)
+
+_FONT_FAMILIES = ["Microsoft YaHei", "SimHei", "Arial"]
+
+_ROW_PADDING_H = 14      # 10px 列表边距 + 4px 消息边距
+_ROW_PADDING_V = 4       # 相邻两条消息间隔 8px
+_AVATAR_SIZE = 32
+_AVATAR_GAP = 6
+_CONTENT_OFFSET = _AVATAR_SIZE + _AVATAR_GAP
+_TIME_HEIGHT = 16
+_TIME_SPACING = 2
+
+_BUBBLE_MAX_WIDTH = 420
+_MATCHING_MAX_WIDTH = 280
+_BUBBLE_RADIUS = 18
+_BUBBLE_PADDING_H = 14
+_BUBBLE_PADDING_V = 8
+
+_IMAGE_RADIUS = 12
+_IMAGE_PLACEHOLDER_SIZE = QSize(160, 120)  # 图片解码完成前的占位尺寸
+
+_FILE_MIN_WIDTH = 200
+_FILE_MAX_WIDTH = 260
+_FILE_NAME_MAX_WIDTH = 200
+_FILE_ICON_SIZE = QSize(34, 42)
+
+_CARD_MAX_WIDTH = 320
+_REPLY_MIN_WIDTH = 160
+_REPLY_SPACING = 6
+_REPLY_PADDING_H = 10
+_REPLY_PADDING_V = 8
+_REPLY_BAR_WIDTH = 3
+_REPLY_THUMBNAIL = 60
+_REPLY_SENDER_MAX_WIDTH = 160
+_LINK_SPACING = 4
+_LINK_PADDING_H = 14
+_LINK_PADDING_V = 10
+
+_NOTICE_HEIGHT = 24
+_SEPARATOR_HEIGHT = 40
+
+# 绘制用的排版对象只为最近绘制过的行保留
+_TEXT_LAYOUT_CACHE_SIZE = 256
+
+_BUBBLE_COLORS = {
+    # (背景, 文字, 边框)
+    "self": (QColor("#dcf8c6"), QColor("#0f172a"), None),
+    "other": (QColor("#ffffff"), QColor("#111827"), QColor("#e5e7eb")),
+    STYLE_MATCHING: (QColor("#eff6ff"), QColor("#1e40af"), QColor("#93c5fd")),
+}
+
+
+class ChatTranscriptModel(QAbstractListModel):
+    """聊天记录模型：在 MessageStore 之上发出 Qt 模型信号，查找均委托给 store"""
+
+    MessageRole = Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = MessageStore()
+        # 已通知视图的行数：批量追加期间新记录先进入 store，结束时一次 rowsInserted
+        self._rows = 0
+        self._batch_depth = 0
+
+    # ---- Qt 接口 ----
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._rows
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        message = self.store.message_at(index.row()) if index.isValid() else None
+        if message is None:
+            return None
+        if role == self.MessageRole:
+            return message
+        if role == Qt.ItemDataRole.DisplayRole:
+            return message.content
+        return None
+
+    # ---- 查询 ----
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def message_at(self, row: int) -> Optional[ChatMessage]:
+        return self.store.message_at(row)
+
+    def find(self, message_id: Any) -> Optional[ChatMessage]:
+        """按消息ID查找记录（O(1)）"""
+        return self.store.find(message_id)
+
+    def find_temp(self, temp_id: Optional[str]) -> Optional[ChatMessage]:
+        """按客户端临时ID查找记录（O(1)）"""
+        return self.store.find_temp(temp_id)
+
+    def find_pending(self, kind: str, content: Optional[str] = None) -> Optional[ChatMessage]:
+        return self.store.find_pending(kind, content)
+
+    def last_pending(self) -> Optional[ChatMessage]:
+        return self.store.last_pending()
+
+    def replies_to(self, message_id: Any) -> List[ChatMessage]:
+        return self.store.replies_to(message_id)
+
+    def index_of(self, message: ChatMessage) -> QModelIndex:
+        if self.store.contains(message):
+            return self.index(message.row)
+        return QModelIndex()
+
+    # ---- 修改 ----
+
+    @property
+    def batching(self) -> bool:
+        return self._batch_depth > 0
+
+    @contextmanager
+    def batch_insert(self):
+        """批量追加：期间的 append / extend 立即写入 store（查找、绑定ID照常可用），
+        结束时只发出一次 rowsInserted，视图只做一次布局（适合批量推送与历史同步）"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._flush_rows()
+
+    def _flush_rows(self) -> None:
+        """通知视图尚未通知的追加行（store 中行号 >= _rows 的记录）"""
+        count = len(self.store)
+        if count > self._rows:
+            self.beginInsertRows(QModelIndex(), self._rows, count - 1)
+            self._rows = count
+            self.endInsertRows()
+
+    def append(self, message: ChatMessage) -> ChatMessage:
+        self.extend([message])
+        return message
+
+    def extend(self, messages: Iterable[ChatMessage]) -> None:
+        """批量追加（一次 rowsInserted，适合加载历史记录）"""
+        messages = list(messages)
+        if not messages:
+            return
+        self.store.extend(messages)
+        if not self._batch_depth:
+            self._flush_rows()
+
+    def insert(self, row: int, message: ChatMessage) -> ChatMessage:
+        self._flush_rows()
+        row = max(0, min(row, len(self.store)))
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.store.insert(row, message)
+        self._rows += 1
+        self.endInsertRows()
+        return message
+
+    def remove(self, message: ChatMessage) -> None:
+        if not self.store.contains(message):
+            return
+        self._flush_rows()
+        self.beginRemoveRows(QModelIndex(), message.row, message.row)
+        self.store.remove(message)
+        self._rows -= 1
+        self.endRemoveRows()
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self.store.clear()
+        self._rows = 0
+        self.endResetModel()
+
+    def set_message_id(self, message: ChatMessage, message_id: Any) -> None:
+        """为乐观展示的消息绑定服务端分配的消息ID（可能同时应用早到的状态回执）"""
+        self.store.set_message_id(message, message_id)
+        self.refresh(message)
+
+    def recall(self, message: ChatMessage, notice: str) -> None:
+        """把记录改为撤回提示"""
+        self.store.recall(message, notice)
+        self.refresh(message)
+
+    def edit(self, message: ChatMessage, content: str, html: Optional[str] = None, edited_at: Optional[str] = None) -> None:
+        """替换记录的正文（消息被编辑）"""
+        self.store.edit(message, content, html, edited_at)
+        self.refresh(message)
+
+    def set_status(self, message_id: Any, status: str) -> Optional[ChatMessage]:
+        """更新消息的送达 / 已读状态并重绘该行（状态与时间同一行，行高不变）"""
+        message = self.store.update_status(message_id, status)
+        if message is not None:
+            self.refresh(message)
+        return message
+
+    def refresh(self, message: ChatMessage, relayout: bool = False) -> None:
+        """记录字段变化后通知视图重绘；relayout 为 True 时同时清除缓存的行高"""
+        if relayout:
+            message.invalidate()
+        index = self.index_of(message)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+
+def _font(pixel_size: int, weight: QFont.Weight = QFont.Weight.Normal) -> QFont:
+    font = QFont()
+    font.setFamilies(_FONT_FAMILIES)
+    font.setPixelSize(pixel_size)
+    font.setWeight(weight)
+    return font
+
+
+def _layout_plain_text(
+    text: str,
+    font: QFont,
+    max_width: int,
+    alignment: Qt.AlignmentFlag = Qt.AlignmentFlag.AlignLeft,
+) -> Tuple[QTextLayout, int, int]:
+    """按最大宽度排版纯文本（与 QLabel 自动换行一致：优先在词边界换行），返回 (排版, 宽, 高)"""
+    # QTextLayout 不处理 "\n"，换行需转为 Unicode 行分隔符
+    layout = QTextLayout(text.replace("\r\n", "\n").replace("\n", "\u2028"), font)
+    option = QTextOption(alignment)
+    option.setWrapMode(QTextOption.WrapMode.WrapAtWordBoundaryOrAnywhere)
+    layout.setTextOption(option)
+    layout.setCacheEnabled(True)
+    width = 0.0
+    height = 0.0
+    layout.beginLayout()
+    while True:
+        line = layout.createLine()
+        if not line.isValid():
+            break
+        line.setLineWidth(max_width)
+        line.setPosition(QPointF(0, height))
+        height += line.height()
+        width = max(width, line.naturalTextWidth())
+    layout.endLayout()
+    return layout, min(math.ceil(width), max_width), math.ceil(height)
+
+
+def _layout_rich_text(html: str, font: QFont, max_width: int) -> Tuple[QTextDocument, int, int]:
+    """按最大宽度排版富文本，返回 (文档, 宽, 高)"""
+    document = QTextDocument()
+    document.setDocumentMargin(0)
+    document.setDefaultFont(font)
+    document.setHtml(html)
+    document.setTextWidth(max_width)
+    width = min(math.ceil(document.idealWidth()), max_width)
+    document.setTextWidth(width)
+    return document, width, math.ceil(document.size().height())
+
+
+class ChatBubbleDelegate(QStyledItemDelegate):
+    """绘制聊天记录：时间、头像、气泡 / 图片 / 文件卡片、引用块、链接预览、撤回提示"""
+
+    def __init__(self, view: QListView):
+        super().__init__(view)
+        self._view = view
+        self._text_font = _font(13)
+        self._time_font = _font(11)
+        self._small_font = _font(12)
+        self._header_font = _font(11, QFont.Weight.DemiBold)
+        self._file_name_font = _font(14, QFont.Weight.DemiBold)
+        self._file_ext_font = _font(12, QFont.Weight.Bold)
+        self._emoji_font = _font(14)
+        self._metrics: Dict[int, QFontMetrics] = {}
+        # id(记录), 用途 -> (排版参数, 排版结果)
+        self._layouts: "OrderedDict[Tuple[int, str], Tuple[Tuple, Any]]" = OrderedDict()
+
+    # ---- 尺寸 ----
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        message = index.data(ChatTranscriptModel.MessageRole)
+        if message is None:
+            return QSize(0, 0)
+        return self.message_size(message, self._view.viewport().width())
+
+    def message_size(self, message: ChatMessage, width: int) -> QSize:
+        """返回记录在给定行宽下的尺寸（按文本可用宽度缓存在记录上）"""
+        layout_width = self._layout_width(message, width)
+        if message._size is not None and message._layout_width == layout_width:
+            return QSize(width, message._size.height())
+        height = self._measure_height(message, width)
+        message._size = QSize(width, height)
+        message._layout_width = layout_width
+        return QSize(width, height)
+
+    def _layout_width(self, message: ChatMessage, width: int) -> int:
+        """影响行高的宽度参数：文本气泡为文本最大宽度，卡片类为卡片最大宽度"""
+        if message.kind == KIND_WIDGET:
+            return 0
+        if message.kind == KIND_TEXT and not message.is_recalled:
+            return self._text_max_width(message, width)
+        return min(_CARD_MAX_WIDTH, max(width - 2 * _ROW_PADDING_H - _CONTENT_OFFSET, 1))
+
+    def _measure_height(self, message: ChatMessage, width: int) -> int:
+        if message.kind == KIND_WIDGET:
+            return message.widget.sizeHint().height() if message.widget is not None else 0
+        if message.kind == KIND_SEPARATOR:
+            return _SEPARATOR_HEIGHT
+        if message.kind == KIND_NOTICE or message.is_recalled:
+            return _NOTICE_HEIGHT
+        height = 2 * _ROW_PADDING_V
+        if message.meta_text():
+            height += _TIME_HEIGHT + _TIME_SPACING
+        height += max(_AVATAR_SIZE, self._content_size(message, width).height())
+        if message.reply_text is not None:
+            height += _REPLY_SPACING + self._reply_size(message, width).height()
+        if message.link_url:
+            height += _LINK_SPACING + self._link_size(message, width).height()
+        return height
+
+    def _available_width(self, width: int) -> int:
+        return max(width - 2 * _ROW_PADDING_H - _CONTENT_OFFSET, 1)
+
+    def _text_max_width(self, message: ChatMessage, width: int) -> int:
+        max_width = _MATCHING_MAX_WIDTH if message.style == STYLE_MATCHING else _BUBBLE_MAX_WIDTH
+        return max(min(max_width, self._available_width(width)) - 2 * _BUBBLE_PADDING_H, 1)
+
+    def _content_size(self, message: ChatMessage, width: int) -> QSize:
+        if message.kind == KIND_IMAGE:
+            return message.pixmap.size() if message.pixmap is not None else _IMAGE_PLACEHOLDER_SIZE
+        if message.kind == KIND_FILE:
+            return self._file_card_size(message)
+        _, text_width, text_height = self._bubble_text(message, width)
+        return QSize(text_width + 2 * _BUBBLE_PADDING_H, text_height + 2 * _BUBBLE_PADDING_V)
+
+    def _bubble_text(self, message: ChatMessage, width: int):
+        max_width = self._text_max_width(message, width)
+        text = message.display_text()
+        rich = message.rich and message.visible_chars is None
+        alignment = Qt.AlignmentFlag.AlignRight if message.from_self else Qt.AlignmentFlag.AlignLeft
+        key = (text, max_width, rich)
+        return self._cached_layout(message, "bubble", key, lambda: (
+            _layout_rich_text(text, self._text_font, max_width) if rich
+            else _layout_plain_text(text, self._text_font, max_width, alignment)
+        ))
+
+    def _reply_size(self, message: ChatMessage, width: int) -> QSize:
+        card_width = min(_CARD_MAX_WIDTH, self._available_width(width))
+        inner = 2 * _REPLY_PADDING_H + _REPLY_BAR_WIDTH + 8
+        if message.reply_thumbnail is not None:
+            sender = self._elided(self._small_font, f"{message.reply_sender}：", _REPLY_SENDER_MAX_WIDTH)
+            content_width = self._fm(self._small_font).horizontalAdvance(sender) + 8 + _REPLY_THUMBNAIL
+            content_height = _REPLY_THUMBNAIL
+        else:
+            _, content_width, content_height = self._reply_text(message, card_width - inner)
+            content_height = max(content_height, 26)
+        return QSize(
+            max(min(content_width + inner, card_width), min(_REPLY_MIN_WIDTH, card_width)),
+            content_height + 2 * _REPLY_PADDING_V,
+        )
+
+    def _reply_text(self, message: ChatMessage, max_width: int):
+        text = f"{message.reply_sender}: {message.reply_text}"
+        return self._cached_layout(message, "reply", (text, max_width), lambda: (
+            _layout_plain_text(text, self._small_font, max(max_width, 1))
+        ))
+
+    def _link_size(self, message: ChatMessage, width: int) -> QSize:
+        card_width = min(_CARD_MAX_WIDTH, self._available_width(width))
+        inner_width = max(card_width - 2 * _LINK_PADDING_H, 1)
+        header = self._elided(self._header_font, self._link_header(message), inner_width - 20)
+        header_width = 20 + self._fm(self._header_font).horizontalAdvance(header)
+        _, text_width, text_height = self._link_text(message, inner_width)
+        return QSize(
+            min(max(header_width, text_width) + 2 * _LINK_PADDING_H, card_width),
+            max(18, self._fm(self._header_font).height()) + 6 + text_height + 4 + 2 * _LINK_PADDING_V,
+        )
+
+    @staticmethod
+    def _link_header(message: ChatMessage) -> str:
+        return message.link_title or "链接预览"
+
+    def _link_text(self, message: ChatMessage, max_width: int):
+        if message.link_text:
+            text = message.link_text
+        else:
+            parsed = urlparse(message.link_url)
+            host = parsed.netloc or parsed.path
+            text = host if len(host) <= 32 else host[:29] + "..."
+        return self._cached_layout(message, "link", (text, max_width), lambda: (
+            _layout_plain_text(text, self._small_font, max_width)
+        ))
+
+    def _file_card_size(self, message: ChatMessage) -> QSize:
+        name = self._elided(self._file_name_font, message.file_name or "", _FILE_NAME_MAX_WIDTH)
+        text_width = max(
+            self._fm(self._file_name_font).horizontalAdvance(name),
+            self._fm(self._small_font).horizontalAdvance(message.file_size or ""),
+            120,
+        )
+        width = min(max(text_width + 20 + 8 + _FILE_ICON_SIZE.width(), _FILE_MIN_WIDTH), _FILE_MAX_WIDTH)
+        text_height = self._fm(self._file_name_font).height() + 4 + self._fm(self._small_font).height()
+        return QSize(width, max(text_height, _FILE_ICON_SIZE.height()) + 16)
+
+    # ---- 命中测试 ----
+
+    def link_rect(self, message: ChatMessage, rect: QRect) -> QRect:
+        """链接预览卡片在视口中的位置（没有卡片时返回空矩形）"""
+        if not message.link_url or message.is_recalled or message.kind not in (KIND_TEXT, KIND_IMAGE, KIND_FILE):
+            return QRect()
+        width = rect.width()
+        size = self._link_size(message, width)
+        y = rect.bottom() + 1 - _ROW_PADDING_V - size.height()
+        return QRect(self._aligned_x(message, rect, size.width()), y, size.width(), size.height())
+
+    def _aligned_x(self, message: ChatMessage, rect: QRect, item_width: int) -> int:
+        """气泡 / 引用块 / 链接卡片与头像内侧对齐"""
+        if message.from_self:
+            return rect.right() + 1 - _ROW_PADDING_H - _CONTENT_OFFSET - item_width
+        return rect.left() + _ROW_PADDING_H + _CONTENT_OFFSET
+
+    # ---- 绘制 ----
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex) -> None:
+        message = index.data(ChatTranscriptModel.MessageRole)
+        if message is None or message.kind == KIND_WIDGET:
+            return
+        rect = option.rect
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        try:
+            if message.kind == KIND_SEPARATOR:
+                self._paint_separator(painter, rect, message.content)
+            elif message.kind == KIND_NOTICE or message.is_recalled:
+                self._paint_notice(painter, rect, message.content)
+            else:
+                self._paint_message(painter, rect, message)
+        finally:
+            painter.restore()
+
+    def _paint_notice(self, painter: QPainter, rect: QRect, text: str) -> None:
+        painter.setFont(self._time_font)
+        painter.setPen(QColor("#9ca3af"))
+        painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, text)
+
+    def _paint_separator(self, painter: QPainter, rect: QRect, text: str) -> None:
+        painter.setFont(self._time_font)
+        text_width = self._fm(self._time_font).horizontalAdvance(text) + 16
+        center_y = rect.center().y()
+        left = rect.left() + _ROW_PADDING_H
+        right = rect.right() + 1 - _ROW_PADDING_H
+        text_left = rect.left() + (rect.width() - text_width) // 2
+        painter.fillRect(QRect(left, center_y, max(text_left - 8 - left, 0), 1), QColor("#d1d5db"))
+        line_start = text_left + text_width + 8
+        painter.fillRect(QRect(line_start, center_y, max(right - line_start, 0), 1), QColor("#d1d5db"))
+        painter.setPen(QColor("#9ca3af"))
+        painter.drawText(QRect(text_left, rect.top(), text_width, rect.height()), Qt.AlignmentFlag.AlignCenter, text)
+
+    def _paint_message(self, painter: QPainter, rect: QRect, message: ChatMessage) -> None:
+        width = rect.width()
+        y = rect.top() + _ROW_PADDING_V
+        meta_text = message.meta_text()
+        if meta_text:
+            # 自己的消息右对齐显示在头像上方，对方的消息左对齐到气泡
+            left = rect.left() + _ROW_PADDING_H + (0 if message.from_self else _CONTENT_OFFSET)
+            align = Qt.AlignmentFlag.AlignRight if message.from_self else Qt.AlignmentFlag.AlignLeft
+            painter.setFont(self._time_font)
+            painter.setPen(QColor("#9ca3af"))
+            painter.drawText(
+                QRect(left, y, rect.right() + 1 - _ROW_PADDING_H - left, _TIME_HEIGHT),
+                align | Qt.AlignmentFlag.AlignVCenter,
+                meta_text,
+            )
+            y += _TIME_HEIGHT + _TIME_SPACING
+
+        content_size = self._content_size(message, width)
+        row_height = max(_AVATAR_SIZE, content_size.height())
+        if message.from_self:
+            avatar_x = rect.right() + 1 - _ROW_PADDING_H - _AVATAR_SIZE
+        else:
+            avatar_x = rect.left() + _ROW_PADDING_H
+        if message.avatar is not None and not message.avatar.isNull():
+            painter.drawPixmap(
+                QRect(avatar_x, y + (row_height - _AVATAR_SIZE) // 2, _AVATAR_SIZE, _AVATAR_SIZE), message.avatar
+            )
+
+        content_rect = QRect(
+            self._aligned_x(message, rect, content_size.width()),
+            y + (row_height - content_size.height()) // 2,
+            content_size.width(),
+            content_size.height(),
+        )
+        if message.kind == KIND_IMAGE:
+            self._paint_image(painter, content_rect, message.pixmap)
+        elif message.kind == KIND_FILE:
+            self._paint_file_card(painter, content_rect, message)
+        else:
+            self._paint_bubble(painter, content_rect, message, width)
+        y += row_height
+
+        if message.reply_text is not None:
+            y += _REPLY_SPACING
+            size = self._reply_size(message, width)
+            self._paint_reply(painter, QRect(self._aligned_x(message, rect, size.width()), y, size.width(), size.height()), message)
+            y += size.height()
+
+        if message.link_url:
+            y += _LINK_SPACING
+            size = self._link_size(message, width)
+            self._paint_link(painter, QRect(self._aligned_x(message, rect, size.width()), y, size.width(), size.height()), message)
+
+    def _paint_bubble(self, painter: QPainter, rect: QRect, message: ChatMessage, width: int) -> None:
+        if message.style == STYLE_MATCHING:
+            background, text_color, border = _BUBBLE_COLORS[STYLE_MATCHING]
+        else:
+            background, text_color, border = _BUBBLE_COLORS["self" if message.from_self else "other"]
+        path = QPainterPath()
+        path.addRoundedRect(QRectF(rect).adjusted(0.5, 0.5, -0.5, -0.5), _BUBBLE_RADIUS, _BUBBLE_RADIUS)
+        painter.setPen(border if border is not None else Qt.PenStyle.NoPen)
+        painter.setBrush(background)
+        painter.drawPath(path)
+
+        layout, text_width, _ = self._bubble_text(message, width)
+        origin = QPointF(rect.left() + _BUBBLE_PADDING_H, rect.top() + _BUBBLE_PADDING_V)
+        if isinstance(layout, QTextDocument):
+            painter.save()
+            painter.translate(origin)
+            context = QAbstractTextDocumentLayout.PaintContext()
+            context.palette.setColor(QPalette.ColorRole.Text, text_color)
+            layout.documentLayout().draw(painter, context)
+            painter.restore()
+        else:
+            painter.setPen(text_color)
+            if message.from_self:
+                # 右对齐的排版按最大宽度定位各行，这里整体左移到气泡内
+                origin.setX(origin.x() - (self._text_max_width(message, width) - text_width))
+            layout.draw(painter, origin)
+
+    def _paint_image(self, painter: QPainter, rect: QRect, pixmap: Optional[QPixmap]) -> None:
+        path = QPainterPath()
+        path.addRoundedRect(QRectF(rect), _IMAGE_RADIUS, _IMAGE_RADIUS)
+        if pixmap is None:
+            # 后台解码尚未完成
+            painter.fillPath(path, QColor("#f1f5f9"))
+            painter.setFont(_font(12))
+            painter.setPen(QColor("#94a3b8"))
+            painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, "图片加载中…")
+            return
+        if pixmap.isNull():
+            return
+        painter.save()
+        painter.setClipPath(path)
+        painter.drawPixmap(rect, pixmap)
+        painter.restore()
+
+    def _paint_file_card(self, painter: QPainter, rect: QRect, message: ChatMessage) -> None:
+        painter.setPen(QColor("#e5e7eb"))
+        painter.setBrush(QColor("#ffffff"))
+        painter.drawRoundedRect(QRectF(rect).adjusted(0.5, 0.5, -0.5, -0.5), 14, 14)
+
+        icon = QRect(
+            rect.right() + 1 - 10 - _FILE_ICON_SIZE.width(),
+            rect.top() + (rect.height() - _FILE_ICON_SIZE.height()) // 2,
+            _FILE_ICON_SIZE.width(),
+            _FILE_ICON_SIZE.height(),
+        )
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QColor("#2563eb"))
+        painter.drawRoundedRect(QRectF(icon), 8, 8)
+        name = message.file_name or ""
+        ext = (name.rsplit(".", 1)[1] if "." in name else "").upper()[:3] or "FIL"
+        painter.setFont(self._file_ext_font)
+        painter.setPen(QColor("#ffffff"))
+        painter.drawText(icon, Qt.AlignmentFlag.AlignCenter, ext)
+
+        text_left = rect.left() + 10
+        text_width = max(icon.left() - 8 - text_left, 1)
+        name_height = self._fm(self._file_name_font).height()
+        size_height = self._fm(self._small_font).height()
+        top = rect.top() + (rect.height() - name_height - 4 - size_height) // 2
+        painter.setFont(self._file_name_font)
+        painter.setPen(QColor("#111827"))
+        painter.drawText(
+            QRect(text_left, top, text_width, name_height),
+            Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+            self._elided(self._file_name_font, name, text_width),
+        )
+        painter.setFont(self._small_font)
+        painter.setPen(QColor("#6b7280"))
+        painter.drawText(
+            QRect(text_left, top + name_height + 4, text_width, size_height),
+            Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+            message.file_size or "",
+        )
+
+    def _paint_reply(self, painter: QPainter, rect: QRect, message: ChatMessage) -> None:
+        painter.setPen(QColor("#e5e7eb"))
+        painter.setBrush(QColor("#f3f4f6"))
+        painter.drawRoundedRect(QRectF(rect).adjusted(0.5, 0.5, -0.5, -0.5), 10, 10)
+
+        inner = rect.adjusted(_REPLY_PADDING_H, _REPLY_PADDING_V, -_REPLY_PADDING_H, -_REPLY_PADDING_V)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QColor("#60a5fa"))
+        painter.drawRoundedRect(QRectF(inner.left(), inner.top(), _REPLY_BAR_WIDTH, inner.height()), 1.5, 1.5)
+
+        left = inner.left() + _REPLY_BAR_WIDTH + 8
+        painter.setPen(QColor("#111827"))
+        if message.reply_thumbnail is not None:
+            sender = self._elided(self._small_font, f"{message.reply_sender}：", _REPLY_SENDER_MAX_WIDTH)
+            sender_width = self._fm(self._small_font).horizontalAdvance(sender)
+            painter.setFont(self._small_font)
+            painter.drawText(
+                QRect(left, inner.top(), sender_width, inner.height()),
+                Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+                sender,
+            )
+            thumbnail = message.reply_thumbnail
+            box = QRect(left + sender_width + 8, inner.top() + (inner.height() - _REPLY_THUMBNAIL) // 2,
+                        _REPLY_THUMBNAIL, _REPLY_THUMBNAIL)
+            target = QRect(0, 0, thumbnail.width(), thumbnail.height())
+            target.moveCenter(box.center())
+            painter.drawPixmap(target, thumbnail)
+            painter.setPen(QColor("#d1d5db"))
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            painter.drawRoundedRect(QRectF(box).adjusted(0.5, 0.5, -0.5, -0.5), 6, 6)
+        else:
+            layout, _, text_height = self._reply_text(message, rect.width() - 2 * _REPLY_PADDING_H - _REPLY_BAR_WIDTH - 8)
+            layout.draw(painter, QPointF(left, inner.top() + (inner.height() - text_height) / 2))
+
+    def _paint_link(self, painter: QPainter, rect: QRect, message: ChatMessage) -> None:
+        gradient = QLinearGradient(QPointF(rect.topLeft()), QPointF(rect.bottomLeft()))
+        gradient.setColorAt(0, QColor("#ffffff"))
+        gradient.setColorAt(1, QColor("#f8fafc"))
+        painter.setPen(QColor("#e2e8f0"))
+        painter.setBrush(gradient)
+        painter.drawRoundedRect(QRectF(rect).adjusted(0.5, 0.5, -0.5, -0.5), 12, 12)
+
+        inner = rect.adjusted(_LINK_PADDING_H, _LINK_PADDING_V, -_LINK_PADDING_H, -_LINK_PADDING_V)
+        header_height = max(18, self._fm(self._header_font).height())
+        painter.setFont(self._emoji_font)
+        painter.drawText(QRect(inner.left(), inner.top(), 20, header_height), Qt.AlignmentFlag.AlignVCenter, "🔗")
+        painter.setFont(self._header_font)
+        painter.setPen(QColor("#64748b"))
+        painter.drawText(
+            QRect(inner.left() + 20, inner.top(), inner.width() - 20, header_height),
+            Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+            self._elided(self._header_font, self._link_header(message), inner.width() - 20),
+        )
+        layout, _, _ = self._link_text(message, max(inner.width(), 1))
+        painter.setPen(QColor("#2563eb"))
+        layout.draw(painter, QPointF(inner.left(), inner.top() + header_height + 6 + 2))
+
+    # ---- 工具 ----
+
+    def _fm(self, font: QFont) -> QFontMetrics:
+        metrics = self._metrics.get(id(font))
+        if metrics is None:
+            metrics = self._metrics[id(font)] = QFontMetrics(font)
+        return metrics
+
+    def _elided(self, font: QFont, text: str, width: int) -> str:
+        return self._fm(font).elidedText(text, Qt.TextElideMode.ElideRight, max(width, 1))
+
+    def _cached_layout(self, message: ChatMessage, purpose: str, params: Tuple, build):
+        cache_key = (id(message), purpose)
+        cached = self._layouts.get(cache_key)
+        if cached is not None and cached[0] == params:
+            self._layouts.move_to_end(cache_key)
+            return cached[1]
+        result = build()
+        self._layouts[cache_key] = (params, result)
+        self._layouts.move_to_end(cache_key)
+        while len(self._layouts) > _TEXT_LAYOUT_CACHE_SIZE:
+            self._layouts.popitem(last=False)
+        return result
+
+    def clear_cache(self) -> None:
+        self._layouts.clear()
+
+
+class ChatTranscriptView(QListView):
+    """聊天记录视图：逐像素滚动、无选中，停留在底部时新消息自动跟随"""
+
+    # (ChatMessage, 全局坐标)
+    context_menu_requested = pyqtSignal(object, QPoint)
+
+    def __init__(self, model: ChatTranscriptModel, parent=None):
+        super().__init__(parent)
+        self._delegate = ChatBubbleDelegate(self)
+        self.setItemDelegate(self._delegate)
+        self.setModel(model)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setFocusPolicy(Qt.FocusPolicy.NoFocus)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setBatchSize(200)
+        self.setUniformItemSizes(False)
+        self.setMouseTracking(True)
+        self.verticalScrollBar().setSingleStep(20)
+
+        self._follow_bottom = True
+        self.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+        self.verticalScrollBar().rangeChanged.connect(self._on_range_changed)
+        model.rowsInserted.connect(self._on_rows_inserted)
+        model.dataChanged.connect(self._on_data_changed)
+        model.modelReset.connect(self._delegate.clear_cache)
+
+    @property
+    def delegate(self) -> ChatBubbleDelegate:
+        return self._delegate
+
+    def message_at(self, pos: QPoint) -> Optional[ChatMessage]:
+        index = self.indexAt(pos)
+        return index.data(ChatTranscriptModel.MessageRole) if index.isValid() else None
+
+    def scroll_to_bottom(self) -> None:
+        """滚动到底部，并在之后的内容增长（新消息、打字机效果）中保持在底部"""
+        self._follow_bottom = True
+        bar = self.verticalScrollBar()
+        bar.setValue(bar.maximum())
+
+    # ---- 模型变化 ----
+
+    def _on_rows_inserted(self, parent: QModelIndex, first: int, last: int) -> None:
+        model = self.model()
+        for row in range(first, last + 1):
+            message = model.message_at(row)
+            if message is not None and message.kind == KIND_WIDGET and message.widget is not None:
+                self.setIndexWidget(model.index(row), message.widget)
+
+    def _on_data_changed(self, top_left: QModelIndex, bottom_right: QModelIndex, roles=()) -> None:
+        # 只有行高确实变化（如打字机效果换行、撤回）时才重新布局，否则只重绘
+        width = self.viewport().width()
+        model = self.model()
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            message = model.message_at(row)
+            if message is None:
+                continue
+            old_size = message._size
+            if old_size is None or self._delegate.message_size(message, width).height() != old_size.height():
+                self.scheduleDelayedItemsLayout()
+                return
+
+    def _on_scrolled(self, value: int) -> None:
+        self._follow_bottom = value >= self.verticalScrollBar().maximum() - 4
+
+    def _on_range_changed(self, minimum: int, maximum: int) -> None:
+        if self._follow_bottom:
+            self.verticalScrollBar().setValue(maximum)
+
+    # ---- 鼠标 ----
+
+    def contextMenuEvent(self, event) -> None:
+        message = self.message_at(event.pos())
+        if message is not None and message.kind in (KIND_TEXT, KIND_IMAGE, KIND_FILE) and not message.is_recalled:
+            self.context_menu_requested.emit(message, event.globalPos())
+            event.accept()
+            return
+        super().contextMenuEvent(event)
+
+    def _link_at(self, pos: QPoint) -> Optional[str]:
+        index = self.indexAt(pos)
+        if not index.isValid():
+            return None
+        message = index.data(ChatTranscriptModel.MessageRole)
+        if message is not None and self._delegate.link_rect(message, self.visualRect(index)).contains(pos):
+            return message.link_url
+        return None
+
+    def mouseMoveEvent(self, event) -> None:
+        link = self._link_at(event.position().toPoint())
+        self.viewport().setCursor(Qt.CursorShape.PointingHandCursor if link else Qt.CursorShape.ArrowCursor)
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event) -> None:
+        if event.button() == Qt.MouseButton.LeftButton:
+            link = self._link_at(event.position().toPoint())
+            if link:
+                QDesktopServices.openUrl(QUrl(link))
+                event.accept()
+                return
+        super().mouseReleaseEvent(event)
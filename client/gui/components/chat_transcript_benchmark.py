@@ -0,0 +1,280 @@
+"""
+聊天记录视图性能测试
+
+加载大量消息，测量加载耗时、内存占用、追加一条消息的耗时以及滚动时的单帧绘制耗时；
+可选与旧的“每条消息一组控件”（QScrollArea + ChatBubble）方式对比。
+
+用法：python client/gui/components/chat_transcript_benchmark.py [--messages 条数] [--frames 帧数] [--compare-widgets]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+# 与 main.py 一致：项目根目录与 client 目录都需要在 sys.path 中
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BASE_DIR = os.path.dirname(CLIENT_DIR)
+for path in (BASE_DIR, CLIENT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QColor, QPainter, QPainterPath, QPixmap
+from PyQt6.QtWidgets import QApplication, QHBoxLayout, QLabel, QScrollArea, QVBoxLayout, QWidget
+
+from gui.components.chat_transcript import (
+    KIND_IMAGE, KIND_TEXT, ChatMessage, ChatTranscriptModel, ChatTranscriptView
+)
+
+_SAMPLE_TEXTS = [
+    "你好，请问会员怎么续费？",
+    "您好！可以在“我的-会员中心”里直接续费，支持微信和支付宝～",
+    "好的，谢谢",
+    "变声器在游戏里没有声音，麦克风权限已经打开了，系统是 Windows 11，声卡是板载的 Realtek，"
+    "之前一直正常，昨天更新之后就不行了，请问要怎么处理？",
+    "请先在设置里把输入设备切换为虚拟麦克风，然后重启一下游戏试试。\n如果还不行，可以把日志发给我们。",
+    "**注意**：更新驱动后需要重新选择输出设备，详见 https://example.com/help/audio-device",
+]
+
+
+def _rss_bytes() -> Optional[int]:
+    """当前进程常驻内存（无法获取时返回 None）"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _avatar() -> QPixmap:
+    pm = QPixmap(32, 32)
+    pm.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(pm)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    path = QPainterPath()
+    path.addEllipse(0, 0, 32, 32)
+    painter.fillPath(path, QColor("#94a3b8"))
+    painter.end()
+    return pm
+
+
+def _image() -> QPixmap:
+    pm = QPixmap(160, 120)
+    pm.fill(QColor("#60a5fa"))
+    return pm
+
+
+def _message_specs(count: int) -> List[Dict]:
+    """生成测试消息：文本为主，每 20 条一张图片，每 7 条带引用"""
+    specs = []
+    for i in range(count):
+        from_self = i % 3 == 0
+        spec = {"id": i + 1, "from_self": from_self, "text": _SAMPLE_TEXTS[i % len(_SAMPLE_TEXTS)], "image": i % 20 == 19}
+        if i % 7 == 6:
+            spec["reply_to"] = i
+        specs.append(spec)
+    return specs
+
+
+def _measure(build: Callable[[], object]):
+    tracemalloc.start()
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = _rss_bytes()
+    rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    return result, elapsed, python_peak, rss_delta
+
+
+def _frame_times(scroll_area, frames: int) -> List[float]:
+    """在整个列表范围内均匀滚动，测量每次同步重绘视口的耗时（毫秒）"""
+    bar = scroll_area.verticalScrollBar()
+    times = []
+    for i in range(frames):
+        bar.setValue(bar.maximum() * i // max(frames - 1, 1))
+        start = time.perf_counter()
+        scroll_area.viewport().repaint()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def benchmark_transcript(app: QApplication, specs: List[Dict], frames: int) -> Dict:
+    avatar = _avatar()
+    image = _image()
+    model = ChatTranscriptModel()
+    view = ChatTranscriptView(model)
+    view.resize(720, 640)
+    view.show()
+    app.processEvents()
+
+    def build():
+        messages = []
+        for spec in specs:
+            message = ChatMessage(
+                KIND_IMAGE if spec["image"] else KIND_TEXT,
+                "[图片]" if spec["image"] else spec["text"],
+                from_self=spec["from_self"],
+                message_id=spec["id"],
+                time_text="2024-01-01 12:00:00" if spec["from_self"] else "",
+                avatar=avatar,
+                pixmap=image if spec["image"] else None,
+            )
+            if "reply_to" in spec:
+                message.reply_to_message_id = spec["reply_to"]
+                message.reply_sender = "用户"
+                message.reply_text = _SAMPLE_TEXTS[spec["reply_to"] % len(_SAMPLE_TEXTS)][:80]
+            messages.append(message)
+        model.extend(messages)
+        # 完成全部行的布局（计算行高）后再计时结束
+        view.executeDelayedItemsLayout()
+        view.scroll_to_bottom()
+        app.processEvents()
+        return view
+
+    _, elapsed, python_peak, rss_delta = _measure(build)
+
+    start = time.perf_counter()
+    model.append(ChatMessage(KIND_TEXT, "新消息", from_self=True, avatar=avatar))
+    view.executeDelayedItemsLayout()
+    view.scroll_to_bottom()
+    view.viewport().repaint()
+    append_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for spec in specs[:: max(len(specs) // 1000, 1)]:
+        model.find(spec["id"])
+    lookup_us = (time.perf_counter() - start) * 1e6 / len(specs[:: max(len(specs) // 1000, 1)])
+
+    result = {
+        "load_s": elapsed,
+        "python_peak": python_peak,
+        "rss_delta": rss_delta,
+        "append_ms": append_ms,
+        "lookup_us": lookup_us,
+        "frames": _frame_times(view, frames),
+    }
+    view.close()
+    return result
+
+
+def benchmark_widgets(app: QApplication, specs: List[Dict], frames: int) -> Dict:
+    """旧方式：每条消息一个 QWidget（头像 QLabel + ChatBubble / 图片 QLabel）放进 QScrollArea"""
+    from gui.components.chat_bubble import ChatBubble
+
+    avatar = _avatar()
+    image = _image()
+    scroll_area = QScrollArea()
+    scroll_area.setWidgetResizable(True)
+    scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+    container = QWidget()
+    layout = QVBoxLayout(container)
+    layout.setContentsMargins(10, 10, 10, 10)
+    layout.setSpacing(8)
+    layout.setAlignment(Qt.AlignmentFlag.AlignTop)
+    scroll_area.setWidget(container)
+    scroll_area.resize(720, 640)
+    scroll_area.show()
+    app.processEvents()
+
+    def build():
+        for spec in specs:
+            message_widget = QWidget()
+            v_layout = QVBoxLayout(message_widget)
+            v_layout.setContentsMargins(4, 0, 4, 0)
+            v_layout.setSpacing(2)
+            if spec["from_self"]:
+                v_layout.addWidget(QLabel("2024-01-01 12:00:00"), alignment=Qt.AlignmentFlag.AlignRight)
+            row = QHBoxLayout()
+            avatar_label = QLabel()
+            avatar_label.setFixedSize(32, 32)
+            avatar_label.setPixmap(avatar)
+            if spec["image"]:
+                content = QLabel()
+                content.setPixmap(image)
+            else:
+                content = ChatBubble(
+                    spec["text"],
+                    background=QColor("#dcf8c6" if spec["from_self"] else "#ffffff"),
+                    text_color=QColor("#111827"),
+                    align_right=spec["from_self"],
+                )
+            if spec["from_self"]:
+                row.addStretch()
+                row.addWidget(content)
+                row.addWidget(avatar_label)
+            else:
+                row.addWidget(avatar_label)
+                row.addWidget(content)
+                row.addStretch()
+            v_layout.addLayout(row)
+            if "reply_to" in spec:
+                v_layout.addWidget(QLabel("用户: " + _SAMPLE_TEXTS[spec["reply_to"] % len(_SAMPLE_TEXTS)][:80]))
+            layout.addWidget(message_widget)
+        app.processEvents()
+        bar = scroll_area.verticalScrollBar()
+        bar.setValue(bar.maximum())
+        return scroll_area
+
+    _, elapsed, python_peak, rss_delta = _measure(build)
+
+    start = time.perf_counter()
+    layout.addWidget(ChatBubble("新消息", background=QColor("#dcf8c6"), text_color=QColor("#111827")))
+    app.processEvents()
+    scroll_area.verticalScrollBar().setValue(scroll_area.verticalScrollBar().maximum())
+    scroll_area.viewport().repaint()
+    append_ms = (time.perf_counter() - start) * 1000
+
+    result = {
+        "load_s": elapsed,
+        "python_peak": python_peak,
+        "rss_delta": rss_delta,
+        "append_ms": append_ms,
+        "lookup_us": None,
+        "frames": _frame_times(scroll_area, frames),
+    }
+    scroll_area.close()
+    return result
+
+
+def _print_report(title: str, result: Dict) -> None:
+    frames = sorted(result["frames"])
+    p95 = frames[min(len(frames) - 1, int(len(frames) * 0.95))]
+    rss = f"{result['rss_delta'] / 1024 / 1024:.1f} MB" if result["rss_delta"] is not None else "不可用"
+    print(f"[{title}]")
+    print(f"  加载耗时: {result['load_s']:.2f} 秒")
+    print(f"  内存: 常驻内存增加 {rss}，Python 堆峰值 {result['python_peak'] / 1024 / 1024:.1f} MB")
+    print(f"  追加一条消息: {result['append_ms']:.1f} ms")
+    if result["lookup_us"] is not None:
+        print(f"  按消息ID查找: {result['lookup_us']:.2f} µs")
+    print(f"  单帧绘制: 平均 {statistics.mean(frames):.2f} ms，p95 {p95:.2f} ms，最大 {frames[-1]:.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="聊天记录视图性能测试")
+    parser.add_argument("--messages", type=int, default=10000, help="加载的消息条数")
+    parser.add_argument("--frames", type=int, default=200, help="测量绘制耗时的帧数")
+    parser.add_argument("--compare-widgets", action="store_true", help="同时测试旧的每条消息一组控件的方式")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    specs = _message_specs(args.messages)
+    print(f"消息数: {len(specs)}")
+    _print_report("模型 / 视图", benchmark_transcript(app, specs, args.frames))
+    if args.compare_widgets:
+        _print_report("每条消息一组控件", benchmark_widgets(app, specs, args.frames))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,51 @@
 """文件上传进度对话框组件"""
+import logging
+
 from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLabel, QProgressBar, QPushButton, QWidget
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
 from PyQt6.QtGui import QPainter, QColor, QBrush, QPen, QPainterPath
 
 
 class FileUploadThread(QThread):
-    """模拟文件上传的线程"""
-    progress_updated = pyqtSignal(int)  # 进度百分比 0-100
-    finished = pyqtSignal(bool, str)  # (成功, 文件名)
+    """分块续传上传文件的线程（见 client.api_client.upload_file）"""
+    progress_updated = pyqtSignal('qint64', 'qint64')  # (已上传字节数, 文件大小)
+    finished = pyqtSignal(bool, str)  # (成功, 成功时为文件地址，失败时为错误信息)
     
-    def __init__(self, file_path: str, file_size: int):
+    def __init__(self, file_path: str, file_size: int, user_id=None):
         super().__init__()
         self.file_path = file_path
         self.file_size = file_size
+        self.user_id = user_id
         self._canceled = False
+        # 上传成功后的服务端文件信息 {file_id, filename, size, sha256, mime_type, url}
+        self.file_info = None
     
     def cancel(self):
-        """取消上传"""
+        """取消上传（当前分块结束后停止；服务端保留已上传部分，再次发送同一文件时续传）"""
         self._canceled = True
     
     def run(self):
-        """模拟文件上传过程"""
-        import time
-        
-        # 模拟读取和上传文件（分块）
-        chunk_size = max(1024 * 1024, self.file_size // 100)  # 至少1MB或分为100块
-        chunks = (self.file_size + chunk_size - 1) // chunk_size
-        
+        """按块上传文件，每块确认后报告真实的已上传字节数"""
+        from client.api_client import UploadCanceled, get_valid_token, upload_file
+
         try:
-            with open(self.file_path, 'rb') as f:
-                uploaded = 0
-                for i in range(chunks):
-                    if self._canceled:
-                        self.finished.emit(False, "上传已取消")
-                        return
-                    
-                    # 读取一块数据（模拟上传）
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                    
-                    uploaded += len(chunk)
-                    progress = min(100, int((uploaded / self.file_size) * 100))
-                    self.progress_updated.emit(progress)
-                    
-                    # 模拟网络延迟（小文件延迟小，大文件延迟稍大）
-                    delay = 0.01 if self.file_size < 1024 * 1024 else 0.02
-                    time.sleep(delay)
-            
-            if not self._canceled:
-                self.finished.emit(True, "")
+            token = get_valid_token()
+            if not token:
+                self.finished.emit(False, "登录已过期，请重新登录")
+                return
+            self.file_info = upload_file(
+                self.file_path,
+                self.user_id,
+                token,
+                on_progress=lambda uploaded, total: self.progress_updated.emit(uploaded, total),
+                should_cancel=lambda: self._canceled,
+            )
+            self.finished.emit(True, self.file_info["url"])
+        except UploadCanceled:
+            self.finished.emit(False, "上传已取消")
         except Exception as e:
-            if not self._canceled:
-                self.finished.emit(False, str(e))
+            logging.error(f"文件上传失败: {e}")
+            self.finished.emit(False, "上传已取消" if self._canceled else str(e))
 
 
 class FileUploadProgressDialog(QDialog):
@@ -212,17 +205,18 @@ class FileUploadProgressDialog(QDialog):
         else:
             return f"{size / (1024 * 1024):.1f} MB"
     
-    def start_upload(self, file_path: str):
+    def start_upload(self, file_path: str, user_id=None):
         """开始上传文件"""
-        self.upload_thread = FileUploadThread(file_path, self.file_size)
+        self.upload_thread = FileUploadThread(file_path, self.file_size, user_id)
         self.upload_thread.progress_updated.connect(self.update_progress)
         self.upload_thread.finished.connect(self.on_upload_finished)
         self.upload_thread.start()
     
-    def update_progress(self, value: int):
-        """更新进度"""
+    def update_progress(self, uploaded: int, total: int):
+        """更新进度（服务端已确认的字节数）"""
+        value = min(100, int(uploaded * 100 / total)) if total > 0 else 0
         self.progress_bar.setValue(value)
-        self.progress_label.setText(f"{value}%")
+        self.progress_label.setText(f"{value}%  （{self._format_size(uploaded)} / {self._format_size(total)}）")
     
     def cancel_upload(self):
         """取消上传"""
@@ -0,0 +1,337 @@
+"""
+客户端消息存储
+
+与 Qt 无关的聊天记录容器，按显示顺序保存 ChatMessage，并增量维护以下索引：
+- 服务端消息ID -> 记录、客户端临时ID -> 记录，查找均为 O(1)
+- 被引用消息ID -> 引用它的记录，撤回 / 编辑被引用消息时据此更新引用块
+- 尚未拿到服务端ID的自己的消息（乐观展示），用于服务端回推时对账
+
+追加、插入、删除、绑定ID、撤回、编辑、状态更新与清空都经由这里，索引始终与列表一致。
+ChatTranscriptModel 在此之上负责发出 Qt 模型信号。
+"""
+
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from PyQt6.QtGui import QPixmap
+
+# 记录类型
+KIND_TEXT = "text"
+KIND_IMAGE = "image"
+KIND_FILE = "file"
+KIND_NOTICE = "notice"        # 居中的灰色提示（如撤回提示）
+KIND_SEPARATOR = "separator"  # 两侧带线的居中提示（如“已连接客服”）
+KIND_WIDGET = "widget"        # 由真实控件占据的一行
+
+# 文本气泡样式
+STYLE_MATCHING = "matching"
+
+# 消息状态（与服务端 MessageStatus 一致），只允许按此顺序前进
+STATUS_SENT = "sent"
+STATUS_DELIVERED = "delivered"
+STATUS_READ = "read"
+_STATUS_ORDER = {STATUS_SENT: 1, STATUS_DELIVERED: 2, STATUS_READ: 3}
+_STATUS_LABELS = {STATUS_DELIVERED: "已送达", STATUS_READ: "已读"}
+# 暂存的早到状态回执条数上限
+_EARLY_STATUS_LIMIT = 256
+
+
+def normalize_message_id(message_id: Any) -> Any:
+    """消息ID统一转为整数（若可），避免 "12" 与 12 被当作两条消息"""
+    if message_id is None or isinstance(message_id, int):
+        return message_id
+    try:
+        return int(message_id)
+    except (ValueError, TypeError):
+        return message_id
+
+
+class ChatMessage:
+    """一条聊天记录，只保存绘制与交互所需的字段"""
+
+    __slots__ = (
+        "kind", "content", "from_self", "message_id", "temp_id", "html", "rich", "style",
+        "time_text", "created_time", "from_user_id", "from_username", "avatar",
+        "visible_chars", "reply_to_message_id", "reply_sender", "reply_text", "reply_thumbnail",
+        "pixmap", "raw_image", "file_name", "file_size",
+        "link_url", "link_title", "link_text",
+        "is_recalled", "status", "edited_at", "widget", "row", "_size", "_layout_width",
+    )
+
+    def __init__(
+        self,
+        kind: str,
+        content: str = "",
+        from_self: bool = False,
+        message_id: Any = None,
+        html: Optional[str] = None,
+        rich: bool = False,
+        style: Optional[str] = None,
+        time_text: str = "",
+        created_time: Optional[str] = None,
+        from_user_id: Any = None,
+        from_username: Optional[str] = None,
+        avatar: Optional["QPixmap"] = None,
+        reply_to_message_id: Any = None,
+        reply_sender: Optional[str] = None,
+        reply_text: Optional[str] = None,
+        reply_thumbnail: Optional["QPixmap"] = None,
+        pixmap: Optional["QPixmap"] = None,
+        raw_image: Optional[str] = None,
+        file_name: Optional[str] = None,
+        file_size: Optional[str] = None,
+        link_url: Optional[str] = None,
+        is_recalled: bool = False,
+        widget=None,
+        temp_id: Optional[str] = None,
+    ):
+        self.kind = kind
+        self.content = content or ""
+        self.from_self = from_self
+        self.message_id = normalize_message_id(message_id)
+        # 客户端临时ID：乐观展示的消息在拿到服务端ID之前以此标识
+        self.temp_id = temp_id
+        # 富文本（HTML）内容；为 None 时按纯文本显示 content
+        self.html = html if rich else None
+        self.rich = bool(rich and html)
+        self.style = style
+        self.time_text = time_text
+        self.created_time = created_time
+        self.from_user_id = from_user_id
+        self.from_username = from_username
+        self.avatar = avatar
+        # 打字机效果：只显示前 visible_chars 个字符（None 表示全部显示）
+        self.visible_chars: Optional[int] = None
+        self.reply_to_message_id = normalize_message_id(reply_to_message_id)
+        self.reply_sender = reply_sender
+        self.reply_text = reply_text
+        self.reply_thumbnail = reply_thumbnail
+        self.pixmap = pixmap
+        self.raw_image = raw_image
+        self.file_name = file_name
+        self.file_size = file_size
+        self.link_url = link_url
+        self.link_title: Optional[str] = None
+        self.link_text: Optional[str] = None
+        self.is_recalled = is_recalled
+        self.status: Optional[str] = None
+        self.edited_at: Optional[str] = None
+        self.widget = widget
+        self.row = -1
+        self._size = None
+        self._layout_width = -1
+
+    def display_text(self) -> str:
+        """气泡中当前应显示的文本（打字机效果进行中时为已显示的部分）"""
+        if self.visible_chars is not None:
+            return self.content[:self.visible_chars]
+        return self.html if self.rich else self.content
+
+    def meta_text(self) -> str:
+        """气泡上方的小字：时间、“已编辑”以及自己消息的送达 / 已读状态"""
+        parts = []
+        if self.edited_at is not None:
+            parts.append("已编辑")
+        if self.time_text:
+            parts.append(self.time_text)
+        if self.from_self and self.status in _STATUS_LABELS:
+            parts.append(_STATUS_LABELS[self.status])
+        return "  ".join(parts)
+
+    def invalidate(self) -> None:
+        """内容变化后清除缓存的行高"""
+        self._size = None
+        self._layout_width = -1
+
+
+class MessageStore:
+    """按显示顺序保存 ChatMessage 并维护各类索引（不依赖 Qt）"""
+
+    def __init__(self):
+        self._messages: List[ChatMessage] = []
+        self._by_id: Dict[Any, ChatMessage] = {}
+        self._by_temp_id: Dict[str, ChatMessage] = {}
+        self._replies: Dict[Any, List[ChatMessage]] = {}
+        # 自己发送、尚未拿到消息ID的记录，按发送顺序（通常只有寥寥几条）
+        self._pending: List[ChatMessage] = []
+        # 早于消息本身到达的状态回执：消息ID -> 状态
+        self._early_status: Dict[Any, str] = {}
+
+    # ---- 查询 ----
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[ChatMessage]:
+        return iter(self._messages)
+
+    def message_at(self, row: int) -> Optional[ChatMessage]:
+        if 0 <= row < len(self._messages):
+            return self._messages[row]
+        return None
+
+    def find(self, message_id: Any) -> Optional[ChatMessage]:
+        """按服务端消息ID查找记录"""
+        if message_id is None:
+            return None
+        return self._by_id.get(normalize_message_id(message_id))
+
+    def find_temp(self, temp_id: Optional[str]) -> Optional[ChatMessage]:
+        """按客户端临时ID查找记录（绑定服务端ID后仍可查到）"""
+        if temp_id is None:
+            return None
+        return self._by_temp_id.get(temp_id)
+
+    def find_pending(self, kind: str, content: Optional[str] = None) -> Optional[ChatMessage]:
+        """从最新的开始查找尚未绑定消息ID的自己的消息；content 不为 None 时要求文本一致"""
+        for message in reversed(self._pending):
+            if message.kind != kind or message.is_recalled:
+                continue
+            if content is None or message.content.strip() == content.strip():
+                return message
+        return None
+
+    def last_pending(self) -> Optional[ChatMessage]:
+        return self._pending[-1] if self._pending else None
+
+    def replies_to(self, message_id: Any) -> List[ChatMessage]:
+        """返回引用了指定消息的记录"""
+        return list(self._replies.get(normalize_message_id(message_id), ()))
+
+    def contains(self, message: ChatMessage) -> bool:
+        return 0 <= message.row < len(self._messages) and self._messages[message.row] is message
+
+    # ---- 修改 ----
+
+    def extend(self, messages: List[ChatMessage]) -> int:
+        """追加到末尾，返回第一条的行号"""
+        first = len(self._messages)
+        for offset, message in enumerate(messages):
+            message.row = first + offset
+            self._messages.append(message)
+            self._register(message)
+        return first
+
+    def insert(self, row: int, message: ChatMessage) -> int:
+        """插入到指定行，返回实际行号"""
+        row = max(0, min(row, len(self._messages)))
+        self._messages.insert(row, message)
+        self._renumber(row)
+        self._register(message)
+        return row
+
+    def remove(self, message: ChatMessage) -> int:
+        """删除记录，返回原行号（不在列表中时返回 -1）"""
+        if not self.contains(message):
+            return -1
+        row = message.row
+        del self._messages[row]
+        self._unregister(message)
+        message.row = -1
+        self._renumber(row)
+        return row
+
+    def clear(self) -> None:
+        for message in self._messages:
+            message.row = -1
+        self._messages = []
+        self._by_id.clear()
+        self._by_temp_id.clear()
+        self._replies.clear()
+        self._pending.clear()
+        self._early_status.clear()
+
+    def set_message_id(self, message: ChatMessage, message_id: Any) -> None:
+        """为乐观展示的消息绑定服务端分配的消息ID"""
+        registered = self.contains(message)
+        if registered:
+            self._unregister(message)
+        message.message_id = normalize_message_id(message_id)
+        if registered:
+            self._register(message)
+
+    def recall(self, message: ChatMessage, notice: str) -> None:
+        """撤回：只保留一行提示，清除正文、图片、引用块与链接预览，且不再参与乐观消息对账"""
+        message.is_recalled = True
+        message.content = notice
+        message.html = None
+        message.rich = False
+        message.visible_chars = None
+        message.time_text = ""
+        message.status = None
+        message.edited_at = None
+        message.pixmap = None
+        message.raw_image = None
+        message.reply_text = None
+        message.reply_thumbnail = None
+        message.link_url = None
+        if message in self._pending:
+            self._pending.remove(message)
+        message.invalidate()
+
+    def edit(self, message: ChatMessage, content: str, html: Optional[str] = None, edited_at: Optional[str] = None) -> None:
+        """编辑消息内容（html 为 None 时按纯文本显示）"""
+        message.content = content or ""
+        message.html = html
+        message.rich = html is not None
+        message.visible_chars = None
+        message.edited_at = edited_at or ""
+        message.invalidate()
+
+    def update_status(self, message_id: Any, status: str) -> Optional[ChatMessage]:
+        """更新送达 / 已读状态，有变化时返回记录。
+
+        状态只允许前进（已读后收到迟到的“已送达”会被忽略）；
+        回执可能早于服务端回推的消息到达，此时先暂存，等记录绑定到该ID时再应用。
+        """
+        if status not in _STATUS_ORDER:
+            return None
+        message_id = normalize_message_id(message_id)
+        message = self.find(message_id)
+        if message is None:
+            if message_id is not None and _STATUS_ORDER[status] > _STATUS_ORDER.get(self._early_status.get(message_id), 0):
+                self._early_status.pop(message_id, None)
+                self._early_status[message_id] = status
+                if len(self._early_status) > _EARLY_STATUS_LIMIT:
+                    del self._early_status[next(iter(self._early_status))]
+            return None
+        if _STATUS_ORDER.get(message.status, 0) >= _STATUS_ORDER[status]:
+            return None
+        message.status = status
+        return message
+
+    # ---- 内部 ----
+
+    def _register(self, message: ChatMessage) -> None:
+        if message.message_id is not None:
+            self._by_id[message.message_id] = message
+            early_status = self._early_status.pop(message.message_id, None)
+            if early_status is not None and _STATUS_ORDER[early_status] > _STATUS_ORDER.get(message.status, 0):
+                message.status = early_status
+        elif message.from_self and message.kind in (KIND_TEXT, KIND_IMAGE) and not message.is_recalled:
+            if message.temp_id is None:
+                message.temp_id = uuid.uuid4().hex
+            self._pending.append(message)
+        if message.temp_id is not None:
+            self._by_temp_id[message.temp_id] = message
+        if message.reply_to_message_id is not None:
+            self._replies.setdefault(message.reply_to_message_id, []).append(message)
+
+    def _unregister(self, message: ChatMessage) -> None:
+        if message.message_id is not None:
+            if self._by_id.get(message.message_id) is message:
+                del self._by_id[message.message_id]
+        elif message in self._pending:
+            self._pending.remove(message)
+        if message.temp_id is not None and self._by_temp_id.get(message.temp_id) is message:
+            del self._by_temp_id[message.temp_id]
+        replies = self._replies.get(message.reply_to_message_id)
+        if replies and message in replies:
+            replies.remove(message)
+            if not replies:
+                del self._replies[message.reply_to_message_id]
+
+    def _renumber(self, start: int) -> None:
+        for row in range(start, len(self._messages)):
+            self._messages[row].row = row
@@ -0,0 +1,149 @@
+"""
+消息存储状态更新测试
+
+构造 N 条消息的聊天记录，按随机顺序应用 N 条送达 / 已读回执，校验最终状态并测量耗时；
+超出时间预算时以非零状态退出。同时校验撤回、编辑、绑定ID、清空后索引仍然一致。
+
+用法：python client/gui/components/message_store_benchmark.py [--messages 5000] [--updates 5000] [--budget-ms 500] [--view]
+--view 时通过 ChatTranscriptModel + ChatTranscriptView（需要 PyQt6，可配合 QT_QPA_PLATFORM=offscreen）应用回执，
+包含模型信号与视图重绘的开销。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# 与 main.py 一致：项目根目录与 client 目录都需要在 sys.path 中
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BASE_DIR = os.path.dirname(CLIENT_DIR)
+for path in (BASE_DIR, CLIENT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from gui.components.message_store import (
+    KIND_TEXT, STATUS_DELIVERED, STATUS_READ, STATUS_SENT, ChatMessage, MessageStore
+)
+
+_STATUS_RANK = {STATUS_SENT: 1, STATUS_DELIVERED: 2, STATUS_READ: 3}
+
+
+def _build_messages(count: int):
+    messages = []
+    for i in range(count):
+        from_self = i % 2 == 0
+        messages.append(ChatMessage(
+            KIND_TEXT,
+            f"消息 {i}",
+            from_self=from_self,
+            message_id=i + 1,
+            time_text="2024-01-01 12:00:00" if from_self else "",
+            reply_to_message_id=i if i % 10 == 9 else None,
+        ))
+    return messages
+
+
+def _build_updates(count: int, message_count: int, rng: random.Random):
+    # 回执 ID 既有 int 也有 str（服务端推送的是字符串），并包含乱序到达的“已送达”
+    updates = []
+    for _ in range(count):
+        message_id = rng.randint(1, message_count)
+        status = rng.choice((STATUS_SENT, STATUS_DELIVERED, STATUS_READ))
+        updates.append((str(message_id) if rng.random() < 0.5 else message_id, status))
+    return updates
+
+
+def _expected_status(updates):
+    expected = {}
+    for message_id, status in updates:
+        message_id = int(message_id)
+        if _STATUS_RANK[status] > _STATUS_RANK.get(expected.get(message_id), 0):
+            expected[message_id] = status
+    return expected
+
+
+def _check_consistency(store: MessageStore) -> None:
+    """撤回、编辑、乐观消息绑定ID、早到回执与清空后索引仍然一致"""
+    target = store.find(10)
+    store.recall(target, "你撤回了一条消息")
+    assert store.find(10) is target and target.is_recalled and target.content == "你撤回了一条消息"
+    assert target.status is None and target.meta_text() == ""
+
+    edited = store.find(12)
+    store.edit(edited, "编辑后的内容", None, "2024-01-01T12:30:00")
+    assert store.find("12") is edited and edited.content == "编辑后的内容" and "已编辑" in edited.meta_text()
+    assert [reply.message_id for reply in store.replies_to(9)] == [10]
+
+    pending = ChatMessage(KIND_TEXT, "乐观展示", from_self=True)
+    store.extend([pending])
+    assert pending.temp_id is not None and store.find_temp(pending.temp_id) is pending
+    assert store.find_pending(KIND_TEXT, "乐观展示") is pending
+    new_id = len(store) + 1000
+    store.update_status(str(new_id), STATUS_READ)          # 回执早于服务端回推到达
+    store.set_message_id(pending, str(new_id))
+    assert store.find(new_id) is pending and store.find_temp(pending.temp_id) is pending
+    assert store.find_pending(KIND_TEXT, "乐观展示") is None and pending.status == STATUS_READ
+
+    store.remove(store.find(1))
+    assert store.find(1) is None and store.message_at(0).message_id == 2 and store.message_at(0).row == 0
+
+    store.clear()
+    assert len(store) == 0 and store.find(2) is None and store.find_temp(pending.temp_id) is None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="消息存储状态更新测试")
+    parser.add_argument("--messages", type=int, default=5000, help="聊天记录条数")
+    parser.add_argument("--updates", type=int, default=5000, help="状态回执条数")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="应用全部回执的时间预算（毫秒）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--view", action="store_true", help="通过 Qt 模型 / 视图应用回执")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    messages = _build_messages(args.messages)
+    updates = _build_updates(args.updates, args.messages, rng)
+
+    view = None
+    if args.view:
+        from PyQt6.QtWidgets import QApplication
+        from gui.components.chat_transcript import ChatTranscriptModel, ChatTranscriptView
+
+        app = QApplication.instance() or QApplication(sys.argv)
+        model = ChatTranscriptModel()
+        view = ChatTranscriptView(model)
+        view.resize(720, 640)
+        view.show()
+        model.extend(messages)
+        view.executeDelayedItemsLayout()
+        app.processEvents()
+        store = model.store
+        apply_update = model.set_status
+    else:
+        store = MessageStore()
+        store.extend(messages)
+        apply_update = store.update_status
+
+    start = time.perf_counter()
+    for message_id, status in updates:
+        apply_update(message_id, status)
+    if view is not None:
+        app.processEvents()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    expected = _expected_status(updates)
+    wrong = sum(1 for message in store if message.status != expected.get(message.message_id))
+    print(f"消息数: {len(store)}，回执数: {len(updates)}，路径: {'模型 / 视图' if view is not None else '消息存储'}")
+    print(f"  总耗时: {elapsed_ms:.1f} ms（预算 {args.budget_ms:.0f} ms），平均每条 {elapsed_ms * 1000 / max(len(updates), 1):.1f} µs")
+    print(f"  状态不一致: {wrong} 条")
+
+    _check_consistency(store)
+    print("  撤回 / 编辑 / 绑定ID / 清空 后索引一致")
+
+    if wrong or elapsed_ms > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from typing import TYPE_CHECKING, Optional
 
 from PyQt6.QtWidgets import QFileDialog, QDialog
 from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPixmap, QPainter, QColor, QPainterPath
+from PyQt6.QtGui import QPixmap, QPainter, QColor
 
 from client.resources import get_default_avatar
 from client.config import texts as text_cfg
@@ -11,6 +11,8 @@ from gui.avatar_crop_dialog import AvatarCropDialog
 from gui.handlers.dialog_handlers import exec_centered_dialog
 from gui.handlers.message_utils import show_message
 from client.api_client import update_avatar
+from client.utils.image_cache import SHAPE_CIRCLE, get_image_service
+from gui.window_utils import pixmap_to_data_url
 
 if TYPE_CHECKING:
     from gui.main_window import MainWindow
@@ -69,105 +71,68 @@ def upload_avatar(main_window: "MainWindow", event) -> None:
         )
 
 
+# 侧栏头像的显示尺寸：使用足够大的尺寸作为 Pixmap 源，配合 setScaledContents(True)，放大动画过程中依然清晰
+_AVATAR_DISPLAY_SIZE = 100
+# 聊天中使用的用户头像（QTextEdit 中按 32px 显示，生成 2 倍尺寸的图片）
+_CHAT_AVATAR_SIZE = 64
+
+
+def _set_placeholder_avatar(main_window: "MainWindow") -> None:
+    """兜底：画一个浅色圆形占位"""
+    pm = QPixmap(main_window.user_avatar_label.size())
+    pm.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(pm)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setBrush(QColor(241, 245, 249))
+    painter.setPen(Qt.PenStyle.NoPen)
+    painter.drawEllipse(0, 0, pm.width(), pm.height())
+    painter.end()
+    main_window.user_avatar_label.setPixmap(pm)
+
+
 def update_user_avatar_display(main_window: "MainWindow", avatar_data) -> None:
-    """更新头像显示（使用异步加载，避免阻塞UI）"""
+    """更新头像显示：解码、圆形裁剪与缩放都交给共享的图片解码服务在后台完成，不占用 UI 线程"""
     # 允许 avatar_data 为 None / memoryview
     if not avatar_data:
         avatar_data = get_default_avatar()
     if avatar_data is None:
-        # 兜底：画一个浅色圆形占位
-        pm = QPixmap(main_window.user_avatar_label.size())
-        pm.fill(Qt.GlobalColor.transparent)
-        painter = QPainter(pm)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-        painter.setBrush(QColor(241, 245, 249))
-        painter.setPen(Qt.PenStyle.NoPen)
-        painter.drawEllipse(0, 0, pm.width(), pm.height())
-        painter.end()
-        main_window.user_avatar_label.setPixmap(pm)
+        main_window._pending_avatar_bytes = None
+        _set_placeholder_avatar(main_window)
         return
-    
-    if isinstance(avatar_data, memoryview):
-        avatar_bytes = avatar_data.tobytes()
-    else:
-        avatar_bytes = avatar_data
-    
-    # 对于较大的头像（>100KB），使用异步加载
-    if len(avatar_bytes) > 100 * 1024:
-        from client.utils.image_load_thread import ImageLoadThread
-        
-        def on_image_loaded(pixmap: QPixmap, loaded_bytes: bytes):
-            _process_and_set_avatar(main_window, pixmap, loaded_bytes)
-        
-        def on_image_load_failed(error_msg: str):
-            logging.warning(f"异步加载头像失败，回退到默认头像: {error_msg}")
-            fallback = get_default_avatar()
-            if fallback:
-                update_user_avatar_display(main_window, fallback)
-            else:
-                # 使用占位符
-                pm = QPixmap(main_window.user_avatar_label.size())
-                pm.fill(Qt.GlobalColor.transparent)
-                painter = QPainter(pm)
-                painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-                painter.setBrush(QColor(241, 245, 249))
-                painter.setPen(Qt.PenStyle.NoPen)
-                painter.drawEllipse(0, 0, pm.width(), pm.height())
-                painter.end()
-                main_window.user_avatar_label.setPixmap(pm)
-        
-        # 启动异步加载线程（限制最大尺寸为500px，避免处理过大的图片）
-        image_thread = ImageLoadThread(avatar_bytes, max_size=500)
-        image_thread.setParent(main_window)  # 设置父对象，确保生命周期管理
-        image_thread.finished.connect(image_thread.deleteLater)  # 完成后自动清理
-        image_thread.image_loaded.connect(on_image_loaded)
-        image_thread.load_failed.connect(on_image_load_failed)
-        image_thread.start()
-    else:
-        # 小图片直接在主线程处理（不会阻塞太久）
-        pixmap = QPixmap()
-        ok = pixmap.loadFromData(avatar_bytes)
-        if not ok or pixmap.isNull():
-            # 数据非法则回退默认头像
-            fallback = get_default_avatar()
-            if fallback and fallback is not avatar_bytes:
-                pixmap = QPixmap()
-                pixmap.loadFromData(fallback)
-                avatar_bytes = fallback
-        
-        _process_and_set_avatar(main_window, pixmap, avatar_bytes)
-
-
-def _process_and_set_avatar(main_window: "MainWindow", pixmap: QPixmap, avatar_bytes: bytes) -> None:
-    """处理并设置头像（在主线程调用）"""
-    size = min(pixmap.width(), pixmap.height())
-    if size <= 0:
-        return
-    cropped_pixmap = QPixmap(size, size)
-    cropped_pixmap.fill(Qt.GlobalColor.transparent)
-    painter = QPainter(cropped_pixmap)
-    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-    path = QPainterPath()
-    path.addEllipse(0, 0, size, size)
-    painter.setClipPath(path)
-    painter.drawPixmap(0, 0, pixmap.scaled(
-        size, size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation
-    ))
-    painter.end()
-    
-    # 使用足够大的尺寸（例如 100x100）作为 Pixmap 源，配合 setScaledContents(True)
-    # 这样在放大动画过程中图像依然保持清晰
-    display_size = 100
-    main_window.user_avatar_label.setPixmap(cropped_pixmap.scaled(
-        display_size, display_size,
-        Qt.AspectRatioMode.KeepAspectRatio,
-        Qt.TransformationMode.SmoothTransformation
-    ))
-    # 同步更新聊天中使用的用户头像（缩小后用于 QTextEdit）
-    try:
-        main_window._user_avatar_url = _avatar_bytes_to_data_url(avatar_bytes, main_window)
-    except Exception:
-        pass
+
+    avatar_bytes = avatar_data.tobytes() if isinstance(avatar_data, memoryview) else bytes(avatar_data)
+    # 连续更换头像时只显示最后一次请求的结果
+    main_window._pending_avatar_bytes = avatar_bytes
+    service = get_image_service()
+
+    def is_current() -> bool:
+        return getattr(main_window, "_pending_avatar_bytes", None) is avatar_bytes
+
+    def on_avatar_decoded(pixmap: Optional[QPixmap]) -> None:
+        if not is_current():
+            return
+        if pixmap is not None:
+            main_window.user_avatar_label.setPixmap(pixmap)
+            return
+        # 数据非法则回退默认头像
+        logging.warning("头像解码失败，回退到默认头像")
+        fallback = get_default_avatar()
+        if fallback and fallback != avatar_bytes:
+            update_user_avatar_display(main_window, fallback)
+        else:
+            _set_placeholder_avatar(main_window)
+
+    def on_chat_avatar_decoded(pixmap: Optional[QPixmap]) -> None:
+        # 同步更新聊天中使用的用户头像
+        if pixmap is not None and is_current():
+            main_window._user_avatar_url = pixmap_to_data_url(pixmap)
+
+    pixmap = service.request(avatar_bytes, on_avatar_decoded, _AVATAR_DISPLAY_SIZE, SHAPE_CIRCLE)
+    if pixmap is not None:
+        on_avatar_decoded(pixmap)
+    pixmap = service.request(avatar_bytes, on_chat_avatar_decoded, _CHAT_AVATAR_SIZE)
+    if pixmap is not None:
+        on_chat_avatar_decoded(pixmap)
 
 
 def update_membership_info(
@@ -246,7 +211,3 @@ def update_membership_info(
     # 更新头像（None/bytes/memoryview 都可）
     update_user_avatar_display(main_window, avatar_data)
 
-
-def _avatar_bytes_to_data_url(data: bytes, main_window: "MainWindow", size: int = 32, mime: str = "image/png") -> str:
-    """将头像字节数据转换为 Data URL（用于富文本嵌入）"""
-    return main_window._avatar_bytes_to_data_url(data, size, mime)
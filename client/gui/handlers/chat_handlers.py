@@ -2,21 +2,24 @@ import os
 import random
 import base64
 import logging
-from datetime import datetime
-from typing import TYPE_CHECKING, List, Tuple, Optional
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Optional
 
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
-    QScrollArea, QPushButton, QMenu, QWidgetAction, QGridLayout,
+    QAbstractScrollArea, QPushButton, QMenu, QWidgetAction, QGridLayout,
     QDialog, QFileDialog, QGraphicsDropShadowEffect, QGraphicsOpacityEffect
 )
-from PyQt6.QtCore import Qt, QPoint, QTimer, QRectF, QUrl
-from PyQt6.QtGui import (
-    QPixmap, QCursor, QPainter, QPainterPath, QColor, QImage, QDesktopServices
-)
+from PyQt6.QtCore import Qt, QPoint, QTimer
+from PyQt6.QtGui import QPixmap, QCursor, QColor, QImageReader
 
 from client.resources import get_default_avatar
-from gui.components.chat_bubble import ChatBubble
+from client.utils.image_cache import SHAPE_CIRCLE, get_image_service
+from client.utils.message_cache import get_message_cache
+from gui.components.message_store import (
+    KIND_FILE, KIND_IMAGE, KIND_NOTICE, KIND_SEPARATOR, KIND_TEXT, KIND_WIDGET, STYLE_MATCHING,
+    ChatMessage, normalize_message_id,
+)
 from gui.handlers import dialog_handlers
 from gui.handlers.message_utils import show_message
 from gui.components.chat_rich_text import format_message_rich_text
@@ -24,6 +27,10 @@ from gui.components.chat_rich_text import format_message_rich_text
 if TYPE_CHECKING:
     from gui.main_window import MainWindow
 
+_AVATAR_SIZE = 32
+_IMAGE_MAX_SIZE = 160          # 聊天图片最大边
+_REPLY_THUMBNAIL_SIZE = 60
+
 
 def open_customer_service_chat(main_window: "MainWindow", event):
     if event.button() != Qt.MouseButton.LeftButton:
@@ -44,6 +51,9 @@ def open_customer_service_chat(main_window: "MainWindow", event):
     # 清除未读消息计数
     clear_unread_count(main_window)
 
+    # 后台加载 / 检查更新客服知识库，首次回复时无需等待下载
+    main_window.keyword_matcher.reload_in_background()
+
     # 如果之前是关闭状态（非最小化），确保彻底清空旧记录
     if getattr(main_window, "_chat_closed", False):
         clear_all_chat_messages(main_window)
@@ -93,12 +103,22 @@ def open_customer_service_chat(main_window: "MainWindow", event):
     main_window._chat_panel_added = True
     
     # 检查是否是第一次打开聊天面板（聊天记录为空），如果是则显示欢迎消息
-    if hasattr(main_window, "chat_layout"):
-        # 检查聊天布局中是否已有消息
-        has_messages = main_window.chat_layout.count() > 0
+    if hasattr(main_window, "chat_model"):
+        # 检查聊天记录中是否已有消息
+        has_messages = len(main_window.chat_model) > 0
         if not has_messages:
-            # 延迟一小段时间，等UI渲染完成后再显示欢迎消息
-            QTimer.singleShot(200, lambda: _show_welcome_message(main_window))
+            from client.utils.websocket_helper import restore_cached_chat
+
+            def on_restored(restored: bool):
+                if restored:
+                    # 有进行中的客服会话：已从本地缓存渲染，连接后增量同步
+                    scroll_to_bottom(main_window)
+                elif len(main_window.chat_model) == 0:
+                    # 延迟一小段时间，等UI渲染完成后再显示欢迎消息
+                    QTimer.singleShot(200, lambda: _show_welcome_message(main_window))
+
+            # 本地缓存在后台线程读取，结果回到主线程后再决定恢复会话还是显示欢迎消息
+            restore_cached_chat(main_window, on_restored)
         else:
             # 如果有消息，滚动到底部
             QTimer.singleShot(100, lambda: scroll_to_bottom(main_window))
@@ -198,24 +218,17 @@ def close_chat_panel(main_window: "MainWindow"):
 
         # 不再需要停止HTTP轮询（已移除）
         
-        # 清空聊天记录（仅清除UI，不清除数据库）
-        if hasattr(main_window, "chat_layout"):
-            while main_window.chat_layout.count():
-                item = main_window.chat_layout.takeAt(0)
-                widget = item.widget()
-                if widget:
-                    widget.deleteLater()
-        
-        # 清除已显示消息ID记录
-        if hasattr(main_window, "_displayed_message_ids"):
-            main_window._displayed_message_ids.clear()
+        # 清空聊天记录（仅清除UI，不清除数据库），同时清除已显示消息ID记录
+        clear_all_chat_messages(main_window)
         
         # 重置状态
         main_window._chat_minimized = False
         main_window._chat_closed = True
         main_window._human_service_connected = False
         main_window._matched_agent_id = None
-        if hasattr(main_window, "_chat_session_id"):
+        if getattr(main_window, "_chat_session_id", None):
+            # 会话结束，下次打开面板不再从本地缓存恢复
+            get_message_cache().close_session(main_window._chat_session_id)
             main_window._chat_session_id = None
         clear_unread_count(main_window)
         
@@ -319,7 +332,8 @@ def handle_chat_send(main_window: "MainWindow"):
                 else:
                     reply_to_message_type = "text"
             
-            append_chat_message(
+            # 重复点击时不会新增记录，沿用上一条未确认消息的临时ID（服务端按此ID去重）
+            pending_record = append_chat_message(
                 main_window, 
                 text, 
                 from_self=True,
@@ -329,7 +343,7 @@ def handle_chat_send(main_window: "MainWindow"):
                 reply_to_message_type=reply_to_message_type,
                 from_user_id=main_window.user_id,
                 from_username=current_username,
-            )
+            ) or main_window.chat_model.last_pending()
             main_window.chat_input.clear()
 
             # 兜底定时器，防止HTTP请求失败时界面一直禁用
@@ -347,16 +361,11 @@ def handle_chat_send(main_window: "MainWindow"):
                 try:
                     # 检查是否有引用消息
                     reply_to_id = getattr(main_window, "_reply_to_message_id", None)
-                    # 如果之前点击引用时还没有 message_id，这里再尝试从被引用控件读取一次（可能已同步到ID）
-                    if reply_to_id is None and hasattr(main_window, "_reply_to_widget"):
-                        try:
-                            cached_widget = getattr(main_window, "_reply_to_widget", None)
-                            if cached_widget:
-                                cached_id = cached_widget.property("message_id")
-                                if cached_id:
-                                    reply_to_id = cached_id
-                        except Exception:
-                            pass
+                    # 如果之前点击引用时还没有 message_id，这里按临时ID再查一次被引用记录（可能已同步到ID）
+                    if reply_to_id is None:
+                        cached_message = main_window.chat_model.find_temp(getattr(main_window, "_reply_to_temp_id", None))
+                        if cached_message is not None and cached_message.message_id:
+                            reply_to_id = cached_message.message_id
                     
                     # 验证引用消息ID是否有效（必须是大于0的正整数）
                     if reply_to_id is not None:
@@ -367,31 +376,8 @@ def handle_chat_send(main_window: "MainWindow"):
                                 logging.warning(f"引用消息ID无效: {reply_to_id}（ID必须大于0），将按普通消息发送")
                                 reply_to_id = None
                             else:
-                                # 先在本地检查是否存在该消息（自己刚发出的消息可立即引用）
-                                local_exists = False
-                                try:
-                                    if hasattr(main_window, "_message_widgets_map") and reply_to_id_int in getattr(main_window, "_message_widgets_map", {}):
-                                        local_exists = True
-                                    elif hasattr(main_window, "chat_layout"):
-                                        for i in range(main_window.chat_layout.count() - 1, -1, -1):
-                                            item = main_window.chat_layout.itemAt(i)
-                                            if not item or not item.widget():
-                                                continue
-                                            widget = item.widget()
-                                            existing_id = widget.property("message_id")
-                                            if existing_id is None:
-                                                continue
-                                            try:
-                                                if int(existing_id) == reply_to_id_int:
-                                                    local_exists = True
-                                                    break
-                                            except Exception:
-                                                continue
-                                except Exception:
-                                    pass
-                                
-                                # 如果本地没有该消息，交由服务端在收到 reply_to_message_id 后自行校验，
-                                # 这里不再通过已废弃的 HTTP 接口进行验证
+                                # 本地没有该消息时交由服务端在收到 reply_to_message_id 后自行校验
+                                reply_to_id = reply_to_id_int
                         except (ValueError, TypeError):
                             logging.warning(f"引用消息ID格式错误: {reply_to_id}，将按普通消息发送")
                             reply_to_id = None
@@ -403,7 +389,8 @@ def handle_chat_send(main_window: "MainWindow"):
                         session_id,
                         text,
                         message_type="text",
-                        reply_to_message_id=reply_to_id
+                        reply_to_message_id=reply_to_id,
+                        client_message_id=pending_record.temp_id if pending_record is not None else None,
                     )
                     
                     # 清除引用状态
@@ -413,8 +400,8 @@ def handle_chat_send(main_window: "MainWindow"):
                         main_window._reply_to_message_text = None
                     if hasattr(main_window, "_reply_to_username"):
                         main_window._reply_to_username = None
-                    if hasattr(main_window, "_reply_to_widget"):
-                        main_window._reply_to_widget = None
+                    if hasattr(main_window, "_reply_to_temp_id"):
+                        main_window._reply_to_temp_id = None
                     # 恢复输入框占位符
                     if hasattr(main_window, "chat_input"):
                         main_window.chat_input.setPlaceholderText("输入消息...")
@@ -507,91 +494,199 @@ def handle_chat_send(main_window: "MainWindow"):
 
 def scroll_to_bottom(main_window: "MainWindow"):
     """滚动聊天区域到底部，确保最新消息可见"""
-    if not hasattr(main_window, "chat_scroll_area"):
+    if not hasattr(main_window, "chat_view"):
         return
-    
+
     def do_scroll():
-        if not hasattr(main_window, "chat_scroll_area"):
-            return
-        bar = main_window.chat_scroll_area.verticalScrollBar()
-        if bar:
-            max_value = bar.maximum()
-            bar.setValue(max_value)
-    
+        if hasattr(main_window, "chat_view"):
+            main_window.chat_view.scroll_to_bottom()
+
     # 立即尝试滚动一次
     do_scroll()
-    # 使用多个延迟确保在不同时机都能滚动到底部（UI更新、布局调整等）
-    QTimer.singleShot(10, do_scroll)
+    # 列表按批次布局，布局完成后再滚动一次（之后的内容增长由视图自动跟随）
+    QTimer.singleShot(0, do_scroll)
     QTimer.singleShot(50, do_scroll)
-    QTimer.singleShot(100, do_scroll)
 
 
 def clear_all_chat_messages(main_window: "MainWindow"):
     """清除聊天区域的所有消息"""
-    if not hasattr(main_window, "chat_layout"):
+    if not hasattr(main_window, "chat_model"):
         return
-    
+
     # 清空聊天记录（仅清除UI，不清除数据库）
-    while main_window.chat_layout.count():
-        item = main_window.chat_layout.takeAt(0)
-        widget = item.widget()
-        if widget:
-            widget.deleteLater()
-    
-    # 清除已显示消息ID记录
-    if hasattr(main_window, "_displayed_message_ids"):
-        main_window._displayed_message_ids.clear()
+    main_window.chat_model.clear()
+    main_window._matching_messages = []
 
 
 def add_connected_separator(main_window: "MainWindow"):
     """在聊天区域顶部添加已连接客服的分隔线提示"""
-    if not hasattr(main_window, "chat_layout"):
+    if not hasattr(main_window, "chat_model"):
         return
-    
-    separator_widget = QWidget()
-    separator_layout = QVBoxLayout(separator_widget)
-    separator_layout.setContentsMargins(0, 12, 0, 12)
-    separator_layout.setSpacing(0)
-    
-    # 创建分隔线和文字
-    separator_container = QWidget()
-    separator_container_layout = QHBoxLayout(separator_container)
-    separator_container_layout.setContentsMargins(0, 0, 0, 0)
-    separator_container_layout.setSpacing(8)
-    
-    # 左侧线条
-    left_line = QLabel()
-    left_line.setFixedHeight(1)
-    left_line.setStyleSheet("background-color: #d1d5db;")
-    left_line.setSizePolicy(left_line.sizePolicy().horizontalPolicy(), left_line.sizePolicy().verticalPolicy())
-    
-    # 中间文字
-    text_label = QLabel("已连接客服，可以开始对话")
-    text_label.setStyleSheet("""
-        QLabel {
-            color: #9ca3af;
-            font-size: 11px;
-            font-family: "Microsoft YaHei", "SimHei", "Arial", sans-serif;
-            padding: 0 8px;
-            background-color: transparent;
-        }
-    """)
-    text_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-    
-    # 右侧线条
-    right_line = QLabel()
-    right_line.setFixedHeight(1)
-    right_line.setStyleSheet("background-color: #d1d5db;")
-    right_line.setSizePolicy(right_line.sizePolicy().horizontalPolicy(), right_line.sizePolicy().verticalPolicy())
-    
-    separator_container_layout.addWidget(left_line, stretch=1)
-    separator_container_layout.addWidget(text_label, stretch=0)
-    separator_container_layout.addWidget(right_line, stretch=1)
-    
-    separator_layout.addWidget(separator_container)
-    
-    # 插入到布局顶部（索引0）
-    main_window.chat_layout.insertWidget(0, separator_widget)
+    main_window.chat_model.insert(0, ChatMessage(KIND_SEPARATOR, "已连接客服，可以开始对话"))
+
+
+def _message_avatar(
+    main_window: "MainWindow",
+    from_self: bool,
+    avatar_base64: Optional[str] = None,
+    message: Optional[ChatMessage] = None,
+) -> Optional[QPixmap]:
+    """生成消息旁的 32x32 圆形头像：自己的消息用当前头像，对方优先用服务器下发的 avatar_base64。
+
+    对方头像不在缓存中时先返回默认头像，后台解码完成后再替换 message 的头像。
+    """
+    service = get_image_service()
+    own_avatar = main_window.user_avatar_label.pixmap()
+    if from_self and own_avatar is not None and not own_avatar.isNull():
+        return service.scaled(own_avatar, _AVATAR_SIZE, SHAPE_CIRCLE)
+
+    if not from_self and avatar_base64:
+        def on_decoded(pixmap: Optional[QPixmap]):
+            if pixmap is not None and message is not None:
+                message.avatar = pixmap
+                main_window.chat_model.refresh(message)
+
+        pixmap = service.request(avatar_base64, on_decoded, _AVATAR_SIZE, SHAPE_CIRCLE)
+        if pixmap is not None:
+            return pixmap
+
+    default_bytes = get_default_avatar()
+    if not default_bytes:
+        return None
+    return service.load(default_bytes, _AVATAR_SIZE, SHAPE_CIRCLE)
+
+
+def _set_reply_preview(
+    main_window: "MainWindow",
+    message: ChatMessage,
+    reply_to_message_id,
+    reply_to_message: str,
+    reply_to_username: Optional[str],
+    reply_to_message_type: Optional[str],
+    max_length: int,
+) -> None:
+    """填充消息的引用块：发送者、文本与图片缩略图（有缩略图时文本为空）。
+
+    图片缩略图不在缓存中时先显示“[图片]”，后台解码完成后替换为缩略图。
+    """
+    message.reply_to_message_id = normalize_message_id(reply_to_message_id)
+    sender = reply_to_username or "用户"
+    # 如果是当前用户自己发送的消息，用“我”替代用户名，效果更贴近聊天习惯
+    current_username = getattr(main_window, "username", None)
+    if current_username and sender == current_username:
+        sender = "我"
+    message.reply_sender = sender
+    message.reply_thumbnail = None
+
+    reply_text = reply_to_message
+    if reply_text == "[消息已撤回]":
+        reply_text = "该引用消息已被撤回"
+
+    if reply_to_message_type == "image":
+        # 优先使用被引用消息记录中的原始 data:image/... 内容，其次使用引用摘要本身
+        data_source = None
+        original = main_window.chat_model.find(reply_to_message_id)
+        if original is not None and original.raw_image and original.raw_image.startswith("data:image"):
+            data_source = original.raw_image
+        elif reply_text and reply_text.startswith("data:image"):
+            data_source = reply_text
+        message.reply_text = "[图片]"
+        if data_source:
+            def on_decoded(pixmap: Optional[QPixmap]):
+                # 解码期间引用的消息可能已被撤回，此时不再显示缩略图
+                if pixmap is not None and message.reply_text == "[图片]":
+                    message.reply_thumbnail = pixmap
+                    message.reply_text = ""
+                    main_window.chat_model.refresh(message, relayout=True)
+
+            # 60x60 的缩略图（紧凑且不撑破引用块）
+            thumbnail = get_image_service().request(data_source, on_decoded, _REPLY_THUMBNAIL_SIZE)
+            if thumbnail is not None:
+                message.reply_thumbnail = thumbnail
+                message.reply_text = ""
+        return
+
+    if reply_text and len(reply_text) > max_length:
+        reply_text = reply_text[:max_length] + "..."
+    message.reply_text = reply_text or ""
+
+
+def _recall_text(main_window: "MainWindow", from_user_id: Optional[int], from_username: Optional[str]) -> str:
+    """撤回提示文案：自己撤回显示“你撤回了一条消息”，对方撤回显示“xx撤回了一条消息”"""
+    current_user_id = getattr(main_window, 'user_id', None)
+    if current_user_id is not None and from_user_id is not None:
+        try:
+            is_self_recalled = (int(from_user_id) == int(current_user_id))
+        except (ValueError, TypeError):
+            is_self_recalled = (from_user_id == current_user_id)
+    else:
+        is_self_recalled = (from_user_id == current_user_id)
+    if is_self_recalled:
+        return "你撤回了一条消息"
+
+    username = from_username or "用户"
+    if from_user_id and not from_username:
+        if hasattr(main_window, "username"):
+            username = main_window.username
+        else:
+            try:
+                from client.login.login_status_manager import check_login_status
+                _, _, current_username = check_login_status()
+                if current_username:
+                    username = current_username
+            except Exception:
+                pass
+    return f"{username}撤回了一条消息"
+
+
+def _apply_recall(main_window: "MainWindow", message_id, from_user_id: Optional[int], from_username: Optional[str]):
+    """把消息标记为已撤回（找不到原消息时追加一条撤回提示），并更新引用了它的引用块"""
+    model = main_window.chat_model
+    recall_text = _recall_text(main_window, from_user_id, from_username)
+
+    message = model.find(message_id)
+    if message is None:
+        model.append(ChatMessage(KIND_NOTICE, recall_text, message_id=message_id, is_recalled=True))
+        scroll_to_bottom(main_window)
+    elif not message.is_recalled:
+        # 撤回后只显示一行灰色提示，不再保留正文、图片、引用块与链接预览
+        model.recall(message, recall_text)
+
+    for reply in model.replies_to(message_id):
+        if reply.is_recalled:
+            continue
+        reply.reply_text = "该引用消息已被撤回"
+        reply.reply_thumbnail = None
+        model.refresh(reply, relayout=True)
+
+
+def _self_time_text(message_id: Optional[int], created_time: Optional[str]) -> str:
+    """自己消息上方的时间：历史消息（已有消息ID）按创建时间显示，乐观展示的消息使用当前时间"""
+    if message_id is not None and created_time:
+        try:
+            created = datetime.fromisoformat(created_time.replace('Z', '+00:00'))
+            # 服务端时间为 UTC（部分接口不带时区后缀）
+            if created.tzinfo is None:
+                created = created.replace(tzinfo=timezone.utc)
+            return created.astimezone().strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _append_record(main_window: "MainWindow", message: ChatMessage):
+    """追加一条记录，并处理未读计数与滚动"""
+    main_window.chat_model.append(message)
+
+    # 如果是客服消息且聊天面板隐藏/最小化，增加未读消息计数
+    if not message.from_self:
+        if (hasattr(main_window, "chat_panel") and not main_window.chat_panel.isVisible()) or \
+           getattr(main_window, "_chat_minimized", False):
+            add_unread_count(main_window)
+
+    # 滚动到底部（批量追加时由调用方在结束后滚动一次）
+    if not main_window.chat_model.batching:
+        scroll_to_bottom(main_window)
 
 
 def append_chat_message(
@@ -610,1697 +705,331 @@ def append_chat_message(
     from_user_id: Optional[int] = None,
     from_username: Optional[str] = None,
     message_created_time: Optional[str] = None,
-):
-    """按左右气泡形式追加一条消息，使用真实圆角控件"""
-    if not hasattr(main_window, "chat_layout"):
-        return
+    rich: Optional[Dict[str, Any]] = None,
+) -> Optional[ChatMessage]:
+    """按左右气泡形式追加一条消息（记录加入聊天记录模型，由视图绘制）
+
+    rich 为服务端随消息下发的预渲染富文本结果，存在时据此跳过普通文本的解析。
+    撤回消息会更新已有记录为撤回提示，而不是追加新气泡。
+    """
+    if not hasattr(main_window, "chat_model"):
+        return None
+    model = main_window.chat_model
+
+    if is_recalled:
+        if message_id is not None:
+            _apply_recall(main_window, message_id, from_user_id, from_username)
+        return None
+
+    # 同一条消息（如断线重连后服务端重推）只显示一次
+    if message_id is not None and model.find(message_id) is not None:
+        return None
+
+    # 乐观展示的消息：上一条尚未确认的相同内容不重复显示（避免重复点击产生两条）
+    if message_id is None and from_self:
+        pending = model.last_pending()
+        if pending is not None and pending.kind == KIND_TEXT and pending.content == content:
+            return None
 
     # 先根据需要将纯文本转换为富文本（Markdown / @提及 / 链接）
-    effective_content = content
-    rich_flag = is_html
+    html = content if is_html else None
     link_urls: List[str] = []
 
     # 仅在原始消息非 HTML 时尝试自动解析富文本，避免破坏已有 HTML 文本
     if not is_html and content:
         try:
-            html, is_rich, urls = format_message_rich_text(content)
+            formatted, is_rich, urls = format_message_rich_text(content, rich)
             if is_rich:
-                effective_content = html
-                rich_flag = True
+                html = formatted
                 link_urls = urls or []
         except Exception:
             # 如果富文本处理出错，使用原始内容
-            effective_content = content
-            rich_flag = False
+            html = None
             link_urls = []
 
-    # 容器：一条完整的消息
-    message_widget = QWidget()
-    v_layout = QVBoxLayout(message_widget)
-    v_layout.setContentsMargins(4, 0, 4, 0)
-    v_layout.setSpacing(2)
-
-    # 用户消息：上方一行时间（右对齐）
-    if from_self:
-        time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        time_label = QLabel(time_str)
-        time_label.setStyleSheet("""
-            QLabel {
-                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                font-size: 11px;
-                color: #9ca3af;
-            }
-        """)
-        time_row = QHBoxLayout()
-        time_row.setContentsMargins(0, 0, 0, 0)
-        time_row.addStretch()
-        time_row.addWidget(time_label)
-        v_layout.addLayout(time_row)
-        # 记录时间标签，便于撤回时隐藏
-        message_widget.setProperty("time_label", time_label)
-
-    # 处理撤回状态 - 如果是撤回消息，先尝试更新现有消息，而不是创建新消息
-    if is_recalled and message_id is not None:
-        try:
-            recalled_id = None
-            try:
-                recalled_id = int(message_id)
-            except (ValueError, TypeError):
-                recalled_id = message_id
-            
-            # 先尝试查找并更新现有消息
-            if recalled_id is not None:
-                # 优先从 _message_widgets_map 中查找
-                # 注意：需要同时尝试整数和字符串键，因为存储时可能类型不一致
-                if hasattr(main_window, "_message_widgets_map"):
-                    widget_bubble = main_window._message_widgets_map.get(recalled_id)
-                    # 如果没找到，尝试字符串键
-                    if not widget_bubble and isinstance(recalled_id, int):
-                        widget_bubble = main_window._message_widgets_map.get(str(recalled_id))
-                    # 如果还没找到，尝试整数键
-                    if not widget_bubble and isinstance(recalled_id, str):
-                        try:
-                            widget_bubble = main_window._message_widgets_map.get(int(recalled_id))
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    if widget_bubble:
-                        widget, bubble = widget_bubble
-                        if widget and not widget.property("is_recalled"):
-                            # 找到现有消息，更新为撤回状态
-                            # 隐藏整个消息行（包括头像和气泡）以及引用块
-                            parent_layout = widget.layout()
-                            if parent_layout and bubble:
-                                # 找到包含bubble的row布局
-                                row_layout = None
-                                row_index = -1
-                                for i in range(parent_layout.count()):
-                                    item = parent_layout.itemAt(i)
-                                    if item and item.layout():
-                                        # 检查这个布局中是否包含bubble
-                                        layout = item.layout()
-                                        for j in range(layout.count()):
-                                            layout_item = layout.itemAt(j)
-                                            if layout_item and layout_item.widget() == bubble:
-                                                row_layout = layout
-                                                row_index = i
-                                                break
-                                        if row_layout:
-                                            break
-                                
-                                # 隐藏包含气泡的row布局中的所有控件（包括头像和气泡）
-                                if row_layout:
-                                    for i in range(row_layout.count()):
-                                        item = row_layout.itemAt(i)
-                                        if item and item.widget():
-                                            item.widget().setVisible(False)
-                                
-                                # 隐藏引用块（如果存在）
-                                reply_container = widget.property("reply_container")
-                                if reply_container:
-                                    reply_container.setVisible(False)
-                            
-                            # 隐藏时间标签（如果有）
-                            time_label = widget.property("time_label")
-                            if time_label:
-                                time_label.setVisible(False)
-                        
-                        # 判断是自己撤回还是对方撤回
-                        current_user_id = getattr(main_window, 'user_id', None)
-                        if current_user_id is not None and from_user_id is not None:
-                            try:
-                                is_self_recalled = (int(from_user_id) == int(current_user_id))
-                            except (ValueError, TypeError):
-                                is_self_recalled = (from_user_id == current_user_id)
-                        else:
-                            is_self_recalled = (from_user_id == current_user_id)
-                        
-                        expected_label_texts = set()
-                        if is_self_recalled:
-                            recall_text = "你撤回了一条消息"
-                            expected_label_texts.add(recall_text)
-                        else:
-                            username = from_username or "用户"
-                            if from_user_id and not from_username:
-                                if hasattr(main_window, "username"):
-                                    username = main_window.username
-                                else:
-                                    try:
-                                        from client.login.login_status_manager import check_login_status
-                                        _, _, current_username = check_login_status()
-                                        if current_username:
-                                            username = current_username
-                                    except Exception:
-                                        pass
-                            recall_text = f"{username}撤回了一条消息"
-                            expected_label_texts.add(recall_text)
-                        
-                        # 检查是否已经有撤回提示标签
-                        widget_layout = widget.layout()
-                        if widget_layout:
-                            # 查找是否已有撤回标签
-                            has_recall_label = False
-                            for i in range(widget_layout.count()):
-                                item = widget_layout.itemAt(i)
-                                if item and item.widget():
-                                    w = item.widget()
-                                    if isinstance(w, QLabel) and w.text() in expected_label_texts:
-                                        has_recall_label = True
-                                        break
-                            
-                            # 如果没有撤回标签，创建一个
-                            if not has_recall_label:
-                                recall_label = QLabel(recall_text)
-                                recall_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                                recall_label.setStyleSheet("""
-                                    QLabel {
-                                        font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                        font-size: 11px;
-                                        color: #9ca3af;
-                                        padding: 4px 0px;
-                                        background-color: transparent;
-                                    }
-                                """)
-                                widget_layout.insertWidget(0, recall_label)
-                        
-                        # 标记为已撤回
-                        widget.setProperty("is_recalled", True)
-                        
-                        # 同步更新所有引用了这条消息的引用块文案
-                        if hasattr(main_window, "chat_layout"):
-                            parent_layout = main_window.chat_layout
-                            for i in range(parent_layout.count()):
-                                item = parent_layout.itemAt(i)
-                                w = item.widget() if item else None
-                                if not w:
-                                    continue
-                                ref_id = w.property("reply_to_message_id")
-                                if ref_id is None:
-                                    continue
-                                try:
-                                    ref_id_norm = int(ref_id)
-                                except (ValueError, TypeError):
-                                    ref_id_norm = ref_id
-                                if ref_id_norm == recalled_id:
-                                    reply_container = w.property("reply_container")
-                                    if reply_container:
-                                        sender_name = reply_container.property("reply_sender_name") or ""
-                                        reply_label = reply_container.property("reply_label")
-                                        new_text = "该引用消息已被撤回"
-                                        if sender_name:
-                                            new_text = f"{sender_name}: {new_text}"
-                                        
-                                        # 先找到并删除所有图片相关的控件
-                                        thumbnail_label = reply_container.property("reply_thumbnail_label")
-                                        thumbnail_layout = reply_container.property("reply_thumbnail_layout")
-                                        
-                                        # 找到 reply_content_layout
-                                        reply_content_layout = None
-                                        main_layout = reply_container.layout()
-                                        if main_layout and main_layout.count() > 0:
-                                            first_item = main_layout.itemAt(0)
-                                            if first_item and first_item.layout():
-                                                reply_content_layout = first_item.layout()
-                                        
-                                        # 如果有 thumbnail_layout，完全删除它及其所有子控件
-                                        if thumbnail_layout and reply_content_layout:
-                                            # 找到 thumbnail_layout 在 reply_content_layout 中的位置
-                                            layout_index = -1
-                                            for i in range(reply_content_layout.count()):
-                                                item = reply_content_layout.itemAt(i)
-                                                if item and item.layout() == thumbnail_layout:
-                                                    layout_index = i
-                                                    break
-                                            
-                                            if layout_index >= 0:
-                                                # 先删除 thumbnail_layout 中的所有控件
-                                                while thumbnail_layout.count() > 0:
-                                                    item = thumbnail_layout.takeAt(0)
-                                                    if item:
-                                                        widget = item.widget()
-                                                        if widget:
-                                                            # 完全删除控件
-                                                            widget.hide()
-                                                            widget.setVisible(False)
-                                                            if isinstance(widget, QLabel):
-                                                                widget.setPixmap(QPixmap())
-                                                                widget.clear()
-                                                            widget.setFixedSize(0, 0)
-                                                            widget.setParent(None)
-                                                            widget.deleteLater()
-                                                        else:
-                                                            # 如果是子布局，也删除
-                                                            sub_layout = item.layout()
-                                                            if sub_layout:
-                                                                while sub_layout.count() > 0:
-                                                                    sub_item = sub_layout.takeAt(0)
-                                                                    if sub_item:
-                                                                        sub_widget = sub_item.widget()
-                                                                        if sub_widget:
-                                                                            sub_widget.hide()
-                                                                            sub_widget.setVisible(False)
-                                                                            sub_widget.setParent(None)
-                                                                            sub_widget.deleteLater()
-                                                                sub_layout.deleteLater()
-                                                
-                                                # 从 reply_content_layout 中移除 thumbnail_layout
-                                                reply_content_layout.removeItem(thumbnail_layout)
-                                                # 删除 thumbnail_layout 本身
-                                                thumbnail_layout.deleteLater()
-                                                
-                                                # 创建新的文本标签并添加到相同位置
-                                                new_reply_label = QLabel(new_text)
-                                                new_reply_label.setStyleSheet("""
-                                                    QLabel {
-                                                        font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                                        font-size: 12px;
-                                                        color: #4b5563;
-                                                        background-color: transparent;
-                                                    }
-                                                """)
-                                                new_reply_label.setWordWrap(True)
-                                                new_reply_label.setMaximumWidth(300)  # 限制最大宽度
-                                                reply_content_layout.insertWidget(layout_index, new_reply_label)
-                                                
-                                                # 更新 reply_label 属性
-                                                reply_container.setProperty("reply_label", new_reply_label)
-                                                reply_label = new_reply_label
-                                        else:
-                                            # 如果没有 thumbnail_layout，直接更新或创建 reply_label
-                                            if reply_label:
-                                                reply_label.setText(new_text)
-                                            else:
-                                                # 如果连 reply_label 都没有，创建一个新的
-                                                if reply_content_layout:
-                                                    new_reply_label = QLabel(new_text)
-                                                    new_reply_label.setStyleSheet("""
-                                                        QLabel {
-                                                            font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                                            font-size: 12px;
-                                                            color: #4b5563;
-                                                            background-color: transparent;
-                                                        }
-                                                    """)
-                                                    new_reply_label.setWordWrap(True)
-                                                    new_reply_label.setMaximumWidth(300)  # 限制最大宽度
-                                                    reply_content_layout.addWidget(new_reply_label)
-                                                    reply_container.setProperty("reply_label", new_reply_label)
-                                                    reply_label = new_reply_label
-                                        
-                                        # 删除 thumbnail_label（如果还存在）
-                                        if thumbnail_label:
-                                            thumbnail_label.hide()
-                                            thumbnail_label.setVisible(False)
-                                            thumbnail_label.setPixmap(QPixmap())
-                                            thumbnail_label.clear()
-                                            thumbnail_label.setFixedSize(0, 0)
-                                            # 尝试从父布局中移除
-                                            parent = thumbnail_label.parent()
-                                            if parent:
-                                                parent_layout = parent.layout()
-                                                if parent_layout:
-                                                    parent_layout.removeWidget(thumbnail_label)
-                                            thumbnail_label.setParent(None)
-                                            thumbnail_label.deleteLater()
-                                        
-                                        # 清除所有属性
-                                        reply_container.setProperty("reply_thumbnail_label", None)
-                                        reply_container.setProperty("reply_thumbnail_layout", None)
-                                        
-                                        # 使用 findChildren 确保找到并删除所有图片标签
-                                        all_labels = reply_container.findChildren(QLabel)
-                                        for label in all_labels:
-                                            # 只处理有图片的标签，且不是新的文本标签
-                                            if label.pixmap() and label is not reply_label:
-                                                label.hide()
-                                                label.setVisible(False)
-                                                label.setPixmap(QPixmap())
-                                                label.clear()
-                                                label.setFixedSize(0, 0)
-                                                # 尝试从父布局中移除
-                                                parent = label.parent()
-                                                if parent:
-                                                    parent_layout = parent.layout()
-                                                    if parent_layout:
-                                                        parent_layout.removeWidget(label)
-                                                label.setParent(None)
-                                                label.deleteLater()
-                                        
-                                        # 强制更新整个引用容器和父控件
-                                        reply_container.update()
-                                        reply_container.repaint()
-                                        if w:
-                                            w.update()
-                                            w.repaint()
-                        
-                        # 已更新现有消息，直接返回，不创建新消息
-                        return
-                
-                # 如果 _message_widgets_map 中没有找到，尝试从布局中查找
-                if hasattr(main_window, "chat_layout"):
-                    for i in range(main_window.chat_layout.count() - 1, -1, -1):
-                        item = main_window.chat_layout.itemAt(i)
-                        if not item or not item.widget():
-                            continue
-                        widget = item.widget()
-                        widget_id = widget.property("message_id")
-                        if widget_id is not None:
-                            # 尝试将 widget_id 转换为整数进行比较
-                            widget_id_matched = False
-                            try:
-                                widget_id_int = int(widget_id)
-                                if isinstance(recalled_id, int):
-                                    widget_id_matched = (widget_id_int == recalled_id)
-                                else:
-                                    try:
-                                        recalled_id_int = int(recalled_id)
-                                        widget_id_matched = (widget_id_int == recalled_id_int)
-                                    except (ValueError, TypeError):
-                                        widget_id_matched = (str(widget_id_int) == str(recalled_id))
-                            except (ValueError, TypeError):
-                                # 如果无法转换为整数，直接进行字符串比较
-                                widget_id_matched = (str(widget_id) == str(recalled_id))
-                            
-                            if widget_id_matched and not widget.property("is_recalled"):
-                                # 找到现有消息，更新为撤回状态
-                                # 隐藏整个消息行（包括头像和气泡）以及引用块
-                                parent_layout = widget.layout()
-                                if parent_layout:
-                                    # 遍历所有布局项，找到包含头像和气泡的row布局
-                                    for i in range(parent_layout.count()):
-                                        item = parent_layout.itemAt(i)
-                                        if item and item.layout():
-                                            row_layout = item.layout()
-                                            # 检查这个布局是否包含头像和气泡（通常是QHBoxLayout）
-                                            # 隐藏row布局中的所有控件（包括头像和气泡）
-                                            for j in range(row_layout.count()):
-                                                row_item = row_layout.itemAt(j)
-                                                if row_item and row_item.widget():
-                                                    w = row_item.widget()
-                                                    # 隐藏头像（QLabel with pixmap）和气泡（ChatBubble 或 QLabel without pixmap）
-                                                    if isinstance(w, (ChatBubble, QLabel)):
-                                                        w.setVisible(False)
-                                    
-                                    # 隐藏引用块（如果存在），并先隐藏其中的所有缩略图
-                                    reply_container = widget.property("reply_container")
-                                    if reply_container:
-                                        # 先隐藏引用块中的所有缩略图
-                                        thumbnail_label = reply_container.property("reply_thumbnail_label")
-                                        if thumbnail_label:
-                                            thumbnail_label.hide()
-                                            thumbnail_label.setVisible(False)
-                                        # 使用 findChildren 查找所有图片标签并隐藏
-                                        all_labels = reply_container.findChildren(QLabel)
-                                        for label in all_labels:
-                                            if label.pixmap():
-                                                label.hide()
-                                                label.setVisible(False)
-                                        # 最后隐藏整个引用块
-                                        reply_container.setVisible(False)
-                                        reply_container.hide()
-                                
-                                # 隐藏时间标签（如果有）
-                                time_label = widget.property("time_label")
-                                if time_label:
-                                    time_label.setVisible(False)
-                                
-                                # 判断是自己撤回还是对方撤回
-                                current_user_id = getattr(main_window, 'user_id', None)
-                                if current_user_id is not None and from_user_id is not None:
-                                    try:
-                                        is_self_recalled = (int(from_user_id) == int(current_user_id))
-                                    except (ValueError, TypeError):
-                                        is_self_recalled = (from_user_id == current_user_id)
-                                else:
-                                    is_self_recalled = (from_user_id == current_user_id)
-                                
-                                if is_self_recalled:
-                                    recall_text = "你撤回了一条消息"
-                                else:
-                                    username = from_username or "用户"
-                                    if from_user_id and not from_username:
-                                        if hasattr(main_window, "username"):
-                                            username = main_window.username
-                                        else:
-                                            try:
-                                                from client.login.login_status_manager import check_login_status
-                                                _, _, current_username = check_login_status()
-                                                if current_username:
-                                                    username = current_username
-                                            except Exception:
-                                                pass
-                                    recall_text = f"{username}撤回了一条消息"
-                                
-                                # 检查是否已经有撤回提示标签
-                                widget_layout = widget.layout()
-                                if widget_layout:
-                                    # 查找是否已有撤回标签
-                                    has_recall_label = False
-                                    for layout_idx in range(widget_layout.count()):
-                                        item = widget_layout.itemAt(layout_idx)
-                                        if item and item.widget():
-                                            w = item.widget()
-                                            if isinstance(w, QLabel) and w.text() in ("你撤回了一条消息", f"{username}撤回了一条消息"):
-                                                has_recall_label = True
-                                                break
-                                    
-                                    # 如果没有撤回标签，创建一个
-                                    if not has_recall_label:
-                                        recall_label = QLabel(recall_text)
-                                        recall_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                                        recall_label.setStyleSheet("""
-                                            QLabel {
-                                                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                                font-size: 11px;
-                                                color: #9ca3af;
-                                                padding: 4px 0px;
-                                                background-color: transparent;
-                                            }
-                                        """)
-                                        widget_layout.insertWidget(0, recall_label)
-                                
-                                # 标记为已撤回
-                                widget.setProperty("is_recalled", True)
-                                
-                                # 同步更新所有引用了这条消息的引用块文案
-                                if hasattr(main_window, "chat_layout"):
-                                    parent_layout = main_window.chat_layout
-                                    for layout_idx in range(parent_layout.count()):
-                                        item = parent_layout.itemAt(layout_idx)
-                                        w = item.widget() if item else None
-                                        if not w:
-                                            continue
-                                        ref_id = w.property("reply_to_message_id")
-                                        if ref_id is None:
-                                            continue
-                                        try:
-                                            ref_id_norm = int(ref_id)
-                                        except (ValueError, TypeError):
-                                            ref_id_norm = ref_id
-                                        if ref_id_norm == recalled_id:
-                                            reply_container = w.property("reply_container")
-                                            if reply_container:
-                                                sender_name = reply_container.property("reply_sender_name") or ""
-                                                reply_label = reply_container.property("reply_label")
-                                                new_text = "该引用消息已被撤回"
-                                                if sender_name:
-                                                    new_text = f"{sender_name}: {new_text}"
-                                                
-                                                # 先找到并删除所有图片相关的控件
-                                                thumbnail_label = reply_container.property("reply_thumbnail_label")
-                                                thumbnail_layout = reply_container.property("reply_thumbnail_layout")
-                                                
-                                                # 找到 reply_content_layout
-                                                reply_content_layout = None
-                                                main_layout = reply_container.layout()
-                                                if main_layout and main_layout.count() > 0:
-                                                    first_item = main_layout.itemAt(0)
-                                                    if first_item and first_item.layout():
-                                                        reply_content_layout = first_item.layout()
-                                                
-                                                # 如果有 thumbnail_layout，完全删除它及其所有子控件
-                                                if thumbnail_layout and reply_content_layout:
-                                                    # 找到 thumbnail_layout 在 reply_content_layout 中的位置
-                                                    layout_index = -1
-                                                    for i in range(reply_content_layout.count()):
-                                                        item = reply_content_layout.itemAt(i)
-                                                        if item and item.layout() == thumbnail_layout:
-                                                            layout_index = i
-                                                            break
-
-                                                    if layout_index >= 0:
-                                                        # 先删除 thumbnail_layout 中的所有控件
-                                                        while thumbnail_layout.count() > 0:
-                                                            item = thumbnail_layout.takeAt(0)
-                                                            if not item:
-                                                                continue
-                                                            widget = item.widget()
-                                                            if widget:
-                                                                # 完全删除控件
-                                                                widget.hide()
-                                                                widget.setVisible(False)
-                                                                if isinstance(widget, QLabel):
-                                                                    widget.setPixmap(QPixmap())
-                                                                    widget.clear()
-                                                                widget.setFixedSize(0, 0)
-                                                                widget.setParent(None)
-                                                                widget.deleteLater()
-                                                            else:
-                                                                # 如果是子布局，也删除
-                                                                sub_layout = item.layout()
-                                                                if sub_layout:
-                                                                    while sub_layout.count() > 0:
-                                                                        sub_item = sub_layout.takeAt(0)
-                                                                        if sub_item:
-                                                                            sub_widget = sub_item.widget()
-                                                                            if sub_widget:
-                                                                                sub_widget.hide()
-                                                                                sub_widget.setVisible(False)
-                                                                                sub_widget.setParent(None)
-                                                                                sub_widget.deleteLater()
-                                                                    sub_layout.deleteLater()
-                                                        
-                                                        # 从 reply_content_layout 中移除 thumbnail_layout
-                                                        reply_content_layout.removeItem(thumbnail_layout)
-                                                        # 删除 thumbnail_layout 本身
-                                                        thumbnail_layout.deleteLater()
-                                                        
-                                                        # 创建新的文本标签并添加到相同位置
-                                                        new_reply_label = QLabel(new_text)
-                                                        new_reply_label.setStyleSheet("""
-                                                            QLabel {
-                                                                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                                                font-size: 12px;
-                                                                color: #4b5563;
-                                                                background-color: transparent;
-                                                            }
-                                                        """)
-                                                        new_reply_label.setWordWrap(True)
-                                                        new_reply_label.setMaximumWidth(300)
-                                                        reply_content_layout.insertWidget(layout_index, new_reply_label)
-                                                        
-                                                        # 更新 reply_label 属性
-                                                        reply_container.setProperty("reply_label", new_reply_label)
-                                                        reply_label = new_reply_label
-                                                else:
-                                                    # 如果没有 thumbnail_layout，直接更新 reply_label
-                                                    if reply_label:
-                                                        reply_label.setText(new_text)
-                                                    else:
-                                                        # 如果连 reply_label 都没有，创建一个新的
-                                                        if reply_content_layout:
-                                                            new_reply_label = QLabel(new_text)
-                                                            new_reply_label.setStyleSheet("""
-                                                                QLabel {
-                                                                    font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                                                    font-size: 12px;
-                                                                    color: #4b5563;
-                                                                    background-color: transparent;
-                                                                }
-                                                            """)
-                                                            new_reply_label.setWordWrap(True)
-                                                            new_reply_label.setMaximumWidth(300)  # 限制最大宽度
-                                                            reply_content_layout.addWidget(new_reply_label)
-                                                            reply_container.setProperty("reply_label", new_reply_label)
-                                                            reply_label = new_reply_label
-                                                
-                                                # 删除 thumbnail_label（如果还存在）
-                                                if thumbnail_label:
-                                                    thumbnail_label.hide()
-                                                    thumbnail_label.setVisible(False)
-                                                    thumbnail_label.setPixmap(QPixmap())
-                                                    thumbnail_label.clear()
-                                                    thumbnail_label.setFixedSize(0, 0)
-                                                    # 尝试从父布局中移除
-                                                    parent = thumbnail_label.parent()
-                                                    if parent:
-                                                        parent_layout = parent.layout()
-                                                        if parent_layout:
-                                                            parent_layout.removeWidget(thumbnail_label)
-                                                    thumbnail_label.setParent(None)
-                                                    thumbnail_label.deleteLater()
-                                                
-                                                # 清除所有属性
-                                                reply_container.setProperty("reply_thumbnail_label", None)
-                                                reply_container.setProperty("reply_thumbnail_layout", None)
-                                                
-                                                # 使用 findChildren 确保找到并删除所有图片标签
-                                                all_labels = reply_container.findChildren(QLabel)
-                                                for label in all_labels:
-                                                    # 只处理有图片的标签，且不是新的文本标签
-                                                    if label.pixmap() and label is not reply_label:
-                                                        label.hide()
-                                                        label.setVisible(False)
-                                                        label.setPixmap(QPixmap())
-                                                        label.clear()
-                                                        label.setFixedSize(0, 0)
-                                                        # 尝试从父布局中移除
-                                                        parent = label.parent()
-                                                        if parent:
-                                                            parent_layout = parent.layout()
-                                                            if parent_layout:
-                                                                parent_layout.removeWidget(label)
-                                                        label.setParent(None)
-                                                        label.deleteLater()
-                                                
-                                                # 强制更新整个引用容器和父控件
-                                                reply_container.update()
-                                                reply_container.repaint()
-                                                if w:
-                                                    w.update()
-                                                    w.repaint()
-                                
-                                # 已更新现有消息，直接返回，不创建新消息
-                                return
-        except Exception as e:
-            logging.error(f"更新撤回消息失败: {e}", exc_info=True)
-            # 如果更新失败，继续创建新的撤回提示消息
-    
-    # 如果没有找到现有消息，或者不是撤回消息，继续正常流程
-    # 处理撤回状态 - 如果是撤回消息，只显示居中灰色小字，不显示气泡和头像
-    if is_recalled:
-        # 隐藏时间标签（如果有）
-        if time_label:
-            time_label.setVisible(False)
-        
-        # 判断是自己撤回还是对方撤回
-        current_user_id = getattr(main_window, 'user_id', None)
-        if current_user_id is not None and from_user_id is not None:
-            try:
-                is_self_recalled = (int(from_user_id) == int(current_user_id))
-            except (ValueError, TypeError):
-                is_self_recalled = (from_user_id == current_user_id)
-        else:
-            is_self_recalled = (from_user_id == current_user_id)
-        
-        if is_self_recalled:
-            recall_text = "你撤回了一条消息"
-        else:
-            username = from_username or "用户"
-            if from_user_id and not from_username:
-                if hasattr(main_window, "username"):
-                    username = main_window.username
-                else:
-                    try:
-                        from client.login.login_status_manager import check_login_status
-                        _, _, current_username = check_login_status()
-                        if current_username:
-                            username = current_username
-                    except Exception:
-                        pass
-            recall_text = f"{username}撤回了一条消息"
-        
-        # 创建撤回提示标签（灰色居中）- 一行灰色小字，独立显示，不显示气泡和头像
-        recall_label = QLabel(recall_text)
-        recall_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        recall_label.setStyleSheet("""
-            QLabel {
-                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                font-size: 11px;
-                color: #9ca3af;
-                padding: 4px 0px;
-                background-color: transparent;
-            }
-        """)
-        # 直接添加到布局，不显示气泡和头像
-        v_layout.addWidget(recall_label)
-
-        # 同步更新所有引用了这条消息的引用块文案
-        try:
-            recalled_id = None
-            if message_id is not None:
-                try:
-                    recalled_id = int(message_id)
-                except (ValueError, TypeError):
-                    recalled_id = message_id
-            if recalled_id is not None and hasattr(main_window, "chat_layout"):
-                parent_layout = main_window.chat_layout
-                for i in range(parent_layout.count()):
-                    item = parent_layout.itemAt(i)
-                    w = item.widget() if item else None
-                    if not w:
-                        continue
-                    ref_id = w.property("reply_to_message_id")
-                    if ref_id is None:
-                        continue
-                    try:
-                        ref_id_norm = int(ref_id)
-                    except (ValueError, TypeError):
-                        ref_id_norm = ref_id
-                    if ref_id_norm == recalled_id:
-                        reply_container = w.property("reply_container")
-                        if reply_container:
-                            sender_name = reply_container.property("reply_sender_name") or ""
-                            reply_label = reply_container.property("reply_label")
-                            new_text = "该引用消息已被撤回"
-                            if sender_name:
-                                new_text = f"{sender_name}: {new_text}"
-                            
-                            # 先找到并删除所有图片相关的控件
-                            thumbnail_label = reply_container.property("reply_thumbnail_label")
-                            thumbnail_layout = reply_container.property("reply_thumbnail_layout")
-                            
-                            # 找到 reply_content_layout
-                            reply_content_layout = None
-                            main_layout = reply_container.layout()
-                            if main_layout and main_layout.count() > 0:
-                                first_item = main_layout.itemAt(0)
-                                if first_item and first_item.layout():
-                                    reply_content_layout = first_item.layout()
-                            
-                            # 如果有 thumbnail_layout，完全删除它及其所有子控件
-                            if thumbnail_layout and reply_content_layout:
-                                # 找到 thumbnail_layout 在 reply_content_layout 中的位置
-                                layout_index = -1
-                                for i in range(reply_content_layout.count()):
-                                    item = reply_content_layout.itemAt(i)
-                                    if item and item.layout() == thumbnail_layout:
-                                        layout_index = i
-                                        break
-                                
-                                if layout_index >= 0:
-                                    # 先删除 thumbnail_layout 中的所有控件
-                                    while thumbnail_layout.count() > 0:
-                                        item = thumbnail_layout.takeAt(0)
-                                        if item:
-                                            widget = item.widget()
-                                            if widget:
-                                                # 完全删除控件
-                                                widget.hide()
-                                                widget.setVisible(False)
-                                                if isinstance(widget, QLabel):
-                                                    widget.setPixmap(QPixmap())
-                                                    widget.clear()
-                                                widget.setFixedSize(0, 0)
-                                                widget.setParent(None)
-                                                widget.deleteLater()
-                                            else:
-                                                # 如果是子布局，也删除
-                                                sub_layout = item.layout()
-                                                if sub_layout:
-                                                    while sub_layout.count() > 0:
-                                                        sub_item = sub_layout.takeAt(0)
-                                                        if sub_item:
-                                                            sub_widget = sub_item.widget()
-                                                            if sub_widget:
-                                                                sub_widget.hide()
-                                                                sub_widget.setVisible(False)
-                                                                sub_widget.setParent(None)
-                                                                sub_widget.deleteLater()
-                                                    sub_layout.deleteLater()
-                                    
-                                    # 从 reply_content_layout 中移除 thumbnail_layout
-                                    reply_content_layout.removeItem(thumbnail_layout)
-                                    # 删除 thumbnail_layout 本身
-                                    thumbnail_layout.deleteLater()
-                                    
-                                    # 创建新的文本标签并添加到相同位置
-                                    new_reply_label = QLabel(new_text)
-                                    new_reply_label.setStyleSheet("""
-                                        QLabel {
-                                            font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                            font-size: 12px;
-                                            color: #4b5563;
-                                            background-color: transparent;
-                                        }
-                                    """)
-                                    new_reply_label.setWordWrap(True)
-                                    new_reply_label.setMaximumWidth(300)  # 限制最大宽度
-                                    reply_content_layout.insertWidget(layout_index, new_reply_label)
-                                    
-                                    # 更新 reply_label 属性
-                                    reply_container.setProperty("reply_label", new_reply_label)
-                                    reply_label = new_reply_label
-                            else:
-                                # 如果没有 thumbnail_layout，直接更新 reply_label
-                                if reply_label:
-                                    reply_label.setText(new_text)
-                                else:
-                                    # 如果连 reply_label 都没有，创建一个新的
-                                    if reply_content_layout:
-                                        new_reply_label = QLabel(new_text)
-                                        new_reply_label.setStyleSheet("""
-                                            QLabel {
-                                                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                                font-size: 12px;
-                                                color: #4b5563;
-                                                background-color: transparent;
-                                            }
-                                        """)
-                                        new_reply_label.setWordWrap(True)
-                                        new_reply_label.setMaximumWidth(300)  # 限制最大宽度
-                                        reply_content_layout.addWidget(new_reply_label)
-                                        reply_container.setProperty("reply_label", new_reply_label)
-                                        reply_label = new_reply_label
-                            
-                            # 删除 thumbnail_label（如果还存在）
-                            if thumbnail_label:
-                                thumbnail_label.hide()
-                                thumbnail_label.setVisible(False)
-                                thumbnail_label.setPixmap(QPixmap())
-                                thumbnail_label.clear()
-                                thumbnail_label.setFixedSize(0, 0)
-                                # 尝试从父布局中移除
-                                parent = thumbnail_label.parent()
-                                if parent:
-                                    parent_layout = parent.layout()
-                                    if parent_layout:
-                                        parent_layout.removeWidget(thumbnail_label)
-                                thumbnail_label.setParent(None)
-                                thumbnail_label.deleteLater()
-                            
-                            # 清除所有属性
-                            reply_container.setProperty("reply_thumbnail_label", None)
-                            reply_container.setProperty("reply_thumbnail_layout", None)
-                            
-                            # 使用 findChildren 确保找到并删除所有图片标签
-                            all_labels = reply_container.findChildren(QLabel)
-                            for label in all_labels:
-                                # 只处理有图片的标签，且不是新的文本标签
-                                if label.pixmap() and label is not reply_label:
-                                    label.hide()
-                                    label.setVisible(False)
-                                    label.setPixmap(QPixmap())
-                                    label.clear()
-                                    label.setFixedSize(0, 0)
-                                    # 尝试从父布局中移除
-                                    parent = label.parent()
-                                    if parent:
-                                        parent_layout = parent.layout()
-                                        if parent_layout:
-                                            parent_layout.removeWidget(label)
-                                    label.setParent(None)
-                                    label.deleteLater()
-                            
-                            # 强制更新整个引用容器和父控件
-                            reply_container.update()
-                            reply_container.repaint()
-                            if w:
-                                w.update()
-                                w.repaint()
-        except Exception:
-            # 更新引用块失败不影响主流程
-            pass
-
-        # 不创建气泡和头像，直接返回
-        return
-    
-    # 气泡 + 头像 行（正常消息才显示）
-    row = QHBoxLayout()
-    row.setContentsMargins(0, 0, 0, 0)
-    row.setSpacing(6)
-
-    # 头像
-    avatar_label = QLabel()
-    avatar_label.setFixedSize(32, 32)
-    if from_self and main_window.user_avatar_label.pixmap():
-        pm = main_window.user_avatar_label.pixmap().scaled(
-            32, 32,
-            Qt.AspectRatioMode.KeepAspectRatio,
-            Qt.TransformationMode.SmoothTransformation,
-        )
-        avatar_label.setPixmap(pm)
-    else:
-        pm = None
-        # 优先使用服务器下发的 avatar_base64
-        if avatar_base64:
-            try:
-                b64 = avatar_base64
-                if b64.startswith("data:image"):
-                    b64 = b64.split(",", 1)[1]
-                pm = QPixmap()
-                if pm.loadFromData(base64.b64decode(b64)):
-                    pm = pm.scaled(32, 32, Qt.AspectRatioMode.KeepAspectRatio,
-                                   Qt.TransformationMode.SmoothTransformation)
-            except Exception:
-                pm = None
-        if pm is None:
-            default_bytes = get_default_avatar()
-            if default_bytes:
-                pm = QPixmap()
-                if pm.loadFromData(default_bytes):
-                    pm = pm.scaled(32, 32, Qt.AspectRatioMode.KeepAspectRatio,
-                                   Qt.TransformationMode.SmoothTransformation)
-
-        if pm:
-            cropped = QPixmap(32, 32)
-            cropped.fill(Qt.GlobalColor.transparent)
-            p = QPainter(cropped)
-            p.setRenderHint(QPainter.RenderHint.Antialiasing)
-            clip_path = QPainterPath()
-            clip_path.addEllipse(0, 0, 32, 32)
-            p.setClipPath(clip_path)
-            p.drawPixmap(0, 0, pm)
-            p.end()
-            avatar_label.setPixmap(cropped)
-
-    if from_self:
-        bubble_label = ChatBubble(
-            effective_content,
-            background=QColor("#dcf8c6"),
-            text_color=QColor("#0f172a"),
-            max_width=420,
-            align_right=True,
-            rich_text=rich_flag,
-        )
-        avatar_label.setStyleSheet("border-radius: 16px;")
-        row.addStretch()
-        row.addWidget(bubble_label)
-        row.addWidget(avatar_label)
-    else:
-        bubble_label = ChatBubble(
-            effective_content,
-            background=QColor("#ffffff"),
-            text_color=QColor("#111827"),
-            border_color=QColor("#e5e7eb"),
-            max_width=420,
-            align_right=False,
-            rich_text=rich_flag,
-        )
-        avatar_label.setStyleSheet("border-radius: 16px;")
-        row.addWidget(avatar_label)
-        row.addWidget(bubble_label)
-        row.addStretch()
-
-    v_layout.addLayout(row)
-    
-    # 处理引用消息显示（引用卡片）：在主布局中单独一行显示引用块，放在正文气泡下方
-    if reply_to_message_id and reply_to_message and not is_recalled:
-        # 创建引用消息容器（浅灰卡片 + 左侧色条），注意：样式只作用于容器本身，避免子控件“各自被包裹”
-        reply_container = QWidget()
-        reply_container.setObjectName("reply_container")
-        reply_container.setStyleSheet("""
-            QWidget#reply_container {
-                background-color: #f3f4f6;
-                border-radius: 10px;
-                margin-top: 6px;
-                border: 1px solid #e5e7eb;
-            }
-        """)
-        # 保证整体有一个合理的最小高度，不会被上下压扁（图片引用会在创建缩略图后再抬高）
-        reply_container.setMinimumHeight(30)
-        reply_layout = QHBoxLayout(reply_container)
-        # 给引用卡片留足内边距，避免“字顶到边/溢出”的观感，并让内部内容在气泡内垂直居中
-        reply_layout.setContentsMargins(10, 8, 10, 8)
-        reply_layout.setSpacing(8)
-        reply_layout.setAlignment(Qt.AlignmentFlag.AlignVCenter)
-
-        # 左侧竖色条，增强层次感
-        left_bar = QLabel()
-        left_bar.setFixedWidth(3)
-        left_bar.setMinimumHeight(26)
-        left_bar.setStyleSheet("""
-            QLabel {
-                background-color: #60a5fa;
-                border-radius: 999px;
-            }
-        """)
-        reply_layout.addWidget(left_bar)
-
-        reply_content_layout = QVBoxLayout()
-        reply_content_layout.setContentsMargins(0, 0, 0, 0)
-        reply_content_layout.setSpacing(2)
-
-        # 获取引用消息的发送者信息
-        reply_sender_name = reply_to_username or "用户"
-        # 如果是当前用户自己发送的消息，用“我”替代用户名，效果更贴近聊天习惯
-        try:
-            current_username = getattr(main_window, "username", None)
-            if current_username and reply_sender_name == current_username:
-                reply_sender_name = "我"
-        except Exception:
-            pass
-        # 检查引用消息是否被撤回
-        reply_text = reply_to_message
-        if reply_text == "[消息已撤回]":
-            reply_text = "该引用消息已被撤回"
-        
-        # 尝试为图片引用查找原始 base64 内容（data:image/...），用于生成缩略图
-        original_image_data: str | None = None
-        if reply_to_message_type == "image" and reply_to_message_id is not None:
-            try:
-                msg_map = getattr(main_window, "_message_widgets_map", None)
-                if isinstance(msg_map, dict):
-                    # 优先从 _message_widgets_map 中查找
-                    # 注意：需要同时尝试整数和字符串键，因为存储时可能类型不一致
-                    original_widget = None
-                    
-                    # 先尝试直接查找（整数或字符串键）
-                    if reply_to_message_id in msg_map:
-                        original_widget = msg_map[reply_to_message_id][0]
-                    # 如果没找到，尝试字符串键
-                    elif isinstance(reply_to_message_id, int):
-                        str_key = str(reply_to_message_id)
-                        if str_key in msg_map:
-                            original_widget = msg_map[str_key][0]
-                    # 如果还没找到，尝试整数键
-                    elif isinstance(reply_to_message_id, str):
-                        try:
-                            int_key = int(reply_to_message_id)
-                            if int_key in msg_map:
-                                original_widget = msg_map[int_key][0]
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    # 如果找到了原始消息控件，尝试获取原始图片数据
-                    if original_widget:
-                        raw_image = original_widget.property("raw_image_message")
-                        if isinstance(raw_image, str) and raw_image.startswith("data:image"):
-                            original_image_data = raw_image
-            except Exception:
-                original_image_data = None
-        
-        # 初始化 reply_label，确保在所有分支中都有定义
-        reply_label = None
-        thumbnail_label = None  # 初始化缩略图标签变量
-        
-        # 如果是图片消息，显示更美观的“左文右图”缩略图布局
-        # 优先使用 original_image_data（从原消息控件里取出的 data:image/...），
-        # 如果没有，再尝试使用 reply_text 本身。
-        if reply_to_message_type == "image" and (original_image_data or (reply_text and reply_text.startswith("data:image"))):
-            try:
-                # 解析base64图片
-                data_source = original_image_data or reply_text
-                b64_part = data_source.split(",", 1)[1] if "," in data_source else ""
-                raw = base64.b64decode(b64_part)
-                image = QImage.fromData(raw)
-                if not image.isNull():
-                    pixmap = QPixmap.fromImage(image)
-                    # 创建 60x60 的缩略图（紧凑且不撑破引用块）
-                    thumbnail = pixmap.scaled(60, 60, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                    
-                    # 创建缩略图标签
-                    thumbnail_label = QLabel()
-                    thumbnail_label.setFixedSize(60, 60)
-                    thumbnail_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                    thumbnail_label.setPixmap(thumbnail)
-                    thumbnail_label.setStyleSheet("""
-                        QLabel {
-                            border-radius: 6px;
-                            background-color: transparent;
-                            border: 1px solid #d1d5db;
-                        }
-                    """)
-                    # 图片引用块高度至少能容纳缩略图
-                    reply_container.setMinimumHeight(68)
-                    # 立即保存缩略图标签到属性中，方便撤回时隐藏
-                    reply_container.setProperty("reply_thumbnail_label", thumbnail_label)
-                    
-                    # 创建文本标签（显示发送者名称），这个标签也作为 reply_label 用于撤回时更新
-                    # 样式参考你给的示例：仅显示 "用户名:"，不再额外加"图片"文字
-                    sender_label = QLabel(f"{reply_sender_name}：")
-                    sender_label.setStyleSheet("""
-                        QLabel {
-                            font-family: "Microsoft YaHei", "SimHei", "Arial";
-                        font-size: 12px;
-                            color: #111827;  /* 深色文字，保证清晰可见 */
-                            background-color: transparent;
-                        }
-                    """)
-                    sender_label.setAlignment(Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft)
-                    # 限制最大宽度，避免整块引用气泡被用户名拉得太长
-                    sender_label.setMaximumWidth(160)
-                    reply_label = sender_label  # 使用 sender_label 作为 reply_label
-                    
-                    # 水平布局：发送者名称 + 缩略图（紧凑排列，中间不要太大空白）
-                    thumbnail_layout = QHBoxLayout()
-                    thumbnail_layout.setContentsMargins(0, 0, 0, 0)
-                    thumbnail_layout.setSpacing(8)
-                    thumbnail_layout.addWidget(sender_label)
-                    thumbnail_layout.addWidget(thumbnail_label)
-                    # 保存 thumbnail_layout 到属性中，方便撤回时处理
-                    reply_container.setProperty("reply_thumbnail_layout", thumbnail_layout)
-                    
-                    reply_content_layout.addLayout(thumbnail_layout)
-                else:
-                    # 图片解析失败，显示文本
-                    reply_label = QLabel(f"{reply_sender_name}: [图片]")
-                    reply_label.setStyleSheet("""
-                        QLabel {
-                            font-family: "Microsoft YaHei", "SimHei", "Arial";
-                            font-size: 12px;
-                            color: #111827;
-                            background-color: transparent;
-                        }
-                    """)
-                    reply_label.setWordWrap(True)
-                    reply_content_layout.addWidget(reply_label)
-            except Exception as e:
-                logging.error(f"解析引用图片失败: {e}", exc_info=True)
-                # 解析失败，显示文本
-                reply_label = QLabel(f"{reply_sender_name}: [图片]")
-                reply_label.setStyleSheet("""
-                    QLabel {
-                        font-family: "Microsoft YaHei", "SimHei", "Arial";
-                        font-size: 12px;
-                        color: #111827;
-                        background-color: transparent;
-                    }
-                """)
-                reply_label.setWordWrap(True)
-                reply_label.setMaximumWidth(300)  # 限制最大宽度
-                reply_content_layout.addWidget(reply_label)
-        else:
-            # 文本消息，单行显示：`用户名: 内容预览`
-            if reply_text and len(reply_text) > 80:
-                reply_text = reply_text[:80] + "..."
-
-            display_text = f"{reply_sender_name}: {reply_text}"
-            reply_label = QLabel(display_text)
-            reply_label.setStyleSheet("""
-                QLabel {
-                    font-family: "Microsoft YaHei", "SimHei", "Arial";
-                    font-size: 12px;
-                    color: #111827;  /* 深色文字 */
-                    background-color: transparent;
-                }
-            """)
-            # 文本引用允许换行（更像微信的引用卡片），避免长文本挤出气泡
-            reply_label.setWordWrap(True)
-            reply_label.setMinimumHeight(20)
-            reply_label.setMaximumWidth(320)
-            # 在引用气泡内部左对齐、垂直方向居中
-            reply_label.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
-            reply_label.setTextInteractionFlags(Qt.TextInteractionFlag.NoTextInteraction)
-            reply_content_layout.addWidget(reply_label)
-
-        # 把引用信息存到容器属性里，方便后续在被引用消息撤回时更新文案/缩略图
-        reply_container.setProperty("reply_sender_name", reply_sender_name)
-        if reply_label:
-            reply_container.setProperty("reply_label", reply_label)
-        # 缩略图标签已在创建时保存到属性中（如果存在的话）
-
-        reply_layout.addLayout(reply_content_layout)
-
-        # 让引用卡片宽度更“饱满”，但封顶避免横向太长
-        reply_container.setMinimumWidth(160)
-        reply_container.setMaximumWidth(320)
-
-        # 引用块单独占一行，与消息气泡左对齐（放在正文气泡下方）
-        reply_row = QHBoxLayout()
-        reply_row.setContentsMargins(0, 0, 0, 0)
-        reply_row.setSpacing(6)
-
-        # 引用块始终与消息气泡的左边缘对齐
-        # 对于用户消息，消息气泡右对齐，但引用块需要与气泡左边缘对齐
-        # 对于客服消息，消息气泡左对齐，引用块也与气泡左边缘对齐
-        if from_self:
-            # 用户消息：引用块右对齐，与消息气泡左边缘对齐
-            reply_row.addStretch()
-            reply_row.addWidget(reply_container)
-            reply_row.addSpacing(38)  # 32px 头像 + 6px spacing
-        else:
-            # 客服消息：引用块左对齐，与消息气泡左边缘对齐
-            reply_row.addSpacing(38)  # 32px 头像 + 6px spacing
-            reply_row.addWidget(reply_container)
-            reply_row.addStretch()
-
-        # 插入到气泡行之后（正文下方）
-        v_layout.addLayout(reply_row)
-        
-        # 存储引用块的引用，以便撤回时能够找到并隐藏
-        message_widget.setProperty("reply_container", reply_container)
-        # 存储引用消息ID，以便在引用消息被撤回时更新
-        message_widget.setProperty("reply_to_message_id", reply_to_message_id)
-    
-    # 若识别到 URL，则在当前消息下方追加简单的链接预览卡片
-    if link_urls:
-        preview_container = QWidget()
-        preview_layout = QHBoxLayout(preview_container)
-        preview_layout.setContentsMargins(40 if not from_self else 0, 4, 0 if from_self else 40, 0)
-        preview_layout.setSpacing(0)
-
+    message = ChatMessage(
+        KIND_TEXT,
+        content,
+        from_self=from_self,
+        message_id=message_id,
+        html=html,
+        rich=html is not None,
+        # 用户消息：上方一行时间（右对齐）
+        time_text=_self_time_text(message_id, message_created_time) if from_self else "",
+        # 消息创建时间（用于撤回时间检查）；乐观展示的消息使用当前时间
+        created_time=message_created_time or datetime.now().isoformat(),
+        from_user_id=from_user_id,
+        from_username=from_username,
         # 只展示第一个链接的预览，避免过于臃肿
-        url = link_urls[0]
-        from urllib.parse import urlparse
-
-        parsed = urlparse(url)
-        host = parsed.netloc or parsed.path
-        display_host = host if len(host) <= 32 else host[:29] + "..."
-
-        card = QWidget()
-        card.setObjectName("linkPreviewCard")
-        card.setStyleSheet("""
-            #linkPreviewCard {
-                background: qlineargradient(x1:0, y1:0, x2:0, y2:1, 
-                    stop:0 #ffffff, stop:1 #f8fafc);
-                border-radius: 12px;
-                border: 1px solid #e2e8f0;
-                max-width: 320px;
-            }
-            #linkPreviewCard:hover {
-                background: qlineargradient(x1:0, y1:0, x2:0, y2:1, 
-                    stop:0 #f8fafc, stop:1 #f1f5f9);
-                border: 1px solid #cbd5e1;
-                transform: translateY(-1px);
-            }
-        """)
-        card_layout = QVBoxLayout(card)
-        card_layout.setContentsMargins(14, 10, 14, 10)
-        card_layout.setSpacing(6)
-
-        # 添加图标和标题行
-        header_layout = QHBoxLayout()
-        header_layout.setContentsMargins(0, 0, 0, 0)
-        header_layout.setSpacing(6)
-        
-        icon_label = QLabel("🔗")
-        icon_label.setStyleSheet("""
-            QLabel {
-                font-size: 14px;
-            }
-        """)
-
-        title_label = QLabel("链接预览")
-        title_label.setStyleSheet("""
-            QLabel {
-                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                font-size: 11px;
-                font-weight: 600;
-                color: #64748b;
-                letter-spacing: 0.5px;
-            }
-        """)
-        
-        header_layout.addWidget(icon_label)
-        header_layout.addWidget(title_label)
-        header_layout.addStretch()
-        
-        url_label = QLabel(display_host)
-        url_label.setStyleSheet("""
-            QLabel {
-                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                font-size: 12px;
-                color: #2563eb;
-                font-weight: 500;
-                padding: 2px 0px;
-            }
-        """)
-        url_label.setWordWrap(True)
-
-        card_layout.addLayout(header_layout)
-        card_layout.addWidget(url_label)
-
-        # 点击整个卡片在系统浏览器中打开链接
-        def open_in_browser(*_):
-            QDesktopServices.openUrl(QUrl(url))
-
-        card.mousePressEvent = lambda event: open_in_browser(event)
-
-        if from_self:
-            preview_layout.addStretch()
-            preview_layout.addWidget(card)
-        else:
-            preview_layout.addWidget(card)
-            preview_layout.addStretch()
+        link_url=link_urls[0] if link_urls else None,
+    )
 
-        v_layout.addLayout(preview_layout)
+    message.avatar = _message_avatar(main_window, from_self, avatar_base64, message)
 
-    # 存储消息ID到消息控件中（用于撤回和引用），统一转换为整数（若可）
-    normalized_msg_id = None
-    if message_id is not None:
-        try:
-            normalized_msg_id = int(message_id)
-        except (ValueError, TypeError):
-            normalized_msg_id = message_id
-    message_widget.setProperty("message_id", normalized_msg_id)
-    
-    # 保存消息创建时间（用于撤回时间检查）
-    if message_created_time:
-        message_widget.setProperty("message_created_time", message_created_time)
-    else:
-        # 如果没有提供创建时间，使用当前时间（用于乐观展示的消息）
-        message_widget.setProperty("message_created_time", datetime.now().isoformat())
-    
-    # 为消息控件添加右键菜单
-    # 用户端：用户自己的消息可以撤回+引用，客服消息只能引用
-    # 注意：即使用户消息暂时没有message_id（乐观展示），也要显示右键菜单，但撤回功能需要等待message_id
-    if not is_recalled:
-        def show_context_menu(pos: QPoint):
-            # customContextMenuRequested 信号传递的是 QPoint，不是事件对象
-            menu = QMenu(message_widget)
-            # 美化右键菜单样式
-            menu.setStyleSheet("""
-                QMenu {
-                    background-color: #ffffff;
-                    border: 1px solid #e5e7eb;
-                    border-radius: 8px;
-                    padding: 4px;
-                    font-family: "Microsoft YaHei", "SimHei", "Arial";
-                    font-size: 13px;
-                }
-                QMenu::item {
-                    padding: 8px 20px;
-                    border-radius: 4px;
-                    color: #1f2937;
-                    min-width: 120px;
-                }
-                QMenu::item:selected {
-                    background-color: #f3f4f6;
-                    color: #111827;
-                }
-                QMenu::item:disabled {
-                    color: #9ca3af;
-                }
-            """)
-            
-            # 引用回复（所有消息都可以引用）
-            reply_action = menu.addAction("引用回复")
-            reply_action.setEnabled(True)
-            
-            def reply_message_action():
-                # 设置引用消息ID和内容
-                # 从message_widget获取message_id（可能为None，但引用功能不需要message_id）
-                current_msg_id = message_widget.property("message_id")
-                
-                # 验证消息ID是否有效（必须是正整数）
-                valid_msg_id = None
-                if current_msg_id is not None:
-                    try:
-                        msg_id_int = int(current_msg_id)
-                        # 数据库ID从1开始，所以允许 >= 1
-                        if msg_id_int > 0:
-                            # 不再通过 HTTP 接口验证是否存在，由服务端在收到引用 ID 后自行校验
-                                valid_msg_id = msg_id_int
-                    except (ValueError, TypeError):
-                        pass
-                
-                # 如果 message_id 无效，不再弹出阻塞弹窗，允许用户继续引用
-                # 这种情况下仅作为普通回复发送（不携带 reply_to_message_id），前端仍会显示引用提示
-                # 这样即使消息刚发送还未绑定 ID，用户也可以顺畅引用自己的消息
-                main_window._reply_to_message_id = valid_msg_id  # 可能为 None
-                main_window._reply_to_message_text = content
-                # 设置引用消息类型为文本（表情也是文本）
-                main_window._reply_to_message_type = "text"
-                # 记录被引用的控件，发送前可再次读取最新的 message_id（避免乐观消息尚未分配ID）
-                main_window._reply_to_widget = message_widget
-                # 获取被引用消息的发送者用户名
-                main_window._reply_to_username = from_username or (from_self and "我" or "用户")
-                # 在输入框显示引用提示
-                if hasattr(main_window, "chat_input"):
-                    sender_name = main_window._reply_to_username
-                    preview = content[:30] + ('...' if len(content) > 30 else '')
-                    placeholder = f"回复 {sender_name}：{preview}"
-                    main_window.chat_input.setPlaceholderText(placeholder)
-                    main_window.chat_input.setFocus()
-            
-            reply_action.triggered.connect(reply_message_action)
-            
-            # 撤回消息（只有自己发送的消息才能撤回）
-            if from_self:
-                recall_action = menu.addAction("撤回消息")
-                # 动态检查message_id（从widget属性获取，可能已经被轮询更新）
-                current_msg_id = message_widget.property("message_id")
-                message_created_time = message_widget.property("message_created_time")
-                
-                # 检查消息是否超过2分钟
-                can_recall = False
-                if current_msg_id and message_created_time:
-                    try:
-                        from datetime import timedelta
-                        created_time = datetime.fromisoformat(message_created_time.replace('Z', '+00:00'))
-                        time_diff = datetime.now() - created_time.replace(tzinfo=None)
-                        can_recall = time_diff <= timedelta(minutes=2)
-                    except Exception:
-                        # 如果时间解析失败，允许撤回（由后端验证）
-                        can_recall = True
-                elif current_msg_id:
-                    # 如果没有创建时间，允许撤回（由后端验证）
-                    can_recall = True
-                
-                if current_msg_id and can_recall:
-                    recall_action.setEnabled(True)
-                else:
-                    recall_action.setEnabled(False)
-                    if not current_msg_id:
-                        recall_action.setToolTip("消息ID尚未同步，请稍后再试")
-                    else:
-                        recall_action.setToolTip("消息已超过2分钟，无法撤回")
-                
-                def recall_message_action():
-                    # 再次检查message_id（确保是最新的）
-                    current_msg_id = message_widget.property("message_id")
-                    if not current_msg_id:
-                        # 不弹窗，直接返回（因为按钮已禁用）
-                        return
-                    
-                    # 再次检查时间（防止在检查后到点击之间超过2分钟）
-                    message_created_time = message_widget.property("message_created_time")
-                    if message_created_time:
-                        try:
-                            from datetime import timedelta
-                            created_time = datetime.fromisoformat(message_created_time.replace('Z', '+00:00'))
-                            time_diff = datetime.now() - created_time.replace(tzinfo=None)
-                            if time_diff > timedelta(minutes=2):
-                                # 超过2分钟，直接禁用，不弹窗
-                                recall_action.setEnabled(False)
-                                return
-                        except Exception:
-                            pass
-                    
-                    # 使用 WebSocket 撤回消息
-                    from client.utils.websocket_helper import recall_message_via_websocket
-                    
-                    try:
-                        resp = recall_message_via_websocket(main_window, current_msg_id)
-                        if resp.get("success"):
-                            # 判断是自己撤回还是对方撤回
-                            # 自己撤回的消息，显示"你撤回了一条消息"
-                            recall_text = "你撤回了一条消息"
-                            
-                            # 隐藏整个消息行（包括头像和气泡）以及引用块，显示撤回提示
-                            parent_layout = message_widget.layout()
-                            if parent_layout:
-                                # 找到包含bubble的row布局
-                                row_layout = None
-                                row_index = -1
-                                for i in range(parent_layout.count()):
-                                    item = parent_layout.itemAt(i)
-                                    if item and item.layout():
-                                        # 检查这个布局中是否包含bubble
-                                        layout = item.layout()
-                                        for j in range(layout.count()):
-                                            layout_item = layout.itemAt(j)
-                                            if layout_item and layout_item.widget() == bubble_label:
-                                                row_layout = layout
-                                                row_index = i
-                                                break
-                                        if row_layout:
-                                            break
-                                
-                                # 隐藏包含气泡的row布局中的所有控件（包括头像和气泡）
-                                if row_layout:
-                                    for i in range(row_layout.count()):
-                                        item = row_layout.itemAt(i)
-                                        if item and item.widget():
-                                            item.widget().setVisible(False)
-                                
-                                # 隐藏引用块（如果存在）
-                                reply_container = message_widget.property("reply_container")
-                                if reply_container:
-                                    reply_container.setVisible(False)
-                            
-                            # 隐藏时间标签（如果有）
-                            time_label = message_widget.property("time_label")
-                            if time_label:
-                                time_label.setVisible(False)
-                            
-                            # 创建撤回提示标签（灰色居中）- 简化样式，只显示一行灰色小字
-                            recall_label = QLabel(recall_text)
-                            recall_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                            recall_label.setStyleSheet("""
-                                QLabel {
-                                    font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                    font-size: 11px;
-                                    color: #9ca3af;
-                                    padding: 4px 0px;
-                                    background-color: transparent;
-                                }
-                            """)
-                            
-                            # 在row布局位置插入撤回提示
-                            if row_index >= 0:
-                                parent_layout.insertWidget(row_index, recall_label)
-                            else:
-                                # 如果找不到row，直接添加到末尾
-                                parent_layout.addWidget(recall_label)
-                            
-                            message_widget.setProperty("message_id", None)  # 标记为已撤回
-                            message_widget.setProperty("is_recalled", True)  # 标记为已撤回
-                        else:
-                            # 撤回失败，但不弹窗（后端会返回具体原因，但用户已经看到按钮被禁用了）
-                            error_msg = resp.get("message", "撤回失败")
-                            logging.warning(f"撤回消息失败: {error_msg}")
-                    except Exception as e:
-                        # 不弹窗，只记录日志
-                        logging.error(f"撤回消息时发生错误: {e}", exc_info=True)
-                
-                recall_action.triggered.connect(recall_message_action)
-            
-            # 将局部坐标转换为全局坐标
-            global_pos = message_widget.mapToGlobal(pos)
-            menu.exec(global_pos)
-        
-        message_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        message_widget.customContextMenuRequested.connect(show_context_menu)
-        
-        # 存储消息ID和控件引用，用于更新撤回状态和消息查找
-        # 即使 message_id 是 None（乐观展示），也要注册到 _message_widgets_map，以便后续更新
-        if not hasattr(main_window, "_message_widgets_map"):
-            main_window._message_widgets_map = {}
-        
-        # 如果 message_id 不为 None，先检查是否已经存在该 message_id 的消息（避免重复显示）
-        if message_id is not None:
-            if message_id in main_window._message_widgets_map:
-                # 消息已经存在，不重复添加
-                return
-            main_window._message_widgets_map[message_id] = (message_widget, bubble_label)
-            message_widget.setProperty("message_id", message_id)
-        else:
-            # 乐观展示时，使用 None 作为临时 key，后续收到 message_id 后会更新
-            # 但要注意：如果已经有 None 的消息，需要先移除（避免覆盖）
-            if None in main_window._message_widgets_map:
-                # 如果已经有乐观展示的消息，检查是否是同一条消息（通过内容匹配）
-                existing_widget, existing_bubble = main_window._message_widgets_map[None]
-                # 如果内容匹配，不重复添加；否则移除旧的（可能是之前的消息）
-                try:
-                    if hasattr(existing_bubble, 'toPlainText'):
-                        existing_text = existing_bubble.toPlainText()
-                    elif hasattr(existing_bubble, 'text'):
-                        existing_text = existing_bubble.text()
-                    else:
-                        existing_text = ""
-                    import re
-                    existing_clean = re.sub(r'<[^>]+>', '', existing_text).strip()
-                    content_clean = re.sub(r'<[^>]+>', '', effective_content).strip()
-                    if existing_clean == content_clean:
-                        # 内容相同，不重复添加
-                        return
-                except Exception:
-                    pass
-                # 移除旧的乐观展示消息
-                del main_window._message_widgets_map[None]
-            main_window._message_widgets_map[None] = (message_widget, bubble_label)
-            message_widget.setProperty("message_id", None)
-    
-    main_window.chat_layout.addWidget(message_widget)
+    # 引用卡片放在正文气泡下方
+    if reply_to_message_id and reply_to_message:
+        _set_reply_preview(
+            main_window, message, reply_to_message_id, reply_to_message, reply_to_username, reply_to_message_type, 80
+        )
 
-    # 打字机效果
-    if streaming and not from_self and not is_html and isinstance(bubble_label, ChatBubble):
-        start_streaming_text(main_window, bubble_label, content)
+    # 打字机效果：先不显示文字，由定时器逐字显示
+    if streaming and not from_self and not is_html and content:
+        message.visible_chars = 0
 
-    # 如果是客服消息且聊天面板隐藏/最小化，增加未读消息计数
-    if not from_self:
-        if (hasattr(main_window, "chat_panel") and not main_window.chat_panel.isVisible()) or \
-           getattr(main_window, "_chat_minimized", False):
-            add_unread_count(main_window)
+    _append_record(main_window, message)
 
-    # 滚动到底部
-    scroll_to_bottom(main_window)
+    if message.visible_chars is not None:
+        start_streaming_text(main_window, message, content)
+    return message
 
 
-def start_streaming_text(main_window: "MainWindow", bubble: ChatBubble, full_text: str, interval_ms: int = 30, on_finished=None):
+def start_streaming_text(main_window: "MainWindow", message: ChatMessage, full_text: str, interval_ms: int = 30, on_finished=None):
     """让气泡中的文本以打字机形式逐字出现"""
-    if not full_text:
+    if not full_text or not hasattr(main_window, "chat_model"):
+        message.visible_chars = None
         if on_finished:
             on_finished()
         return
 
-    bubble.label.setText("")
-    state = {"i": 0}
-    timer = QTimer(bubble)
+    model = main_window.chat_model
+    message.visible_chars = 0
+    model.refresh(message)
+    timer = QTimer(main_window.chat_view)
     timer.setInterval(interval_ms)
 
     def on_timeout():
-        i = state["i"]
-        if i >= len(full_text):
+        # 记录已被清除（如关闭聊天面板）或撤回时停止
+        if message.row < 0 or message.is_recalled or message.visible_chars is None:
+            timer.stop()
+            timer.deleteLater()
+            return
+        if message.visible_chars >= len(full_text):
             timer.stop()
             timer.deleteLater()
+            # 逐字显示完成后显示完整内容（富文本消息此时按 HTML 渲染）
+            message.visible_chars = None
+            model.refresh(message)
             if on_finished:
                 on_finished()
             return
-        i += 1
-        state["i"] = i
-        # 使用 ChatBubble 的格式化方法来处理换行
-        partial_text = full_text[:i]
-        formatted_text = bubble._format_text_with_line_breaks(partial_text)
-        bubble.label.setText(formatted_text)
-
-        scroll_to_bottom(main_window)
+        message.visible_chars += 1
+        model.refresh(message)
 
     timer.timeout.connect(on_timeout)
     timer.start()
 
 
-def append_support_message(main_window: "MainWindow", content: str, is_html: bool = False):
-    """供后续真实客服或机器人使用的接口"""
-    # 检测是否需要人工客服
-    if content == "NEED_HUMAN_SERVICE":
-        append_human_service_request(main_window)
+def apply_message_link_preview(main_window: "MainWindow", message_id, preview: Dict[str, Any]):
+    """用服务端推送的链接预览（标题 / 描述）填充消息下方的预览卡片"""
+    if not hasattr(main_window, "chat_model") or not preview.get("url"):
+        return
+    message = main_window.chat_model.find(message_id)
+    if message is None or message.is_recalled or message.link_url != preview["url"]:
         return
-    
-    streaming = not is_html
-    append_chat_message(main_window, content, from_self=False, is_html=is_html, streaming=streaming)
-    # 如果聊天面板隐藏，增加未读消息计数
-    if hasattr(main_window, "chat_panel") and not main_window.chat_panel.isVisible():
-        add_unread_count(main_window)
 
+    title = (preview.get("title") or "").strip()
+    description = (preview.get("description") or preview.get("site_name") or "").strip()
+    if title:
+        message.link_title = title if len(title) <= 40 else title[:37] + "..."
+    if description:
+        message.link_text = description if len(description) <= 80 else description[:77] + "..."
+    if title or description:
+        main_window.chat_model.refresh(message, relayout=True)
 
-def append_human_service_request(main_window: "MainWindow"):
-    """显示需要人工客服的消息和按钮"""
-    if not hasattr(main_window, "chat_layout"):
+
+def update_message_content(
+    main_window: "MainWindow",
+    message_id,
+    new_content: str,
+    edited_at: Optional[str] = None,
+    rich: Optional[Dict[str, Any]] = None,
+):
+    """消息被编辑：替换正文（重新生成富文本与链接预览），并同步引用了它的引用块"""
+    if not hasattr(main_window, "chat_model") or new_content is None:
+        return
+    model = main_window.chat_model
+    message = model.find(message_id)
+    if message is None or message.is_recalled or message.kind != KIND_TEXT:
+        return
+
+    html = None
+    link_urls: List[str] = []
+    try:
+        formatted, is_rich, urls = format_message_rich_text(new_content, rich)
+        if is_rich:
+            html = formatted
+            link_urls = urls or []
+    except Exception:
+        html = None
+
+    link_url = link_urls[0] if link_urls else None
+    if link_url != message.link_url:
+        message.link_url = link_url
+        message.link_title = None
+        message.link_text = None
+    model.edit(message, new_content, html, edited_at)
+
+    for reply in model.replies_to(message_id):
+        # 图片引用保留缩略图；已撤回的引用保持撤回提示
+        if reply.is_recalled or reply.reply_thumbnail is not None or reply.reply_text == "该引用消息已被撤回":
+            continue
+        reply.reply_text = new_content if len(new_content) <= 80 else new_content[:80] + "..."
+        model.refresh(reply, relayout=True)
+
+
+def show_message_context_menu(main_window: "MainWindow", message: ChatMessage, global_pos: QPoint):
+    """消息右键菜单：所有文本 / 图片消息可以引用，自己的消息在 2 分钟内可以撤回"""
+    if message.kind not in (KIND_TEXT, KIND_IMAGE) or message.is_recalled:
+        return
+
+    menu = QMenu(main_window.chat_view)
+    # 美化右键菜单样式
+    menu.setStyleSheet("""
+        QMenu {
+            background-color: #ffffff;
+            border: 1px solid #e5e7eb;
+            border-radius: 8px;
+            padding: 4px;
+            font-family: "Microsoft YaHei", "SimHei", "Arial";
+            font-size: 13px;
+        }
+        QMenu::item {
+            padding: 8px 20px;
+            border-radius: 4px;
+            color: #1f2937;
+            min-width: 120px;
+        }
+        QMenu::item:selected {
+            background-color: #f3f4f6;
+            color: #111827;
+        }
+        QMenu::item:disabled {
+            color: #9ca3af;
+        }
+    """)
+
+    # 引用回复（所有消息都可以引用）
+    reply_action = menu.addAction("引用回复")
+
+    def reply_message_action():
+        # message_id 可能为 None（乐观展示的消息尚未绑定ID），此时仅作为普通回复发送，
+        # 发送前会再按 _reply_to_temp_id 查找一次最新的ID
+        valid_msg_id = message.message_id if isinstance(message.message_id, int) and message.message_id > 0 else None
+        main_window._reply_to_message_id = valid_msg_id
+        main_window._reply_to_temp_id = message.temp_id
+        main_window._reply_to_username = message.from_username or (message.from_self and "我" or "用户")
+        if message.kind == KIND_IMAGE:
+            # 优先使用原始 data:image/... 内容，方便引用时生成缩略图
+            if message.raw_image and message.raw_image.startswith("data:image"):
+                main_window._reply_to_message_text = message.raw_image
+            else:
+                main_window._reply_to_message_text = "[图片]"
+            main_window._reply_to_message_type = "image"
+            preview = "[图片]"
+        else:
+            main_window._reply_to_message_text = message.content
+            # 表情也是文本
+            main_window._reply_to_message_type = "text"
+            preview = message.content[:30] + ('...' if len(message.content) > 30 else '')
+        # 在输入框显示引用提示
+        if hasattr(main_window, "chat_input"):
+            main_window.chat_input.setPlaceholderText(f"回复 {main_window._reply_to_username}：{preview}")
+            main_window.chat_input.setFocus()
+
+    reply_action.triggered.connect(reply_message_action)
+
+    # 撤回消息（只有自己发送的消息才能撤回）
+    if message.from_self:
+        recall_action = menu.addAction("撤回消息")
+        can_recall = _within_recall_window(message)
+        recall_action.setEnabled(bool(message.message_id) and can_recall)
+        if not message.message_id:
+            recall_action.setToolTip("消息ID尚未同步，请稍后再试")
+        elif not can_recall:
+            recall_action.setToolTip("消息已超过2分钟，无法撤回")
+
+        def recall_message_action():
+            # 再次检查（防止在打开菜单后到点击之间超过2分钟或记录已被撤回）
+            if not message.message_id or message.is_recalled or not _within_recall_window(message):
+                return
+
+            # 使用 WebSocket 撤回消息
+            from client.utils.websocket_helper import recall_message_via_websocket
+
+            try:
+                resp = recall_message_via_websocket(main_window, message.message_id)
+                if resp.get("success"):
+                    _apply_recall(main_window, message.message_id, getattr(main_window, "user_id", None), None)
+                else:
+                    # 撤回失败，但不弹窗（后端会返回具体原因）
+                    logging.warning(f"撤回消息失败: {resp.get('message', '撤回失败')}")
+            except Exception as e:
+                # 不弹窗，只记录日志
+                logging.error(f"撤回消息时发生错误: {e}", exc_info=True)
+
+        recall_action.triggered.connect(recall_message_action)
+
+    menu.exec(global_pos)
+
+
+def _within_recall_window(message: ChatMessage) -> bool:
+    """消息是否仍在 2 分钟撤回时限内（时间无法解析时由后端校验）"""
+    if not message.created_time:
+        return True
+    try:
+        from datetime import timedelta
+        created_time = datetime.fromisoformat(message.created_time.replace('Z', '+00:00'))
+        return datetime.now() - created_time.replace(tzinfo=None) <= timedelta(minutes=2)
+    except Exception:
+        return True
+
+
+def append_support_message(main_window: "MainWindow", content: str, is_html: bool = False):
+    """供后续真实客服或机器人使用的接口"""
+    # 检测是否需要人工客服
+    if content == "NEED_HUMAN_SERVICE":
+        append_human_service_request(main_window)
         return
     
+    streaming = not is_html
+    append_chat_message(main_window, content, from_self=False, is_html=is_html, streaming=streaming)
+    # 如果聊天面板隐藏，增加未读消息计数
+    if hasattr(main_window, "chat_panel") and not main_window.chat_panel.isVisible():
+        add_unread_count(main_window)
+
+
+def append_human_service_request(main_window: "MainWindow"):
+    """显示需要人工客服的消息和按钮"""
+    if not hasattr(main_window, "chat_model"):
+        return
+
     # 显示提示消息（使用打字机效果）
     message_text = "这个问题我这边暂时没有查到详细说明呢，建议您直接联系人工客服处理哈～"
-    
-    # 先添加消息气泡（使用streaming=True实现打字机效果）
-    message_widget = QWidget()
-    v_layout = QVBoxLayout(message_widget)
-    v_layout.setContentsMargins(4, 0, 4, 0)
-    v_layout.setSpacing(2)
-    
-    # 气泡 + 头像 行
-    row = QHBoxLayout()
-    row.setContentsMargins(0, 0, 0, 0)
-    row.setSpacing(6)
-    
-    # 头像
-    avatar_label = QLabel()
-    avatar_label.setFixedSize(32, 32)
-    default_bytes = get_default_avatar()
-    if default_bytes:
-        pm = QPixmap()
-        if pm.loadFromData(default_bytes):
-            pm = pm.scaled(32, 32, Qt.AspectRatioMode.KeepAspectRatio,
-                           Qt.TransformationMode.SmoothTransformation)
-            cropped = QPixmap(32, 32)
-            cropped.fill(Qt.GlobalColor.transparent)
-            p = QPainter(cropped)
-            p.setRenderHint(QPainter.RenderHint.Antialiasing)
-            clip_path = QPainterPath()
-            clip_path.addEllipse(0, 0, 32, 32)
-            p.setClipPath(clip_path)
-            p.drawPixmap(0, 0, pm)
-            p.end()
-            avatar_label.setPixmap(cropped)
-    avatar_label.setStyleSheet("border-radius: 16px;")
-    
-    bubble_label = ChatBubble(
-        message_text,
-        background=QColor("#ffffff"),
-        text_color=QColor("#111827"),
-        border_color=QColor("#e5e7eb"),
-        max_width=420,
-        align_right=False,
-        rich_text=False,
-    )
-    row.addWidget(avatar_label)
-    row.addWidget(bubble_label)
-    row.addStretch()
-    
-    v_layout.addLayout(row)
-    main_window.chat_layout.addWidget(message_widget)
-    
+    message = ChatMessage(KIND_TEXT, message_text, avatar=_message_avatar(main_window, False))
+    main_window.chat_model.append(message)
+
     # 延迟显示按钮（等文字显示完成后再显示按钮，更有层次感）
     def show_button():
+        if not hasattr(main_window, "chat_model"):
+            return
         # 创建包含按钮的消息组件
         button_widget = QWidget()
+        button_widget.setStyleSheet("background-color: transparent;")
         button_v_layout = QVBoxLayout(button_widget)
         button_v_layout.setContentsMargins(4, 12, 4, 8)
         button_v_layout.setSpacing(0)
-        
+
         # 按钮容器
         button_container = QWidget()
         button_layout = QHBoxLayout(button_container)
         button_layout.setContentsMargins(0, 0, 0, 0)
         button_layout.setSpacing(0)
-        
+
         # 创建"联系人工客服"按钮（更美观的版本）
         connect_btn = QPushButton("💬 联系人工客服")
         connect_btn.setFixedHeight(52)
         connect_btn.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
-        
+
         # 使用更现代、更美观的样式（带阴影效果和更柔和的渐变色）
         connect_btn.setStyleSheet("""
             QPushButton {
@@ -2324,37 +1053,36 @@ def append_human_service_request(main_window: "MainWindow"):
                     stop:0 #4f46e5, stop:0.5 #7c3aed, stop:1 #9333ea);
             }
         """)
-        
+
         # 添加阴影效果（通过GraphicsDropShadowEffect）
         shadow = QGraphicsDropShadowEffect(connect_btn)
         shadow.setBlurRadius(12)
         shadow.setOffset(0, 4)
         shadow.setColor(QColor(99, 102, 241, 120))  # 半透明紫色阴影
         connect_btn.setGraphicsEffect(shadow)
-        
+
         # 连接按钮点击事件
         connect_btn.clicked.connect(lambda: request_human_service(main_window))
-        
+
         button_layout.addStretch()
         button_layout.addWidget(connect_btn)
         button_layout.addStretch()
-        
+
         button_v_layout.addWidget(button_container)
-        
-        # 添加消息到聊天布局
-        main_window.chat_layout.addWidget(button_widget)
-        
+
+        # 按钮作为真实控件占据聊天记录中的一行
+        main_window.chat_model.append(ChatMessage(KIND_WIDGET, widget=button_widget))
+
         # 滚动到底部
         scroll_to_bottom(main_window)
-    
+
     # 启动打字机效果，完成后显示按钮
-    # 计算文字显示完成的时间（每个字符约30ms延迟，interval_ms=30）
     def on_streaming_finished():
         # 延迟200ms再显示按钮，让用户看到完整的文字
         QTimer.singleShot(200, show_button)
-    
-    start_streaming_text(main_window, bubble_label, message_text, interval_ms=30, on_finished=on_streaming_finished)
-    
+
+    start_streaming_text(main_window, message, message_text, interval_ms=30, on_finished=on_streaming_finished)
+
     # 滚动到底部
     scroll_to_bottom(main_window)
 
@@ -2407,66 +1135,25 @@ def request_human_service(main_window: "MainWindow"):
 
 def append_matching_message(main_window: "MainWindow"):
     """显示正在匹配的消息（简化版）"""
-    if not hasattr(main_window, "chat_layout"):
+    if not hasattr(main_window, "chat_model"):
         return
-    
-    message_widget = QWidget()
-    v_layout = QVBoxLayout(message_widget)
-    v_layout.setContentsMargins(4, 0, 4, 0)
-    v_layout.setSpacing(0)
-    
-    row = QHBoxLayout()
-    row.setContentsMargins(0, 0, 0, 0)
-    row.setSpacing(6)
-    
-    # 头像
-    avatar_label = QLabel()
-    avatar_label.setFixedSize(32, 32)
-    default_bytes = get_default_avatar()
-    if default_bytes:
-        pm = QPixmap()
-        if pm.loadFromData(default_bytes):
-            pm = pm.scaled(32, 32, Qt.AspectRatioMode.KeepAspectRatio,
-                           Qt.TransformationMode.SmoothTransformation)
-            cropped = QPixmap(32, 32)
-            cropped.fill(Qt.GlobalColor.transparent)
-            p = QPainter(cropped)
-            p.setRenderHint(QPainter.RenderHint.Antialiasing)
-            clip_path = QPainterPath()
-            clip_path.addEllipse(0, 0, 32, 32)
-            p.setClipPath(clip_path)
-            p.drawPixmap(0, 0, pm)
-            p.end()
-            avatar_label.setPixmap(cropped)
-    avatar_label.setStyleSheet("border-radius: 16px;")
-    
-    # 简化的匹配消息 - 更短更简洁
-    matching_text = "🔍 正在匹配客服"
-    bubble_label = ChatBubble(
-        matching_text,
-        background=QColor("#eff6ff"),  # 非常浅的蓝色背景
-        text_color=QColor("#1e40af"),  # 深蓝色文字
-        border_color=QColor("#93c5fd"),  # 浅蓝色边框
-        max_width=280,  # 减小最大宽度，让气泡更短
-        align_right=False,
-        rich_text=False,
+
+    # 简化的匹配消息 - 更短更简洁（浅蓝背景、深蓝文字，气泡更窄）
+    message = ChatMessage(
+        KIND_TEXT,
+        "🔍 正在匹配客服",
+        style=STYLE_MATCHING,
+        avatar=_message_avatar(main_window, False),
     )
-    
-    row.addWidget(avatar_label)
-    row.addWidget(bubble_label)
-    row.addStretch()
-    
-    v_layout.addLayout(row)
-    
-    main_window.chat_layout.addWidget(message_widget)
-    
+    main_window.chat_model.append(message)
+
     # 滚动到底部
     scroll_to_bottom(main_window)
-    
-    # 保存消息组件引用，以便后续更新
-    if not hasattr(main_window, "_matching_message_widget"):
-        main_window._matching_message_widget = []
-    main_window._matching_message_widget.append(message_widget)
+
+    # 保存记录，匹配结束后移除
+    if not hasattr(main_window, "_matching_messages"):
+        main_window._matching_messages = []
+    main_window._matching_messages.append(message)
 
 
 def match_human_service(main_window: "MainWindow"):
@@ -2501,24 +1188,48 @@ def match_human_service(main_window: "MainWindow"):
             if not connect_websocket(main_window, main_window.user_id, token):
                 raise RuntimeError("WebSocket 连接失败，无法匹配客服")
 
-        response = ws_client.match_agent(session_id) if ws_client else None
-        
+        # 非阻塞请求，结果在主线程回调中处理
+        ws_client.match_agent(
+            session_id,
+            callback=lambda future: _on_match_agent_finished(main_window, future.result()),
+        )
+    except Exception as e:
+        # API调用失败
+        logging.error(f"匹配客服时发生错误: {e}", exc_info=True)
+        _remove_matching_message(main_window)
+        append_chat_message(
+            main_window,
+            f"匹配客服时发生错误：{str(e)}，请稍后重试。",
+            from_self=False,
+            is_html=False,
+            streaming=False
+        )
+        main_window._matching_human_service = False
+
+
+def _remove_matching_message(main_window: "MainWindow"):
+    """移除“正在匹配”提示消息"""
+    if getattr(main_window, "_matching_messages", None) and hasattr(main_window, "chat_model"):
+        main_window.chat_model.remove(main_window._matching_messages.pop(0))
+
+
+def _on_match_agent_finished(main_window: "MainWindow", response: Optional[Dict[str, Any]]):
+    """匹配客服请求完成（主线程）"""
+    try:
         # 移除匹配中的消息
-        if hasattr(main_window, "_matching_message_widget") and main_window._matching_message_widget:
-            widget = main_window._matching_message_widget.pop(0)
-            if widget:
-                widget.deleteLater()
-        
+        _remove_matching_message(main_window)
+
         if response and response.get("success") and response.get("matched"):
             # 一旦匹配到在线客服，用户端立即进入对话模式
-            from gui.handlers.chat_handlers import clear_all_chat_messages, add_connected_separator
-
             # 清空原有聊天内容
             clear_all_chat_messages(main_window)
             
             # 标记为已连接人工客服
             main_window._human_service_connected = True
             main_window._matched_agent_id = response.get("agent_id")
+            get_message_cache().open_session(
+                main_window._chat_session_id, main_window.user_id, main_window._matched_agent_id
+            )
             
             # 添加"已连接客服，可以开始对话"的分隔线
             add_connected_separator(main_window)
@@ -2528,6 +1239,8 @@ def match_human_service(main_window: "MainWindow"):
             # 匹配失败或暂无在线客服，加入等待队列
             safe_response = response or {}
             wait_message = safe_response.get("message", "暂无在线客服，您的请求已加入等待队列，客服接入后会主动联系您。")
+            if safe_response.get("error") in ("timeout", "disconnected", "not_connected", "send_failed"):
+                wait_message = f"匹配客服时发生错误：{wait_message}，请稍后重试。"
             append_chat_message(
                 main_window,
                 wait_message,
@@ -2536,26 +1249,13 @@ def match_human_service(main_window: "MainWindow"):
                 streaming=False
             )
     except Exception as e:
-        # API调用失败
-        logging.error(f"匹配客服时发生错误: {e}", exc_info=True)
-        if hasattr(main_window, "_matching_message_widget") and main_window._matching_message_widget:
-            widget = main_window._matching_message_widget.pop(0)
-            if widget:
-                widget.deleteLater()
-        
-        append_chat_message(
-            main_window,
-            f"匹配客服时发生错误：{str(e)}，请稍后重试。",
-            from_self=False,
-            is_html=False,
-            streaming=False
-        )
-    
-    # 重置匹配状态
-    main_window._matching_human_service = False
+        logging.error(f"处理客服匹配结果失败: {e}", exc_info=True)
+    finally:
+        # 重置匹配状态
+        main_window._matching_human_service = False
 
 
-def show_scrollbar_handle(scroll_area: QScrollArea):
+def show_scrollbar_handle(scroll_area: QAbstractScrollArea):
     """鼠标进入时显示滚动条手柄"""
     style = scroll_area.styleSheet()
     style = style.replace(
@@ -2565,7 +1265,7 @@ def show_scrollbar_handle(scroll_area: QScrollArea):
     scroll_area.setStyleSheet(style)
 
 
-def hide_scrollbar_handle(scroll_area: QScrollArea):
+def hide_scrollbar_handle(scroll_area: QAbstractScrollArea):
     """鼠标离开时隐藏滚动条手柄"""
     style = scroll_area.styleSheet()
     style = style.replace(
@@ -2782,8 +1482,12 @@ def create_clickable_image(main_window: "MainWindow", img_path: str, title: str)
         if not os.path.exists(full_path):
             return None
 
-    pixmap = QPixmap(full_path)
-    if pixmap.isNull():
+    if not QImageReader(full_path).canRead():
+        return None
+    try:
+        with open(full_path, "rb") as f:
+            image_data = f.read()
+    except OSError:
         return None
 
     container = QWidget()
@@ -2791,14 +1495,21 @@ def create_clickable_image(main_window: "MainWindow", img_path: str, title: str)
     container_layout.setContentsMargins(6, 4, 6, 4)
     container_layout.setSpacing(4)
 
-    thumb = pixmap.scaled(
-        200, 120,
-        Qt.AspectRatioMode.KeepAspectRatio,
-        Qt.TransformationMode.SmoothTransformation
-    )
-
     img_label = QLabel()
-    img_label.setPixmap(thumb)
+
+    def on_decoded(thumb: Optional[QPixmap]):
+        if thumb is None:
+            return
+        try:
+            img_label.setPixmap(thumb)
+        except RuntimeError:
+            # 解码期间 FAQ 面板已被销毁
+            pass
+
+    # 缩略图在后台解码，完成前先保持空白
+    thumb = get_image_service().request(image_data, on_decoded, (200, 120))
+    if thumb is not None:
+        img_label.setPixmap(thumb)
     img_label.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
     img_label.setStyleSheet("""
         QLabel {
@@ -2978,8 +1689,8 @@ def send_image(main_window: "MainWindow"):
         QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
         return
 
-    pix = QPixmap(file_path)
-    if pix.isNull():
+    # 只读取文件头判断格式，真正的解码在后台线程完成
+    if not QImageReader(file_path).canRead():
         append_chat_message(main_window, "图片加载失败。", from_self=False)
         # 恢复状态
         main_window.chat_input.setEnabled(True)
@@ -2991,7 +1702,6 @@ def send_image(main_window: "MainWindow"):
         QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
         return
     
-    scaled = pix.scaled(160, 160, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
     # 先在界面上乐观展示图片；raw_message 会在真正发送时设置为 data_url
     # 如果已连接人工客服，使用 WebSocket 发送图片
     if getattr(main_window, "_human_service_connected", False) and getattr(main_window, "_chat_session_id", None):
@@ -3018,9 +1728,9 @@ def send_image(main_window: "MainWindow"):
         reply_to_username_preview = getattr(main_window, "_reply_to_username", None)
         reply_to_type_preview = getattr(main_window, "_reply_to_message_type", None)
 
-        append_image_message(
+        pending_record = append_image_message(
             main_window,
-            scaled,
+            None,
             from_self=True,
             message_id=None,
             message_created_time=None,
@@ -3044,10 +1754,8 @@ def send_image(main_window: "MainWindow"):
             QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
 
         # 直接在主线程中使用 WebSocket 客户端发送（WebSocket 发送是异步的，不会阻塞UI）
-        from client.utils.websocket_helper import get_or_create_websocket_client
-        
         ws_client = get_or_create_websocket_client(main_window)
-        if not ws_client or not ws_client.is_connected():
+        if not ws_client:
             append_chat_message(main_window, "WebSocket 未连接，请稍后重试。", from_self=False)
             restore()
             return
@@ -3067,16 +1775,14 @@ def send_image(main_window: "MainWindow"):
                 logging.warning(f"引用消息ID格式错误: {reply_to_id}，将按普通消息发送")
                 reply_to_id = None
         
-        # 使用 WebSocket 客户端发送消息（异步，不阻塞UI）
-        ws_client = get_or_create_websocket_client(main_window)
-        success = False
-        if ws_client and ws_client.is_connected():
-            success = ws_client.send_message(
+        # 使用 WebSocket 客户端发送消息（先进入待发送队列，未连接时重连后自动补发）
+        success = ws_client.send_message(
             session_id=session_id,
             message=data_url,
             role="user",
             message_type="image",
-            reply_to_message_id=reply_to_id
+            reply_to_message_id=reply_to_id,
+            client_message_id=pending_record.temp_id if pending_record is not None else None,
         )
         
         # 清除引用状态
@@ -3119,7 +1825,7 @@ def send_image(main_window: "MainWindow"):
 
 def append_image_message(
     main_window: "MainWindow",
-    pixmap: QPixmap,
+    pixmap: Optional[QPixmap],
     from_self: bool = True,
     message_id: Optional[int] = None,
     message_created_time: Optional[str] = None,
@@ -3131,924 +1837,143 @@ def append_image_message(
     reply_to_message_type: Optional[str] = None,
     is_recalled: bool = False,
     raw_message: Optional[str] = None,
-):
-    """发送图片消息，不使用气泡，直接显示圆角图片 + 头像。
+    avatar_base64: Optional[str] = None,
+) -> Optional[ChatMessage]:
+    """追加图片消息，不使用气泡，直接显示圆角图片 + 头像。
 
-    raw_message: 原始消息内容（例如 data:image/... 的 base64 串），用于后续“引用图片”时生成 40x40 缩略图。
+    pixmap 为 None 时从 raw_message 在后台解码，解码完成前显示占位图。
+    raw_message: 原始消息内容（例如 data:image/... 的 base64 串），用于后台解码以及后续“引用图片”时生成缩略图。
     """
-    if not hasattr(main_window, "chat_layout"):
-        return
+    if not hasattr(main_window, "chat_model"):
+        return None
+    model = main_window.chat_model
 
-    # 处理撤回消息：查找现有消息并更新为撤回状态，同时更新所有引用块
-    if is_recalled and message_id is not None:
-        try:
-            recalled_id = None
-            try:
-                recalled_id = int(message_id)
-            except (ValueError, TypeError):
-                recalled_id = message_id
-            
-            # 先尝试查找并更新现有消息
-            if recalled_id is not None:
-                # 优先从 _message_widgets_map 中查找
-                if hasattr(main_window, "_message_widgets_map"):
-                    widget_img = main_window._message_widgets_map.get(recalled_id)
-                    # 如果没找到，尝试字符串键
-                    if not widget_img and isinstance(recalled_id, int):
-                        widget_img = main_window._message_widgets_map.get(str(recalled_id))
-                    # 如果还没找到，尝试整数键
-                    if not widget_img and isinstance(recalled_id, str):
-                        try:
-                            widget_img = main_window._message_widgets_map.get(int(recalled_id))
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    if widget_img:
-                        widget, img_label = widget_img
-                        if widget and not widget.property("is_recalled"):
-                            # 找到现有消息，更新为撤回状态
-                            # 隐藏图片和头像
-                            if img_label:
-                                img_label.setVisible(False)
-                            parent_layout = widget.layout()
-                            if parent_layout:
-                                # 隐藏头像
-                                for i in range(parent_layout.count()):
-                                    item = parent_layout.itemAt(i)
-                                    if item and item.layout():
-                                        row_layout = item.layout()
-                                        for j in range(row_layout.count()):
-                                            row_item = row_layout.itemAt(j)
-                                            if row_item and row_item.widget():
-                                                w = row_item.widget()
-                                                if isinstance(w, QLabel) and w.pixmap():
-                                                    # 检查是否是头像（固定大小32x32）
-                                                    if w.size().width() == 32 and w.size().height() == 32:
-                                                        w.setVisible(False)
-                            
-                            # 隐藏时间标签（如果有）
-                            time_label = widget.property("time_label")
-                            if time_label:
-                                time_label.setVisible(False)
-                            
-                            # 隐藏引用块（如果存在），并先隐藏其中的所有缩略图
-                            reply_container = widget.property("reply_container")
-                            if reply_container:
-                                # 先隐藏引用块中的所有缩略图
-                                thumbnail_label = reply_container.property("reply_thumbnail_label")
-                                if thumbnail_label:
-                                    thumbnail_label.hide()
-                                    thumbnail_label.setVisible(False)
-                                # 使用 findChildren 查找所有图片标签并隐藏
-                                all_labels = reply_container.findChildren(QLabel)
-                                for label in all_labels:
-                                    if label.pixmap():
-                                        label.hide()
-                                        label.setVisible(False)
-                                # 最后隐藏整个引用块
-                                reply_container.setVisible(False)
-                                reply_container.hide()
-                            
-                            # 判断是自己撤回还是对方撤回
-                            current_user_id = getattr(main_window, 'user_id', None)
-                            if current_user_id is not None and from_user_id is not None:
-                                try:
-                                    is_self_recalled = (int(from_user_id) == int(current_user_id))
-                                except (ValueError, TypeError):
-                                    is_self_recalled = (from_user_id == current_user_id)
-                            else:
-                                is_self_recalled = (from_user_id == current_user_id)
-                            
-                            if is_self_recalled:
-                                recall_text = "你撤回了一条消息"
-                            else:
-                                username = from_username or "用户"
-                                if from_user_id and not from_username:
-                                    if hasattr(main_window, "username"):
-                                        username = main_window.username
-                                    else:
-                                        try:
-                                            from client.login.login_status_manager import check_login_status
-                                            _, _, current_username = check_login_status()
-                                            if current_username:
-                                                username = current_username
-                                        except Exception:
-                                            pass
-                                recall_text = f"{username}撤回了一条消息"
-                            
-                            # 检查是否已经有撤回提示标签
-                            widget_layout = widget.layout()
-                            if widget_layout:
-                                # 查找是否已有撤回标签
-                                has_recall_label = False
-                                for layout_idx in range(widget_layout.count()):
-                                    item = widget_layout.itemAt(layout_idx)
-                                    if item and item.widget():
-                                        w = item.widget()
-                                        if isinstance(w, QLabel) and w.text() in ("你撤回了一条消息", f"{username}撤回了一条消息"):
-                                            has_recall_label = True
-                                            break
-                                
-                                # 如果没有撤回标签，创建一个
-                                if not has_recall_label:
-                                    recall_label = QLabel(recall_text)
-                                    recall_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                                    recall_label.setStyleSheet("""
-                                        QLabel {
-                                            font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                            font-size: 11px;
-                                            color: #9ca3af;
-                                            padding: 4px 0px;
-                                            background-color: transparent;
-                                        }
-                                    """)
-                                    widget_layout.insertWidget(0, recall_label)
-                            
-                            # 标记为已撤回
-                            widget.setProperty("is_recalled", True)
-                            
-                            # 同步更新所有引用了这条消息的引用块文案和缩略图
-                            if hasattr(main_window, "chat_layout"):
-                                parent_layout = main_window.chat_layout
-                                for layout_idx in range(parent_layout.count()):
-                                    item = parent_layout.itemAt(layout_idx)
-                                    w = item.widget() if item else None
-                                    if not w:
-                                        continue
-                                    ref_id = w.property("reply_to_message_id")
-                                    if ref_id is None:
-                                        continue
-                                    try:
-                                        ref_id_norm = int(ref_id)
-                                    except (ValueError, TypeError):
-                                        ref_id_norm = ref_id
-                                    if ref_id_norm == recalled_id:
-                                        reply_container = w.property("reply_container")
-                                        if reply_container:
-                                            sender_name = reply_container.property("reply_sender_name") or ""
-                                            reply_label = reply_container.property("reply_label")
-                                            new_text = "该引用消息已被撤回"
-                                            if sender_name:
-                                                new_text = f"{sender_name}: {new_text}"
-                                            
-                                            # 先找到并删除所有图片相关的控件
-                                            thumbnail_label = reply_container.property("reply_thumbnail_label")
-                                            thumbnail_layout = reply_container.property("reply_thumbnail_layout")
-                                            
-                                            # 找到 reply_content_layout
-                                            reply_content_layout = None
-                                            main_layout = reply_container.layout()
-                                            if main_layout and main_layout.count() > 0:
-                                                first_item = main_layout.itemAt(0)
-                                                if first_item and first_item.layout():
-                                                    reply_content_layout = first_item.layout()
-                                            
-                                            # 如果有 thumbnail_layout，完全删除它及其所有子控件
-                                            if thumbnail_layout and reply_content_layout:
-                                                # 找到 thumbnail_layout 在 reply_content_layout 中的位置
-                                                layout_index = -1
-                                                for i in range(reply_content_layout.count()):
-                                                    item = reply_content_layout.itemAt(i)
-                                                    if item and item.layout() == thumbnail_layout:
-                                                        layout_index = i
-                                                        break
-
-                                                if layout_index >= 0:
-                                                    # 先删除 thumbnail_layout 中的所有控件
-                                                    while thumbnail_layout.count() > 0:
-                                                        item = thumbnail_layout.takeAt(0)
-                                                        if not item:
-                                                            continue
-                                                        widget = item.widget()
-                                                        if widget:
-                                                            # 完全删除控件
-                                                            widget.hide()
-                                                            widget.setVisible(False)
-                                                            if isinstance(widget, QLabel):
-                                                                widget.setPixmap(QPixmap())
-                                                                widget.clear()
-                                                            widget.setFixedSize(0, 0)
-                                                            widget.setParent(None)
-                                                            widget.deleteLater()
-                                                        else:
-                                                            # 如果是子布局，也删除
-                                                            sub_layout = item.layout()
-                                                            if sub_layout:
-                                                                while sub_layout.count() > 0:
-                                                                    sub_item = sub_layout.takeAt(0)
-                                                                    if sub_item:
-                                                                        sub_widget = sub_item.widget()
-                                                                        if sub_widget:
-                                                                            sub_widget.hide()
-                                                                            sub_widget.setVisible(False)
-                                                                            sub_widget.setParent(None)
-                                                                            sub_widget.deleteLater()
-                                                                sub_layout.deleteLater()
-                                                    
-                                                    # 从 reply_content_layout 中移除 thumbnail_layout
-                                                    reply_content_layout.removeItem(thumbnail_layout)
-                                                    # 删除 thumbnail_layout 本身
-                                                    thumbnail_layout.deleteLater()
-                                                    
-                                                    # 创建新的文本标签并添加到相同位置
-                                                    new_reply_label = QLabel(new_text)
-                                                    new_reply_label.setStyleSheet("""
-                                                        QLabel {
-                                                            font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                                            font-size: 12px;
-                                                            color: #4b5563;
-                                                            background-color: transparent;
-                                                        }
-                                                    """)
-                                                    new_reply_label.setWordWrap(True)
-                                                    new_reply_label.setMaximumWidth(300)
-                                                    reply_content_layout.insertWidget(layout_index, new_reply_label)
-                                                    
-                                                    # 更新 reply_label 属性
-                                                    reply_container.setProperty("reply_label", new_reply_label)
-                                                    reply_label = new_reply_label
-                                            else:
-                                                # 如果没有 thumbnail_layout，直接更新 reply_label
-                                                if reply_label:
-                                                    reply_label.setText(new_text)
-                                                else:
-                                                    # 如果连 reply_label 都没有，创建一个新的
-                                                    if reply_content_layout:
-                                                        new_reply_label = QLabel(new_text)
-                                                        new_reply_label.setStyleSheet("""
-                                                            QLabel {
-                                                                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                                                                font-size: 12px;
-                                                                color: #4b5563;
-                                                                background-color: transparent;
-                                                            }
-                                                        """)
-                                                        new_reply_label.setWordWrap(True)
-                                                        new_reply_label.setMaximumWidth(300)  # 限制最大宽度
-                                                        reply_content_layout.addWidget(new_reply_label)
-                                                        reply_container.setProperty("reply_label", new_reply_label)
-                                                        reply_label = new_reply_label
-                                            
-                                            # 删除 thumbnail_label（如果还存在）
-                                            if thumbnail_label:
-                                                thumbnail_label.hide()
-                                                thumbnail_label.setVisible(False)
-                                                thumbnail_label.setPixmap(QPixmap())
-                                                thumbnail_label.clear()
-                                                thumbnail_label.setFixedSize(0, 0)
-                                                # 尝试从父布局中移除
-                                                parent = thumbnail_label.parent()
-                                                if parent:
-                                                    parent_layout = parent.layout()
-                                                    if parent_layout:
-                                                        parent_layout.removeWidget(thumbnail_label)
-                                                thumbnail_label.setParent(None)
-                                                thumbnail_label.deleteLater()
-                                            
-                                            # 清除所有属性
-                                            reply_container.setProperty("reply_thumbnail_label", None)
-                                            reply_container.setProperty("reply_thumbnail_layout", None)
-                                            
-                                            # 使用 findChildren 确保找到并删除所有图片标签
-                                            all_labels = reply_container.findChildren(QLabel)
-                                            for label in all_labels:
-                                                # 只处理有图片的标签，且不是新的文本标签
-                                                if label.pixmap() and label is not reply_label:
-                                                    label.hide()
-                                                    label.setVisible(False)
-                                                    label.setPixmap(QPixmap())
-                                                    label.clear()
-                                                    label.setFixedSize(0, 0)
-                                                    # 尝试从父布局中移除
-                                                    parent = label.parent()
-                                                    if parent:
-                                                        parent_layout = parent.layout()
-                                                        if parent_layout:
-                                                            parent_layout.removeWidget(label)
-                                                    label.setParent(None)
-                                                    label.deleteLater()
-                                            
-                                            # 强制更新整个引用容器和父控件
-                                            reply_container.update()
-                                            reply_container.repaint()
-                                            if w:
-                                                w.update()
-                                                w.repaint()
-                            
-                            # 已更新现有消息，直接返回，不创建新消息
-                            return
-        except Exception as e:
-            logging.error(f"处理图片撤回消息失败: {e}", exc_info=True)
-
-    message_widget = QWidget()
-    v_layout = QVBoxLayout(message_widget)
-    v_layout.setContentsMargins(4, 0, 4, 0)
-    v_layout.setSpacing(2)
-
-    time_label = None
-    if from_self:
-        time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        time_label = QLabel(time_str)
-        time_label.setStyleSheet("""
-            QLabel {
-                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                font-size: 11px;
-                color: #9ca3af;
-            }
-        """)
-        time_row = QHBoxLayout()
-        time_row.setContentsMargins(0, 0, 0, 0)
-        time_row.addStretch()
-        time_row.addWidget(time_label)
-        v_layout.addLayout(time_row)
-        # 记录时间标签，便于撤回时隐藏
-        message_widget.setProperty("time_label", time_label)
-
-    row = QHBoxLayout()
-    row.setContentsMargins(0, 0, 0, 0)
-    row.setSpacing(6)
+    # 撤回消息：更新现有消息为撤回状态，同时更新所有引用块
+    if is_recalled:
+        if message_id is not None:
+            _apply_recall(main_window, message_id, from_user_id, from_username)
+        return None
 
-    img_label = QLabel()
-    
-    # 如果是客服消息且聊天面板隐藏/最小化，增加未读消息计数
-    if not from_self:
-        if (hasattr(main_window, "chat_panel") and not main_window.chat_panel.isVisible()) or \
-           getattr(main_window, "_chat_minimized", False):
-            add_unread_count(main_window)
-    img_label.setFixedSize(pixmap.width(), pixmap.height())
-    rounded_pix = QPixmap(pixmap.size())
-    rounded_pix.fill(Qt.GlobalColor.transparent)
-    painter = QPainter(rounded_pix)
-    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-    path = QPainterPath()
-    path.addRoundedRect(QRectF(0, 0, pixmap.width(), pixmap.height()), 12, 12)
-    painter.setClipPath(path)
-    painter.drawPixmap(0, 0, pixmap)
-    painter.end()
-    img_label.setPixmap(rounded_pix)
-
-    avatar_label = QLabel()
-    avatar_label.setFixedSize(32, 32)
-    if from_self:
-        if main_window.user_avatar_label.pixmap():
-            pm = main_window.user_avatar_label.pixmap().scaled(
-                32, 32,
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation,
-            )
-            avatar_label.setPixmap(pm)
-    else:
-        default_bytes = get_default_avatar()
-        if default_bytes:
-            pm = QPixmap()
-            pm.loadFromData(default_bytes)
-            pm = pm.scaled(32, 32, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            cropped = QPixmap(32, 32)
-            cropped.fill(Qt.GlobalColor.transparent)
-            p = QPainter(cropped)
-            p.setRenderHint(QPainter.RenderHint.Antialiasing)
-            clip_path = QPainterPath()
-            clip_path.addEllipse(0, 0, 32, 32)
-            p.setClipPath(clip_path)
-            p.drawPixmap(0, 0, pm)
-            p.end()
-            avatar_label.setPixmap(cropped)
-
-    avatar_label.setStyleSheet("border-radius: 16px;")
-
-    if from_self:
-        row.addStretch()
-        row.addWidget(img_label)
-        row.addWidget(avatar_label)
-    else:
-        row.addWidget(avatar_label)
-        row.addWidget(img_label)
-        row.addStretch()
-
-    v_layout.addLayout(row)
-
-    # 处理引用消息显示（如果有）：放在图片下方，让整体更自然，样式与文本消息的引用气泡保持一致
-    if reply_to_message_id and reply_to_message and not is_recalled:
-        # 创建引用消息容器（浅灰卡片 + 左侧色条），与文本消息的引用样式保持一致
-        reply_container = QWidget()
-        reply_container.setObjectName("reply_container")
-        reply_container.setStyleSheet("""
-            QWidget#reply_container {
-                background-color: #f3f4f6;
-                border-radius: 10px;
-                margin-top: 6px;
-                border: 1px solid #e5e7eb;
-            }
-        """)
-        # 宽度自适应但不铺满整行，避免像输入框一样太长
-        from PyQt6.QtWidgets import QSizePolicy
-        reply_container.setSizePolicy(QSizePolicy.Policy.Maximum, QSizePolicy.Policy.Fixed)
-        reply_layout = QHBoxLayout(reply_container)
-        # 给引用卡片留足内边距，避免“字顶到边/溢出”的观感，并让内部内容在气泡内垂直居中
-        reply_layout.setContentsMargins(10, 8, 10, 8)
-        reply_layout.setSpacing(8)
-        reply_layout.setAlignment(Qt.AlignmentFlag.AlignVCenter)
-
-        # 左侧竖色条，增强层次感（与文本引用统一）
-        left_bar = QLabel()
-        left_bar.setFixedWidth(3)
-        left_bar.setMinimumHeight(26)
-        left_bar.setStyleSheet("""
-            QLabel {
-                background-color: #60a5fa;
-                border-radius: 999px;
-            }
-        """)
-        reply_layout.addWidget(left_bar)
+    if message_id is not None and model.find(message_id) is not None:
+        return None
 
-        reply_content_layout = QVBoxLayout()
-        reply_content_layout.setContentsMargins(0, 0, 0, 0)
-        reply_content_layout.setSpacing(2)
+    message = ChatMessage(
+        KIND_IMAGE,
+        "[图片]",
+        from_self=from_self,
+        message_id=message_id,
+        time_text=_self_time_text(message_id, message_created_time) if from_self else "",
+        created_time=message_created_time or datetime.now().isoformat(),
+        from_user_id=from_user_id,
+        from_username=from_username,
+        pixmap=pixmap,
+        # 保存原始消息内容，方便后续“引用图片”时生成缩略图
+        raw_image=raw_message if isinstance(raw_message, str) and raw_message else None,
+    )
+    message.avatar = _message_avatar(main_window, from_self, avatar_base64, message)
+    if pixmap is None:
+        if message.raw_image and message.raw_image.startswith("data:image"):
+            def on_decoded(decoded: Optional[QPixmap]):
+                if message.is_recalled:
+                    return
+                if decoded is None:
+                    _mark_image_failed(message)
+                else:
+                    message.pixmap = decoded
+                main_window.chat_model.refresh(message, relayout=True)
 
-        # 获取引用消息的发送者信息
-        reply_sender_name = reply_to_username or "用户"
-        reply_text = reply_to_message
-        if reply_text == "[消息已撤回]":
-            reply_text = "该引用消息已被撤回"
+            # 与用户本地发送图片的大小规格一致，统一使用最大边 160 像素的缩放规则
+            message.pixmap = get_image_service().request(message.raw_image, on_decoded, _IMAGE_MAX_SIZE)
+        else:
+            _mark_image_failed(message)
 
-        # 尝试为图片引用查找原始 base64 内容（data:image/...），用于生成缩略图
-        original_image_data: str | None = None
-        if reply_to_message_type == "image" and reply_to_message_id is not None:
-            try:
-                msg_map = getattr(main_window, "_message_widgets_map", None)
-                if isinstance(msg_map, dict) and reply_to_message_id in msg_map:
-                    original_widget = msg_map[reply_to_message_id][0]
-                    raw_image = original_widget.property("raw_image_message")
-                    if isinstance(raw_image, str) and raw_image.startswith("data:image"):
-                        original_image_data = raw_image
-                # 如果没找到，尝试字符串键
-                if not original_image_data and isinstance(reply_to_message_id, int):
-                    if isinstance(msg_map, dict) and str(reply_to_message_id) in msg_map:
-                        original_widget = msg_map[str(reply_to_message_id)][0]
-                        raw_image = original_widget.property("raw_image_message")
-                        if isinstance(raw_image, str) and raw_image.startswith("data:image"):
-                            original_image_data = raw_image
-                # 如果还没找到，尝试整数键
-                if not original_image_data and isinstance(reply_to_message_id, str):
-                    try:
-                        msg_id_int = int(reply_to_message_id)
-                        if isinstance(msg_map, dict) and msg_id_int in msg_map:
-                            original_widget = msg_map[msg_id_int][0]
-                            raw_image = original_widget.property("raw_image_message")
-                            if isinstance(raw_image, str) and raw_image.startswith("data:image"):
-                                original_image_data = raw_image
-                    except (ValueError, TypeError):
-                        pass
-            except Exception:
-                original_image_data = None
+    if reply_to_message_id and reply_to_message:
+        _set_reply_preview(
+            main_window, message, reply_to_message_id, reply_to_message, reply_to_username, reply_to_message_type, 50
+        )
 
-        # 如果是图片消息，显示缩略图
-        # 优先使用 original_image_data（从原消息控件里取出的 data:image/...），
-        # 如果没有，再尝试使用 reply_text 本身。
-        if reply_to_message_type == "image" and (original_image_data or (reply_text and reply_text.startswith("data:image"))):
-            try:
-                # 解析base64图片
-                import base64
-                from PyQt6.QtGui import QImage
-                data_source = original_image_data or reply_text
-                b64_part = data_source.split(",", 1)[1] if "," in data_source else ""
-                raw = base64.b64decode(b64_part)
-                image = QImage.fromData(raw)
-                if not image.isNull():
-                    thumb_pixmap = QPixmap.fromImage(image)
-                    # 创建 60x60 的缩略图
-                    thumbnail = thumb_pixmap.scaled(60, 60, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-
-                    # 创建缩略图标签
-                    thumbnail_label = QLabel()
-                    thumbnail_label.setFixedSize(60, 60)
-                    thumbnail_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                    thumbnail_label.setPixmap(thumbnail)
-                    thumbnail_label.setStyleSheet("""
-                        QLabel {
-                            border-radius: 6px;
-                            background-color: transparent;
-                            border: 1px solid #d1d5db;
-                        }
-                    """)
-                    # 立即保存缩略图标签到属性中，方便撤回时隐藏
-                    reply_container.setProperty("reply_thumbnail_label", thumbnail_label)
-
-                    # 创建文本标签（只显示发送者名称，后面直接跟缩略图）
-                    sender_label = QLabel(f"{reply_sender_name}：")
-                    sender_label.setStyleSheet("""
-                        QLabel {
-                            font-family: "Microsoft YaHei", "SimHei", "Arial";
-                            font-size: 12px;
-                            color: #4b5563;
-                            background-color: transparent;
-                        }
-                    """)
-                    reply_label = sender_label  # 使用 sender_label 作为 reply_label
-
-                    # 水平布局：发送者名称 + 缩略图
-                    thumbnail_layout = QHBoxLayout()
-                    thumbnail_layout.setContentsMargins(0, 0, 0, 0)
-                    thumbnail_layout.setSpacing(6)
-                    thumbnail_layout.addWidget(sender_label)
-                    thumbnail_layout.addWidget(thumbnail_label)
-                    thumbnail_layout.addStretch()
-                    # 保存 thumbnail_layout 到属性中，方便撤回时处理
-                    reply_container.setProperty("reply_thumbnail_layout", thumbnail_layout)
-
-                    reply_content_layout.addLayout(thumbnail_layout)
-                else:
-                    # 图片解析失败，显示文本
-                    reply_label = QLabel(f"{reply_sender_name}: [图片]")
-                    reply_label.setStyleSheet("""
-                        QLabel {
-                            font-family: "Microsoft YaHei", "SimHei", "Arial";
-                            font-size: 12px;
-                            color: #4b5563;
-                            background-color: transparent;
-                        }
-                    """)
-                    reply_label.setWordWrap(True)
-                    reply_content_layout.addWidget(reply_label)
-            except Exception as e:
-                logging.error(f"解析引用图片失败: {e}", exc_info=True)
-                # 解析失败，显示文本
-                reply_label = QLabel(f"{reply_sender_name}: [图片]")
-                reply_label.setStyleSheet("""
-                    QLabel {
-                        font-family: "Microsoft YaHei", "SimHei", "Arial";
-                        font-size: 12px;
-                        color: #4b5563;
-                        background-color: transparent;
-                    }
-                """)
-                reply_label.setWordWrap(True)
-                reply_label.setMaximumWidth(300)  # 限制最大宽度
-                reply_content_layout.addWidget(reply_label)
-        else:
-            # 文本消息，显示文本内容
-            if reply_text and len(reply_text) > 50:
-                reply_text = reply_text[:50] + "..."
-            reply_label = QLabel(f"{reply_sender_name}: {reply_text}")
-            reply_label.setStyleSheet("""
-                QLabel {
-                    font-family: "Microsoft YaHei", "SimHei", "Arial";
-                    font-size: 12px;
-                    color: #4b5563;
-                    background-color: transparent;
-                }
-            """)
-            reply_label.setWordWrap(True)
-            reply_content_layout.addWidget(reply_label)
-
-        reply_layout.addLayout(reply_content_layout)
-
-        # 使用单独一行的水平布局控制引用块对齐方式，
-        # 让引用气泡的边缘与图片边缘对齐（用户侧右对齐，客服侧左对齐）
-        reply_row = QHBoxLayout()
-        reply_row.setContentsMargins(0, 0, 0, 0)
-        reply_row.setSpacing(6)
-
-        if from_self:
-            # 用户消息：引用气泡的右边缘应该与图片的右边缘对齐
-            # 图片行的布局是：[stretch] + img_label + avatar_label
-            # 所以引用行应该是：[stretch] + reply_container + [spacer for avatar]
-            reply_row.addStretch()
-            reply_row.addWidget(reply_container)
-            # 添加一个固定宽度的 spacer，宽度等于头像宽度（32px）+ 间距（6px）
-            avatar_spacer = QWidget()
-            avatar_spacer.setFixedWidth(38)  # 32px 头像 + 6px 间距
-            reply_row.addWidget(avatar_spacer)
-        else:
-            # 客服消息：引用气泡的左边缘应该与图片的左边缘对齐
-            # 图片行的布局是：avatar_label + img_label + [stretch]
-            # 所以引用行应该是：[spacer for avatar] + reply_container + [stretch]
-            # 添加一个固定宽度的 spacer，宽度等于头像宽度（32px）+ 间距（6px）
-            avatar_spacer = QWidget()
-            avatar_spacer.setFixedWidth(38)  # 32px 头像 + 6px 间距
-            reply_row.addWidget(avatar_spacer)
-            reply_row.addWidget(reply_container)
-            reply_row.addStretch()
-
-        v_layout.addLayout(reply_row)
-
-        # 保存引用块相关属性到 message_widget，便于撤回时更新
-        message_widget.setProperty("reply_container", reply_container)
-        # 查找 reply_label（可能是 sender_label 或文本 reply_label）
-        reply_label_to_save = None
-        # 首先尝试从 reply_content_layout 中查找文字标签（没有 pixmap 的 QLabel）
-        for i in range(reply_content_layout.count()):
-            item = reply_content_layout.itemAt(i)
-            if item:
-                layout = item.layout()
-                if layout:
-                    # 如果是布局（如 thumbnail_layout），查找其中的文字 QLabel
-                    for j in range(layout.count()):
-                        sub_item = layout.itemAt(j)
-                        if sub_item and sub_item.widget():
-                            w = sub_item.widget()
-                            if isinstance(w, QLabel) and not w.pixmap():
-                                reply_label_to_save = w
-                                break
-                    if reply_label_to_save:
-                        break
-                else:
-                    widget = item.widget()
-                    if widget and isinstance(widget, QLabel) and not widget.pixmap():
-                        reply_label_to_save = widget
-                        break
-        # 如果还没找到，使用 findChildren 查找所有没有图片的 QLabel
-        if not reply_label_to_save:
-            all_labels = reply_container.findChildren(QLabel)
-            for label in all_labels:
-                if not label.pixmap():
-                    reply_label_to_save = label
-                    break
-        if reply_label_to_save:
-            reply_container.setProperty("reply_label", reply_label_to_save)
-        reply_container.setProperty("reply_sender_name", reply_sender_name)
-        message_widget.setProperty("reply_to_message_id", reply_to_message_id)
-    
-    # 存储消息ID和控件引用，用于更新撤回状态和引用功能
-    # 即使 message_id 是 None（乐观展示），也要注册到 _message_widgets_map，以便后续更新
-    if not hasattr(main_window, "_message_widgets_map"):
-        main_window._message_widgets_map = {}
-    
-    if message_id is not None:
-        main_window._message_widgets_map[message_id] = (message_widget, img_label)
-        message_widget.setProperty("message_id", message_id)
-    else:
-        # 乐观展示时，使用 None 作为临时 key，后续收到 message_id 后会更新
-        main_window._message_widgets_map[None] = (message_widget, img_label)
-        # 设置一个标记，表示这是乐观展示的消息
-        message_widget.setProperty("message_id", None)
-
-    # 保存原始消息内容，方便后续“引用图片”时生成缩略图
-    if raw_message and isinstance(raw_message, str):
-        message_widget.setProperty("raw_image_message", raw_message)
-    
-    # 保存消息创建时间（用于撤回时间检查）
-    if message_created_time:
-        message_widget.setProperty("message_created_time", message_created_time)
-    else:
-        # 如果没有提供创建时间，使用当前时间
-        message_widget.setProperty("message_created_time", datetime.now().isoformat())
-    
-    # 为图片消息添加右键菜单（引用 + 撤回）
-    def show_context_menu(pos: QPoint):
-        menu = QMenu(message_widget)
-        menu.setStyleSheet("""
-            QMenu {
-                background-color: #ffffff;
-                border: 1px solid #e5e7eb;
-                border-radius: 8px;
-                padding: 4px;
-                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                font-size: 13px;
-            }
-            QMenu::item {
-                padding: 8px 20px;
-                border-radius: 4px;
-                color: #1f2937;
-                min-width: 120px;
-            }
-            QMenu::item:selected {
-                background-color: #f3f4f6;
-                color: #111827;
-            }
-        """)
-        
-        # 引用回复
-        reply_action = menu.addAction("引用回复")
-        reply_action.setEnabled(True)
-        
-        def reply_message_action():
-            # 允许在 message_id 尚未同步时也进行引用，发送时按普通消息处理
-            current_msg_id = message_widget.property("message_id")
-            valid_msg_id = None
-            if current_msg_id is not None:
-                try:
-                    msg_id_int = int(current_msg_id)
-                    # 数据库ID从1开始，所以允许 >= 1
-                    if msg_id_int > 0:
-                        valid_msg_id = msg_id_int
-                except (ValueError, TypeError):
-                    pass
-            
-            main_window._reply_to_message_id = valid_msg_id  # 可能为 None
-            # 直接使用本地信息设置引用内容，不再通过 HTTP 获取详情。
-            # 优先从当前图片消息控件中读取原始 data:image/... 内容，方便引用时生成缩略图
-            raw_image_message = message_widget.property("raw_image_message")
-            if isinstance(raw_image_message, str) and raw_image_message.startswith("data:image"):
-                main_window._reply_to_message_text = raw_image_message
-                main_window._reply_to_message_type = "image"
-            else:
-                # 回退：如果没有保存原始内容，则仍然使用占位文本
-                main_window._reply_to_message_text = "[图片]"
-                main_window._reply_to_message_type = "image"
-            
-            # 记录被引用的控件，便于后续在拿到 message_id 后自动补齐引用ID
-            main_window._reply_to_widget = message_widget
-            
-            main_window._reply_to_username = from_username or (from_self and "我" or "用户")
-            # 在输入框显示引用提示
-            if hasattr(main_window, "chat_input"):
-                sender_name = main_window._reply_to_username
-                placeholder = f"回复 {sender_name}：[图片]"
-                main_window.chat_input.setPlaceholderText(placeholder)
-                main_window.chat_input.setFocus()
-        
-        reply_action.triggered.connect(reply_message_action)
-        
-        # 撤回图片消息（仅自己发送的图片可以撤回）
-        if from_self:
-            recall_action = menu.addAction("撤回消息")
-            current_msg_id = message_widget.property("message_id")
-            message_created_time = message_widget.property("message_created_time")
-            
-            # 检查是否超过2分钟
-            can_recall = False
-            if current_msg_id and message_created_time:
-                try:
-                    from datetime import timedelta
-                    created_time = datetime.fromisoformat(str(message_created_time).replace('Z', '+00:00'))
-                    time_diff = datetime.now() - created_time.replace(tzinfo=None)
-                    can_recall = time_diff <= timedelta(minutes=2)
-                except Exception:
-                    # 解析失败则交给后端再校验
-                    can_recall = True
-            elif current_msg_id:
-                can_recall = True
-            
-            if current_msg_id and can_recall:
-                recall_action.setEnabled(True)
-            else:
-                recall_action.setEnabled(False)
-                if not current_msg_id:
-                    recall_action.setToolTip("消息ID尚未同步，请稍后再试")
-                else:
-                    recall_action.setToolTip("消息已超过2分钟，无法撤回")
-            
-            def recall_image_message_action():
-                # 再次读取最新 message_id 与时间，防止状态变化
-                current_msg_id = message_widget.property("message_id")
-                if not current_msg_id:
-                    return
-                
-                message_created_time = message_widget.property("message_created_time")
-                if message_created_time:
-                    try:
-                        from datetime import timedelta
-                        created_time = datetime.fromisoformat(str(message_created_time).replace('Z', '+00:00'))
-                        time_diff = datetime.now() - created_time.replace(tzinfo=None)
-                        if time_diff > timedelta(minutes=2):
-                            recall_action.setEnabled(False)
-                            return
-                    except Exception:
-                        pass
-                
-                from client.utils.websocket_helper import recall_message_via_websocket
-                try:
-                    resp = recall_message_via_websocket(main_window, current_msg_id)
-                    if resp.get("success"):
-                        # 本地立即更新 UI，隐藏图片并显示撤回提示，后续服务器广播时会自动跳过
-                        try:
-                            from gui.handlers.chat_handlers import append_chat_message
-                            append_chat_message(
-                                main_window,
-                                "",
-                                from_self=True,
-                                is_html=False,
-                                streaming=False,
-                                avatar_base64=None,
-                                message_id=current_msg_id,
-                                is_recalled=True,
-                                from_user_id=getattr(main_window, "user_id", None),
-                                from_username=getattr(main_window, "username", None),
-                                message_created_time=message_created_time,
-                            )
-                        except Exception as e:
-                            logging.error(f"更新图片撤回消息UI失败: {e}", exc_info=True)
-                except Exception as e:
-                    logging.error(f"撤回图片消息失败: {e}", exc_info=True)
-            
-            recall_action.triggered.connect(recall_image_message_action)
-        
-        global_pos = message_widget.mapToGlobal(pos)
-        menu.exec(global_pos)
-    
-    message_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-    message_widget.customContextMenuRequested.connect(show_context_menu)
-    
-    main_window.chat_layout.addWidget(message_widget)
+    _append_record(main_window, message)
+    return message
 
-    scroll_to_bottom(main_window)
 
+def _format_file_size(size: int) -> str:
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
 
-def _handle_file_upload_result(main_window: "MainWindow", success: bool, filename: str, size: int, error: str = "", file_path: str = ""):
-    """处理文件上传结果"""
-    if success:
-        # 格式化文件大小
-        if size < 1024 * 1024:
-            size_kb = size / 1024
-            size_str = f"{size_kb:.1f} KB"
-        else:
-            size_mb = size / (1024 * 1024)
-            size_str = f"{size_mb:.1f} MB"
-        append_file_message(main_window, filename, size_str)
-
-        # 如已有人工客服会话，发送文件内容到客服
-        if getattr(main_window, "_human_service_connected", False) and getattr(main_window, "_chat_session_id", None):
-            from client.login.token_storage import read_token
-            from client.api_client import send_chat_message
-            
-            token = read_token()
-            session_id = getattr(main_window, "_chat_session_id", None)
-            
-            # 读取文件内容并转换为base64 data URL
-            file_data_url = None
-            if file_path and os.path.exists(file_path):
-                try:
-                    import base64
-                    import mimetypes
-                    # 获取MIME类型
-                    mime_type, _ = mimetypes.guess_type(file_path)
-                    if not mime_type:
-                        mime_type = 'application/octet-stream'
-                    
-                    # 读取文件并编码为base64
-                    with open(file_path, "rb") as f:
-                        file_content = f.read()
-                    b64_content = base64.b64encode(file_content).decode("utf-8")
-                    # 格式: data:{mime_type};base64,{content};filename="{filename}"
-                    file_data_url = f"data:{mime_type};base64,{b64_content};filename=\"{filename}\""
-                except Exception as e:
-                    logging.error(f"读取文件失败: {e}", exc_info=True)
-                    append_chat_message(main_window, f"文件读取失败：{str(e)}", from_self=False)
-            
-            # 如果文件读取失败，使用占位符
-            if not file_data_url:
-                file_data_url = f"[文件] {filename} ({size_str})"
 
-            def restore():
-                main_window.chat_input.setEnabled(True)
-                if hasattr(main_window, 'chat_send_button'):
-                    main_window.chat_send_button.setEnabled(True)
-                QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
+def _restore_chat_input(main_window: "MainWindow", original_text: Optional[str] = None):
+    """文件发送结束后恢复输入框与发送按钮"""
+    main_window.chat_input.setEnabled(True)
+    if hasattr(main_window, 'chat_send_button'):
+        main_window.chat_send_button.setEnabled(True)
+        if original_text:
+            main_window.chat_send_button.setText(original_text)
+        main_window.chat_send_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
+    QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
 
-            # 直接在主线程中使用 WebSocket 客户端发送（WebSocket 发送是异步的，不会阻塞UI）
-            from client.utils.websocket_helper import get_or_create_websocket_client
-            
-            ws_client = get_or_create_websocket_client(main_window)
-            if not ws_client or not ws_client.is_connected():
-                append_chat_message(main_window, "WebSocket 未连接，请稍后重试。", from_self=False)
-                restore()
-                return
-            
-            # 使用 WebSocket 客户端发送消息（异步，不阻塞UI）
-            success = ws_client.send_message(
-                session_id=session_id,
-                message=file_data_url,
-                role="user",
-                message_type="file"
-            )
-            
-            if success:
-                # 发送成功，恢复UI状态
-                restore()
-            else:
-                # 发送失败，显示错误并恢复UI状态
-                append_chat_message(main_window, "文件发送失败，请稍后重试。", from_self=False)
-                restore()
-            return
 
-        # 无人工客服时仍使用机器人
-        reply = main_window.keyword_matcher.generate_reply("文件", add_greeting=True)
-        delay = random.randint(500, 1500)
-        
-        def send_reply_and_enable():
-            append_support_message(main_window, reply)
-            main_window.chat_input.setEnabled(True)
-            if hasattr(main_window, 'chat_send_button'):
-                main_window.chat_send_button.setEnabled(True)
-            QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
-        
-        QTimer.singleShot(delay, send_reply_and_enable)
-    else:
+def _handle_file_upload_result(
+    main_window: "MainWindow",
+    success: bool,
+    filename: str,
+    size: int,
+    error: str = "",
+    file_url: str = "",
+    original_text: Optional[str] = None,
+):
+    """处理文件上传结果：人工客服会话中发送已存储文件的地址，否则由机器人回复"""
+    if not success:
         error_msg = error if error else "未知错误"
         append_chat_message(main_window, f"文件 {filename} 上传失败：{error_msg}", from_self=False)
-        main_window.chat_input.setEnabled(True)
-        if hasattr(main_window, 'chat_send_button'):
-            main_window.chat_send_button.setEnabled(True)
-        QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
+        _restore_chat_input(main_window, original_text)
+        return
+
+    pending_record = append_file_message(main_window, filename, _format_file_size(size))
+
+    # 已进入人工客服：消息中只发送文件地址（文件已分块上传并通过服务端校验），不再内联 base64
+    session_id = getattr(main_window, "_chat_session_id", None)
+    if file_url and getattr(main_window, "_human_service_connected", False) and session_id:
+        from client.utils.websocket_helper import get_or_create_websocket_client
+
+        ws_client = get_or_create_websocket_client(main_window)
+        if not ws_client:
+            append_chat_message(main_window, "WebSocket 未连接，请稍后重试。", from_self=False)
+            _restore_chat_input(main_window, original_text)
+            return
+
+        # 先进入待发送队列，未连接时重连后自动补发
+        sent = ws_client.send_message(
+            session_id=session_id,
+            message=file_url,
+            role="user",
+            message_type="file",
+            client_message_id=pending_record.temp_id if pending_record is not None else None,
+        )
+        if not sent:
+            append_chat_message(main_window, "文件发送失败，请稍后重试。", from_self=False)
+        _restore_chat_input(main_window, original_text)
+        return
+
+    # 未进入人工客服，使用机器人回复
+    reply = main_window.keyword_matcher.generate_reply("文件", add_greeting=True)
+    delay = random.randint(500, 1500)
+
+    def send_reply_and_enable():
+        append_support_message(main_window, reply)
+        _restore_chat_input(main_window, original_text)
+
+    QTimer.singleShot(delay, send_reply_and_enable)
 
 
 def send_file(main_window: "MainWindow"):
-    """发送文件，限制 10MB；展示文件名和大小，显示上传进度
-    
-    为避免通过 WebSocket 发送超大 Base64 数据导致连接异常，这里在客户端
-    先做严格的体积限制和错误处理，只在文件成功读取且体积在安全范围内时发送。
+    """发送文件：展示文件名和大小；人工客服会话中先分块上传到服务端，再发送文件地址
+
+    上传按块读取文件并支持断点续传，进度为服务端已确认的字节数（仅对大于 1MB 的文件显示进度对话框）；
+    文件大小上限与服务端一致（FILE_UPLOAD_MAX_SIZE）。
     """
+    from client.api_client import FILE_UPLOAD_MAX_SIZE
+
     # 检查是否正在发送中，防止重复操作
     if hasattr(main_window, 'chat_send_button') and not main_window.chat_send_button.isEnabled():
         return
@@ -4062,21 +1987,45 @@ def send_file(main_window: "MainWindow"):
         return
     
     size = os.path.getsize(file_path)
-    # 客户端侧限制：最大 10MB，避免 WebSocket 发送超大 Base64 消息导致断线
-    max_size_mb = 10
-    if size > max_size_mb * 1024 * 1024:
+    max_size_mb = FILE_UPLOAD_MAX_SIZE // (1024 * 1024)
+    if size > FILE_UPLOAD_MAX_SIZE:
         # 显示错误提示框给用户，而不是在聊天框中显示
         show_message(
             main_window,
-            f"文件大小超过 {max_size_mb} MB 限制，无法通过实时通道发送。\n\n"
+            f"文件大小超过 {max_size_mb} MB 限制，无法发送。\n\n"
             f"请选择小于 {max_size_mb} MB 的文件，或通过其他方式发送该文件。",
             "文件过大",
             variant="error"
         )
         return
+    if size == 0:
+        show_message(main_window, "不能发送空文件。", "无法发送", variant="error")
+        return
 
-    # 显示上传进度对话框（仅对大于1MB的文件显示）
     filename = os.path.basename(file_path)
+
+    # 禁用发送相关控件
+    main_window.chat_input.setEnabled(False)
+    original_text = None
+    if hasattr(main_window, 'chat_send_button'):
+        original_text = main_window.chat_send_button.text()
+        main_window.chat_send_button.setEnabled(False)
+        main_window.chat_send_button.setText("发送中...")
+        main_window.chat_send_button.setCursor(QCursor(Qt.CursorShape.ArrowCursor))
+
+    # 未进入人工客服：无需上传，直接由机器人回复
+    if not (getattr(main_window, "_human_service_connected", False) and getattr(main_window, "_chat_session_id", None)):
+        _handle_file_upload_result(main_window, True, filename, size, original_text=original_text)
+        return
+
+    def on_finished(success: bool, result: str):
+        _handle_file_upload_result(
+            main_window, success, filename, size,
+            error="" if success else result,
+            file_url=result if success else "",
+            original_text=original_text,
+        )
+
     if size > 1024 * 1024:  # 大于1MB的文件显示进度
         from gui.components.file_upload_progress import FileUploadProgressDialog
         progress_dialog = FileUploadProgressDialog(main_window, filename, size)
@@ -4089,17 +2038,15 @@ def send_file(main_window: "MainWindow"):
         # 保存原始完成处理方法
         original_on_finished = progress_dialog.on_upload_finished
         
-        def custom_on_finished(success: bool, error: str = ""):
+        def custom_on_finished(success: bool, result: str = ""):
             # 调用原始处理（更新UI状态、关闭对话框）
-            original_on_finished(success, error)
+            original_on_finished(success, result)
             
             # 延迟处理文件发送逻辑，等待对话框关闭动画
-            QTimer.singleShot(350, lambda: _handle_file_upload_result(
-                main_window, success, filename, size, error, file_path
-            ))
+            QTimer.singleShot(350, lambda: on_finished(success, result))
         
         # 启动上传
-        progress_dialog.start_upload(file_path)
+        progress_dialog.start_upload(file_path, getattr(main_window, "user_id", None))
         # 替换完成处理信号（断开原有连接，连接自定义处理）
         if progress_dialog.upload_thread:
             try:
@@ -4109,269 +2056,35 @@ def send_file(main_window: "MainWindow"):
             progress_dialog.upload_thread.finished.connect(custom_on_finished)
         
         progress_dialog.show()
-        
-        # 禁用发送相关控件
-        main_window.chat_input.setEnabled(False)
-        if hasattr(main_window, 'chat_send_button'):
-            main_window.chat_send_button.setEnabled(False)
     else:
-        # 小于1MB的文件直接发送，不显示进度
-        # 禁用发送相关控件
-        main_window.chat_input.setEnabled(False)
-        original_text = None
-        if hasattr(main_window, 'chat_send_button'):
-            original_text = main_window.chat_send_button.text()
-            main_window.chat_send_button.setEnabled(False)
-            main_window.chat_send_button.setText("发送中...")
-            main_window.chat_send_button.setCursor(QCursor(Qt.CursorShape.ArrowCursor))
-        
-        size_kb = size / 1024
-        size_str = f"{size_kb:.1f} KB"
-        append_file_message(main_window, filename, size_str)
-
-        # 如果已进入人工客服，发送占位文本给客服，不触发机器人
-        if getattr(main_window, "_human_service_connected", False) and getattr(main_window, "_chat_session_id", None):
-            from client.login.token_storage import read_token
-            from client.api_client import send_chat_message
-            
-            token = read_token()
-            session_id = getattr(main_window, "_chat_session_id", None)
+        # 小文件在后台上传，不显示进度；保留线程引用，避免上传中被回收
+        from gui.components.file_upload_progress import FileUploadThread
+        upload_thread = FileUploadThread(file_path, size, getattr(main_window, "user_id", None))
+        upload_thread.finished.connect(on_finished)
+        main_window._file_upload_thread = upload_thread
+        upload_thread.start()
 
-            # 读取文件内容并转换为 base64 data URL
-            file_data_url = None
-            try:
-                import base64
-                import mimetypes
-                # 获取MIME类型
-                mime_type, _ = mimetypes.guess_type(file_path)
-                if not mime_type:
-                    mime_type = 'application/octet-stream'
-                
-                # 读取文件并编码为 base64
-                with open(file_path, "rb") as f:
-                    file_content = f.read()
-                b64_content = base64.b64encode(file_content).decode("utf-8")
-                # 格式: data:{mime_type};base64,{content};filename="{filename}"
-                file_data_url = f"data:{mime_type};base64,{b64_content};filename=\"{filename}\""
-            except Exception as e:
-                logging.error(f"读取文件失败: {e}", exc_info=True)
-                append_chat_message(main_window, f"文件读取失败：{str(e)}", from_self=False)
-                # 读取失败时直接恢复 UI，不再发送占位符，避免客服端收到错误文件
-                main_window.chat_input.setEnabled(True)
-                if hasattr(main_window, 'chat_send_button'):
-                    main_window.chat_send_button.setEnabled(True)
-                    if original_text:
-                        main_window.chat_send_button.setText(original_text)
-                    main_window.chat_send_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
-                QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
-                return
-
-            # 双重保险：如果 file_data_url 仍然为空，则不发送，避免发送错误占位内容
-            if not file_data_url:
-                append_chat_message(main_window, "文件处理失败，未发送。", from_self=False)
-                main_window.chat_input.setEnabled(True)
-                if hasattr(main_window, 'chat_send_button'):
-                    main_window.chat_send_button.setEnabled(True)
-                    if original_text:
-                        main_window.chat_send_button.setText(original_text)
-                    main_window.chat_send_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
-                QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
-                return
-
-            def restore():
-                main_window.chat_input.setEnabled(True)
-                if hasattr(main_window, 'chat_send_button'):
-                    main_window.chat_send_button.setEnabled(True)
-                    if original_text:
-                        main_window.chat_send_button.setText(original_text)
-                    main_window.chat_send_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
-                QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
 
-            # 直接在主线程中使用 WebSocket 客户端发送（WebSocket 发送是异步的，不会阻塞UI）
-            from client.utils.websocket_helper import get_or_create_websocket_client
-            
-            ws_client = get_or_create_websocket_client(main_window)
-            if not ws_client or not ws_client.is_connected():
-                append_chat_message(main_window, "WebSocket 未连接，请稍后重试。", from_self=False)
-                restore()
-                return
-            
-            # 使用 WebSocket 客户端发送消息（异步，不阻塞UI）
-            success = ws_client.send_message(
-                session_id=session_id,
-                message=file_data_url,
-                role="user",
-                message_type="file"
-            )
-            
-            if success:
-                # 发送成功，恢复UI状态
-                restore()
-            else:
-                # 发送失败，显示错误并恢复UI状态
-                append_chat_message(main_window, "文件发送失败，请稍后重试。", from_self=False)
-                restore()
-        else:
-            # 未进入人工客服，使用机器人回复
-            reply = main_window.keyword_matcher.generate_reply("文件", add_greeting=True)
-            delay = random.randint(500, 1500)
-            
-            def send_reply_and_enable():
-                append_support_message(main_window, reply)
-                # 恢复按钮和输入框状态
-                main_window.chat_input.setEnabled(True)
-                if hasattr(main_window, 'chat_send_button'):
-                    main_window.chat_send_button.setEnabled(True)
-                    if original_text:
-                        main_window.chat_send_button.setText(original_text)
-                    main_window.chat_send_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
-                # 延迟聚焦，确保 UI 更新完成后再聚焦
-                QTimer.singleShot(50, lambda: main_window.chat_input.setFocus())
-            
-            QTimer.singleShot(delay, send_reply_and_enable)
+def _mark_image_failed(message: ChatMessage) -> None:
+    """图片无法解码时改为显示文字提示"""
+    message.kind = KIND_TEXT
+    message.content = "[图片] 加载失败"
+    message.pixmap = None
 
 
-def append_file_message(main_window: "MainWindow", filename: str, size_str: str, from_self: bool = True):
+def append_file_message(main_window: "MainWindow", filename: str, size_str: str, from_self: bool = True) -> Optional[ChatMessage]:
     """以卡片形式追加一条文件消息（用户或客服）"""
-    if not hasattr(main_window, "chat_layout"):
-        return
-
-    message_widget = QWidget()
-    v_layout = QVBoxLayout(message_widget)
-    v_layout.setContentsMargins(4, 0, 4, 0)
-    v_layout.setSpacing(2)
-
-    if from_self:
-        time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        time_label = QLabel(time_str)
-        time_label.setStyleSheet("""
-            QLabel {
-                font-family: "Microsoft YaHei", "SimHei", "Arial";
-                font-size: 11px;
-                color: #9ca3af;
-            }
-        """)
-        time_row = QHBoxLayout()
-        time_row.setContentsMargins(0, 0, 0, 0)
-        time_row.addStretch()
-        time_row.addWidget(time_label)
-        v_layout.addLayout(time_row)
-
-    row = QHBoxLayout()
-    row.setContentsMargins(0, 0, 0, 0)
-    row.setSpacing(6)
-
-    card = QWidget()
-    card.setObjectName("fileCard")
-    card.setStyleSheet("""
-        #fileCard {
-            background-color: #ffffff;
-            border-radius: 14px;
-            border: 1px solid #e5e7eb;
-        }
-    """)
-    card.setMinimumWidth(200)
-    card.setMaximumWidth(260)
-    card_layout = QHBoxLayout(card)
-    card_layout.setContentsMargins(10, 8, 10, 8)
-    card_layout.setSpacing(8)
-
-    text_col = QVBoxLayout()
-    text_col.setContentsMargins(0, 0, 0, 0)
-    text_col.setSpacing(4)
-
-    name_label = QLabel(filename)
-    name_label.setStyleSheet("""
-        QLabel {
-            font-family: "Microsoft YaHei", "SimHei", "Arial";
-            font-size: 14px;
-            font-weight: 600;
-            color: #111827;
-        }
-    """)
-    name_label.setMinimumWidth(120)
-    name_label.setMaximumWidth(200)
-
-    size_label = QLabel(size_str)
-    size_label.setStyleSheet("""
-        QLabel {
-            font-family: "Microsoft YaHei", "SimHei", "Arial";
-            font-size: 12px;
-            color: #6b7280;
-        }
-    """)
-
-    text_col.addWidget(name_label)
-    text_col.addWidget(size_label)
-    card_layout.addLayout(text_col, stretch=1)
-
-    ext = os.path.splitext(filename)[1].lstrip(".").upper() or "FILE"
-    ext = ext[:3]
-    icon_bg = QWidget()
-    icon_bg.setObjectName("fileIcon")
-    icon_bg.setFixedSize(34, 42)
-    icon_bg.setStyleSheet("""
-        #fileIcon {
-            background-color: #2563eb;
-            border-radius: 8px;
-        }
-    """)
-    icon_layout = QVBoxLayout(icon_bg)
-    icon_layout.setContentsMargins(0, 0, 0, 0)
-    icon_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
-
-    icon_label = QLabel(ext)
-    icon_label.setStyleSheet("""
-        QLabel {
-            color: #ffffff;
-            font-family: "Microsoft YaHei", "SimHei", "Arial";
-            font-size: 12px;
-            font-weight: 700;
-        }
-    """)
-    icon_layout.addWidget(icon_label)
-
-    card_layout.addWidget(icon_bg, alignment=Qt.AlignmentFlag.AlignVCenter)
-
-    avatar_label = QLabel()
-    avatar_label.setFixedSize(32, 32)
-    if from_self:
-        if main_window.user_avatar_label.pixmap():
-            pm = main_window.user_avatar_label.pixmap().scaled(
-                32, 32,
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation,
-            )
-            avatar_label.setPixmap(pm)
-    else:
-        default_bytes = get_default_avatar()
-        if default_bytes:
-            pm = QPixmap()
-            pm.loadFromData(default_bytes)
-            pm = pm.scaled(32, 32, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            cropped = QPixmap(32, 32)
-            cropped.fill(Qt.GlobalColor.transparent)
-            p = QPainter(cropped)
-            p.setRenderHint(QPainter.RenderHint.Antialiasing)
-            clip_path = QPainterPath()
-            clip_path.addEllipse(0, 0, 32, 32)
-            p.setClipPath(clip_path)
-            p.drawPixmap(0, 0, pm)
-            p.end()
-            avatar_label.setPixmap(cropped)
-
-    avatar_label.setStyleSheet("border-radius:16px;")
-
-    if from_self:
-        row.addStretch()
-        row.addWidget(card)
-        row.addWidget(avatar_label)
-    else:
-        row.addWidget(avatar_label)
-        row.addWidget(card)
-        row.addStretch()
-
-    v_layout.addLayout(row)
-    main_window.chat_layout.addWidget(message_widget)
+    if not hasattr(main_window, "chat_model"):
+        return None
 
-    scroll_to_bottom(main_window)
+    message = ChatMessage(
+        KIND_FILE,
+        filename,
+        from_self=from_self,
+        time_text=datetime.now().strftime("%Y-%m-%d %H:%M:%S") if from_self else "",
+        avatar=_message_avatar(main_window, from_self),
+        file_name=filename,
+        file_size=size_str,
+    )
+    _append_record(main_window, message)
+    return message
@@ -6,8 +6,7 @@ from PyQt6.QtCore import QPoint, QRect, QTimer, Qt
 
 from client.login.login_status_manager import check_login_status, save_login_status
 from client.login.token_storage import read_token
-from client.login.token_utils import verify_token
-from client.api_client import check_token as api_check_token
+from client.api_client import check_token as api_check_token, get_valid_token, build_user_profile
 from client.config import texts as text_cfg
 from gui.custom_message_box import CustomMessageBox
 from modules.login_dialog import LoginDialog
@@ -66,8 +65,9 @@ def check_auto_login(main_window: "MainWindow") -> None:
         if not token:
             raise StopIteration  # 使用内部哨兵异常，仅用于跳出 try，不视为错误
 
-        # 先做本地 token 签名校验
-        if not verify_token(token):
+        # 先做本地格式/过期检查，access token 即将过期时用 refresh token 换新
+        token = get_valid_token()
+        if not token:
             raise RuntimeError("本地 token 已失效")
 
         # 通过后端接口校验并获取用户信息
@@ -88,10 +88,8 @@ def check_auto_login(main_window: "MainWindow") -> None:
         if user_id is not None:
             save_login_status(user_id, username)
 
-            # 通过用户资料接口获取最新头像与 VIP / 钻石信息，确保使用用户上传的头像
-            from client.api_client import get_user_profile
-
-            profile = get_user_profile(user_id) or {}
+            # check_token 响应已包含用户与 VIP 信息，头像按引用地址下载（本地按版本缓存）
+            profile = build_user_profile(resp)
             p_user = profile.get("user") or {}
             p_vip = profile.get("vip") or vip_info
 
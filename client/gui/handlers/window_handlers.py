@@ -5,6 +5,7 @@ from PyQt6.QtCore import Qt, QPoint, QRect, QPropertyAnimation, QTimer
 from PyQt6.QtGui import QCursor, QColor
 
 from client.login.token_storage import clear_token
+from client.api_client import stop_token_auto_refresh
 from client.login.login_status_manager import clear_login_status
 from gui.handlers import dialog_handlers, avatar_handlers
 from gui.components.chat_bubble import LogoutPopup
@@ -147,9 +148,10 @@ def update_logout_popup_position(main_window: "MainWindow"):
 
 def handle_logout_click(main_window: "MainWindow"):
     """处理退出登录：清除 token、重置 UI 并返回登录界面"""
-    # 清除本地 token
+    # 清除本地 token，并停止后台续期
     try:
         clear_token()
+        stop_token_auto_refresh()
     except Exception:
         pass
 
@@ -4,13 +4,13 @@ from PyQt6.QtWidgets import (
     QWidget,
     QVBoxLayout,
     QPushButton,
-    QScrollArea,
+    QAbstractScrollArea,
 )
 from PyQt6.QtCore import Qt, QPoint, QTimer
 from PyQt6.QtGui import QPixmap
 from modules.login_dialog import LoginDialog
 from client.customer_service.keyword_matcher import get_matcher
-from gui.components.chat_bubble import ChatBubble
+from gui.components.message_store import ChatMessage
 from gui.components.chat_panel import create_chat_panel
 from gui.components.ui_layout import create_main_layout
 from gui.handlers import dialog_handlers, avatar_handlers, chat_handlers
@@ -164,16 +164,16 @@ class MainWindow(QMainWindow):
     def open_emoji_menu(self):
         return chat_handlers.open_emoji_menu(self)
 
-    def _start_streaming_text(self, bubble: "ChatBubble", full_text: str, interval_ms: int = 30):
-        return chat_handlers.start_streaming_text(self, bubble, full_text, interval_ms)
+    def _start_streaming_text(self, message: ChatMessage, full_text: str, interval_ms: int = 30):
+        return chat_handlers.start_streaming_text(self, message, full_text, interval_ms)
 
     def _insert_emoji(self, emoji: str):
         return chat_handlers.insert_emoji(self, emoji)
 
-    def _show_scrollbar_handle(self, scroll_area: QScrollArea):
+    def _show_scrollbar_handle(self, scroll_area: QAbstractScrollArea):
         return chat_handlers.show_scrollbar_handle(scroll_area)
 
-    def _hide_scrollbar_handle(self, scroll_area: QScrollArea):
+    def _hide_scrollbar_handle(self, scroll_area: QAbstractScrollArea):
         return chat_handlers.hide_scrollbar_handle(scroll_area)
 
     def _create_faq_item(self, question: str, answer: str) -> QWidget:
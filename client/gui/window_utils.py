@@ -73,12 +73,16 @@ def avatar_bytes_to_data_url(data: bytes, size: int = 32, mime: str = "image/png
             return bytes_to_data_url(data, mime)
         target = size * 2
         scaled = pix.scaled(target, target, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-
-        buffer = QBuffer()
-        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
-        scaled.save(buffer, "PNG")
-        b64 = base64.b64encode(buffer.data()).decode("utf-8")
-        buffer.close()
-        return f"data:{mime};base64,{b64}"
+        return pixmap_to_data_url(scaled, mime)
     except Exception:
         return bytes_to_data_url(data, mime)
+
+
+def pixmap_to_data_url(pixmap: QPixmap, mime: str = "image/png") -> str:
+    """将已解码（已缩放）的像素图编码为 PNG data URL"""
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    pixmap.save(buffer, "PNG")
+    b64 = base64.b64encode(buffer.data()).decode("utf-8")
+    buffer.close()
+    return f"data:{mime};base64,{b64}"
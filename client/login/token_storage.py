@@ -1,4 +1,7 @@
+import json
+import logging
 import os
+import threading
 from pathlib import Path
 from client.encryption.encryption_utils import encrypt_file, decrypt_file
 
@@ -13,23 +16,56 @@ TOKEN_DIR.mkdir(parents=True, exist_ok=True)
 # 完整的文件路径
 TOKEN_FILE = TOKEN_DIR / "token.enc"
 
-def save_token(token):
-    """将加密后的令牌保存到文件中"""
-    encrypted_token = encrypt_file(token)
+# access token 更新时的回调（例如让已建立的 WebSocket 连接改用新 token）
+_token_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def _read_tokens():
+    """读取并解密令牌文件，返回 {access_token, refresh_token}
+
+    兼容旧版文件：旧版只保存一个明文 token 字符串。
+    """
+    if not TOKEN_FILE.exists():
+        return {}
+    with open(TOKEN_FILE, 'rb') as f:
+        encrypted_token = f.read()
+    try:
+        raw = decrypt_file(encrypted_token)
+    except Exception:
+        return {}
+    try:
+        data = json.loads(raw)
+        if isinstance(data, dict):
+            return data
+    except ValueError:
+        pass
+    return {"access_token": raw}
+
+
+def save_token(token, refresh_token=None):
+    """将加密后的令牌保存到文件中
+
+    未传入 refresh_token 时保留本地已有的 refresh token。
+    """
+    if refresh_token is None:
+        refresh_token = _read_tokens().get("refresh_token")
+    data = {"access_token": token, "refresh_token": refresh_token}
+    encrypted_token = encrypt_file(json.dumps(data))
     with open(TOKEN_FILE, 'wb') as f:
         f.write(encrypted_token)
+    _notify_token_listeners(token)
+
 
 def read_token():
-    """读取并解密令牌文件"""
-    if TOKEN_FILE.exists():
-        with open(TOKEN_FILE, 'rb') as f:
-            encrypted_token = f.read()
-        try:
-            token = decrypt_file(encrypted_token)
-            return token
-        except Exception:
-            return None
-    return None
+    """读取 access token"""
+    return _read_tokens().get("access_token")
+
+
+def read_refresh_token():
+    """读取 refresh token"""
+    return _read_tokens().get("refresh_token")
+
 
 def clear_token():
     """清除本地保存的 token 文件"""
@@ -39,3 +75,26 @@ def clear_token():
         except OSError:
             pass
 
+
+def add_token_listener(callback):
+    """注册 access token 更新回调：callback(new_token)"""
+    with _listeners_lock:
+        if callback not in _token_listeners:
+            _token_listeners.append(callback)
+
+
+def remove_token_listener(callback):
+    """移除 access token 更新回调"""
+    with _listeners_lock:
+        if callback in _token_listeners:
+            _token_listeners.remove(callback)
+
+
+def _notify_token_listeners(token):
+    with _listeners_lock:
+        listeners = list(_token_listeners)
+    for callback in listeners:
+        try:
+            callback(token)
+        except Exception as e:
+            logging.error(f"token 更新回调异常: {e}", exc_info=True)
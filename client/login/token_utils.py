@@ -55,3 +55,23 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
     except Exception:
         return None
 
+
+def seconds_until_expiry(token: str) -> Optional[int]:
+    """
+    返回令牌距离过期的剩余秒数（不验证签名，仅用于决定何时刷新）。
+
+    Returns:
+        剩余秒数（已过期时为负数）；格式错误返回 None
+    """
+    try:
+        parts = token.split(".")
+        if len(parts) != 3:
+            return None
+        payload = json.loads(_b64url_decode(parts[1]).decode("utf-8"))
+        exp = payload.get("exp")
+        if not isinstance(exp, int):
+            return None
+        return exp - int(time.time())
+    except Exception:
+        return None
+
@@ -21,8 +21,10 @@ from client.api_client import (
     register_user as api_register_user,
     login_user as api_login_user,
     check_token as api_check_token,
+    get_valid_token,
+    build_user_profile,
+    start_token_auto_refresh,
 )
-from client.login.token_utils import verify_token
 from client.login.token_storage import save_token, read_token
 from client.login.login_status_manager import save_login_status
 import logging
@@ -880,14 +882,15 @@ class LoginDialog(QDialog):
         if user_id is not None:
             save_login_status(user_id, username)
         if token:
-            save_token(token)
+            save_token(token, resp.get("refresh_token"))
+            # 在 access token 过期前后台续期（否则登录约 30 分钟后 WebSocket 事件都会因 token 过期失败）
+            start_token_auto_refresh()
 
         is_vip = bool(vip_info.get("is_vip", False))
         diamonds = vip_info.get("diamonds", 0)
 
-        # 通过用户资料接口获取最新头像（包括默认头像）
-        from client.api_client import get_user_profile
-        profile = get_user_profile(user_id) or {}
+        # 直接使用注册响应中的资料与头像，无需再次请求后端
+        profile = build_user_profile(resp)
         p_user = profile.get("user") or {}
         p_vip = profile.get("vip") or vip_info
         avatar_bytes = p_user.get("avatar_bytes")
@@ -947,14 +950,15 @@ class LoginDialog(QDialog):
         if user_id is not None:
             save_login_status(user_id, username)
         if token:
-            save_token(token)
+            save_token(token, resp.get("refresh_token"))
+            # 在 access token 过期前后台续期（否则登录约 30 分钟后 WebSocket 事件都会因 token 过期失败）
+            start_token_auto_refresh()
 
         is_vip = bool(vip_info.get("is_vip", False))
         diamonds = vip_info.get("diamonds", 0)
 
-        # 通过用户资料接口获取最新头像，确保使用用户上传的头像
-        from client.api_client import get_user_profile
-        profile = get_user_profile(user_id) or {}
+        # 登录响应已包含用户与 VIP 信息，头像按引用地址下载（本地按版本缓存）
+        profile = build_user_profile(resp)
         p_user = profile.get("user") or {}
         p_vip = profile.get("vip") or vip_info
         avatar_bytes = p_user.get("avatar_bytes")
@@ -983,11 +987,10 @@ class LoginDialog(QDialog):
             super().keyPressEvent(event)
     
     def check_token(self):
-        token = read_token()
-        if token:
-            # 先做本地签名验证，避免明显非法 token
-            payload = verify_token(token)
-            if not payload:
+        if read_token():
+            # 先做本地格式/过期检查，access token 即将过期时用 refresh token 换新
+            token = get_valid_token()
+            if not token:
                 return False
 
             try:
@@ -1010,9 +1013,8 @@ class LoginDialog(QDialog):
             if new_token:
                 save_token(new_token)
 
-            # 通过用户资料接口获取最新头像，确保使用用户上传的头像
-            from client.api_client import get_user_profile
-            profile = get_user_profile(user_id) or {}
+            # check_token 响应已包含用户与 VIP 信息，头像按引用地址下载（本地按版本缓存）
+            profile = build_user_profile(resp)
             p_user = profile.get("user") or {}
             p_vip = profile.get("vip") or vip_info
             avatar_bytes = p_user.get("avatar_bytes")
@@ -0,0 +1,223 @@
+"""图片解码服务与像素图缓存
+
+聊天气泡、头像、引用缩略图共用一个解码服务：
+- 图片字节 / base64 / data URL 在 QThreadPool 中解码并缩放为 QImage，不占用 UI 线程；
+- 解码结果回到主线程后转为 QPixmap，按“内容哈希 + 目标尺寸 + 形状”放入带内存上限的 LRU 缓存；
+- 同一张图片的并发请求只解码一次，完成后依次回调。
+"""
+import base64
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+from PyQt6.QtGui import QImage, QPainter, QPainterPath, QPixmap
+
+ImageSource = Union[bytes, bytearray, memoryview, str]
+ImageSize = Union[int, Tuple[int, int]]   # 最大边，或 (最大宽, 最大高)
+ImageKey = Tuple[Hashable, Optional[ImageSize], str]
+DecodeCallback = Callable[[Optional[QPixmap]], None]
+
+SHAPE_FIT = "fit"        # 等比缩放到 size 以内（不放大）
+SHAPE_CIRCLE = "circle"  # 居中裁剪为 size x size 的圆形（头像）
+
+# 缓存中像素图占用的内存上限
+DEFAULT_CACHE_BUDGET = 64 * 1024 * 1024
+
+
+def image_key(source: ImageSource, size: Optional[ImageSize] = None, shape: str = SHAPE_FIT) -> ImageKey:
+    """缓存键：内容哈希 + 目标尺寸 + 形状"""
+    data = source.encode("utf-8") if isinstance(source, str) else bytes(source)
+    return hashlib.blake2b(data, digest_size=16).digest(), size, shape
+
+
+def _source_bytes(source: ImageSource) -> bytes:
+    if isinstance(source, str):
+        b64 = source.split(",", 1)[1] if source.startswith("data:") else source
+        return base64.b64decode(b64)
+    return bytes(source)
+
+
+def shape_image(image: QImage, size: Optional[ImageSize], shape: str) -> QImage:
+    """按形状缩放 / 裁剪图片；只使用 QImage 与 QPainter，可在工作线程中调用"""
+    if image.isNull():
+        return image
+    if shape == SHAPE_CIRCLE and size:
+        scaled = image.scaled(
+            size, size, Qt.AspectRatioMode.KeepAspectRatioByExpanding, Qt.TransformationMode.SmoothTransformation
+        )
+        result = QImage(size, size, QImage.Format.Format_ARGB32_Premultiplied)
+        result.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(result)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        path = QPainterPath()
+        path.addEllipse(0, 0, size, size)
+        painter.setClipPath(path)
+        painter.drawImage((size - scaled.width()) // 2, (size - scaled.height()) // 2, scaled)
+        painter.end()
+        return result
+    if size:
+        max_width, max_height = (size, size) if isinstance(size, int) else size
+        if image.width() > max_width or image.height() > max_height:
+            return image.scaled(
+                max_width, max_height, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation
+            )
+    return image
+
+
+def decode_image(source: ImageSource, size: Optional[ImageSize] = None, shape: str = SHAPE_FIT) -> QImage:
+    """解码并缩放图片，失败时返回空 QImage"""
+    try:
+        return shape_image(QImage.fromData(_source_bytes(source)), size, shape)
+    except Exception as e:
+        logging.error(f"图片解码失败: {e}")
+        return QImage()
+
+
+class PixmapCache:
+    """按内存占用淘汰的 LRU 像素图缓存"""
+
+    def __init__(self, budget_bytes: int = DEFAULT_CACHE_BUDGET):
+        self.budget_bytes = budget_bytes
+        self._items: "OrderedDict[Hashable, QPixmap]" = OrderedDict()
+        self._cost = 0
+
+    @staticmethod
+    def _pixmap_cost(pixmap: QPixmap) -> int:
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def cost(self) -> int:
+        """当前缓存的像素图占用的字节数"""
+        return self._cost
+
+    def get(self, key: Hashable) -> Optional[QPixmap]:
+        pixmap = self._items.get(key)
+        if pixmap is not None:
+            self._items.move_to_end(key)
+        return pixmap
+
+    def put(self, key: Hashable, pixmap: QPixmap) -> None:
+        cost = self._pixmap_cost(pixmap)
+        if cost > self.budget_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._cost -= self._pixmap_cost(old)
+        self._items[key] = pixmap
+        self._cost += cost
+        while self._cost > self.budget_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self._cost -= self._pixmap_cost(evicted)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._cost = 0
+
+
+class _DecodeTask(QRunnable):
+    """线程池中的解码任务，完成后通过服务的信号把 QImage 送回主线程"""
+
+    def __init__(
+        self, service: "ImageDecodeService", key: ImageKey, source: ImageSource, size: Optional[ImageSize], shape: str
+    ):
+        super().__init__()
+        self._service = service
+        self._key = key
+        self._source = source
+        self._size = size
+        self._shape = shape
+
+    def run(self):
+        self._service._decoded.emit(self._key, decode_image(self._source, self._size, self._shape))
+
+
+class ImageDecodeService(QObject):
+    """共享的图片解码服务（必须在主线程创建和调用）"""
+
+    _decoded = pyqtSignal(object, QImage)
+
+    def __init__(self, budget_bytes: int = DEFAULT_CACHE_BUDGET, max_threads: Optional[int] = None, parent=None):
+        super().__init__(parent)
+        self.cache = PixmapCache(budget_bytes)
+        self._pool = QThreadPool(self)
+        if max_threads:
+            self._pool.setMaxThreadCount(max_threads)
+        self._waiting: Dict[ImageKey, List[DecodeCallback]] = {}
+        self._decoded.connect(self._on_decoded)
+
+    def cached(self, source: ImageSource, size: Optional[ImageSize] = None, shape: str = SHAPE_FIT) -> Optional[QPixmap]:
+        """只查缓存，不触发解码"""
+        return self.cache.get(image_key(source, size, shape))
+
+    def request(
+        self,
+        source: ImageSource,
+        callback: Optional[DecodeCallback] = None,
+        size: Optional[ImageSize] = None,
+        shape: str = SHAPE_FIT,
+    ) -> Optional[QPixmap]:
+        """命中缓存时直接返回像素图（不调用回调）；否则返回 None 并提交后台解码，
+        完成后在主线程调用 callback(像素图)，解码失败时参数为 None"""
+        key = image_key(source, size, shape)
+        pixmap = self.cache.get(key)
+        if pixmap is not None:
+            return pixmap
+        waiting = self._waiting.get(key)
+        if waiting is None:
+            self._waiting[key] = waiting = []
+            self._pool.start(_DecodeTask(self, key, source, size, shape))
+        if callback is not None:
+            waiting.append(callback)
+        return None
+
+    def load(self, source: ImageSource, size: Optional[ImageSize] = None, shape: str = SHAPE_FIT) -> Optional[QPixmap]:
+        """同步解码（带缓存），仅用于必须立即显示的小图，如默认头像"""
+        key = image_key(source, size, shape)
+        pixmap = self.cache.get(key)
+        if pixmap is None:
+            image = decode_image(source, size, shape)
+            if image.isNull():
+                return None
+            pixmap = QPixmap.fromImage(image)
+            self.cache.put(key, pixmap)
+        return pixmap
+
+    def scaled(self, pixmap: QPixmap, size: int, shape: str = SHAPE_FIT) -> QPixmap:
+        """缩放 / 裁剪已有的像素图（如当前用户头像），结果按 QPixmap.cacheKey 缓存"""
+        key = (("pixmap", pixmap.cacheKey()), size, shape)
+        result = self.cache.get(key)
+        if result is None:
+            result = QPixmap.fromImage(shape_image(pixmap.toImage(), size, shape))
+            self.cache.put(key, result)
+        return result
+
+    def wait_for_done(self, msecs: int = -1) -> bool:
+        """等待线程池中的解码任务结束（回调仍需事件循环派发）"""
+        return self._pool.waitForDone(msecs)
+
+    def _on_decoded(self, key: ImageKey, image: QImage) -> None:
+        pixmap = None
+        if not image.isNull():
+            pixmap = QPixmap.fromImage(image)
+            self.cache.put(key, pixmap)
+        for callback in self._waiting.pop(key, []):
+            try:
+                callback(pixmap)
+            except Exception as e:
+                logging.error(f"图片解码回调失败: {e}", exc_info=True)
+
+
+_service: Optional[ImageDecodeService] = None
+
+
+def get_image_service() -> ImageDecodeService:
+    """获取全局图片解码服务（首次调用时创建，需在 QApplication 创建之后）"""
+    global _service
+    if _service is None:
+        _service = ImageDecodeService()
+    return _service
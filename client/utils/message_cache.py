@@ -0,0 +1,435 @@
+"""本地聊天记录缓存
+
+把客服会话的消息、图片缩略图与头像保存在本地 SQLite 中，消息按“会话ID + 消息ID”索引
+（消息ID由服务端自增分配，即会话内的序号）：
+- 打开聊天面板时先从磁盘渲染上次的聊天记录，再只向服务端请求最后一条缓存消息之后的消息；
+- 图片消息只保存缩略图，头像按内容哈希只保存一份，消息负载中以键引用；
+- 超过保留天数的会话，以及超出容量上限时最久未更新的会话会被淘汰。
+
+所有数据库操作在同一个后台线程中按提交顺序执行：写入不等待；读取排在此前提交的写入之后，总能读到最新数据。
+读取方法传入 callback 时不等待，结果在后台线程中传给 callback（UI 线程必须用这种方式，
+排在前面的图片消息写入需要解码缩略图，等待会卡住界面）；不传时等待结果返回（用于后台线程与测试）。
+"""
+import base64
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from PyQt6.QtCore import QBuffer, QIODevice
+from PyQt6.QtGui import QImage
+
+from client.config.config import CACHE_DIR
+from client.utils.image_cache import decode_image
+
+# 缓存文件：<本地缓存目录>/messages.db（与头像文件缓存同目录，见 client.config.config.CACHE_DIR）
+DEFAULT_CACHE_PATH = CACHE_DIR / "messages.db"
+
+# 容量上限（消息负载 + 缩略图字节数）与会话保留天数
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+
+# 图片消息缩略图最大边；头像最大边（界面显示为 32 像素，保留高分屏余量）
+THUMBNAIL_SIZE = 320
+AVATAR_SIZE = 64
+
+# 每写入多少条消息检查一次容量
+_PRUNE_INTERVAL = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    agent_id INTEGER,
+    active INTEGER NOT NULL DEFAULT 1,
+    last_message_id INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id, active, updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    thumbnail_key TEXT,
+    avatar_key TEXT,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (session_id, message_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS thumbnails (
+    key TEXT PRIMARY KEY,
+    mime TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def _encode_image(image: QImage) -> Tuple[str, bytes]:
+    """有透明通道的保存为 PNG，否则保存为 JPEG"""
+    fmt, mime = ("PNG", "image/png") if image.hasAlphaChannel() else ("JPG", "image/jpeg")
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, fmt, 85)
+    return mime, bytes(buffer.data())
+
+
+def _data_url(mime: str, data: bytes) -> str:
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class MessageCache:
+    """客服会话的本地 SQLite 缓存（线程安全，可在任意线程调用）"""
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+    ):
+        self.path = Path(path) if path is not None else DEFAULT_CACHE_PATH
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message-cache")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._submit(self._prune)
+
+    # ---- 会话 ----
+
+    def open_session(self, session_id: str, user_id: int, agent_id: Optional[int] = None) -> None:
+        """记录进行中的客服会话（已存在时更新客服ID并重新标记为进行中）"""
+        def run(conn: sqlite3.Connection):
+            conn.execute(
+                "INSERT INTO sessions (session_id, user_id, agent_id, active, updated_at) VALUES (?, ?, ?, 1, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET "
+                "agent_id = COALESCE(excluded.agent_id, agent_id), active = 1, updated_at = excluded.updated_at",
+                (session_id, user_id, agent_id, time.time()),
+            )
+        self._submit(run)
+
+    def close_session(self, session_id: str) -> None:
+        """会话结束：不再在打开面板时恢复，数据保留到按时间 / 容量淘汰"""
+        def run(conn: sqlite3.Connection):
+            conn.execute("UPDATE sessions SET active = 0 WHERE session_id = ?", (session_id,))
+            self._prune(conn)
+        self._submit(run)
+
+    def active_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """用户最近一个进行中的会话：{session_id, agent_id, last_message_id}，没有时返回 None"""
+        return self._call(lambda conn: self._active_session(conn, user_id))
+
+    def load_active_session(
+        self, user_id: int, limit: Optional[int] = None, callback: Optional[Callable[[Any], None]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """用户最近一个进行中的会话及其最后 limit 条消息：{session_id, agent_id, last_message_id, messages}，
+        没有时为 None（打开聊天面板时恢复会话，一次读取）"""
+        def run(conn: sqlite3.Connection):
+            session = self._active_session(conn, user_id)
+            if session is not None:
+                session["messages"] = self._load_messages(conn, session["session_id"], limit)
+            return session
+        return self._call(run, callback)
+
+    def sync_range(
+        self, session_id: str, callback: Optional[Callable[[Any], None]] = None
+    ) -> Optional[Tuple[int, int]]:
+        """(第一条, 最后一条) 缓存消息的ID：增量同步的起点与校正撤回 / 编辑的范围，没有缓存时为 (0, 0)"""
+        def run(conn: sqlite3.Connection):
+            return self._first_message_id(conn, session_id), self._last_message_id(conn, session_id)
+        return self._call(run, callback, default=(0, 0))
+
+    def last_message_id(self, session_id: str) -> int:
+        """会话中最后一条缓存消息的ID（增量同步的起点），没有缓存时为 0"""
+        return self._call(lambda conn: self._last_message_id(conn, session_id), default=0)
+
+    def first_message_id(self, session_id: str) -> int:
+        """会话中第一条缓存消息的ID（增量同步时校正撤回 / 编辑的范围起点），没有缓存时为 0"""
+        return self._call(lambda conn: self._first_message_id(conn, session_id), default=0)
+
+    # ---- 消息 ----
+
+    def load_messages(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按消息ID顺序读取会话的消息负载（结构与服务端 new_message 一致，图片与头像为缓存的缩略图）"""
+        return self._call(lambda conn: self._load_messages(conn, session_id, limit), default=[])
+
+    def put_messages(self, session_id: str, payloads: Iterable[Dict[str, Any]]) -> None:
+        """写入 / 合并消息（新字段覆盖旧字段，值为 None 的字段不覆盖）；
+        图片转为缩略图、头像去重后保存，撤回的消息删除其缩略图引用"""
+        payloads = [dict(p) for p in payloads if p.get("id") is not None]
+        if not payloads:
+            return
+
+        def run(conn: sqlite3.Connection):
+            last_id = 0
+            for payload in payloads:
+                try:
+                    message_id = int(payload["id"])
+                except (ValueError, TypeError):
+                    continue
+                last_id = max(last_id, message_id)
+                row = conn.execute(
+                    "SELECT payload, thumbnail_key, avatar_key FROM messages WHERE session_id = ? AND message_id = ?",
+                    (session_id, message_id),
+                ).fetchone()
+                merged, thumbnail_key, avatar_key = ({}, None, None) if row is None else (json.loads(row[0]), row[1], row[2])
+                merged.update({k: v for k, v in payload.items() if v is not None})
+
+                text = merged.get("text")
+                if merged.get("is_recalled"):
+                    thumbnail_key = None
+                elif merged.get("message_type") == "image" and isinstance(text, str) and text.startswith("data:image"):
+                    thumbnail_key = self._store_image(conn, text, THUMBNAIL_SIZE) or thumbnail_key
+                    if thumbnail_key is not None:
+                        merged["text"] = None
+                avatar = merged.pop("avatar", None)
+                if isinstance(avatar, str) and avatar.startswith("data:image"):
+                    avatar_key = self._store_image(conn, avatar, AVATAR_SIZE) or avatar_key
+
+                encoded = json.dumps(merged, ensure_ascii=False, separators=(",", ":"))
+                conn.execute(
+                    "INSERT OR REPLACE INTO messages (session_id, message_id, payload, thumbnail_key, avatar_key, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, message_id, encoded, thumbnail_key, avatar_key, len(encoded.encode("utf-8"))),
+                )
+            conn.execute(
+                "UPDATE sessions SET last_message_id = MAX(last_message_id, ?), updated_at = ? WHERE session_id = ?",
+                (last_id, time.time(), session_id),
+            )
+            self._writes_since_prune += len(payloads)
+            if self._writes_since_prune >= _PRUNE_INTERVAL:
+                self._prune(conn)
+        self._submit(run)
+
+    def update_message(self, session_id: str, message_id: Any, changes: Dict[str, Any]) -> None:
+        """只更新已缓存的消息（如编辑），未缓存时忽略"""
+        def run(conn: sqlite3.Connection):
+            row = conn.execute(
+                "SELECT payload FROM messages WHERE session_id = ? AND message_id = ?", (session_id, int(message_id))
+            ).fetchone()
+            if row is None:
+                return
+            merged = json.loads(row[0])
+            merged.update(changes)
+            encoded = json.dumps(merged, ensure_ascii=False, separators=(",", ":"))
+            conn.execute(
+                "UPDATE messages SET payload = ?, size = ? WHERE session_id = ? AND message_id = ?",
+                (encoded, len(encoded.encode("utf-8")), session_id, int(message_id)),
+            )
+        self._submit(run)
+
+    # ---- 维护 ----
+
+    def stats(self) -> Dict[str, int]:
+        """会话数、消息数、缩略图数与占用字节数"""
+        def run(conn: sqlite3.Connection):
+            sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            messages, message_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM messages").fetchone()
+            thumbnails, thumbnail_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM thumbnails"
+            ).fetchone()
+            return {
+                "sessions": sessions,
+                "messages": messages,
+                "thumbnails": thumbnails,
+                "bytes": message_bytes + thumbnail_bytes,
+            }
+        return self._call(run) or {}
+
+    def prune(self) -> None:
+        """立即按保留天数与容量上限淘汰"""
+        self._submit(self._prune)
+
+    def flush(self) -> None:
+        """等待此前提交的写入全部完成"""
+        self._call(lambda conn: None)
+
+    def close(self) -> None:
+        """完成剩余写入后关闭数据库"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        def run():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(run)
+        self._executor.shutdown(wait=True)
+
+    # ---- 内部 ----
+
+    def _connection(self) -> sqlite3.Connection:
+        # 只在后台线程中创建和使用
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path))
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        conn = self._connection()
+        try:
+            with conn:
+                return fn(conn)
+        except Exception as e:
+            logging.error(f"本地聊天记录缓存操作失败: {e}", exc_info=True)
+            return None
+
+    def _submit(self, fn: Callable[[sqlite3.Connection], Any]) -> Optional[Future]:
+        with self._lock:
+            if self._closed:
+                return None
+            return self._executor.submit(self._execute, fn)
+
+    def _call(
+        self, fn: Callable[[sqlite3.Connection], Any], callback: Optional[Callable[[Any], None]] = None, default: Any = None
+    ) -> Any:
+        """执行读取：callback 为 None 时等待并返回结果；否则立即返回 None，结果在后台线程中传给 callback。
+        读取失败或缓存已关闭时结果为 default"""
+        future = self._submit(fn)
+        if callback is None:
+            result = future.result() if future is not None else None
+            return default if result is None else result
+        if future is None:
+            callback(default)
+        else:
+            future.add_done_callback(lambda f: callback(default if f.result() is None else f.result()))
+        return None
+
+    @staticmethod
+    def _active_session(conn: sqlite3.Connection, user_id: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            "SELECT session_id, agent_id, last_message_id FROM sessions "
+            "WHERE user_id = ? AND active = 1 ORDER BY updated_at DESC LIMIT 1",
+            (user_id,),
+        ).fetchone()
+        return None if row is None else {"session_id": row[0], "agent_id": row[1], "last_message_id": row[2]}
+
+    @staticmethod
+    def _last_message_id(conn: sqlite3.Connection, session_id: str) -> int:
+        row = conn.execute("SELECT last_message_id FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _first_message_id(conn: sqlite3.Connection, session_id: str) -> int:
+        row = conn.execute("SELECT MIN(message_id) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row and row[0] is not None else 0
+
+    @staticmethod
+    def _load_messages(conn: sqlite3.Connection, session_id: str, limit: Optional[int]) -> List[Dict[str, Any]]:
+        query = (
+            "SELECT m.payload, t.mime, t.data, a.mime, a.data FROM messages m "
+            "LEFT JOIN thumbnails t ON t.key = m.thumbnail_key "
+            "LEFT JOIN thumbnails a ON a.key = m.avatar_key "
+            "WHERE m.session_id = ? ORDER BY m.message_id"
+        )
+        rows = conn.execute(f"{query} DESC LIMIT ?", (session_id, limit)).fetchall()[::-1] if limit \
+            else conn.execute(query, (session_id,))
+        messages = []
+        for payload, thumb_mime, thumb_data, avatar_mime, avatar_data in rows:
+            message = json.loads(payload)
+            if thumb_data is not None:
+                message["text"] = _data_url(thumb_mime, thumb_data)
+            if avatar_data is not None:
+                message["avatar"] = _data_url(avatar_mime, avatar_data)
+            messages.append(message)
+        conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+        return messages
+
+    @staticmethod
+    def _store_image(conn: sqlite3.Connection, data_url: str, size: int) -> Optional[str]:
+        """按原图内容哈希保存缩略图，已存在时直接返回键"""
+        key = hashlib.blake2b(data_url.encode("utf-8"), digest_size=16).hexdigest()
+        if conn.execute("SELECT 1 FROM thumbnails WHERE key = ?", (key,)).fetchone():
+            return key
+        image = decode_image(data_url, size)
+        if image.isNull():
+            return None
+        mime, data = _encode_image(image)
+        conn.execute(
+            "INSERT INTO thumbnails (key, mime, data, size) VALUES (?, ?, ?, ?)", (key, mime, data, len(data))
+        )
+        return key
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        """删除过期会话；超出容量时从最久未更新的会话开始删除，只剩一个会话时删除其最早的消息"""
+        self._writes_since_prune = 0
+        cutoff = time.time() - self.max_age_days * 86400
+        expired = [row[0] for row in conn.execute("SELECT session_id FROM sessions WHERE updated_at < ?", (cutoff,))]
+        for session_id in expired:
+            self._delete_session(conn, session_id)
+
+        total = self._total_bytes(conn)
+        while total > self.max_bytes:
+            sessions = [row[0] for row in conn.execute("SELECT session_id FROM sessions ORDER BY updated_at")]
+            if len(sessions) > 1:
+                self._delete_session(conn, sessions[0])
+            elif self._trim_oldest(conn, total - self.max_bytes):
+                self._delete_orphan_thumbnails(conn)
+            else:
+                break
+            total = self._total_bytes(conn)
+
+        if expired:
+            logging.info(f"本地聊天记录缓存淘汰过期会话 {len(expired)} 个")
+
+    def _delete_session(self, conn: sqlite3.Connection, session_id: str) -> None:
+        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._delete_orphan_thumbnails(conn)
+
+    @staticmethod
+    def _trim_oldest(conn: sqlite3.Connection, excess: int) -> bool:
+        """删除最早的消息直到约释放 excess 字节，返回是否删除了消息"""
+        # 按消息本身与其缩略图估算（共享的头像 / 缩略图在删除孤立项后才释放，不足时由调用方再次裁剪）
+        freed = 0
+        last_id = None
+        for session_id, message_id, size in conn.execute(
+            "SELECT m.session_id, m.message_id, m.size + COALESCE(t.size, 0) FROM messages m "
+            "LEFT JOIN thumbnails t ON t.key = m.thumbnail_key ORDER BY m.message_id"
+        ):
+            freed += size
+            last_id = (session_id, message_id)
+            if freed >= excess:
+                break
+        if last_id is None:
+            return False
+        conn.execute("DELETE FROM messages WHERE session_id = ? AND message_id <= ?", last_id)
+        return True
+
+    @staticmethod
+    def _delete_orphan_thumbnails(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "DELETE FROM thumbnails WHERE key NOT IN "
+            "(SELECT thumbnail_key FROM messages WHERE thumbnail_key IS NOT NULL "
+            "UNION SELECT avatar_key FROM messages WHERE avatar_key IS NOT NULL)"
+        )
+
+    @staticmethod
+    def _total_bytes(conn: sqlite3.Connection) -> int:
+        messages = conn.execute("SELECT COALESCE(SUM(size), 0) FROM messages").fetchone()[0]
+        thumbnails = conn.execute("SELECT COALESCE(SUM(size), 0) FROM thumbnails").fetchone()[0]
+        return messages + thumbnails
+
+
+_cache: Optional[MessageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_message_cache() -> MessageCache:
+    """获取全局聊天记录缓存（首次调用时创建）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MessageCache()
+        return _cache
@@ -0,0 +1,176 @@
+"""
+本地聊天记录缓存冷 / 热打开测试
+
+构造一个含内联 base64 图片与头像的客服会话，对比两种打开方式：
+- 冷打开：没有本地缓存，从服务端拉取完整历史（JSON 编解码 + 图片按气泡尺寸解码）；
+- 热打开：从 SQLite 读取缓存的消息与缩略图并解码，再只拉取最后一条缓存消息之后的增量消息。
+同时统计两种方式需要传输的字节数、缓存写入耗时与占用空间，并校验按容量 / 按时间淘汰后的结果。
+
+用法：python client/utils/message_cache_benchmark.py [--messages 500] [--image-every 10] [--delta 5] [--rounds 5]
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+# 与 main.py 一致：项目根目录与 client 目录都需要在 sys.path 中
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_DIR = os.path.dirname(CLIENT_DIR)
+for path in (BASE_DIR, CLIENT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from PyQt6.QtCore import QBuffer, QIODevice, Qt
+from PyQt6.QtGui import QColor, QImage, QLinearGradient, QPainter
+from PyQt6.QtWidgets import QApplication
+
+from client.utils.image_cache import decode_image
+from client.utils.message_cache import MessageCache
+
+# 与聊天气泡中图片的最大边一致
+_BUBBLE_IMAGE_SIZE = 160
+
+
+def _image_data_url(width: int, height: int, color: str, fmt: str = "JPG") -> str:
+    image = QImage(width, height, QImage.Format.Format_RGB32)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor(color))
+    gradient.setColorAt(1, QColor("#0f172a"))
+    painter.fillRect(image.rect(), gradient)
+    painter.setPen(Qt.GlobalColor.white)
+    painter.drawText(image.rect(), Qt.AlignmentFlag.AlignCenter, color)
+    painter.end()
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, fmt, 90)
+    mime = "image/png" if fmt == "PNG" else "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(bytes(buffer.data())).decode('ascii')}"
+
+
+def _history(count: int, image_every: int, first_id: int = 1) -> List[Dict]:
+    """生成与 get_session_messages 返回结构一致的消息（双方各有头像，每 image_every 条一张图片）"""
+    avatars = {1: _image_data_url(96, 96, "#f97316", "PNG"), 2: _image_data_url(96, 96, "#22c55e", "PNG")}
+    images = [_image_data_url(1280, 960, color) for color in ("#60a5fa", "#f472b6", "#facc15")]
+    messages = []
+    for i in range(count):
+        message_id = first_id + i
+        user_id = 1 if i % 2 == 0 else 2
+        is_image = image_every > 0 and i % image_every == image_every - 1
+        messages.append({
+            "id": str(message_id),
+            "session_id": "chat_1_benchmark",
+            "from": "user" if user_id == 1 else "agent",
+            "from_user_id": user_id,
+            "text": images[message_id % len(images)] if is_image else f"第 {message_id} 条消息：变声器在游戏里没有声音怎么办？",
+            "time": "刚刚",
+            "created_at": "2024-01-01T12:00:00",
+            "username": "用户" if user_id == 1 else "客服",
+            "avatar": avatars[user_id],
+            "message_type": "image" if is_image else "text",
+            "is_recalled": False,
+            "is_edited": False,
+            "edited_at": None,
+            "reply_to_message_id": None,
+            "rich": None,
+            "link_previews": [],
+        })
+    return messages
+
+
+def _decode_for_display(messages: List[Dict]) -> int:
+    """按客户端显示的方式解码图片与头像（头像按内容只解码一次）"""
+    decoded = 0
+    avatars = set()
+    for message in messages:
+        if message.get("message_type") == "image" and (message.get("text") or "").startswith("data:image"):
+            decoded += not decode_image(message["text"], _BUBBLE_IMAGE_SIZE).isNull()
+        avatar = message.get("avatar")
+        if avatar and avatar not in avatars:
+            avatars.add(avatar)
+            decode_image(avatar, 32)
+    return decoded
+
+
+def _cold_open(payload: bytes) -> float:
+    start = time.perf_counter()
+    messages = json.loads(payload)["messages"]
+    _decode_for_display(messages)
+    return (time.perf_counter() - start) * 1000
+
+
+def _warm_open(cache: MessageCache, session_id: str, delta_payload: bytes) -> float:
+    start = time.perf_counter()
+    messages = cache.load_messages(session_id)
+    _decode_for_display(messages)
+    # 增量同步在界面渲染之后进行，这里一并计入
+    _decode_for_display(json.loads(delta_payload)["messages"])
+    return (time.perf_counter() - start) * 1000
+
+
+def _check_eviction(path: Path, session_id: str) -> None:
+    """按容量淘汰后不超过上限；按时间淘汰后会话被删除"""
+    small = MessageCache(path, max_bytes=64 * 1024)
+    stats = small.stats()
+    assert stats["bytes"] <= 64 * 1024, stats
+    assert small.last_message_id(session_id) > 0
+    small.close()
+
+    expired = MessageCache(path, max_age_days=0)
+    stats = expired.stats()
+    assert stats["sessions"] == 0 and stats["messages"] == 0 and stats["thumbnails"] == 0, stats
+    expired.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地聊天记录缓存冷 / 热打开测试")
+    parser.add_argument("--messages", type=int, default=500, help="会话中已有的消息条数")
+    parser.add_argument("--image-every", type=int, default=10, help="每多少条消息一张图片（0 表示没有图片）")
+    parser.add_argument("--delta", type=int, default=5, help="上次关闭后新增的消息条数")
+    parser.add_argument("--rounds", type=int, default=5, help="重复次数（取中位数）")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    session_id = "chat_1_benchmark"
+    history = _history(args.messages, args.image_every)
+    delta = _history(args.delta, args.image_every, first_id=args.messages + 1)
+    full_payload = json.dumps({"success": True, "messages": history + delta}, ensure_ascii=False).encode("utf-8")
+    delta_payload = json.dumps({"success": True, "messages": delta}, ensure_ascii=False).encode("utf-8")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "messages.db"
+        cache = MessageCache(path)
+        cache.open_session(session_id, 1, 2)
+        start = time.perf_counter()
+        cache.put_messages(session_id, history)
+        cache.flush()
+        write_ms = (time.perf_counter() - start) * 1000
+        assert cache.last_message_id(session_id) == args.messages
+        assert len(cache.load_messages(session_id)) == args.messages
+
+        cold = [_cold_open(full_payload) for _ in range(args.rounds)]
+        warm = [_warm_open(cache, session_id, delta_payload) for _ in range(args.rounds)]
+        stats = cache.stats()
+        db_bytes = sum(f.stat().st_size for f in Path(tmp).iterdir())
+        cache.close()
+
+        print(f"消息数: {args.messages}（其中图片 {sum(m['message_type'] == 'image' for m in history)} 张），增量: {args.delta}")
+        print(f"[冷打开] 传输 {len(full_payload) / 1024:.0f} KB，解析 + 解码 {statistics.median(cold):.1f} ms")
+        print(f"[热打开] 传输 {len(delta_payload) / 1024:.0f} KB，读取缓存 + 解码 {statistics.median(warm):.1f} ms")
+        print(f"  缓存写入 {write_ms:.1f} ms，缓存内容 {stats['bytes'] / 1024:.0f} KB（数据库文件 {db_bytes / 1024:.0f} KB），"
+              f"缩略图 / 头像 {stats['thumbnails']} 个")
+
+        _check_eviction(path, session_id)
+        print("  按容量 / 按时间淘汰结果正确")
+    app.quit()
+
+
+if __name__ == "__main__":
+    main()
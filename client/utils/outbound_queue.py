@@ -0,0 +1,265 @@
+"""待发送消息队列
+
+离线或发送失败的消息先进入此队列，连接恢复后按会话分批补发：
+- 每条消息带客户端生成的消息ID（client_message_id），服务端据此去重，重发不会产生重复消息；
+- 同一会话内严格按入队顺序发送：一批未确认前，该会话后面的消息不会发出；
+- 发送失败按指数退避 + 随机抖动重试，服务端明确拒绝的消息直接移出队列；
+- 队列有容量上限，并以追加写的日志文件持久化（不保存 token），应用重启后继续发送。
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from client.config.config import CACHE_DIR
+
+# 日志文件：<本地缓存目录>/outbound_queue.jsonl（见 client.config.config.CACHE_DIR）
+DEFAULT_JOURNAL_PATH = CACHE_DIR / "outbound_queue.jsonl"
+
+DEFAULT_MAX_SIZE = 500
+# 重试退避：首次 1 秒，每次翻倍，最长 60 秒；实际等待为其 50%~100%
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+# 超过此时长仍未发出的消息放弃发送（与服务端去重记录的保留时长一致）
+DEFAULT_MAX_AGE = 24 * 3600
+# 日志中累计多少条确认记录后压缩重写
+_COMPACT_THRESHOLD = 256
+
+
+class OutboundItem:
+    """一条待发送的事件"""
+
+    __slots__ = ("item_id", "event", "data", "lane", "user_id", "created_at", "attempts", "next_attempt_at", "in_flight")
+
+    def __init__(
+        self,
+        item_id: str,
+        event: str,
+        data: Dict[str, Any],
+        lane: str = "",
+        user_id: Any = None,
+        created_at: Optional[float] = None,
+        attempts: int = 0,
+    ):
+        self.item_id = item_id
+        self.event = event
+        self.data = data
+        # 顺序通道：同一通道（会话）内按入队顺序发送
+        self.lane = lane
+        self.user_id = user_id
+        self.created_at = created_at if created_at is not None else time.time()
+        self.attempts = attempts
+        self.next_attempt_at = 0.0
+        self.in_flight = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.item_id,
+            "event": self.event,
+            "data": self.data,
+            "lane": self.lane,
+            "user_id": self.user_id,
+            "created_at": self.created_at,
+            "attempts": self.attempts,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "OutboundItem":
+        return cls(
+            data["id"], data["event"], data.get("data") or {}, data.get("lane") or "",
+            data.get("user_id"), data.get("created_at"), data.get("attempts", 0),
+        )
+
+
+class OutboundQueue:
+    """按会话保序、带退避重试与持久化的有界发送队列（线程安全）"""
+
+    def __init__(
+        self,
+        journal_path: Optional[Path] = DEFAULT_JOURNAL_PATH,
+        max_size: int = DEFAULT_MAX_SIZE,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        max_age: float = DEFAULT_MAX_AGE,
+    ):
+        self.journal_path = Path(journal_path) if journal_path is not None else None
+        self.max_size = max_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # 通道 -> 按入队顺序排列的消息
+        self._lanes: "OrderedDict[str, Deque[OutboundItem]]" = OrderedDict()
+        self._items: Dict[str, OutboundItem] = {}
+        self._acks_since_compact = 0
+        self._load()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def __contains__(self, item_id: str) -> bool:
+        with self._lock:
+            return item_id in self._items
+
+    def add(
+        self, event: str, data: Dict[str, Any], lane: str = "", item_id: Optional[str] = None, user_id: Any = None
+    ) -> Optional[str]:
+        """入队，返回消息ID；同一ID已在队列中时不重复入队；队列已满时返回 None"""
+        item_id = item_id or uuid.uuid4().hex
+        with self._lock:
+            if item_id in self._items:
+                return item_id
+            if len(self._items) >= self.max_size:
+                logging.warning(f"待发送队列已满（{self.max_size} 条），拒绝新消息: {event}")
+                return None
+            item = OutboundItem(item_id, event, data, lane or "", user_id)
+            self._items[item_id] = item
+            self._lanes.setdefault(item.lane, deque()).append(item)
+            self._append_journal({"op": "add", "item": item.to_dict()})
+        return item_id
+
+    def take_batches(self, max_batch: int, user_id: Any = None, now: Optional[float] = None) -> List[List[OutboundItem]]:
+        """取出可以发送的批次并标记为发送中。
+
+        每个通道最多一批：该通道没有发送中的消息且队首已到重试时间时，从队首起取连续的同类事件（最多 max_batch 条）。
+        user_id 不为 None 时只取该用户入队的消息。
+        """
+        now = time.time() if now is None else now
+        batches = []
+        with self._lock:
+            for lane in self._lanes.values():
+                if not lane or lane[0].in_flight or lane[0].next_attempt_at > now:
+                    continue
+                if user_id is not None and lane[0].user_id != user_id:
+                    continue
+                batch = []
+                for item in lane:
+                    if len(batch) >= max_batch or item.event != lane[0].event or item.user_id != lane[0].user_id:
+                        break
+                    item.in_flight = True
+                    batch.append(item)
+                batches.append(batch)
+        return batches
+
+    def acknowledge(self, item_id: str) -> Optional[OutboundItem]:
+        """发送成功或被服务端拒绝：移出队列"""
+        with self._lock:
+            item = self._items.pop(item_id, None)
+            if item is None:
+                return None
+            lane = self._lanes.get(item.lane)
+            if lane is not None:
+                try:
+                    lane.remove(item)
+                except ValueError:
+                    pass
+                if not lane:
+                    del self._lanes[item.lane]
+            self._append_journal({"op": "ack", "id": item_id})
+            self._acks_since_compact += 1
+            if self._acks_since_compact >= _COMPACT_THRESHOLD:
+                self._compact()
+            return item
+
+    def retry_later(self, items: List[OutboundItem], now: Optional[float] = None) -> None:
+        """发送失败：保持原位置，按指数退避 + 抖动安排下次发送"""
+        now = time.time() if now is None else now
+        with self._lock:
+            for item in items:
+                if item.item_id not in self._items:
+                    continue
+                item.in_flight = False
+                item.attempts += 1
+                delay = min(self.base_delay * (2 ** (item.attempts - 1)), self.max_delay)
+                item.next_attempt_at = now + delay * random.uniform(0.5, 1.0)
+
+    def release(self, items: List[OutboundItem]) -> None:
+        """未发出（如连接已断开）：恢复为可发送，不计入重试次数"""
+        with self._lock:
+            for item in items:
+                item.in_flight = False
+
+    def reset_backoff(self) -> None:
+        """连接恢复：所有消息立即可发送，未确认的发送中消息重新发送"""
+        with self._lock:
+            for item in self._items.values():
+                item.next_attempt_at = 0.0
+                item.in_flight = False
+
+    def expired(self, now: Optional[float] = None) -> List[OutboundItem]:
+        """取出超过最长保留时间仍未发出的消息（已移出队列）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            stale = [item.item_id for item in self._items.values() if not item.in_flight and now - item.created_at > self.max_age]
+        return [item for item in map(self.acknowledge, stale) if item is not None]
+
+    def next_retry_delay(self, now: Optional[float] = None) -> Optional[float]:
+        """距最早一次可发送还有多少秒；没有等待重试的消息时返回 None"""
+        now = time.time() if now is None else now
+        with self._lock:
+            waiting = [lane[0].next_attempt_at for lane in self._lanes.values() if lane and not lane[0].in_flight]
+        if not waiting:
+            return None
+        return max(min(waiting) - now, 0.0)
+
+    # ---- 持久化 ----
+
+    def _load(self) -> None:
+        if self.journal_path is None or not self.journal_path.exists():
+            return
+        items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 写入中途退出导致的残缺行
+                        continue
+                    if record.get("op") == "add":
+                        items[record["item"]["id"]] = record["item"]
+                    elif record.get("op") == "ack":
+                        items.pop(record.get("id"), None)
+        except OSError as e:
+            logging.error(f"读取待发送队列失败: {e}")
+            return
+        for data in list(items.values())[-self.max_size:]:
+            item = OutboundItem.from_dict(data)
+            self._items[item.item_id] = item
+            self._lanes.setdefault(item.lane, deque()).append(item)
+        self._compact()
+        if self._items:
+            logging.info(f"恢复待发送消息 {len(self._items)} 条")
+
+    def _append_journal(self, record: Dict[str, Any]) -> None:
+        if self.journal_path is None:
+            return
+        try:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.error(f"写入待发送队列失败: {e}")
+
+    def _compact(self) -> None:
+        """用当前队列内容重写日志（先写临时文件再替换）"""
+        self._acks_since_compact = 0
+        if self.journal_path is None:
+            return
+        try:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.journal_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for lane in self._lanes.values():
+                    for item in lane:
+                        f.write(json.dumps({"op": "add", "item": item.to_dict()}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.journal_path)
+        except OSError as e:
+            logging.error(f"压缩待发送队列失败: {e}")
@@ -0,0 +1,149 @@
+"""
+待发送消息队列可靠性测试
+
+模拟不稳定的服务端（请求丢失、写入成功但确认丢失、批量中途暂时失败），按虚拟时钟反复补发，
+中途模拟客户端重启（从日志文件恢复队列），最后校验：
+- 服务端每个会话收到的消息与入队顺序一致，且没有重复（服务端按客户端消息ID去重）；
+- 重试间隔符合指数退避 + 抖动的范围；
+- 队列满时拒绝新消息，超过保留时间的消息被移出。
+
+用法：python client/utils/outbound_queue_benchmark.py [--sessions 20] [--messages 50] [--fail-rate 0.3] [--batch 20]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+# 与 main.py 一致：项目根目录与 client 目录都需要在 sys.path 中
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_DIR = os.path.dirname(CLIENT_DIR)
+for path in (BASE_DIR, CLIENT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from client.utils.outbound_queue import OutboundQueue
+
+
+class _FlakyServer:
+    """按 client_message_id 去重写入的模拟服务端"""
+
+    def __init__(self, fail_rate: float, rng: random.Random):
+        self.fail_rate = fail_rate
+        self.rng = rng
+        self.sessions = defaultdict(list)
+        self.seen = set()
+        self.duplicates = 0
+        self.requests = 0
+
+    def send(self, batch):
+        """返回成功写入（且客户端收到确认）的条数；其余消息需要重发"""
+        self.requests += 1
+        roll = self.rng.random()
+        if roll < self.fail_rate / 3:
+            return 0                                    # 请求未到达服务端
+        processed = len(batch)
+        if roll < self.fail_rate * 2 / 3:
+            processed = self.rng.randint(0, len(batch))  # 中途暂时失败，之后的消息不再处理
+        for item in batch[:processed]:
+            if item.item_id in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(item.item_id)
+            self.sessions[item.lane].append(item.item_id)
+        if roll < self.fail_rate:
+            return 0 if processed == len(batch) else processed   # 写入成功但确认丢失
+        return processed
+
+
+def _run(queue_path: Path, args, rng: random.Random):
+    queue = OutboundQueue(queue_path, max_size=args.sessions * args.messages)
+    expected = defaultdict(list)
+    # 各会话交错入队
+    for i in range(args.messages):
+        for s in range(args.sessions):
+            lane = f"chat_{s}"
+            item_id = queue.add("send_message", {"text": f"{lane} #{i}"}, lane=lane, user_id=1)
+            expected[lane].append(item_id)
+
+    server = _FlakyServer(args.fail_rate, rng)
+    now = 0.0
+    restarted = False
+    start = time.perf_counter()
+    while len(queue):
+        batches = queue.take_batches(args.batch, user_id=1, now=now)
+        if not batches:
+            now += queue.next_retry_delay(now) or 0.0
+            continue
+        for batch in batches:
+            acked = server.send(batch)
+            for item in batch[:acked]:
+                queue.acknowledge(item.item_id)
+            if acked < len(batch):
+                queue.retry_later(batch[acked:], now=now)
+        if not restarted and len(queue) < args.sessions * args.messages // 2:
+            # 模拟客户端在发送中途退出并重启：从日志恢复未确认的消息
+            restarted = True
+            queue = OutboundQueue(queue_path, max_size=args.sessions * args.messages)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    wrong = sum(1 for lane, ids in expected.items() if server.sessions[lane] != ids)
+    total = args.sessions * args.messages
+    print(f"会话数: {args.sessions}，每会话消息: {args.messages}，失败率: {args.fail_rate:.0%}，批量上限: {args.batch}")
+    print(f"  请求次数: {server.requests}（逐条发送至少需要 {total} 次），服务端去重丢弃重发: {server.duplicates} 条")
+    print(f"  虚拟耗时: {now:.1f} s（含退避等待），实际耗时: {elapsed_ms:.1f} ms，中途重启: {'是' if restarted else '否'}")
+    print(f"  顺序或条数不一致的会话: {wrong} 个")
+    assert restarted and wrong == 0
+    assert sum(len(ids) for ids in server.sessions.values()) == total
+    # 全部确认后，从日志恢复的队列为空
+    assert len(OutboundQueue(queue_path)) == 0
+
+
+def _check_backoff(queue_path: Path) -> None:
+    queue = OutboundQueue(queue_path, base_delay=1.0, max_delay=60.0)
+    queue.add("send_message", {}, lane="chat_backoff")
+    for attempt in range(1, 10):
+        batch = queue.take_batches(10, now=1e9)[0]
+        queue.retry_later(batch, now=0.0)
+        delay = batch[0].next_attempt_at
+        cap = min(2 ** (attempt - 1), 60.0)
+        assert cap * 0.5 <= delay <= cap, (attempt, delay)
+        # 退避期间同一会话不会被取出
+        assert not queue.take_batches(10, now=delay - 0.01)
+        queue.reset_backoff()
+    queue.acknowledge(batch[0].item_id)
+
+
+def _check_limits(queue_path: Path) -> None:
+    queue = OutboundQueue(queue_path, max_size=3, max_age=10)
+    ids = [queue.add("send_message", {}, lane="chat_limit") for _ in range(3)]
+    assert all(ids) and queue.add("send_message", {}, lane="chat_limit") is None
+    # 同一ID重复入队不占用容量
+    assert queue.add("send_message", {}, lane="chat_limit", item_id=ids[0]) == ids[0]
+    assert len(queue.expired(now=time.time() + 60)) == 3 and len(queue) == 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="待发送消息队列可靠性测试")
+    parser.add_argument("--sessions", type=int, default=20, help="会话数")
+    parser.add_argument("--messages", type=int, default=50, help="每个会话的消息条数")
+    parser.add_argument("--fail-rate", type=float, default=0.3, help="每次请求失败的概率")
+    parser.add_argument("--batch", type=int, default=20, help="单次批量发送的消息条数上限")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        _run(Path(tmp) / "outbound.jsonl", args, rng)
+        _check_backoff(Path(tmp) / "backoff.jsonl")
+        _check_limits(Path(tmp) / "limits.jsonl")
+    print("  退避间隔、容量上限与过期清理正确")
+
+
+if __name__ == "__main__":
+    main()
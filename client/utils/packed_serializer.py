@@ -0,0 +1,191 @@
+"""
+Socket.IO 按连接协商的二进制序列化（msgpack）与帧压缩 —— 客户端
+
+连接建立后先以 JSON 通信；register 时声明 "msgpack" 能力，服务端在注册结果中确认后，
+本连接之后发出的包改为 msgpack 二进制帧。解码按帧类型区分（文本帧为 JSON，二进制帧为 msgpack），
+切换前后在途的包都能正确解码。base64 data URL 以原始字节传输，收到后还原为原字符串。
+声明 "deflate" 能力并得到确认后，超过阈值的帧以 zlib 压缩发送（websocket-client 不支持
+permessage-deflate，因此在应用层压缩）；收到的压缩帧无论是否已确认都会解压。
+编码格式与服务端 backend/websocket/packed_serializer.py 保持一致。
+"""
+
+import base64
+import binascii
+import logging
+import struct
+import zlib
+from typing import Any, List, Optional, Union
+
+import socketio
+from socketio import packet as sio_packet
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+# msgpack 扩展类型：data URL，内容为 前缀长度、后缀长度（各 2 字节）+ 前缀（data:...;base64）+ 后缀（如 ;filename="..."）+ 原始字节
+EXT_DATA_URL = 1
+# 短于此长度的 data URL 按普通字符串传输
+_MIN_DATA_URL_LENGTH = 128
+# 压缩帧的首字节：0xc1 在 msgpack 中从不使用，Socket.IO 文本包以数字开头，均不会与之混淆
+COMPRESSED_FRAME_MARKER = b"\xc1"
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+DEFAULT_COMPRESSION_LEVEL = 1
+# 收到的压缩帧解压后的大小上限（字节）
+_MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+
+def _pack_data_url(value: str) -> Optional[Any]:
+    """base64 data URL 转为扩展类型；不是规范的 base64（还原后与原字符串不一致）时返回 None"""
+    head, sep, rest = value.partition(",")
+    if not sep or not head.endswith(";base64"):
+        return None
+    content, semi, suffix = rest.partition(";")
+    try:
+        raw = base64.b64decode(content, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    # 长度与末尾一组都一致时，重新编码得到的字符串与原字符串相同
+    tail = raw[(len(raw) - 1) // 3 * 3:]
+    if len(content) != (len(raw) + 2) // 3 * 4 or base64.b64encode(tail) != content[-4:].encode("ascii"):
+        return None
+    head_bytes, suffix_bytes = head.encode("utf-8"), (semi + suffix).encode("utf-8")
+    if len(head_bytes) > 0xFFFF or len(suffix_bytes) > 0xFFFF:
+        return None
+    header = struct.pack("!HH", len(head_bytes), len(suffix_bytes))
+    return msgpack.ExtType(EXT_DATA_URL, b"".join((header, head_bytes, suffix_bytes, raw)))
+
+
+def _to_wire(value: Any) -> Any:
+    if isinstance(value, str):
+        if len(value) >= _MIN_DATA_URL_LENGTH and value.startswith("data:"):
+            packed = _pack_data_url(value)
+            if packed is not None:
+                return packed
+        return value
+    if isinstance(value, dict):
+        return {key: _to_wire(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_wire(item) for item in value]
+    return value
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == EXT_DATA_URL:
+        head_len, suffix_len = struct.unpack_from("!HH", data)
+        head = data[4:4 + head_len].decode("utf-8")
+        suffix = data[4 + head_len:4 + head_len + suffix_len].decode("utf-8")
+        raw = memoryview(data)[4 + head_len + suffix_len:]
+        return f"{head},{base64.b64encode(raw).decode('ascii')}{suffix}"
+    return msgpack.ExtType(code, data)
+
+
+def pack(value: Any) -> bytes:
+    """编码为 msgpack（data URL 以原始字节传输）"""
+    return msgpack.packb(_to_wire(value), use_bin_type=True)
+
+
+def unpack(data: bytes) -> Any:
+    """解码 msgpack（data URL 还原为原字符串）"""
+    return msgpack.unpackb(data, raw=False, ext_hook=_ext_hook, strict_map_key=False)
+
+
+def encode_packed(pkt: sio_packet.Packet) -> bytes:
+    """将 Socket.IO 包编码为一个 msgpack 二进制帧（字节数据直接内嵌，不使用附件）"""
+    packet_type = pkt.packet_type
+    if packet_type == sio_packet.BINARY_EVENT:
+        packet_type = sio_packet.EVENT
+    elif packet_type == sio_packet.BINARY_ACK:
+        packet_type = sio_packet.ACK
+    data = {"type": packet_type, "data": pkt.data, "nsp": pkt.namespace}
+    if pkt.id is not None:
+        data["id"] = pkt.id
+    return pack(data)
+
+
+def compress_frame(frame: Union[str, bytes], threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+                   level: int = DEFAULT_COMPRESSION_LEVEL) -> Union[str, bytes]:
+    """达到阈值（字节）且压缩后更小时返回压缩帧，否则原样返回"""
+    payload = frame.encode("utf-8") if isinstance(frame, str) else frame
+    if len(payload) < threshold:
+        return frame
+    compressed = zlib.compress(payload, level)
+    if len(compressed) + 1 >= len(payload):
+        return frame
+    return COMPRESSED_FRAME_MARKER + compressed
+
+
+def decompress_frame(data: bytes, max_size: int = _MAX_DECOMPRESSED_SIZE) -> Union[str, bytes]:
+    """
+    解压压缩帧：内容为 Socket.IO 文本包时返回 str，否则（msgpack）返回 bytes。
+
+    Raises:
+        ValueError: 数据损坏，或解压后超过 max_size 字节
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        payload = decompressor.decompress(memoryview(data)[1:], max_size)
+    except zlib.error as e:
+        raise ValueError(f"压缩帧解压失败: {e}") from e
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError("压缩帧不完整或解压后超过大小上限")
+    return payload.decode("utf-8") if payload[:1].isdigit() else payload
+
+
+class PackedPacket(sio_packet.Packet):
+    """编码为 JSON；解码时二进制帧按 msgpack、文本帧按 JSON 处理"""
+
+    def decode(self, encoded_packet):
+        if isinstance(encoded_packet, (bytes, bytearray)) and MSGPACK_AVAILABLE:
+            decoded = unpack(encoded_packet)
+            if not isinstance(decoded, dict) or "type" not in decoded:
+                raise ValueError("msgpack 帧不是有效的 Socket.IO 包")
+            self.packet_type = decoded["type"]
+            self.data = decoded.get("data")
+            self.id = decoded.get("id")
+            self.namespace = decoded.get("nsp")
+            return 0
+        return super().decode(encoded_packet)
+
+
+class PackedClient(socketio.Client):
+    """
+    packed 为 True 时发出的包使用 msgpack 编码，compressed 为 True 时压缩达到阈值的帧
+    （分别由服务端确认 "msgpack" / "deflate" 能力后设置，断线后复位）
+    """
+
+    def __init__(self, *args, compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+                 compression_level: int = DEFAULT_COMPRESSION_LEVEL, **kwargs):
+        kwargs.setdefault("serializer", PackedPacket)
+        super().__init__(*args, **kwargs)
+        self.packed = False
+        self.compressed = False
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+
+    def _encode_frames(self, pkt) -> List[Union[str, bytes]]:
+        if self.packed:
+            frames = [encode_packed(pkt)]
+        else:
+            encoded = pkt.encode()
+            frames = encoded if isinstance(encoded, list) else [encoded]
+        if self.compressed and len(frames) == 1:
+            frames = [compress_frame(frames[0], self.compression_threshold, self.compression_level)]
+        return frames
+
+    def _send_packet(self, pkt):
+        for frame in self._encode_frames(pkt):
+            self.eio.send(frame)
+
+    def _handle_eio_message(self, data):
+        # 二进制附件原样交给父类；压缩帧解压后与未压缩的帧一样解码
+        if isinstance(data, bytes) and data[:1] == COMPRESSED_FRAME_MARKER and not self._binary_packet:
+            try:
+                data = decompress_frame(data)
+            except ValueError as e:
+                logging.warning(f"丢弃无法解压的帧: {e}")
+                return
+        super()._handle_eio_message(data)
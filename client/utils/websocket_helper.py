@@ -6,12 +6,19 @@ WebSocket 辅助函数
 
 import logging
 import platform
-from typing import Optional, Dict, Any
+import re
+from typing import Optional, Dict, Any, List, Callable
 from PyQt6.QtCore import Qt, QObject, pyqtSignal
 from PyQt6.QtWidgets import QApplication
 
+from client.utils.message_cache import get_message_cache
+
 logger = logging.getLogger(__name__)
 
+# 从本地缓存恢复时最多渲染的消息条数；增量同步每页条数（与服务端上限一致）
+_RESTORE_LIMIT = 200
+_HISTORY_PAGE_SIZE = 200
+
 # 全局 UI 调度器，确保从任意线程切换到主线程执行 UI 更新
 class _UIDispatcher(QObject):
     trigger = pyqtSignal(object)
@@ -45,6 +52,412 @@ def _get_ui_dispatcher(main_window) -> Optional[_UIDispatcher]:
     return _ui_dispatcher
 
 
+def display_server_message(main_window, data: Dict[str, Any], history: bool = False):
+    """
+    在聊天记录中显示一条服务端消息（new_message 推送、撤回事件或本地缓存 / 增量同步的历史消息）
+
+    Args:
+        main_window: MainWindow 实例
+        data: 与 new_message 结构一致的消息负载
+        history: 是否为历史消息；历史消息中自己发送的消息直接显示，而不是与乐观展示的消息对账
+    """
+    try:
+        message_id = data.get('id')
+        text = data.get('text', '')
+        from_user_id = data.get('from_user_id')
+        from_username = data.get('username')
+        avatar = data.get('avatar')
+        message_type = data.get('message_type', 'text')
+        reply_to_message_id = data.get('reply_to_message_id')
+        # 引用消息摘要信息由服务端随消息一起推送
+        # 后端可能推送 reply_to_message 为字典（包含 id, message, message_type 等字段）
+        # 也可能直接推送字符串，需要兼容处理
+        reply_to_message_raw = data.get('reply_to_message')
+        if isinstance(reply_to_message_raw, dict):
+            # 如果是字典，优先使用字典中的 id 字段作为 reply_to_message_id
+            # 如果没有提供单独的 reply_to_message_id，则使用字典中的 id
+            if not reply_to_message_id and reply_to_message_raw.get('id'):
+                try:
+                    reply_to_message_id = int(reply_to_message_raw.get('id'))
+                except (ValueError, TypeError):
+                    reply_to_message_id = reply_to_message_raw.get('id')
+            # 提取其中的 message 字段
+            reply_to_message = reply_to_message_raw.get('message', '')
+            # 如果字典中没有单独提供 reply_to_username 和 reply_to_message_type，也从字典中提取
+            if not data.get('reply_to_username'):
+                reply_to_username = reply_to_message_raw.get('from_username')
+            else:
+                reply_to_username = data.get('reply_to_username')
+            if not data.get('reply_to_message_type'):
+                reply_to_message_type = reply_to_message_raw.get('message_type', 'text')
+            else:
+                reply_to_message_type = data.get('reply_to_message_type')
+        else:
+            # 如果是字符串，直接使用
+            reply_to_message = reply_to_message_raw
+            reply_to_username = data.get('reply_to_username')
+            reply_to_message_type = data.get('reply_to_message_type')
+        is_recalled = data.get('is_recalled', False)
+        offline = data.get('offline', False)
+        message_time = data.get('time') or data.get('created_at') or data.get('timestamp')
+
+        # 使用服务端提供的 is_from_self 标记（优先使用，更可靠）
+        # 如果没有提供，则回退到通过 user_id 比较判断
+        is_from_self = data.get('is_from_self')
+        current_user_id = getattr(main_window, 'user_id', None)
+        if is_from_self is None:
+            # 回退逻辑：通过 user_id 比较判断
+            if current_user_id is not None and from_user_id is not None:
+                try:
+                    is_from_self = (int(from_user_id) == int(current_user_id))
+                except (ValueError, TypeError):
+                    is_from_self = (from_user_id == current_user_id)
+            else:
+                is_from_self = (from_user_id == current_user_id)
+
+        # 如果是撤回的消息，先尝试更新现有消息
+        if is_recalled and message_id:
+            try:
+                recalled_id = int(message_id)
+
+                # 直接调用 append_chat_message，让它自己处理查找和更新逻辑
+                from gui.handlers.chat_handlers import append_chat_message
+                append_chat_message(
+                    main_window,
+                    text or "",
+                    from_self=is_from_self,
+                    is_html=False,
+                    streaming=False,
+                    avatar_base64=avatar,
+                    message_id=recalled_id,
+                    is_recalled=True,
+                    from_user_id=from_user_id,
+                    from_username=from_username,
+                    message_created_time=message_time
+                )
+                # append_chat_message 内部会处理查找和更新，如果找到现有消息会直接返回
+                # 如果没有找到，会创建新的撤回提示消息
+                return
+            except (ValueError, TypeError) as e:
+                logger.error(f"处理撤回消息失败: {e}", exc_info=True)
+
+        chat_model = getattr(main_window, "chat_model", None)
+        if chat_model is None:
+            logger.error(f"chat_model 不存在，无法显示消息: message_id={message_id}")
+            return
+
+        # 消息去重：同一个 message_id 只显示一次
+        if message_id and chat_model.find(message_id) is not None:
+            return
+
+        # 自己发送的消息带有客户端消息ID：按ID找到乐观展示的记录并绑定 message_id；
+        # 找不到时（如重启后补发的消息、其他设备发送的消息）直接显示
+        client_message_id = data.get('client_message_id')
+        if is_from_self and message_id and client_message_id and not is_recalled:
+            pending = chat_model.find_temp(client_message_id)
+            if pending is not None:
+                if pending.message_id is None:
+                    chat_model.set_message_id(pending, message_id)
+                return
+        # 如果是自己的消息，且已经通过乐观展示显示过了，则只绑定 message_id，不重复显示
+        # 注意：只对文本消息和图片消息进行此检查，其他消息类型直接显示
+        elif is_from_self and message_id and message_type in ['text', 'image'] and not is_recalled:
+            pending = chat_model.find_pending(
+                message_type,
+                # 文本消息还需要内容一致，避免绑定到错误的消息
+                re.sub(r'<[^>]+>', '', text or '') if message_type == 'text' else None,
+            )
+            if pending is not None:
+                chat_model.set_message_id(pending, message_id)
+                return
+
+            # 没有找到乐观展示的消息：服务器推送的可能是重复消息（多设备同步），
+            # 而乐观展示的消息已经在界面上显示了，这里不重复显示（历史消息则照常显示）
+            if not history:
+                return
+
+        if not message_id:
+            # 如果没有message_id，记录日志但继续处理（可能是系统消息）
+            logger.warning(f"收到没有message_id的消息，继续处理")
+
+        # 导入消息处理函数
+        from gui.handlers.chat_handlers import append_chat_message, append_image_message
+
+        # 如果是撤回的消息
+        if is_recalled:
+            text = "[消息已撤回]"
+
+        # 获取消息创建时间（用于撤回时间检查）；历史消息的 time 是当时生成的相对时间，改用 created_at
+        message_time = (data.get('created_at') if history else None) or message_time
+
+        # 根据消息类型显示消息
+        if message_type == 'image' and text and text.startswith('data:image'):
+            # 图片消息
+            # 引用信息直接使用服务端推送的摘要（reply_to_message / reply_to_username / reply_to_message_type），
+            # 不再通过已废弃的 HTTP 接口获取
+            # 图片在后台线程解码，解码完成前显示占位图，失败时改为文字提示
+            try:
+                message = append_image_message(
+                    main_window,
+                    None,
+                    from_self=is_from_self,
+                    message_id=int(message_id) if message_id else None,
+                    message_created_time=message_time,
+                    from_user_id=from_user_id,
+                    from_username=from_username,
+                    reply_to_message_id=int(reply_to_message_id) if reply_to_message_id else None,
+                    reply_to_message=reply_to_message,
+                    reply_to_username=reply_to_username,
+                    reply_to_message_type=reply_to_message_type,
+                    is_recalled=is_recalled,
+                    raw_message=text,  # 原始 data:image/...，用于解码以及后续引用生成缩略图
+                    avatar_base64=avatar,
+                )
+            except Exception as e:
+                message = None
+                logger.error(f"显示图片消息失败: message_id={message_id}, error={e}", exc_info=True)
+        else:
+            # 文本消息或表情消息（表情也是文本）
+            # 引用信息同样直接使用服务端推送的数据
+            # 检查是否在主线程中
+            from PyQt6.QtCore import QThread
+            from PyQt6.QtWidgets import QApplication
+            app = QApplication.instance()
+            if app:
+                is_main_thread = QThread.currentThread() == app.thread()
+
+            try:
+                message = append_chat_message(
+                    main_window,
+                    text,
+                    from_self=is_from_self,
+                    is_html=False,
+                    streaming=False,
+                    avatar_base64=avatar,
+                    message_id=int(message_id) if message_id else None,
+                    is_recalled=is_recalled,
+                    reply_to_message_id=int(reply_to_message_id) if reply_to_message_id else None,
+                    reply_to_message=reply_to_message,
+                    reply_to_username=reply_to_username,
+                    reply_to_message_type=reply_to_message_type,
+                    from_user_id=from_user_id,
+                    from_username=from_username,
+                    message_created_time=message_time,
+                    rich=data.get('rich'),
+                )
+            except Exception as e:
+                message = None
+                logger.error(f"显示消息失败: message_id={message_id}, error={e}", exc_info=True)
+
+        # 历史消息自带编辑状态与已抓取的链接预览
+        if history and message is not None:
+            from gui.handlers.chat_handlers import apply_message_link_preview, update_message_content
+            if data.get('edited_at'):
+                update_message_content(main_window, message_id, text, data.get('edited_at'), data.get('rich'))
+            for preview in data.get('link_previews') or []:
+                apply_message_link_preview(main_window, message_id, preview)
+
+    except Exception as e:
+        logger.error(f"处理 WebSocket 消息失败: {e}", exc_info=True)
+
+
+def display_server_messages(main_window, messages: List[Dict[str, Any]], history: bool = False):
+    """
+    批量显示服务端消息（new_messages 批量推送、本地缓存恢复、增量同步）：
+    记录逐条加入聊天记录模型，结束时只通知视图一次并滚动到底部一次
+    """
+    chat_model = getattr(main_window, "chat_model", None)
+    if chat_model is None or not messages:
+        return
+    count = len(chat_model)
+    with chat_model.batch_insert():
+        for data in messages:
+            display_server_message(main_window, data, history=history)
+    if len(chat_model) > count:
+        from gui.handlers.chat_handlers import scroll_to_bottom
+        scroll_to_bottom(main_window)
+
+
+def _cache_live_messages(main_window, messages: List[Dict[str, Any]]):
+    """当前客服会话的实时消息（含撤回事件）写入本地缓存"""
+    session_id = getattr(main_window, "_chat_session_id", None)
+    messages = [data for data in messages if isinstance(data, dict) and session_id and data.get('session_id') == session_id]
+    if not messages:
+        return
+    try:
+        get_message_cache().put_messages(session_id, messages)
+    except Exception as e:
+        logger.error(f"写入本地聊天记录缓存失败: {e}", exc_info=True)
+
+
+def _ui_callback(main_window, callback: Callable[[Any], None]) -> Callable[[Any], None]:
+    """把本地缓存后台线程中的读取结果切换到主线程交给 callback"""
+    dispatcher = _get_ui_dispatcher(main_window)
+
+    def deliver(result):
+        if dispatcher:
+            dispatcher.trigger.emit(lambda: callback(result))
+        else:
+            callback(result)
+    return deliver
+
+
+def restore_cached_chat(main_window, on_done: Callable[[bool], None]):
+    """
+    打开聊天面板时恢复进行中的客服会话：在后台读取本地缓存后渲染，连接成功后再增量同步。
+    完成后在主线程调用 on_done(是否恢复了会话)
+    """
+    user_id = getattr(main_window, "user_id", None)
+    if not user_id:
+        on_done(False)
+        return
+
+    def on_loaded(cached: Optional[Dict[str, Any]]):
+        restored = False
+        try:
+            # 读取期间已退出登录、切换账号或已开始新的客服会话
+            if cached and user_id == getattr(main_window, "user_id", None) \
+                    and not getattr(main_window, "_chat_session_id", None):
+                _show_restored_chat(main_window, user_id, cached)
+                restored = True
+        except Exception as e:
+            logger.error(f"恢复本地缓存的客服会话失败: {e}", exc_info=True)
+        on_done(restored)
+
+    try:
+        get_message_cache().load_active_session(user_id, limit=_RESTORE_LIMIT, callback=_ui_callback(main_window, on_loaded))
+    except Exception as e:
+        logger.error(f"读取本地聊天记录缓存失败: {e}", exc_info=True)
+        on_done(False)
+
+
+def _show_restored_chat(main_window, user_id: int, cached: Dict[str, Any]):
+    from gui.handlers.chat_handlers import add_connected_separator
+
+    session_id = cached["session_id"]
+    payloads = cached.get("messages") or []
+    main_window._chat_session_id = session_id
+    main_window._human_service_connected = True
+    main_window._matched_agent_id = cached.get("agent_id")
+    add_connected_separator(main_window)
+    display_server_messages(main_window, payloads, history=True)
+    logger.info(f"已从本地缓存恢复客服会话: session_id={session_id}, messages={len(payloads)}")
+
+    # 已连接时立即增量同步，否则在连接成功回调中同步
+    ws_client = getattr(main_window, "_ws_client", None)
+    if ws_client and ws_client.is_connected():
+        sync_chat_history(main_window)
+    else:
+        from client.login.token_storage import read_token
+        token = read_token()
+        if token:
+            connect_websocket(main_window, user_id, token)
+
+
+def sync_chat_history(main_window, after_id: Optional[int] = None, changed_from_id: Optional[int] = None):
+    """
+    向服务端请求本地缓存最后一条消息之后的消息（恢复会话、连接 / 重连后调用）；
+    首页同时带上本地缓存的消息ID范围，校正离线期间被撤回或编辑的缓存消息。
+    未指定 after_id 时先在后台读取本地缓存的消息ID范围，结果回到主线程后再请求
+    """
+    session_id = getattr(main_window, "_chat_session_id", None)
+    if not session_id or not getattr(main_window, "_human_service_connected", False):
+        return
+    if after_id is not None:
+        _request_history(main_window, session_id, after_id, changed_from_id)
+        return
+
+    def on_range(sync_range):
+        first_id, last_id = sync_range
+        _request_history(main_window, session_id, last_id, first_id if last_id else None)
+
+    get_message_cache().sync_range(session_id, callback=_ui_callback(main_window, on_range))
+
+
+def _request_history(main_window, session_id: str, after_id: int, changed_from_id: Optional[int]):
+    """请求 after_id 之后的一页消息与 [changed_from_id, after_id] 中的一页撤回 / 编辑，有剩余时继续请求"""
+    ws_client = getattr(main_window, "_ws_client", None)
+    # 等待本地缓存期间会话已关闭或切换
+    if not ws_client or session_id != getattr(main_window, "_chat_session_id", None) \
+            or not getattr(main_window, "_human_service_connected", False):
+        return
+    cache = get_message_cache()
+
+    def _normalize(raw_messages) -> List[Dict[str, Any]]:
+        messages = []
+        for message in raw_messages or []:
+            message = dict(message, session_id=session_id)
+            message.setdefault("from_user_id", message.get("userId"))
+            messages.append(message)
+        return messages
+
+    def on_done(future):
+        response = future.result() or {}
+        # 请求期间会话已关闭或切换
+        if session_id != getattr(main_window, "_chat_session_id", None):
+            return
+        if not response.get("success"):
+            if response.get("message") in ("会话不存在", "无权限访问此会话"):
+                end_cached_session(main_window, session_id)
+            else:
+                logger.warning(f"增量同步聊天记录失败: session_id={session_id}, {response.get('message')}")
+            return
+
+        changes = _normalize(response.get("changes"))
+        if changes:
+            cache.put_messages(session_id, changes)
+            apply_message_changes(main_window, changes)
+
+        messages = _normalize(response.get("messages"))
+        if messages:
+            cache.put_messages(session_id, messages)
+            display_server_messages(main_window, messages, history=True)
+
+        # 新消息与撤回 / 编辑各自分页：下一页从本页最后一条新消息之后、changes_next_id 开始
+        next_changed_from_id = response.get("changes_next_id")
+        if response.get("session_status") == "closed":
+            end_cached_session(main_window, session_id)
+        elif (response.get("has_more") and messages) or next_changed_from_id:
+            next_after_id = int(messages[-1]["id"]) if messages else after_id
+            _request_history(main_window, session_id, next_after_id, next_changed_from_id)
+
+    ws_client.get_session_messages(
+        session_id, limit=_HISTORY_PAGE_SIZE, callback=on_done, after_id=after_id, changed_from_id=changed_from_id
+    )
+
+
+def apply_message_changes(main_window, messages: List[Dict[str, Any]]):
+    """把服务端返回的已撤回 / 已编辑消息应用到聊天记录中已显示的消息（状态未变化的跳过）"""
+    chat_model = getattr(main_window, "chat_model", None)
+    if chat_model is None:
+        return
+    from gui.handlers.chat_handlers import update_message_content
+    for data in messages:
+        message = chat_model.find(data.get("id"))
+        if message is None:
+            continue
+        if data.get("is_recalled"):
+            if not message.is_recalled:
+                # 撤回的消息由 display_server_message 替换为撤回提示
+                display_server_message(main_window, data, history=True)
+        elif data.get("is_edited"):
+            edited_at = data.get("edited_at") or ""
+            if message.edited_at != edited_at or message.content != (data.get("text") or ""):
+                update_message_content(main_window, data.get("id"), data.get("text"), edited_at, data.get("rich"))
+
+
+def end_cached_session(main_window, session_id: str):
+    """服务端会话已结束：本地缓存不再恢复该会话，界面退出人工客服模式"""
+    get_message_cache().close_session(session_id)
+    if session_id != getattr(main_window, "_chat_session_id", None):
+        return
+    main_window._human_service_connected = False
+    main_window._matched_agent_id = None
+    main_window._chat_session_id = None
+    from gui.handlers.chat_handlers import append_support_message
+    append_support_message(main_window, "本次客服会话已结束，如需帮助可重新联系人工客服。")
+
+
 def get_or_create_websocket_client(main_window, server_url: str = "http://127.0.0.1:8000"):
     """
     获取或创建 WebSocket 客户端实例
@@ -84,6 +497,11 @@ def get_or_create_websocket_client(main_window, server_url: str = "http://127.0.
                         main_window._ws_client.subscribe_vip_info()
                     except Exception as e:
                         logger.error(f"订阅 VIP 信息失败: {e}", exc_info=True)
+                # 进行中的客服会话补齐断线期间的消息
+                try:
+                    sync_chat_history(main_window)
+                except Exception as e:
+                    logger.error(f"增量同步聊天记录失败: {e}", exc_info=True)
             # 通过 UI 调度器在主线程中执行
             dispatcher = _get_ui_dispatcher(main_window)
             if dispatcher:
@@ -127,6 +545,7 @@ def get_or_create_websocket_client(main_window, server_url: str = "http://127.0.
                     main_window._human_service_connected = True
                     if agent_id is not None:
                         main_window._matched_agent_id = agent_id
+                    get_message_cache().open_session(current_session_id, main_window.user_id, agent_id)
 
                     # 添加“已连接客服，可以开始对话”的分隔线
                     add_connected_separator(main_window)
@@ -151,421 +570,8 @@ def get_or_create_websocket_client(main_window, server_url: str = "http://127.0.
                 
                 # 在主线程中执行 UI 更新
                 def update_ui():
-                    message_id_log = data.get('id') if isinstance(data, dict) else 'unknown'
-                    try:
-                        message_id = data.get('id')
-                        text = data.get('text', '')
-                        from_user_id = data.get('from_user_id')
-                        from_username = data.get('username')
-                        avatar = data.get('avatar')
-                        message_type = data.get('message_type', 'text')
-                        reply_to_message_id = data.get('reply_to_message_id')
-                        # 引用消息摘要信息由服务端随消息一起推送
-                        # 后端可能推送 reply_to_message 为字典（包含 id, message, message_type 等字段）
-                        # 也可能直接推送字符串，需要兼容处理
-                        reply_to_message_raw = data.get('reply_to_message')
-                        if isinstance(reply_to_message_raw, dict):
-                            # 如果是字典，优先使用字典中的 id 字段作为 reply_to_message_id
-                            # 如果没有提供单独的 reply_to_message_id，则使用字典中的 id
-                            if not reply_to_message_id and reply_to_message_raw.get('id'):
-                                try:
-                                    reply_to_message_id = int(reply_to_message_raw.get('id'))
-                                except (ValueError, TypeError):
-                                    reply_to_message_id = reply_to_message_raw.get('id')
-                            # 提取其中的 message 字段
-                            reply_to_message = reply_to_message_raw.get('message', '')
-                            # 如果字典中没有单独提供 reply_to_username 和 reply_to_message_type，也从字典中提取
-                            if not data.get('reply_to_username'):
-                                reply_to_username = reply_to_message_raw.get('from_username')
-                            else:
-                                reply_to_username = data.get('reply_to_username')
-                            if not data.get('reply_to_message_type'):
-                                reply_to_message_type = reply_to_message_raw.get('message_type', 'text')
-                            else:
-                                reply_to_message_type = data.get('reply_to_message_type')
-                        else:
-                            # 如果是字符串，直接使用
-                            reply_to_message = reply_to_message_raw
-                            reply_to_username = data.get('reply_to_username')
-                            reply_to_message_type = data.get('reply_to_message_type')
-                        is_recalled = data.get('is_recalled', False)
-                        offline = data.get('offline', False)
-                        message_time = data.get('time') or data.get('created_at') or data.get('timestamp')
-                        
-                        # 初始化 updated 变量，用于标记是否已找到并更新了乐观展示的消息
-                        updated = False
-                        
-                        # 使用服务端提供的 is_from_self 标记（优先使用，更可靠）
-                        # 如果没有提供，则回退到通过 user_id 比较判断
-                        is_from_self = data.get('is_from_self')
-                        current_user_id = getattr(main_window, 'user_id', None)
-                        if is_from_self is None:
-                            # 回退逻辑：通过 user_id 比较判断
-                            if current_user_id is not None and from_user_id is not None:
-                                try:
-                                    is_from_self = (int(from_user_id) == int(current_user_id))
-                                except (ValueError, TypeError):
-                                    is_from_self = (from_user_id == current_user_id)
-                            else:
-                                is_from_self = (from_user_id == current_user_id)
-                        
-                        # 如果是撤回的消息，先尝试更新现有消息
-                        if is_recalled and message_id:
-                            try:
-                                recalled_id = int(message_id)
-                                
-                                # 直接调用 append_chat_message，让它自己处理查找和更新逻辑
-                                from gui.handlers.chat_handlers import append_chat_message
-                                append_chat_message(
-                                    main_window,
-                                    text or "",
-                                    from_self=is_from_self,
-                                    is_html=False,
-                                    streaming=False,
-                                    avatar_base64=avatar,
-                                    message_id=recalled_id,
-                                    is_recalled=True,
-                                    from_user_id=from_user_id,
-                                    from_username=from_username,
-                                    message_created_time=message_time
-                                )
-                                # append_chat_message 内部会处理查找和更新，如果找到现有消息会直接返回
-                                # 如果没有找到，会创建新的撤回提示消息
-                                return
-                            except (ValueError, TypeError) as e:
-                                logger.error(f"处理撤回消息失败: {e}", exc_info=True)
-                        
-                        # 如果是自己的消息，且已经通过乐观展示显示过了，则只更新message_id，不重复显示
-                        # 注意：只对文本消息和图片消息进行此检查，其他消息类型直接显示
-                        if is_from_self and message_id and message_type in ['text', 'image'] and not is_recalled:
-                            # 首先检查 _message_widgets_map 中是否已经有该 message_id 的消息
-                            # 如果 handle_response 已经更新了 _message_widgets_map，这里应该能找到
-                            msg_id_int = None
-                            try:
-                                msg_id_int = int(message_id)
-                            except (ValueError, TypeError):
-                                pass
-                            
-                            if msg_id_int and hasattr(main_window, "_message_widgets_map") and msg_id_int in main_window._message_widgets_map:
-                                # 消息已经在 _message_widgets_map 中（可能是 handle_response 已经更新了），跳过
-                                return
-                            
-                            # 检查是否已经显示过（乐观展示的消息可能还没有message_id）
-                            # 尝试更新已显示的消息的message_id
-                            updated = False
-                            if hasattr(main_window, "chat_layout"):
-                                # 优先检查 _message_widgets_map 中是否有未设置 message_id 的消息（乐观展示的消息）
-                                if hasattr(main_window, "_message_widgets_map") and None in main_window._message_widgets_map:
-                                    existing_widget, existing_bubble = main_window._message_widgets_map[None]
-                                    # 检查消息类型和内容是否匹配
-                                    matched = False
-                                    if message_type == 'image':
-                                        # 对于图片消息，检查是否是图片
-                                        from PyQt6.QtWidgets import QLabel
-                                        if isinstance(existing_bubble, QLabel) and existing_bubble.pixmap() is not None:
-                                            matched = True
-                                    elif message_type == 'text':
-                                        # 对于文本消息，检查内容是否匹配
-                                        from gui.components.chat_bubble import ChatBubble
-                                        if isinstance(existing_bubble, ChatBubble):
-                                            try:
-                                                bubble_text = existing_bubble.toPlainText() if hasattr(existing_bubble, 'toPlainText') else existing_bubble.text() if hasattr(existing_bubble, 'text') else ""
-                                                # 比较文本内容（去除HTML标签和空白字符）
-                                                import re
-                                                bubble_text_clean = re.sub(r'<[^>]+>', '', bubble_text).strip()
-                                                text_clean = re.sub(r'<[^>]+>', '', text).strip()
-                                                if bubble_text_clean == text_clean:
-                                                    matched = True
-                                            except Exception:
-                                                pass
-                                    
-                                    if matched:
-                                        # 找到匹配的乐观展示消息，更新message_id
-                                        existing_widget.setProperty("message_id", int(message_id))
-                                        # 更新 _message_widgets_map
-                                        del main_window._message_widgets_map[None]
-                                        if not hasattr(main_window, "_message_widgets_map"):
-                                            main_window._message_widgets_map = {}
-                                        main_window._message_widgets_map[int(message_id)] = (existing_widget, existing_bubble)
-                                        updated = True
-                                
-                                # 如果图片消息没有在 _message_widgets_map 中找到，或者不是图片消息，查找布局中未设置 message_id 的消息
-                                if not updated:
-                                    # 从最新的消息开始查找（从后往前），找到第一个没有ID且是用户发送的消息
-                                    for i in range(main_window.chat_layout.count() - 1, -1, -1):
-                                        if updated:
-                                            break
-                                        item = main_window.chat_layout.itemAt(i)
-                                        if item and item.widget():
-                                            widget = item.widget()
-                                            existing_id = widget.property("message_id")
-                                            # 如果消息没有ID或者是0，尝试更新它
-                                            if existing_id is None or existing_id == 0 or existing_id == "":
-                                                # 检查是否是用户自己的消息（通过布局判断：用户消息在右侧，有stretch）
-                                                layout = widget.layout()
-                                                if layout:
-                                                    for j in range(layout.count()):
-                                                        if updated:
-                                                            break
-                                                        layout_item = layout.itemAt(j)
-                                                        if layout_item and layout_item.layout():
-                                                            row_layout = layout_item.layout()
-                                                            for k in range(row_layout.count()):
-                                                                if updated:
-                                                                    break
-                                                                row_item = row_layout.itemAt(k)
-                                                                if row_item and row_item.widget():
-                                                                    w = row_item.widget()
-                                                                    # 检查是否是文本消息的气泡或图片消息
-                                                                    from PyQt6.QtWidgets import QLabel
-                                                                    from gui.components.chat_bubble import ChatBubble
-                                                                    if isinstance(w, ChatBubble) or (isinstance(w, QLabel) and w.pixmap() is not None):
-                                                                        # 检查前面是否有stretch（用户消息在右侧）
-                                                                        if k > 0:
-                                                                            prev_item = row_layout.itemAt(k - 1)
-                                                                            if prev_item and prev_item.spacerItem():
-                                                                                # 对于文本消息，还需要检查内容是否匹配（避免匹配到错误的消息）
-                                                                                if message_type == 'text' and isinstance(w, ChatBubble):
-                                                                                    # 获取气泡的文本内容进行比较
-                                                                                    try:
-                                                                                        bubble_text = w.toPlainText() if hasattr(w, 'toPlainText') else w.text() if hasattr(w, 'text') else ""
-                                                                                        # 比较文本内容（去除HTML标签和空白字符）
-                                                                                        import re
-                                                                                        bubble_text_clean = re.sub(r'<[^>]+>', '', bubble_text).strip()
-                                                                                        text_clean = re.sub(r'<[^>]+>', '', text).strip()
-                                                                                        if bubble_text_clean != text_clean:
-                                                                                            # 内容不匹配，继续查找
-                                                                                            continue
-                                                                                    except Exception:
-                                                                                        # 如果无法获取文本内容，跳过内容匹配检查
-                                                                                        pass
-                                                                                
-                                                                                # 找到用户发送的消息，更新message_id
-                                                                                widget.setProperty("message_id", int(message_id))
-                                                                                if not hasattr(main_window, "_message_widgets_map"):
-                                                                                    main_window._message_widgets_map = {}
-                                                                                # 如果 w 是图片，使用 img_label；否则使用 w
-                                                                                if isinstance(w, QLabel) and w.pixmap() is not None:
-                                                                                    main_window._message_widgets_map[int(message_id)] = (widget, w)
-                                                                                else:
-                                                                                    main_window._message_widgets_map[int(message_id)] = (widget, w)
-                                                                                updated = True
-                                                                                break
-                            
-                            # 如果成功更新了message_id，直接返回，不重复显示
-                            if updated:
-                                return
-                            
-                            # 对于自己的消息，如果 updated=False，说明没有找到乐观展示的消息
-                            # 但是，为了安全起见，对于自己的消息，如果 _message_widgets_map 中有 None 键（说明有乐观展示的消息），
-                            # 即使内容匹配失败，也应该直接返回，避免重复显示
-                            # 因为服务器推送的消息可能是重复的（多设备同步），而乐观展示的消息已经在界面上显示了
-                            if not updated:
-                                # 再次检查 _message_widgets_map[message_id]，确保不会重复显示
-                                if msg_id_int and hasattr(main_window, "_message_widgets_map") and msg_id_int in main_window._message_widgets_map:
-                                    return
-                                # 如果 _message_widgets_map 中有 None 键，说明有乐观展示的消息，即使内容匹配失败，也应该直接返回
-                                # 因为服务器推送的消息可能是重复的
-                                if hasattr(main_window, "_message_widgets_map") and None in main_window._message_widgets_map:
-                                    # 有乐观展示的消息，直接返回，避免重复显示
-                                    return
-                                # 检查 _displayed_message_ids，如果 message_id 已经在列表中，说明已经处理过，直接返回
-                                if not hasattr(main_window, "_displayed_message_ids"):
-                                    main_window._displayed_message_ids = set()
-                                msg_id_str = str(message_id)
-                                if msg_id_str in main_window._displayed_message_ids:
-                                    return
-                                # 将 message_id 添加到 _displayed_message_ids，防止后续重复处理
-                                main_window._displayed_message_ids.add(msg_id_str)
-                            
-                            # 对于自己的消息，如果 updated=False 且没有找到乐观展示的消息，直接返回，避免重复显示
-                            # 因为服务器推送的消息可能是重复的（多设备同步），而乐观展示的消息已经在界面上显示了
-                            # 如果确实没有乐观展示的消息（比如消息发送失败后重试），那么应该显示服务器推送的消息
-                            # 但是，为了安全起见，我们假设乐观展示的消息总是存在的，所以直接返回
-                            return
-                        
-                        # 消息去重：检查是否已经显示过
-                        # 对于自己的消息，如果已经通过乐观展示显示并更新了message_id，上面的逻辑应该已经返回了
-                        # 这里只对未处理的消息进行去重检查
-                        # 注意：对于客服消息（is_from_self=False），updated 仍然是 False，所以也会进入这个检查
-                        # 但是，对于客服消息，我们只检查 _message_widgets_map，不检查 _displayed_message_ids
-                        # 因为客服消息没有乐观展示，所以如果 _message_widgets_map 中没有，就应该显示
-                        if not updated:  # 只对未找到乐观展示的消息进行去重
-                            if not hasattr(main_window, "_displayed_message_ids"):
-                                main_window._displayed_message_ids = set()
-                            
-                            # 如果有message_id，进行去重检查
-                            if message_id:
-                                msg_id_str = str(message_id)
-                                msg_id_int = None
-                                try:
-                                    msg_id_int = int(message_id)
-                                except (ValueError, TypeError):
-                                    pass
-                                
-                                # 首先检查 _message_widgets_map 中是否已经有该 message_id 的消息
-                                if msg_id_int and hasattr(main_window, "_message_widgets_map") and msg_id_int in main_window._message_widgets_map:
-                                    # 消息已经在 _message_widgets_map 中，说明已经显示过了，跳过
-                                    return
-                                
-                                # 对于自己的消息，检查 _displayed_message_ids 集合
-                                # 对于客服消息（is_from_self=False），不检查 _displayed_message_ids，因为客服消息没有乐观展示
-                                if is_from_self:
-                                    # 然后检查 _displayed_message_ids 集合
-                                    if msg_id_str in main_window._displayed_message_ids:
-                                        # 检查消息是否真的已经显示（在_message_widgets_map中）
-                                        if hasattr(main_window, "_message_widgets_map"):
-                                            if msg_id_int and msg_id_int in main_window._message_widgets_map:
-                                                # 消息已显示，跳过
-                                                return
-                                            else:
-                                                # 消息ID在列表中但未显示，可能是HTTP轮询获取失败，继续处理
-                                                # 从列表中移除，允许重新处理
-                                                main_window._displayed_message_ids.discard(msg_id_str)
-                                        else:
-                                            main_window._displayed_message_ids.discard(msg_id_str)
-                                    
-                                    main_window._displayed_message_ids.add(msg_id_str)
-                            else:
-                                # 如果没有message_id，记录日志但继续处理（可能是系统消息）
-                                logger.warning(f"收到没有message_id的消息，继续处理")
-                        
-                        # 导入消息处理函数
-                        from gui.handlers.chat_handlers import append_chat_message, append_image_message
-                        from PyQt6.QtGui import QPixmap, QImage
-                        import base64
-                        
-                        # 检查 chat_layout 是否存在
-                        if not hasattr(main_window, "chat_layout"):
-                            logger.error(f"chat_layout 不存在，无法显示消息: message_id={message_id}")
-                            return
-                        
-                        # 如果是撤回的消息
-                        if is_recalled:
-                            text = "[消息已撤回]"
-                        
-                        # 获取消息创建时间（用于撤回时间检查）
-                        message_time = data.get('time') or data.get('created_at') or data.get('timestamp')
-                        
-                        # 根据消息类型显示消息
-                        if message_type == 'image' and text and text.startswith('data:image'):
-                            # 图片消息
-                            # 引用信息直接使用服务端推送的摘要（reply_to_message / reply_to_username / reply_to_message_type），
-                            # 不再通过已废弃的 HTTP 接口获取
-                            try:
-                                b64_part = text.split(",", 1)[1] if "," in text else ""
-                                raw = base64.b64decode(b64_part)
-                                image = QImage.fromData(raw)
-                                if not image.isNull():
-                                    pixmap = QPixmap.fromImage(image)
-                                    # 为了与用户本地发送图片的大小规格一致，统一使用最大边 160 像素的缩放规则
-                                    max_size = 160
-                                    w, h = pixmap.width(), pixmap.height()
-                                    if w > max_size or h > max_size:
-                                        if w >= h:
-                                            pixmap = pixmap.scaledToWidth(max_size, Qt.TransformationMode.SmoothTransformation)
-                                        else:
-                                            pixmap = pixmap.scaledToHeight(max_size, Qt.TransformationMode.SmoothTransformation)
-                                    # 图片消息支持引用显示
-                                    try:
-                                        append_image_message(
-                                            main_window,
-                                            pixmap,
-                                            from_self=is_from_self,
-                                            message_id=int(message_id) if message_id else None,
-                                            message_created_time=message_time,
-                                            from_user_id=from_user_id,
-                                            from_username=from_username,
-                                            reply_to_message_id=int(reply_to_message_id) if reply_to_message_id else None,
-                                            reply_to_message=reply_to_message,
-                                            reply_to_username=reply_to_username,
-                                            reply_to_message_type=reply_to_message_type,
-                                            is_recalled=is_recalled,
-                                            raw_message=text,  # 保存原始 data:image/...，用于后续引用生成缩略图
-                                        )
-                                    except Exception as e:
-                                        logger.error(f"显示图片消息失败: message_id={message_id}, error={e}", exc_info=True)
-                                    # 确保消息ID已添加到已显示列表（避免轮询重复显示）
-                                    if message_id:
-                                        if not hasattr(main_window, "_displayed_message_ids"):
-                                            main_window._displayed_message_ids = set()
-                                        main_window._displayed_message_ids.add(str(message_id))
-                                else:
-                                    # 图片解析失败，显示文本（带引用信息）
-                                    append_chat_message(
-                                        main_window,
-                                        "[图片] 加载失败",
-                                        from_self=is_from_self,
-                                        is_html=False,
-                                        streaming=False,
-                                        avatar_base64=avatar,
-                                        message_id=int(message_id) if message_id else None,
-                                        is_recalled=is_recalled,
-                                        reply_to_message_id=int(reply_to_message_id) if reply_to_message_id else None,
-                                        reply_to_message=reply_to_message,
-                                        reply_to_username=reply_to_username,
-                                        reply_to_message_type=reply_to_message_type,
-                                        from_user_id=from_user_id,
-                                        from_username=from_username,
-                                        message_created_time=message_time
-                                    )
-                            except Exception as e:
-                                logger.error(f"处理图片消息失败: {e}", exc_info=True)
-                                append_chat_message(
-                                    main_window,
-                                    "[图片] 加载失败",
-                                    from_self=is_from_self,
-                                    is_html=False,
-                                    streaming=False,
-                                    avatar_base64=avatar,
-                                    message_id=int(message_id) if message_id else None,
-                                    is_recalled=is_recalled,
-                                    reply_to_message_id=int(reply_to_message_id) if reply_to_message_id else None,
-                                    reply_to_message=reply_to_message,
-                                    reply_to_username=reply_to_username,
-                                    reply_to_message_type=reply_to_message_type,
-                                    from_user_id=from_user_id,
-                                    from_username=from_username,
-                                    message_created_time=message_time
-                                )
-                        else:
-                            # 文本消息或表情消息（表情也是文本）
-                            # 引用信息同样直接使用服务端推送的数据
-                            # 检查是否在主线程中
-                            from PyQt6.QtCore import QThread
-                            from PyQt6.QtWidgets import QApplication
-                            app = QApplication.instance()
-                            if app:
-                                is_main_thread = QThread.currentThread() == app.thread()
-                            
-                            try:
-                                append_chat_message(
-                                    main_window,
-                                    text,
-                                    from_self=is_from_self,
-                                    is_html=False,
-                                    streaming=False,
-                                    avatar_base64=avatar,
-                                    message_id=int(message_id) if message_id else None,
-                                    is_recalled=is_recalled,
-                                    reply_to_message_id=int(reply_to_message_id) if reply_to_message_id else None,
-                                    reply_to_message=reply_to_message,
-                                    reply_to_username=reply_to_username,
-                                    reply_to_message_type=reply_to_message_type,
-                                    from_user_id=from_user_id,
-                                    from_username=from_username,
-                                    message_created_time=message_time
-                                )
-                            except Exception as e:
-                                logger.error(f"显示消息失败: message_id={message_id}, error={e}", exc_info=True)
-                            # 确保消息ID已添加到已显示列表（避免轮询重复显示）
-                            if message_id:
-                                if not hasattr(main_window, "_displayed_message_ids"):
-                                    main_window._displayed_message_ids = set()
-                                main_window._displayed_message_ids.add(str(message_id))
-                    
-                    except Exception as e:
-                        logger.error(f"处理 WebSocket 消息失败: {e}", exc_info=True)
+                    _cache_live_messages(main_window, [data])
+                    display_server_message(main_window, data)
                 
                 # 强制通过 UI 调度器在主线程中执行 update_ui
                 # Socket.IO 回调总是在后台线程中执行，必须通过信号机制切换到主线程
@@ -601,6 +607,29 @@ def get_or_create_websocket_client(main_window, server_url: str = "http://127.0.
                 except Exception as e:
                     logger.error(f"调用自定义 WebSocket 消息处理函数失败: {e}", exc_info=True)
         
+        def on_messages(messages):
+            """处理批量推送的新消息（new_messages）：整批一次切换到主线程、一次写缓存、一次布局"""
+            def update_ui():
+                try:
+                    _cache_live_messages(main_window, messages)
+                    display_server_messages(main_window, messages)
+                except Exception as e:
+                    logger.error(f"处理批量新消息失败: {e}, count={len(messages)}", exc_info=True)
+            
+            dispatcher = _get_ui_dispatcher(main_window)
+            if dispatcher:
+                dispatcher.trigger.emit(update_ui)
+            else:
+                update_ui()
+            
+            # 如果存在自定义处理函数，也逐条调用它
+            if hasattr(main_window, '_on_websocket_message'):
+                for data in messages:
+                    try:
+                        main_window._on_websocket_message(data)
+                    except Exception as e:
+                        logger.error(f"调用自定义 WebSocket 消息处理函数失败: {e}", exc_info=True)
+        
         def on_error(error):
             def _on_error():
                 logger.error(f"WebSocket 错误: {error}")
@@ -672,16 +701,22 @@ def get_or_create_websocket_client(main_window, server_url: str = "http://127.0.
             """处理消息编辑"""
             def _on_message_edited():
                 try:
-                    message_id = data.get('message_id')
+                    from gui.handlers.chat_handlers import update_message_content
+                    update_message_content(
+                        main_window,
+                        data.get('message_id'),
+                        data.get('new_content'),
+                        data.get('edited_at'),
+                        data.get('rich'),
+                    )
                     session_id = data.get('session_id')
-                    new_content = data.get('new_content')
-                    edited_at = data.get('edited_at')
-                    
-                    # 更新聊天面板中的消息内容
-                    # 这里需要根据实际的消息显示逻辑来更新
-                    # 可以通过 main_window 的方法来更新消息显示
-                    if hasattr(main_window, 'update_message_content'):
-                        main_window.update_message_content(message_id, new_content, edited_at)
+                    if session_id and session_id == getattr(main_window, "_chat_session_id", None):
+                        get_message_cache().update_message(session_id, data.get('message_id'), {
+                            "text": data.get('new_content'),
+                            "is_edited": True,
+                            "edited_at": data.get('edited_at'),
+                            "rich": data.get('rich'),
+                        })
                 except Exception as e:
                     logger.error(f"处理消息编辑失败: {e}", exc_info=True)
             
@@ -691,6 +726,22 @@ def get_or_create_websocket_client(main_window, server_url: str = "http://127.0.
             else:
                 _on_message_edited()
         
+        def on_message_status(data):
+            """处理消息送达 / 已读回执"""
+            def _on_message_status():
+                try:
+                    chat_model = getattr(main_window, "chat_model", None)
+                    if chat_model is not None:
+                        chat_model.set_status(data.get('message_id'), data.get('status'))
+                except Exception as e:
+                    logger.error(f"处理消息状态失败: {e}", exc_info=True)
+            
+            dispatcher = _get_ui_dispatcher(main_window)
+            if dispatcher:
+                dispatcher.trigger.emit(_on_message_status)
+            else:
+                _on_message_status()
+        
         def on_session_status_updated(data):
             """处理会话状态更新"""
             def _on_session_status_updated():
@@ -698,6 +749,9 @@ def get_or_create_websocket_client(main_window, server_url: str = "http://127.0.
                     session_id = data.get('session_id')
                     status = data.get('status')
                     
+                    if status == "closed" and session_id:
+                        end_cached_session(main_window, session_id)
+
                     # 更新会话列表和状态显示
                     # 这里需要根据实际的会话列表逻辑来更新
                     if hasattr(main_window, 'update_session_status'):
@@ -711,21 +765,75 @@ def get_or_create_websocket_client(main_window, server_url: str = "http://127.0.
             else:
                 _on_session_status_updated()
         
+        def on_message_preview_ready(data):
+            """处理服务端推送的链接预览，更新对应消息下方的预览卡片"""
+            def _on_message_preview_ready():
+                try:
+                    from gui.handlers.chat_handlers import apply_message_link_preview
+                    apply_message_link_preview(main_window, data.get('message_id'), data.get('preview') or {})
+                    session_id = data.get('session_id')
+                    if session_id and data.get('preview') and session_id == getattr(main_window, "_chat_session_id", None):
+                        get_message_cache().update_message(
+                            session_id, data.get('message_id'), {"link_previews": [data.get('preview')]}
+                        )
+                except Exception as e:
+                    logger.error(f"处理链接预览失败: {e}", exc_info=True)
+            
+            dispatcher = _get_ui_dispatcher(main_window)
+            if dispatcher:
+                dispatcher.trigger.emit(_on_message_preview_ready)
+            else:
+                _on_message_preview_ready()
+        
+        def on_message_sent(client_message_id, response):
+            """待发送队列中的消息发送成功（主线程）：回推尚未到达时先绑定消息ID"""
+            try:
+                chat_model = getattr(main_window, "chat_model", None)
+                record = chat_model.find_temp(client_message_id) if chat_model is not None else None
+                if record is not None and record.message_id is None and response.get('message_id'):
+                    chat_model.set_message_id(record, response['message_id'])
+            except Exception as e:
+                logger.error(f"处理消息发送结果失败: {e}", exc_info=True)
+        
+        def on_message_failed(client_message_id, response):
+            """待发送队列中的消息被服务端拒绝或长时间未能发出（主线程）"""
+            try:
+                from gui.handlers.chat_handlers import append_chat_message
+                reason = response.get('message') or "未知错误"
+                append_chat_message(main_window, f"消息发送失败：{reason}", from_self=False)
+            except Exception as e:
+                logger.error(f"处理消息发送失败通知失败: {e}", exc_info=True)
+        
         ws_client.on_connect(on_connect)
         ws_client.on_disconnect(on_disconnect)
         ws_client.on_message(on_message)
+        ws_client.on_messages(on_messages)
         ws_client.on_error(on_error)
         ws_client.on_vip_status_updated(on_vip_status_updated)
         ws_client.on_diamond_balance_updated(on_diamond_balance_updated)
         ws_client.on_user_profile_updated(on_user_profile_updated)
         ws_client.on_message_edited(on_message_edited)
+        ws_client.on_message_status(on_message_status)
         ws_client.on_session_status_updated(on_session_status_updated)
+        ws_client.on_message_preview_ready(on_message_preview_ready)
         ws_client.on_session_accepted_for_user(on_session_accepted_for_user)
+        ws_client.on_message_sent(on_message_sent)
+        ws_client.on_message_failed(on_message_failed)
         
         # 注册撤回消息事件处理器（通过 WebSocketClient 的 message_recalled 事件）
         # WebSocketClient 会将 message_recalled 事件转换为消息格式并调用 on_message_callback
         # 所以这里不需要单独处理，撤回消息会通过 on_message 回调处理
         
+        # access token 续期后同步到 WebSocket 客户端（后续事件与重连使用新 token）
+        def on_token_refreshed(new_token):
+            if ws_client.token:
+                ws_client.token = new_token
+
+        from client.login.token_storage import add_token_listener
+        _remove_token_listener(main_window)
+        add_token_listener(on_token_refreshed)
+        main_window._ws_token_listener = on_token_refreshed
+
         # 保存到 main_window
         main_window._ws_client = ws_client
         
@@ -777,9 +885,10 @@ def connect_websocket(main_window, user_id: int, token: str):
 
 
 def send_message_via_websocket(main_window, session_id: str, message: str, 
-                               message_type: str = "text", reply_to_message_id: Optional[int] = None) -> Dict[str, Any]:
+                               message_type: str = "text", reply_to_message_id: Optional[int] = None,
+                               client_message_id: Optional[str] = None) -> Dict[str, Any]:
     """
-    通过 WebSocket 发送消息
+    通过 WebSocket 发送消息（未连接时加入待发送队列，重连后自动补发）
     
     Args:
         main_window: MainWindow 实例
@@ -787,6 +896,7 @@ def send_message_via_websocket(main_window, session_id: str, message: str,
         message: 消息内容
         message_type: 消息类型 (text/image/file)
         reply_to_message_id: 引用消息ID
+        client_message_id: 客户端消息ID（乐观展示记录的临时ID），服务端回推时据此绑定消息ID
         
     Returns:
         dict: 发送结果，格式 {"success": bool, "message": str, "message_id": Optional[int]}
@@ -799,26 +909,20 @@ def send_message_via_websocket(main_window, session_id: str, message: str,
                 "message": "WebSocket 客户端未初始化，请先连接"
             }
         
-        # 检查是否已连接
-        if not ws_client.is_connected():
-            return {
-                "success": False,
-                "message": "WebSocket 未连接，请先连接"
-            }
-        
-        # 发送消息（异步 emit，返回值仅表示是否成功提交给 Socket.IO 客户端）
+        # 发送消息（先写入待发送队列，返回值仅表示是否已入队）
         send_ok = ws_client.send_message(
             session_id=session_id,
             message=message,
             role="user",
             message_type=message_type,
-            reply_to_message_id=reply_to_message_id
+            reply_to_message_id=reply_to_message_id,
+            client_message_id=client_message_id,
         )
         
         if send_ok:
             return {
                 "success": True,
-                "message": "消息已发送"
+                "message": "消息已发送" if ws_client.is_connected() else "消息已加入待发送队列"
             }
         else:
             return {
@@ -890,6 +994,15 @@ def recall_message_via_websocket(main_window, message_id: int) -> Dict[str, Any]
         }
 
 
+def _remove_token_listener(main_window):
+    """移除为 WebSocket 客户端注册的 token 续期监听（客户端断开或被替换时调用）"""
+    listener = getattr(main_window, '_ws_token_listener', None)
+    if listener is not None:
+        from client.login.token_storage import remove_token_listener
+        remove_token_listener(listener)
+        main_window._ws_token_listener = None
+
+
 def disconnect_websocket(main_window):
     """
     断开 WebSocket 连接
@@ -898,6 +1011,7 @@ def disconnect_websocket(main_window):
         main_window: MainWindow 实例
     """
     try:
+        _remove_token_listener(main_window)
         if hasattr(main_window, '_ws_client') and main_window._ws_client:
             main_window._ws_client.disconnect()
             main_window._ws_client = None
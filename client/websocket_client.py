@@ -7,14 +7,18 @@ WebSocket 客户端
 import logging
 import threading
 import uuid
-from typing import Callable, Optional, Dict, Any
+from collections import deque
+from typing import Callable, Optional, Dict, Any, List
 from enum import Enum
-from PyQt6.QtCore import QTimer
+from PyQt6.QtCore import QCoreApplication, QObject, Qt, QTimer, pyqtSignal
+
+from client.utils.outbound_queue import OutboundItem, OutboundQueue
 
 try:
-    import socketio
+    from client.utils.packed_serializer import MSGPACK_AVAILABLE, PackedClient
     SOCKETIO_AVAILABLE = True
 except ImportError:
+    MSGPACK_AVAILABLE = False
     SOCKETIO_AVAILABLE = False
     logging.warning("socketio 模块未安装，WebSocket 功能不可用")
 
@@ -29,6 +33,117 @@ class ConnectionStatus(Enum):
     ERROR = "error"
 
 
+class RequestError(str, Enum):
+    """请求失败原因（作为响应中的 error 字段）"""
+    NOT_CONNECTED = "not_connected"
+    TIMEOUT = "timeout"
+    CANCELLED = "cancelled"
+    DISCONNECTED = "disconnected"
+    TOO_MANY_REQUESTS = "too_many_requests"
+    SEND_FAILED = "send_failed"
+
+
+class RequestFuture:
+    """
+    一次请求的结果占位（非阻塞）
+
+    - 结果统一为 dict：服务端响应原样返回；本地失败时为 {success: False, message, error}
+    - 通过 add_done_callback 注册的回调总是在 Qt 主线程中执行
+    - 不提供阻塞等待，UI 代码只应使用回调
+    """
+
+    def __init__(self, request_id: str, event: str):
+        self.request_id = request_id
+        self.event = event
+        self._lock = threading.Lock()
+        self._response: Optional[Dict[str, Any]] = None
+        self._done = False
+        self._callbacks: List[Callable[["RequestFuture"], None]] = []
+        self._client: Optional["WebSocketClient"] = None
+
+    def done(self) -> bool:
+        return self._done
+
+    def cancelled(self) -> bool:
+        return self._done and self.error == RequestError.CANCELLED.value
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """返回响应；尚未完成时返回 None"""
+        return self._response
+
+    @property
+    def error(self) -> Optional[str]:
+        return (self._response or {}).get("error") if self._done else None
+
+    def ok(self) -> bool:
+        return self._done and bool((self._response or {}).get("success"))
+
+    def cancel(self) -> bool:
+        """取消请求：之后到达的服务端响应会被丢弃。已完成时返回 False"""
+        if self._client is not None:
+            return self._client._finish_request(
+                self.request_id, _failure(RequestError.CANCELLED, "请求已取消")
+            )
+        return self._set_response(_failure(RequestError.CANCELLED, "请求已取消"))
+
+    def add_done_callback(self, fn: Callable[["RequestFuture"], None]) -> None:
+        """注册完成回调（主线程执行）；已完成时也会异步回调一次"""
+        with self._lock:
+            if not self._done:
+                self._callbacks.append(fn)
+                return
+        _dispatcher().deliver(self, [fn])
+
+    def _set_response(self, response: Dict[str, Any]) -> bool:
+        with self._lock:
+            if self._done:
+                return False
+            self._response = response
+            self._done = True
+            callbacks, self._callbacks = self._callbacks, []
+        if callbacks:
+            _dispatcher().deliver(self, callbacks)
+        return True
+
+
+def _failure(error: RequestError, message: str) -> Dict[str, Any]:
+    return {"success": False, "message": message, "error": error.value}
+
+
+class _RequestDispatcher(QObject):
+    """把请求完成回调切换到 Qt 主线程执行（信号使用 QueuedConnection）"""
+
+    request_finished = pyqtSignal(object, object)
+
+    def __init__(self):
+        super().__init__()
+        self.request_finished.connect(self._run_callbacks, Qt.ConnectionType.QueuedConnection)
+
+    def deliver(self, future: RequestFuture, callbacks: List[Callable[[RequestFuture], None]]) -> None:
+        self.request_finished.emit(future, callbacks)
+
+    def _run_callbacks(self, future: RequestFuture, callbacks) -> None:
+        for fn in callbacks:
+            try:
+                fn(future)
+            except Exception as e:
+                logging.error(f"请求回调异常: {future.event}, {e}", exc_info=True)
+
+
+_request_dispatcher: Optional[_RequestDispatcher] = None
+
+
+def _dispatcher() -> _RequestDispatcher:
+    """获取请求回调调度器（首次调用须在主线程，WebSocketClient 初始化时创建）"""
+    global _request_dispatcher
+    if _request_dispatcher is None:
+        _request_dispatcher = _RequestDispatcher()
+        app = QCoreApplication.instance()
+        if app is not None:
+            _request_dispatcher.moveToThread(app.thread())
+    return _request_dispatcher
+
+
 class WebSocketClient:
     """WebSocket 客户端"""
     
@@ -45,7 +160,8 @@ class WebSocketClient:
         self.server_url = server_url
         # 使用 threading 模式，确保所有对 sio 的操作都在主线程中执行
         # 使用 emit() 而不是 call() 来避免阻塞操作
-        self.sio = socketio.Client(
+        # 支持按连接协商 msgpack 与帧压缩：注册时声明，服务端确认后切换（见 client.utils.packed_serializer）
+        self.sio = PackedClient(
             reconnection=True,
             reconnection_attempts=0,  # 无限重试
             reconnection_delay=1,
@@ -53,6 +169,11 @@ class WebSocketClient:
             randomization_factor=0.5,
         )
         
+        # 是否在注册时声明 msgpack 能力（需要安装 msgpack；服务端不支持时保持 JSON）
+        self.use_msgpack = MSGPACK_AVAILABLE
+        # 是否在注册时声明 deflate 能力（大帧 zlib 压缩，历史分页、会话列表等重复内容多的帧收益明显）
+        self.use_compression = True
+        
         # 连接信息
         self.connection_id = str(uuid.uuid4())
         self.user_id: Optional[int] = None
@@ -68,17 +189,17 @@ class WebSocketClient:
         self.heartbeat_interval = 30  # 秒
         self.heartbeat_timer: Optional[QTimer] = None
         
-        # 消息队列（发送失败时重试）
-        self.message_queue = []
-        self.queue_lock = threading.Lock()
-        self.max_queue_size = 100
-        self.retry_interval = 5  # 秒
+        # 待发送队列（持久化，按会话保序，断线重连后分批补发，失败按指数退避重试）
+        self.outbound = OutboundQueue()
+        self.outbound_batch_size = 20
         self.retry_timer: Optional[QTimer] = None
         
         # 回调函数
         self.on_connect_callback: Optional[Callable] = None
         self.on_disconnect_callback: Optional[Callable] = None
         self.on_message_callback: Optional[Callable] = None
+        # 批量新消息回调：callback(messages)；未设置时逐条调用 on_message_callback
+        self.on_messages_callback: Optional[Callable] = None
         self.on_message_status_callback: Optional[Callable] = None
         self.on_status_change_callback: Optional[Callable] = None
         self.on_error_callback: Optional[Callable] = None
@@ -87,11 +208,25 @@ class WebSocketClient:
         self.on_user_profile_updated_callback: Optional[Callable] = None
         self.on_message_edited_callback: Optional[Callable] = None
         self.on_session_status_updated_callback: Optional[Callable] = None
+        self.on_message_preview_ready_callback: Optional[Callable] = None
+        # 队列中的消息发送成功 / 被服务端拒绝：callback(client_message_id, response)
+        self.on_message_sent_callback: Optional[Callable] = None
+        self.on_message_failed_callback: Optional[Callable] = None
         
         # 消息去重
         self.received_message_ids = set()
         self.max_received_ids = 1000
         
+        # 请求/响应（带 ack 的事件）：请求ID -> (future, 超时定时器)
+        self.request_timeout = 5.0  # 秒
+        self.max_in_flight = 8
+        self._requests_lock = threading.Lock()
+        self._in_flight: Dict[str, Any] = {}
+        # 超出并发上限的请求排队：(future, data)
+        self._waiting_requests: deque = deque()
+        self.max_waiting_requests = 64
+        _dispatcher()
+        
         # 注册事件处理器
         self._register_event_handlers()
         
@@ -120,8 +255,9 @@ class WebSocketClient:
             # 启动心跳
             self._start_heartbeat()
             
-            # 启动重试线程
-            self._start_retry_worker()
+            # 补发待发送队列（重连后立即重试，不再等待退避）
+            self.outbound.reset_backoff()
+            self._call_in_main_thread(self._flush_outbound)
             
             # 调用回调
             if self.on_connect_callback:
@@ -135,10 +271,16 @@ class WebSocketClient:
             """连接断开"""
             logging.warning("WebSocket 连接断开")
             self._update_status(ConnectionStatus.DISCONNECTED)
+            # 重连后的新连接从未压缩的 JSON 开始，重新协商
+            self.sio.packed = False
+            self.sio.compressed = False
             
             # 停止心跳
             self._stop_heartbeat()
             
+            # 断线后不会再收到响应，未完成的请求立即失败
+            self._fail_all_requests(RequestError.DISCONNECTED, "连接已断开")
+            
             # 调用回调
             if self.on_disconnect_callback:
                 try:
@@ -163,20 +305,11 @@ class WebSocketClient:
             """收到新消息"""
             try:
                 message_id = data.get("id") if isinstance(data, dict) else (data.id if hasattr(data, 'id') else None)
-                from_user_id = data.get("from_user_id") if isinstance(data, dict) else (data.from_user_id if hasattr(data, 'from_user_id') else None)
-                to_user_id = data.get("to_user_id") if isinstance(data, dict) else (data.to_user_id if hasattr(data, 'to_user_id') else None)
                 
                 # 消息去重
-                if message_id and message_id in self.received_message_ids:
+                if not self._accept_message_id(message_id):
                     return
                 
-                if message_id:
-                    self.received_message_ids.add(message_id)
-                    # 限制集合大小
-                    if len(self.received_message_ids) > self.max_received_ids:
-                        # 移除最旧的一半
-                        self.received_message_ids = set(list(self.received_message_ids)[self.max_received_ids // 2:])
-                
                 # 发送已送达回执
                 if message_id and self.user_id:
                     try:
@@ -196,6 +329,37 @@ class WebSocketClient:
             except Exception as e:
                 logging.error(f"处理新消息失败: {e}, data={data}", exc_info=True)
         
+        @self.sio.on("new_messages")
+        def on_new_messages(data):
+            """收到批量新消息（注册时声明了 new_messages 能力）：一次回执、一次回调"""
+            try:
+                messages = [
+                    message for message in (data.get("messages") or [])
+                    if isinstance(message, dict) and self._accept_message_id(message.get("id"))
+                ]
+                if not messages:
+                    return
+                
+                # 整批一次已送达回执
+                message_ids = [int(message["id"]) for message in messages if message.get("id")]
+                if message_ids and self.user_id:
+                    self.send_messages_delivered(message_ids, self.user_id)
+                
+                if self.on_messages_callback:
+                    try:
+                        self.on_messages_callback(messages)
+                    except Exception as e:
+                        logging.error(f"批量消息回调异常: {e}, count={len(messages)}", exc_info=True)
+                elif self.on_message_callback:
+                    for message in messages:
+                        try:
+                            self.on_message_callback(message)
+                        except Exception as e:
+                            logging.error(f"消息回调异常: {e}, message_id={message.get('id')}", exc_info=True)
+            
+            except Exception as e:
+                logging.error(f"处理批量新消息失败: {e}", exc_info=True)
+        
         @self.sio.on("message_status")
         def on_message_status(data):
             """消息状态更新"""
@@ -262,6 +426,18 @@ class WebSocketClient:
             except Exception as e:
                 logging.error(f"处理消息编辑失败: {e}", exc_info=True)
         
+        @self.sio.on("message_preview_ready")
+        def on_message_preview_ready(data):
+            """消息链接预览就绪（服务端后台抓取完成后推送）"""
+            try:
+                if self.on_message_preview_ready_callback:
+                    try:
+                        self.on_message_preview_ready_callback(data)
+                    except Exception as e:
+                        logging.error(f"链接预览回调异常: {e}", exc_info=True)
+            except Exception as e:
+                logging.error(f"处理链接预览推送失败: {e}", exc_info=True)
+        
         @self.sio.on("session_status_updated")
         def on_session_status_updated(data):
             """会话状态更新"""
@@ -344,6 +520,19 @@ class WebSocketClient:
                 except Exception as e:
                     logging.error(f"状态变化回调异常: {e}", exc_info=True)
     
+    def _accept_message_id(self, message_id) -> bool:
+        """新消息去重：同一消息ID只处理一次（没有ID的消息总是处理）"""
+        if not message_id:
+            return True
+        if message_id in self.received_message_ids:
+            return False
+        self.received_message_ids.add(message_id)
+        # 限制集合大小
+        if len(self.received_message_ids) > self.max_received_ids:
+            # 移除最旧的一半
+            self.received_message_ids = set(list(self.received_message_ids)[self.max_received_ids // 2:])
+        return True
+    
     def _register_connection(self):
         """向服务器注册连接"""
         try:
@@ -353,16 +542,28 @@ class WebSocketClient:
                 "connection_id": self.connection_id,
                 "device_id": self.device_id,
                 "device_info": self.device_info or {},
+                # 声明支持批量推送：服务端合并新消息为 new_messages 事件
+                "capabilities": ["new_messages"] + (["msgpack"] if self.use_msgpack else [])
+                                + (["deflate"] if self.use_compression else []),
             }
             
-            # 使用 emit 而不是 call，避免阻塞和跨线程问题
-            # 注册结果将通过 new_message 或其他事件返回
-            self.sio.emit("register", data)
+            # 使用 emit 而不是 call，避免阻塞和跨线程问题；注册结果在 Socket.IO 线程中回调
+            self.sio.emit("register", data, callback=self._on_registered)
             logging.info(f"连接注册请求已发送: {self.connection_id}")
         
         except Exception as e:
             logging.error(f"注册连接异常: {e}", exc_info=True)
     
+    def _on_registered(self, response=None):
+        """注册结果：服务端确认 msgpack / deflate 能力后，本连接之后发出的包改用 msgpack 编码 / 压缩大帧"""
+        if not isinstance(response, dict) or not response.get("success"):
+            logging.warning(f"连接注册失败: {response}")
+            return
+        capabilities = response.get("capabilities") or []
+        self.sio.packed = self.use_msgpack and "msgpack" in capabilities
+        self.sio.compressed = self.use_compression and "deflate" in capabilities
+        logging.info(f"连接注册成功: {self.connection_id}, capabilities={capabilities}")
+    
     def _start_heartbeat(self):
         """启动心跳定时器（主线程 QTimer）"""
         from PyQt6.QtCore import QThread, QTimer
@@ -435,38 +636,25 @@ class WebSocketClient:
         except Exception as e:
             logging.error(f"发送心跳异常: {e}", exc_info=True)
     
-    def _start_retry_worker(self):
-        """启动重试定时器（主线程 QTimer）"""
-        from PyQt6.QtCore import QThread, QTimer
-        from PyQt6.QtWidgets import QApplication
-        
-        app = QApplication.instance()
-        if not app:
-            logging.warning("QApplication 不存在，无法启动重试定时器")
-            return
-        
-        # 检查是否在主线程
-        is_main_thread = QThread.currentThread() == app.thread()
-        
-        if not is_main_thread:
-            # 不在主线程，通过 QTimer.singleShot 切换到主线程执行
-            QTimer.singleShot(0, self._start_retry_worker)
-            return
-        
-        # 在主线程中执行
-        if self.retry_timer and self.retry_timer.isActive():
-            logging.debug("重试定时器已在运行")
+    def _call_in_main_thread(self, fn: Callable[[], None]):
+        """在主线程执行 fn（借用请求回调调度器切换线程）"""
+        def run(_):
+            try:
+                fn()
+            except Exception as e:
+                logging.error(f"主线程任务异常: {e}", exc_info=True)
+        _dispatcher().deliver(None, [run])
+    
+    def _schedule_outbound_retry(self):
+        """按最早一次到期的重试时间启动单次定时器（主线程）"""
+        delay = self.outbound.next_retry_delay()
+        if delay is None or self.status != ConnectionStatus.CONNECTED:
             return
-        
-        try:
+        if self.retry_timer is None:
             self.retry_timer = QTimer()
-            self.retry_timer.setInterval(int(self.retry_interval * 1000))
-            self.retry_timer.setSingleShot(False)
-            self.retry_timer.timeout.connect(self._process_message_queue)
-            self.retry_timer.start()
-            logging.debug("重试定时器已启动")
-        except Exception as e:
-            logging.error(f"启动重试定时器失败: {e}", exc_info=True)
+            self.retry_timer.setSingleShot(True)
+            self.retry_timer.timeout.connect(self._flush_outbound)
+        self.retry_timer.start(int(delay * 1000) + 10)
     
     def _stop_retry_worker(self):
         """停止重试定时器（必须在主线程中执行）"""
@@ -495,40 +683,65 @@ class WebSocketClient:
             except Exception as e:
                 logging.error(f"停止重试定时器失败: {e}", exc_info=True)
     
-    def _process_message_queue(self):
-        """处理消息队列"""
-        with self.queue_lock:
-            if not self.message_queue:
-                return
-            
-            # 复制队列，避免在处理时被修改
-            queue_copy = self.message_queue.copy()
-            self.message_queue.clear()
+    def _flush_outbound(self):
+        """发送待发送队列中已到重试时间的消息（主线程）：每个会话一批，单条用 send_message，多条用 send_messages"""
+        for item in self.outbound.expired():
+            logging.warning(f"消息超过最长保留时间仍未发出，放弃发送: {item.event}")
+            self._notify_outbound(self.on_message_failed_callback, item,
+                                  {"success": False, "message": "消息长时间未能发出，已放弃发送"})
+        if self.status != ConnectionStatus.CONNECTED or not self.token:
+            return
         
-        for item in queue_copy:
-            try:
-                event = item.get("event")
-                data = item.get("data")
-                retry_count = item.get("retry_count", 0)
-                
-                # 重试次数限制
-                if retry_count >= 3:
-                    logging.warning(f"消息重试次数超限，丢弃: {event}")
-                    continue
-                
-                # 重新发送
-                logging.info(f"重试发送消息: {event} (第 {retry_count + 1} 次)")
-                success = self._send_event(event, data)
-                
-                if not success:
-                    # 失败，重新加入队列
-                    item["retry_count"] = retry_count + 1
-                    with self.queue_lock:
-                        if len(self.message_queue) < self.max_queue_size:
-                            self.message_queue.append(item)
-            
-            except Exception as e:
-                logging.error(f"处理队列消息异常: {e}", exc_info=True)
+        for batch in self.outbound.take_batches(self.outbound_batch_size, user_id=self.user_id):
+            if len(batch) == 1:
+                item = batch[0]
+                future = self.request(item.event, dict(item.data, token=self.token))
+            else:
+                data = {"token": self.token, "messages": [item.data for item in batch]}
+                # 服务端逐条写入，按条数放宽超时
+                future = self.request("send_messages", data, timeout=self.request_timeout + 0.5 * len(batch))
+            future.add_done_callback(lambda f, batch=batch: self._on_outbound_done(batch, f.result()))
+        self._schedule_outbound_retry()
+    
+    def _on_outbound_done(self, batch: List[OutboundItem], response: Dict[str, Any]):
+        """处理一批消息的发送结果（主线程）"""
+        if response.get("error") == RequestError.NOT_CONNECTED.value:
+            # 没有发出：等待重连后补发，不计入重试次数
+            self.outbound.release(batch)
+            return
+        if len(batch) == 1:
+            results = [response]
+        elif response.get("success") and isinstance(response.get("results"), list):
+            results = response["results"]
+        else:
+            results = [response] * len(batch)
+        
+        retry = []
+        for item, result in zip(batch, results):
+            if retry or result.get("error") or result.get("retryable"):
+                # 超时、断线或服务端暂时失败：保持顺序，连同之后的消息一起稍后重发
+                retry.append(item)
+                continue
+            self.outbound.acknowledge(item.item_id)
+            if result.get("success"):
+                self._notify_outbound(self.on_message_sent_callback, item, result)
+            else:
+                logging.warning(f"消息被服务端拒绝: {item.event}, {result.get('message')}")
+                self._notify_outbound(self.on_message_failed_callback, item, result)
+        retry.extend(batch[len(results):])
+        if retry:
+            logging.info(f"{len(retry)} 条消息发送失败，稍后重试（第 {retry[0].attempts + 1} 次）")
+            self.outbound.retry_later(retry)
+        self._flush_outbound()
+    
+    def _notify_outbound(self, callback: Optional[Callable], item: OutboundItem, response: Dict[str, Any]):
+        """通知聊天消息的发送结果（撤回等其他事件只记录日志）"""
+        if callback is None or item.event != "send_message":
+            return
+        try:
+            callback(item.item_id, response)
+        except Exception as e:
+            logging.error(f"发送结果回调异常: {item.event}, {e}", exc_info=True)
     
     def _send_event(self, event: str, data: dict) -> bool:
         """
@@ -554,24 +767,106 @@ class WebSocketClient:
             logging.error(f"发送事件失败: {e}", exc_info=True)
             return False
     
-    def _add_to_queue(self, event: str, data: dict):
+    def request(self, event: str, data: dict, timeout: Optional[float] = None,
+                callback: Optional[Callable[[RequestFuture], None]] = None) -> RequestFuture:
         """
-        添加到消息队列
+        发送带 ack 的请求，立即返回 RequestFuture，不等待响应
+        
+        - 每个请求分配请求ID（同时写入 data["request_id"]），ack 回调按ID找到对应请求
+        - 同时在途的请求不超过 max_in_flight，多出的排队，队列满时直接失败
+        - 超时、取消、断线都会以 {success: False, error} 结束请求，之后到达的响应被丢弃
         
         Args:
             event: 事件名称
             data: 数据
+            timeout: 超时秒数（默认 request_timeout，从提交时开始计算）
+            callback: 完成回调（主线程执行），等价于 future.add_done_callback
         """
-        with self.queue_lock:
-            if len(self.message_queue) >= self.max_queue_size:
-                logging.warning("消息队列已满，丢弃最旧的消息")
-                self.message_queue.pop(0)
-            
-            self.message_queue.append({
-                "event": event,
-                "data": data,
-                "retry_count": 0,
-            })
+        request_id = uuid.uuid4().hex
+        future = RequestFuture(request_id, event)
+        future._client = self
+        if callback:
+            future.add_done_callback(callback)
+        
+        if self.status != ConnectionStatus.CONNECTED:
+            future._set_response(_failure(RequestError.NOT_CONNECTED, "WebSocket 未连接"))
+            return future
+        
+        payload = dict(data)
+        payload["request_id"] = request_id
+        timer = threading.Timer(
+            self.request_timeout if timeout is None else timeout,
+            self._finish_request,
+            args=(request_id, _failure(RequestError.TIMEOUT, "请求超时")),
+        )
+        timer.daemon = True
+        
+        with self._requests_lock:
+            sending = len(self._in_flight) - len(self._waiting_requests)
+            if sending < self.max_in_flight and not self._waiting_requests:
+                self._in_flight[request_id] = (future, timer)
+                send_now = True
+            elif len(self._waiting_requests) < self.max_waiting_requests:
+                self._in_flight[request_id] = (future, timer)
+                self._waiting_requests.append((future, payload))
+                send_now = False
+            else:
+                future._set_response(_failure(RequestError.TOO_MANY_REQUESTS, "请求过多，请稍后重试"))
+                return future
+        
+        timer.start()
+        if send_now:
+            self._emit_request(future, payload)
+        return future
+    
+    def _emit_request(self, future: RequestFuture, payload: dict):
+        request_id = future.request_id
+        
+        def ack(response=None):
+            self._finish_request(request_id, response if isinstance(response, dict) else {})
+        
+        try:
+            self.sio.emit(future.event, payload, callback=ack)
+        except Exception as e:
+            logging.error(f"发送 {future.event} 事件失败: {e}", exc_info=True)
+            self._finish_request(request_id, _failure(RequestError.SEND_FAILED, f"发送失败: {e}"))
+    
+    def _finish_request(self, request_id: str, response: Dict[str, Any]) -> bool:
+        """结束请求并发出排队中的请求；请求已结束时返回 False"""
+        with self._requests_lock:
+            entry = self._in_flight.pop(request_id, None)
+            if entry is None:
+                return False
+            # 排队中的请求被取消 / 超时，只需从队列移除
+            if self._waiting_requests:
+                self._waiting_requests = deque(
+                    item for item in self._waiting_requests if item[0].request_id != request_id
+                )
+            ready = []
+            sending = len(self._in_flight) - len(self._waiting_requests)
+            while self._waiting_requests and sending < self.max_in_flight:
+                ready.append(self._waiting_requests.popleft())
+                sending += 1
+        
+        future, timer = entry
+        timer.cancel()
+        if response.get("error") == RequestError.TIMEOUT.value:
+            logging.error(f"请求超时: {future.event}")
+        future._set_response(response)
+        for waiting_future, payload in ready:
+            self._emit_request(waiting_future, payload)
+        return True
+    
+    def _fail_all_requests(self, error: RequestError, message: str):
+        with self._requests_lock:
+            request_ids = list(self._in_flight)
+        for request_id in request_ids:
+            self._finish_request(request_id, _failure(error, message))
+    
+    def pending_request_count(self) -> int:
+        """在途（含排队）的请求数"""
+        with self._requests_lock:
+            return len(self._in_flight)
     
     def connect(self, user_id: int, token: str, device_id: str = None, device_info: Dict[str, Any] = None):
         """
@@ -634,9 +929,13 @@ class WebSocketClient:
             logging.error(f"断开连接失败: {e}", exc_info=True)
     
     def send_message(self, session_id: str, message: str, role: str = "user", 
-                    message_type: str = "text", reply_to_message_id: int = None) -> bool:
+                    message_type: str = "text", reply_to_message_id: int = None,
+                    client_message_id: Optional[str] = None) -> bool:
         """
-        发送消息（异步，使用 emit，避免阻塞导致超时和断线）
+        发送消息：先写入待发送队列再尝试发送，未连接时在重连后自动补发
+        
+        同一会话的消息按调用顺序送达；超时等失败按指数退避重试，服务端按 client_message_id 去重，
+        重发不会产生重复消息。结果通过 on_message_sent / on_message_failed 回调通知。
         
         Args:
             session_id: 会话ID
@@ -644,98 +943,72 @@ class WebSocketClient:
             role: 角色 (user/agent)
             message_type: 消息类型 (text/image/file)
             reply_to_message_id: 引用消息ID
+            client_message_id: 客户端消息ID（默认自动生成），服务端回推的消息会带上此ID
             
         Returns:
-            bool: 是否成功发送到 Socket.IO 客户端（不代表服务端处理成功）
+            bool: 是否已加入待发送队列（未登录或队列已满时为 False）
         """
         try:
             if not self.user_id or not self.token:
                 logging.error("未登录，无法发送消息")
                 return False
             
-            if self.status != ConnectionStatus.CONNECTED:
-                logging.error("WebSocket 未连接，无法发送消息")
-                return False
-            
+            client_message_id = client_message_id or uuid.uuid4().hex
+            # token 不写入队列（队列会持久化到磁盘），发送时再附加
             data = {
                 "session_id": session_id,
                 "from_user_id": self.user_id,
                 "message": message,
                 "role": role,
-                "token": self.token,
                 "message_type": message_type,
+                "client_message_id": client_message_id,
             }
             
             if reply_to_message_id:
                 data["reply_to_message_id"] = reply_to_message_id
             
-            # 使用内部 _send_event（emit），不会阻塞当前线程，也不会因为超时导致断线
-            success = self._send_event("send_message", data)
-            
-            if not success:
-                # 发送失败时加入重试队列
-                logging.warning("消息发送失败，加入重试队列")
-                self._add_to_queue("send_message", data)
+            if not self.outbound.add("send_message", data, lane=session_id,
+                                     item_id=client_message_id, user_id=self.user_id):
+                return False
             
-            return success
+            if self.status != ConnectionStatus.CONNECTED:
+                logging.warning("WebSocket 未连接，消息已加入待发送队列")
+            self._flush_outbound()
+            return True
         
         except Exception as e:
             logging.error(f"发送消息异常: {e}", exc_info=True)
             return False
     
-    def get_session_messages(self, session_id: str, limit: int = 200) -> Optional[Dict[str, Any]]:
+    def get_session_messages(self, session_id: str, limit: int = 200,
+                             callback: Optional[Callable[[RequestFuture], None]] = None,
+                             after_id: Optional[int] = None,
+                             changed_from_id: Optional[int] = None) -> RequestFuture:
         """
-        获取会话历史消息（通过 WebSocket）
+        获取会话历史消息（通过 WebSocket，非阻塞）
 
         Args:
             session_id: 会话ID
             limit: 拉取条数（默认 200，上限由服务端限制）
+            callback: 完成回调（主线程执行）
+            after_id: 只拉取该消息ID之后的消息（本地缓存的增量同步）
+            changed_from_id: 本地缓存的第一条消息ID（与 after_id 一起使用），结果的 changes 中
+                返回该范围内离线期间被撤回或编辑的消息
 
         Returns:
-            dict: {success, messages, message?}，失败返回 None
+            RequestFuture: 结果为 {success, messages, changes, session_status, has_more, message?}
         """
-        try:
-            if not self.user_id or not self.token:
-                logging.error("未登录，无法获取历史消息")
-                return None
-
-            if self.status != ConnectionStatus.CONNECTED:
-                logging.error("WebSocket 未连接，无法获取历史消息")
-                return None
-
-            data = {
-                "session_id": session_id,
-                "user_id": self.user_id,
-                "token": self.token,
-                "limit": limit,
-            }
-
-            # 使用 call-like 回调方式：_send_event 无回调，这里直接 sio.emit 并等待回调
-            event = threading.Event()
-            result: Dict[str, Any] = {}
-
-            def callback(response):
-                nonlocal result
-                result = response or {}
-                event.set()
-
-            try:
-                self.sio.emit("get_session_messages", data, callback=callback)
-            except Exception as e:
-                logging.error(f"发送 get_session_messages 事件失败: {e}", exc_info=True)
-                return None
-
-            # 等待回调，超时 5 秒
-            if not event.wait(timeout=5.0):
-                logging.error("获取历史消息超时")
-                return None
+        data = {
+            "session_id": session_id,
+            "user_id": self.user_id,
+            "limit": limit,
+        }
+        if after_id is not None:
+            data["after_id"] = after_id
+            if changed_from_id is not None:
+                data["changed_from_id"] = changed_from_id
+        return self._authed_request("get_session_messages", data, "获取历史消息", callback)
 
-            return result
-
-        except Exception as e:
-            logging.error(f"获取历史消息异常: {e}", exc_info=True)
-            return None
-    
     def send_message_delivered(self, message_id: int, user_id: int) -> bool:
         """
         发送消息已送达回执
@@ -759,6 +1032,24 @@ class WebSocketClient:
             logging.error(f"发送已送达回执异常: {e}", exc_info=True)
             return False
     
+    def send_messages_delivered(self, message_ids: List[int], user_id: int) -> bool:
+        """
+        批量发送已送达回执（收到 new_messages 后整批一次）
+        
+        Args:
+            message_ids: 消息ID列表
+            user_id: 用户ID
+            
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            return self._send_event("message_delivered", {"message_ids": message_ids, "user_id": user_id})
+        
+        except Exception as e:
+            logging.error(f"发送已送达回执异常: {e}", exc_info=True)
+            return False
+    
     def send_message_read(self, message_id: int, user_id: int) -> bool:
         """
         发送消息已读回执
@@ -801,15 +1092,14 @@ class WebSocketClient:
             data = {
                 "message_id": message_id,
                 "user_id": user_id,
-                "token": self.token,
             }
             
-            success = self._send_event("recall_message", data)
+            success = self._send_event("recall_message", dict(data, token=self.token))
             
             if not success:
-                # 失败，加入队列重试
+                # 失败，加入待发送队列重试（撤回单独一个顺序通道，不阻塞会话消息）
                 logging.warning("撤回消息失败，加入重试队列")
-                self._add_to_queue("recall_message", data)
+                self.outbound.add("recall_message", data, lane="recall", user_id=self.user_id)
             
             return success
         
@@ -817,146 +1107,43 @@ class WebSocketClient:
             logging.error(f"撤回消息异常: {e}", exc_info=True)
             return False
 
-    def match_agent(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """匹配在线客服（用户侧）"""
-        try:
-            if not self.user_id or not self.token:
-                logging.error("未登录，无法匹配客服")
-                return None
-
-            if self.status != ConnectionStatus.CONNECTED:
-                logging.error("WebSocket 未连接，无法匹配客服")
-                return None
-
-            data = {
-                "session_id": session_id,
-                "user_id": self.user_id,
-                "token": self.token,
-            }
-
-            event = threading.Event()
-            result: Dict[str, Any] = {}
-
-            def callback(response):
-                nonlocal result
-                result = response or {}
-                event.set()
-
-            self.sio.emit("match_agent", data, callback=callback)
-
-            if not event.wait(timeout=5.0):
-                logging.error("匹配客服超时")
-                return None
-
-            return result
-        except Exception as e:
-            logging.error(f"匹配客服异常: {e}", exc_info=True)
-            return None
-
-    def accept_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """客服接入待接入会话"""
-        try:
-            if not self.user_id or not self.token:
-                logging.error("未登录，无法接入会话")
-                return None
-
-            if self.status != ConnectionStatus.CONNECTED:
-                logging.error("WebSocket 未连接，无法接入会话")
-                return None
-
-            data = {
-                "session_id": session_id,
-                "user_id": self.user_id,
-                "token": self.token,
-            }
-
-            event = threading.Event()
-            result: Dict[str, Any] = {}
-
-            def callback(response):
-                nonlocal result
-                result = response or {}
-                event.set()
-
-            self.sio.emit("accept_session", data, callback=callback)
-
-            if not event.wait(timeout=5.0):
-                logging.error("接入会话超时")
-                return None
-
-            return result
-        except Exception as e:
-            logging.error(f"接入会话异常: {e}", exc_info=True)
-            return None
-
-    def get_link_preview(self, url: str) -> Optional[Dict[str, Any]]:
-        """通过 WebSocket 获取链接预览"""
-        try:
-            if not self.user_id or not self.token:
-                logging.error("未登录，无法获取链接预览")
-                return None
-
-            if self.status != ConnectionStatus.CONNECTED:
-                logging.error("WebSocket 未连接，无法获取链接预览")
-                return None
-
-            data = {"url": url, "token": self.token}
-
-            event = threading.Event()
-            result: Dict[str, Any] = {}
-
-            def callback(response):
-                nonlocal result
-                result = response or {}
-                event.set()
+    def match_agent(self, session_id: str,
+                    callback: Optional[Callable[[RequestFuture], None]] = None) -> RequestFuture:
+        """匹配在线客服（用户侧，非阻塞）"""
+        data = {"session_id": session_id, "user_id": self.user_id}
+        return self._authed_request("match_agent", data, "匹配客服", callback)
 
-            self.sio.emit("link_preview", data, callback=callback)
+    def accept_session(self, session_id: str,
+                       callback: Optional[Callable[[RequestFuture], None]] = None) -> RequestFuture:
+        """客服接入待接入会话（非阻塞）"""
+        data = {"session_id": session_id, "user_id": self.user_id}
+        return self._authed_request("accept_session", data, "接入会话", callback)
 
-            if not event.wait(timeout=5.0):
-                logging.error("获取链接预览超时")
-                return None
+    def get_link_preview(self, url: str,
+                         callback: Optional[Callable[[RequestFuture], None]] = None) -> RequestFuture:
+        """通过 WebSocket 获取链接预览（非阻塞）"""
+        return self._authed_request("link_preview", {"url": url}, "获取链接预览", callback)
 
-            return result
-        except Exception as e:
-            logging.error(f"获取链接预览异常: {e}", exc_info=True)
-            return None
+    def process_rich_text(self, content: str,
+                          callback: Optional[Callable[[RequestFuture], None]] = None) -> RequestFuture:
+        """通过 WebSocket 处理富文本（非阻塞）"""
+        data = {"content": content, "user_id": self.user_id}
+        return self._authed_request("process_rich_text", data, "处理富文本", callback)
 
-    def process_rich_text(self, content: str) -> Optional[Dict[str, Any]]:
-        """通过 WebSocket 处理富文本"""
-        try:
-            if not self.user_id or not self.token:
-                logging.error("未登录，无法处理富文本")
-                return None
+    def _authed_request(self, event: str, data: dict, action: str,
+                        callback: Optional[Callable[[RequestFuture], None]] = None) -> RequestFuture:
+        """发送需要登录的请求：未登录时返回已失败的 future"""
+        if not self.user_id or not self.token:
+            logging.error(f"未登录，无法{action}")
+            future = RequestFuture(uuid.uuid4().hex, event)
+            if callback:
+                future.add_done_callback(callback)
+            future._set_response(_failure(RequestError.NOT_CONNECTED, f"未登录，无法{action}"))
+            return future
+        if self.status != ConnectionStatus.CONNECTED:
+            logging.error(f"WebSocket 未连接，无法{action}")
+        return self.request(event, dict(data, token=self.token), callback=callback)
 
-            if self.status != ConnectionStatus.CONNECTED:
-                logging.error("WebSocket 未连接，无法处理富文本")
-                return None
-
-            data = {
-                "content": content,
-                "user_id": self.user_id,
-                "token": self.token,
-            }
-
-            event = threading.Event()
-            result: Dict[str, Any] = {}
-
-            def callback(response):
-                nonlocal result
-                result = response or {}
-                event.set()
-
-            self.sio.emit("process_rich_text", data, callback=callback)
-
-            if not event.wait(timeout=5.0):
-                logging.error("处理富文本超时")
-                return None
-
-            return result
-        except Exception as e:
-            logging.error(f"处理富文本异常: {e}", exc_info=True)
-            return None
-    
     def on_connect(self, callback: Callable):
         """注册连接成功回调"""
         self.on_connect_callback = callback
@@ -969,6 +1156,10 @@ class WebSocketClient:
         """注册收到消息回调"""
         self.on_message_callback = callback
     
+    def on_messages(self, callback: Callable):
+        """注册批量新消息回调：callback(messages)"""
+        self.on_messages_callback = callback
+    
     def on_message_status(self, callback: Callable):
         """注册消息状态更新回调"""
         self.on_message_status_callback = callback
@@ -1085,6 +1276,18 @@ class WebSocketClient:
         """注册会话状态更新回调"""
         self.on_session_status_updated_callback = callback
     
+    def on_message_preview_ready(self, callback: Callable):
+        """注册链接预览就绪回调"""
+        self.on_message_preview_ready_callback = callback
+    
+    def on_message_sent(self, callback: Callable):
+        """注册队列消息发送成功回调：callback(client_message_id, response)"""
+        self.on_message_sent_callback = callback
+    
+    def on_message_failed(self, callback: Callable):
+        """注册队列消息发送失败（服务端拒绝或超过保留时间）回调：callback(client_message_id, response)"""
+        self.on_message_failed_callback = callback
+    
     def on_status_change(self, callback: Callable):
         """注册状态变化回调"""
         self.on_status_change_callback = callback
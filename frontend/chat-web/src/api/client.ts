@@ -30,6 +30,7 @@ api.interceptors.response.use(
   (error) => {
     if (error.response?.status === 401) {
       sessionStorage.removeItem('token');
+      sessionStorage.removeItem('refresh_token');
       sessionStorage.removeItem('user');
       window.location.href = '/login';
     }
@@ -106,5 +107,68 @@ export const customerServiceApi = {
   },
 };
 
+// access token 剩余有效期低于该值时提前刷新（秒）
+const TOKEN_REFRESH_MARGIN = 120;
+let refreshTimer: number | null = null;
+
+// 解析 token 的过期时间（仅解码 payload，不验证签名）
+const getTokenExpiry = (token: string): number | null => {
+  try {
+    const payload = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+    return typeof payload.exp === 'number' ? payload.exp : null;
+  } catch {
+    return null;
+  }
+};
+
+/**
+ * 使用 refresh token 换取新的 access token，成功返回新 token
+ */
+export const refreshAccessToken = async (): Promise<string | null> => {
+  const refreshToken = sessionStorage.getItem('refresh_token');
+  if (!refreshToken) return null;
+  try {
+    const response = await axios.post(`${BASE_URL}/api/refresh_token`, { refresh_token: refreshToken });
+    const data = response.data;
+    if (!data.success || !data.token) return null;
+    sessionStorage.setItem('token', data.token);
+    if (data.refresh_token) {
+      sessionStorage.setItem('refresh_token', data.refresh_token);
+    }
+    return data.token;
+  } catch (error) {
+    console.error('刷新 token 失败:', error);
+    return null;
+  }
+};
+
+/**
+ * 在 access token 过期前自动续期，续期成功后回调 onRefreshed(newToken)
+ */
+export const startTokenAutoRefresh = (onRefreshed: (token: string) => void) => {
+  stopTokenAutoRefresh();
+  const token = sessionStorage.getItem('token');
+  const exp = token ? getTokenExpiry(token) : null;
+  if (!exp) return;
+  const delay = Math.max(exp - Math.floor(Date.now() / 1000) - TOKEN_REFRESH_MARGIN, 0) * 1000;
+  refreshTimer = window.setTimeout(async () => {
+    const newToken = await refreshAccessToken();
+    if (newToken) {
+      onRefreshed(newToken);
+      startTokenAutoRefresh(onRefreshed);
+    } else if (sessionStorage.getItem('refresh_token')) {
+      // 网络异常等情况稍后重试
+      refreshTimer = window.setTimeout(() => startTokenAutoRefresh(onRefreshed), 30000);
+    }
+  }, delay);
+};
+
+export const stopTokenAutoRefresh = () => {
+  if (refreshTimer !== null) {
+    clearTimeout(refreshTimer);
+    refreshTimer = null;
+  }
+};
+
 export default api;
 
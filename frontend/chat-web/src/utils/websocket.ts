@@ -44,6 +44,14 @@ export interface WebSocketMessage {
   is_from_self?: boolean;  // 服务端提供的标记，表示是否是自己发送的消息
 }
 
+export interface LinkPreviewInfo {
+  url: string;
+  title: string | null;
+  description: string | null;
+  image: string | null;
+  site_name: string | null;
+}
+
 export interface WebSocketClientCallbacks {
   onConnect?: () => void;
   onDisconnect?: () => void;
@@ -58,8 +66,9 @@ export interface WebSocketClientCallbacks {
   onVipStatusUpdated?: (data: { user_id: number; vip_info: any }) => void;
   onDiamondBalanceUpdated?: (data: { user_id: number; balance: number }) => void;
   onUserProfileUpdated?: (data: { user_id: number; profile: any }) => void;
-  onMessageEdited?: (data: { message_id: number; session_id: string; new_content: string; edited_at: string }) => void;
+  onMessageEdited?: (data: { message_id: number; session_id: string; new_content: string; edited_at: string; rich?: { html: string; is_rich: boolean; urls?: string[] } | null }) => void;
   onSessionStatusUpdated?: (data: { session_id: string; status: string; user_id: number; agent_id: number }) => void;
+  onMessagePreviewReady?: (data: { message_id: number; session_id: string; preview: LinkPreviewInfo }) => void;
 }
 
 class WebSocketClient {
@@ -325,6 +334,20 @@ class WebSocketClient {
         this.callbacks.onDiamondBalanceUpdated(data);
       }
     });
+
+    // 消息编辑
+    this.socket.on('message_edited', (data: any) => {
+      if (this.callbacks.onMessageEdited) {
+        this.callbacks.onMessageEdited(data);
+      }
+    });
+
+    // 消息链接预览就绪（服务端后台抓取完成后推送）
+    this.socket.on('message_preview_ready', (data: { message_id: number; session_id: string; preview: LinkPreviewInfo }) => {
+      if (this.callbacks.onMessagePreviewReady) {
+        this.callbacks.onMessagePreviewReady(data);
+      }
+    });
   }
 
   /**
@@ -478,6 +501,13 @@ class WebSocketClient {
     });
   }
 
+  /**
+   * 更新 access token（token 续期后调用，后续事件使用新 token）
+   */
+  updateToken(token: string): void {
+    this.token = token;
+  }
+
   /**
    * 断开连接
    */